@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Benchmarks of the hot paths of opentimspy, on synthetic datasets.
+
+Examples:
+    python benchmarks/run_benchmarks.py --frames 500 --peaks 100000 -o results.json
+    python benchmarks/run_benchmarks.py -k query -k tic --compare results.json
+
+Results are saved as JSON: a "meta" record (versions, git commit, machine,
+dataset parameters) and one record per case with all measured times, so that
+runs on different commits can be compared with --compare.
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import opentimspy
+from opentimspy import OpenTIMS, conversion_method
+from opentimspy.testing import synthesize_tdf
+
+REPO = pathlib.Path(__file__).resolve().parent.parent
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(fun, repeats, min_time):
+    """Run fun at least `repeats` times and for at least min_time seconds; return the times."""
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeats or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        fun()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def cases(path, tmp_dir, max_threads):
+    """Yield (name, params, function, number of peaks processed per call or None)."""
+    ot = OpenTIMS(path, cm=conversion_method.OpenSource)
+    frames = ot.frames["Id"]
+    peaks = int(ot.frames["NumPeaks"].sum())
+    raw_columns = ("frame", "scan", "tof", "intensity")
+
+    yield "open_close", {}, lambda: OpenTIMS(path, cm=conversion_method.OpenSource).close(), None
+
+    # Every set of columns is decoded by its own specialized kernel.
+    for columns in (raw_columns, ("tof",), ("intensity",), ("frame", "retention_time"), ("scan", "tof", "intensity"),
+                    ("mz", "intensity"), ("mz", "inv_ion_mobility", "retention_time", "intensity")):
+        yield "query", {"columns": list(columns)}, lambda c=columns: ot.query(columns=c), peaks
+
+    middle = int(frames[len(frames) // 2])
+    frame_peaks = int(ot.frames["NumPeaks"][len(frames) // 2])
+    yield "frame_array", {}, lambda: ot.frame_array(middle), frame_peaks
+    yield "getitem_slice", {}, lambda: ot[frames[0]:frames[-1] + 1], peaks
+    yield "query_iter", {"columns": list(raw_columns)}, lambda: sum(1 for _ in ot.query_iter(columns=raw_columns)), peaks
+    yield "iter_chunks", {"columns": list(raw_columns)}, lambda: sum(1 for _ in ot.iter_chunks(columns=raw_columns)), peaks
+
+    threads = sorted({1, 2, 4, 8, max_threads} & set(range(1, max_threads + 1)))
+    for n in threads:
+        def separate(n=n):
+            opentimspy.set_num_threads(n)
+            try:
+                ot.get_separate_frames(frames, columns=raw_columns)
+            finally:
+                opentimspy.set_num_threads(0)
+        yield "extract_separate_frames", {"threads": n}, separate, peaks
+
+    yield "framesTIC", {}, ot.framesTIC, peaks
+
+    data = ot.query(columns=raw_columns)
+    yield "tof_to_mz", {}, lambda: ot.tof_to_mz(data["tof"], data["frame"]), peaks
+    yield "tof_to_mz_frame_sorted", {}, lambda: ot.tof_to_mz_frame_sorted(data["tof"], data["frame"]), peaks
+    yield "scan_to_inv_ion_mobility", {}, lambda: ot.scan_to_inv_ion_mobility(data["scan"], data["frame"]), peaks
+    del data
+
+    out = pathlib.Path(tmp_dir) / "export"
+    yield "write_tdf", {}, lambda: ot.write_tdf(out / "subset.d", overwrite=True), peaks
+    script = REPO / "scripts" / "opentims_extract_tdf.py"
+    if script.exists() and all(importlib.util.find_spec(m) for m in ("pandas", "tqdm")):
+        command = [sys.executable, str(script), str(path), "--no-convert", "--format", "csv", "-o", str(out / "out.csv")]
+        yield "export_script_csv", {}, lambda: subprocess.run(command, check=True, capture_output=True), peaks
+    ot.close()
+
+
+def summarize(name, params, times, peaks):
+    result = {
+        "name": name,
+        "params": params,
+        "times": times,
+        "min": min(times),
+        "median": statistics.median(times),
+    }
+    if peaks is not None:
+        result["peaks"] = peaks
+        result["peaks_per_s"] = peaks / result["min"]
+    return result
+
+
+def key(result):
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark opentimspy on a synthetic dataset.")
+    parser.add_argument("--dataset", type=pathlib.Path, help="Use this dataset instead of generating one.")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames of the synthetic dataset.")
+    parser.add_argument("--peaks", type=int, default=50_000, help="Mean number of peaks per frame.")
+    parser.add_argument("--ms2-ratio", type=float, default=0.9, help="Fraction of MS2 frames.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="Minimal number of runs of each case.")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimal time spent on each case, in seconds.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="Maximal number of threads to scale to.")
+    parser.add_argument("-k", "--select", action="append", default=[], help="Only run cases whose name contains this (repeatable).")
+    parser.add_argument("-o", "--output", type=pathlib.Path, help="Save results to this JSON file.")
+    parser.add_argument("--compare", type=pathlib.Path, help="Compare with results saved earlier.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        meta = {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "opentimspy": opentimspy.__version__,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        }
+        if args.dataset is None:
+            path = pathlib.Path(tmp_dir) / "synthetic.d"
+            t0 = time.perf_counter()
+            synthesize_tdf(path, n_frames=args.frames, peaks_per_frame=args.peaks, ms2_ratio=args.ms2_ratio, seed=args.seed)
+            meta["dataset"] = {
+                "synthetic": True, "frames": args.frames, "peaks_per_frame": args.peaks,
+                "ms2_ratio": args.ms2_ratio, "seed": args.seed,
+                "synthesis_time": time.perf_counter() - t0,
+            }
+        else:
+            path = args.dataset
+            meta["dataset"] = {"synthetic": False, "path": str(path)}
+
+        results = []
+        for name, params, fun, peaks in cases(path, tmp_dir, args.threads):
+            if args.select and not any(s in name for s in args.select):
+                continue
+            try:
+                result = summarize(name, params, measure(fun, args.repeats, args.min_time), peaks)
+            except Exception as e:
+                # Keep going: a broken case should not hide the timings of the others.
+                results.append({"name": name, "params": params, "error": repr(e)})
+                print(f"{name:28} {json.dumps(params):60} failed: {e!r}")
+                continue
+            results.append(result)
+            rate = f"{result['peaks_per_s'] / 1e6:10.1f} Mpeaks/s" if peaks else ""
+            print(f"{name:28} {json.dumps(params):60} {result['min'] * 1e3:10.2f} ms {rate}")
+
+    if args.output is not None:
+        args.output.write_text(json.dumps({"meta": meta, "results": results}, indent=1))
+
+    if args.compare is not None:
+        previous = {key(r): r for r in json.loads(args.compare.read_text())["results"]}
+        print(f"\nCompared with {args.compare} (ratio of minimal times, < 1 is faster):")
+        for result in results:
+            if "error" not in result and "min" in previous.get(key(result), {}):
+                ratio = result["min"] / previous[key(result)]["min"]
+                print(f"{result['name']:28} {json.dumps(result['params']):60} {ratio:6.2f}")
+
+
+if __name__ == "__main__":
+    main()
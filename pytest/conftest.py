@@ -0,0 +1,51 @@
+"""Synthetic datasets shared by the tests, see opentimspy.testing.synthesize_tdf."""
+import shutil
+
+import pytest
+
+from opentimspy import OpenTIMS, conversion_method
+from opentimspy.testing import synthesize_tdf
+
+# diaPASEF cycles of one MS1 and three MS2 frames.
+SYNTHETIC = dict(n_frames=22, peaks_per_frame=1000, ms2_ratio=0.75)
+
+
+@pytest.fixture(scope="session")
+def synthesize(tmp_path_factory):
+    """synthesize(**kwargs): path of a dataset made by synthesize_tdf with SYNTHETIC updated by kwargs.
+
+    Datasets are made once per session for each set of arguments; tests must not modify them (see synthetic_copy).
+    """
+    paths = {}
+
+    def synthesize(**kwargs):
+        params = {**SYNTHETIC, **kwargs}
+        key = tuple(sorted(params.items()))
+        if key not in paths:
+            paths[key] = synthesize_tdf(tmp_path_factory.mktemp("synthetic") / "synthetic.d", **params)
+        return paths[key]
+
+    return synthesize
+
+
+@pytest.fixture(scope="session")
+def synthetic_path(synthesize):
+    return synthesize()
+
+
+@pytest.fixture(scope="session")
+def pasef_path(synthesize):
+    return synthesize(n_frames=12, peaks_per_frame=300, acquisition="pasef")
+
+
+@pytest.fixture
+def synthetic_copy(synthetic_path, tmp_path):
+    """A copy of the synthetic dataset, for tests which modify it."""
+    return shutil.copytree(synthetic_path, tmp_path / "synthetic.d")
+
+
+@pytest.fixture(scope="module")
+def synthetic(synthetic_path):
+    """The synthetic dataset, opened with the open-source converters."""
+    with OpenTIMS(synthetic_path, cm=conversion_method.OpenSource) as ot:
+        yield ot
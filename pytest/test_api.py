@@ -4,6 +4,7 @@ from pathlib import Path
 import numpy as np
 import pytest
 
+import opentimspy
 from opentimspy import OpenTIMS, conversion_method
 
 data_path = Path(__file__).parent / "test.d"
@@ -152,3 +153,154 @@ def test_context_manager_closes():
     with OpenTIMS(data_path, cm=conversion_method.OpenSource) as handle:
         assert handle.handle is not None
     assert handle.handle is None
+
+
+# --- MS level selection ---
+
+COLUMNS = ("frame", "scan", "tof", "intensity")
+
+def _assert_same(a, b):
+    for c in COLUMNS:
+        assert np.array_equal(a[c], b[c])
+
+def test_ms_level_frames(ot):
+    assert list(ot.ms1_frames) == list(ot.frames["Id"][ot.ms_types == 0])
+    assert list(ot.ms2_frames) == list(ot.frames["Id"][ot.ms_types != 0])
+    assert list(ot.handle.ms_level_frames(0)) == list(ot.frames["Id"])
+    assert np.array_equal(ot.handle.ms_level_retention_times(1), ot.retention_times[ot.ms_types == 0])
+    with pytest.raises(ValueError):
+        ot.handle.ms_level_frames(3)
+
+@pytest.mark.parametrize("ms_level", [1, 2])
+def test_query_ms_level(ot, ms_level):
+    frames = ot.ms1_frames if ms_level == 1 else ot.ms2_frames
+    _assert_same(ot.query(columns=COLUMNS, ms_level=ms_level), ot.query(frames, columns=COLUMNS))
+    _assert_same(ot.query([1, 2], columns=COLUMNS, ms_level=ms_level), ot.query(frames, columns=COLUMNS))
+
+def test_rt_query_ms_level(ot):
+    rt = ot.retention_times
+    everything = (rt[0], rt[-1] + 1)
+    _assert_same(ot.rt_query(*everything, columns=COLUMNS), ot.query(columns=COLUMNS))
+    _assert_same(ot.rt_query(*everything, columns=COLUMNS, ms_level=2), ot.query(ot.ms2_frames, columns=COLUMNS))
+    assert len(ot.rt_query(rt[0], rt[1], columns="tof", ms_level=2)["tof"]) == 0
+    chunks = list(ot.rt_query_iter(*everything, columns=COLUMNS, ms_level=1))
+    assert len(chunks) == len(ot.ms1_frames)
+
+@pytest.mark.parametrize("max_peaks", [1, 5, 6, 10**9])
+def test_iter_chunks(ot, max_peaks):
+    chunks = list(ot.iter_chunks(columns=COLUMNS, max_peaks=max_peaks))
+    counts = ot.frames["NumPeaks"]
+    assert all(len(c["tof"]) <= max_peaks or len(np.unique(c["frame"])) == 1 for c in chunks)
+    assert len(chunks) == (1 if max_peaks >= counts.sum() else len(counts))
+    _assert_same({c: np.concatenate([ch[c] for ch in chunks]) for c in COLUMNS}, ot.query(columns=COLUMNS))
+
+def test_iter_chunks_ms_level(ot):
+    rt = ot.retention_times
+    chunks = list(ot.iter_chunks(columns=COLUMNS, ms_level=2, retention_time=(rt[0], rt[-1] + 1)))
+    assert len(chunks) == 1
+    _assert_same(chunks[0], ot.query(ot.ms2_frames, columns=COLUMNS))
+    assert list(ot.iter_chunks(columns=COLUMNS, ms_level=2, retention_time=(0, rt[1]))) == []
+
+
+# --- performance counters ---
+
+def test_stats():
+    with OpenTIMS(data_path, cm=conversion_method.OpenSource) as ot:
+        ot.query(frames=[1, 2])
+        assert not ot.stats()["enabled"]
+        assert all(s["calls"] == 0 for s in ot.stats()["stages"].values())
+
+        ot.enable_stats()
+        frames = ot.frames["Id"][:5]
+        data = ot.query(frames=frames)
+        stages = ot.stats()["stages"]
+        peaks = len(data["frame"])
+        assert stages["decompress"]["frames"] == len(frames)
+        assert stages["decode"]["peaks"] == peaks
+        assert stages["tof_to_mz"]["peaks"] == peaks
+        assert stages["scan_to_inv_ion_mobility"]["peaks"] == peaks
+        assert stages["allocation"]["peaks"] == peaks
+        assert stages["decompress"]["bytes_out"] > stages["decompress"]["bytes_in"] > 0
+        per_thread = ot.stats()["per_thread"]
+        assert sum(t["decode"]["peaks"] for t in per_thread.values() if "decode" in t) == peaks
+        # The calling thread has its own slot, apart from the workers'.
+        assert list(per_thread[0]) == ["allocation"]
+
+        ot.reset_stats()
+        assert all(s["calls"] == 0 for s in ot.stats()["stages"].values())
+        ot.enable_stats(False)
+        ot.query(frames=frames)
+        assert ot.stats()["per_thread"] == {}
+
+
+# --- memory budget ---
+
+def test_query_max_memory(ot, tmp_path):
+    frames = ot.frames["Id"][:3]
+    columns = ("frame", "scan", "tof", "intensity", "mz")
+    expected = ot.query(frames=frames, columns=columns)
+
+    in_ram = ot.query(frames=frames, columns=columns, max_memory=10**12)
+    assert not any(isinstance(a, np.memmap) for a in in_ram.values())
+
+    spilled = ot.query(frames=frames, columns=columns, max_memory=1)
+    assert all(isinstance(a, np.memmap) for a in spilled.values())
+    for c in columns:
+        np.testing.assert_array_equal(spilled[c], expected[c])
+
+    ot.query(frames=frames, columns=columns, max_memory=1, spill_dir=tmp_path)
+    np.testing.assert_array_equal(np.load(tmp_path / "tof.npy"), expected["tof"])
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f"{c}.npy" for c in columns)
+
+
+# --- compact dtypes and run-length columns ---
+
+def test_query_compact(ot):
+    frames = ot.frames["Id"][:4]
+    expected = ot.query(frames=frames)
+    compact = ot.query(frames=frames, compact=True)
+    assert compact["scan"].dtype == np.uint16
+    assert compact["mz"].dtype == np.float32
+    assert compact["inv_ion_mobility"].dtype == np.float32
+    assert compact["tof"].dtype == np.uint32
+    for c in ("frame", "scan", "tof", "intensity", "retention_time"):
+        np.testing.assert_array_equal(compact[c], expected[c])
+    np.testing.assert_allclose(compact["mz"], expected["mz"], rtol=1e-6)
+    np.testing.assert_allclose(compact["inv_ion_mobility"], expected["inv_ion_mobility"], rtol=1e-6)
+
+    float32_rt = ot.query(frames=frames, columns=("retention_time",), dtypes={"retention_time": np.float32})
+    assert float32_rt["retention_time"].dtype == np.float32
+
+    arrays = {"scan": np.empty(len(expected["scan"]), dtype=np.uint16)}
+    ot.query(frames=frames, columns=arrays)
+    np.testing.assert_array_equal(arrays["scan"], expected["scan"])
+
+    with pytest.raises(ValueError):
+        ot.query(frames=frames, dtypes={"tof": np.float32})
+
+
+def test_query_run_length(ot):
+    frames = ot.frames["Id"][[1, 0]]
+    expected = ot.query(frames=frames, columns=("frame", "retention_time", "tof"))
+    result = ot.query(frames=frames, columns=("frame", "retention_time", "tof"), run_length=True)
+    np.testing.assert_array_equal(result["tof"], expected["tof"])
+    ids, offsets = result["frame"]
+    times, offsets_rt = result["retention_time"]
+    np.testing.assert_array_equal(ids, frames)
+    np.testing.assert_array_equal(offsets, offsets_rt)
+    np.testing.assert_array_equal(np.repeat(ids, np.diff(offsets)), expected["frame"])
+    np.testing.assert_array_equal(np.repeat(times, np.diff(offsets)), expected["retention_time"])
+
+
+def test_query_repeated_frames_in_threads(synthetic):
+    opentimspy.set_num_threads(8)
+    try:
+        frame = synthetic.min_frame
+        single = synthetic.query(frames=[frame], columns=("scan", "tof", "intensity"))
+        # Threads decoding the same frame at once used to share its decompression state and crash.
+        for dtypes in [None, {"scan": np.uint16}] * 100:
+            repeated = synthetic.query(frames=[frame] * 64, columns=("scan", "tof", "intensity"), dtypes=dtypes)
+            for c, v in single.items():
+                np.testing.assert_array_equal(repeated[c], np.tile(v, 64))
+    finally:
+        opentimspy.set_num_threads(0)
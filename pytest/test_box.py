@@ -0,0 +1,111 @@
+"""Tests for box queries and chromatograms pruned with zone maps."""
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from opentimspy import OpenTIMS, conversion_method
+
+data_path = Path(__file__).parent / "test.d"
+
+
+@pytest.fixture(scope="module")
+def ot():
+    with OpenTIMS(data_path, cm=conversion_method.OpenSource) as handle:
+        yield handle
+
+
+def _expected(ot, frames=None, scan=None, tof=None, mz=None, inv_ion_mobility=None, min_intensity=0):
+    data = ot.query(frames)
+    mask = data["intensity"] >= min_intensity
+    for column, bounds in (("scan", scan), ("tof", tof), ("mz", mz), ("inv_ion_mobility", inv_ion_mobility)):
+        if bounds is not None:
+            mask &= (bounds[0] <= data[column]) & (data[column] < bounds[1])
+    return {c: v[mask] for c, v in data.items()}
+
+
+def _boxes(ot):
+    data = ot.query()
+    tof_mid = int(np.median(data["tof"]))
+    scan_mid = int(np.median(data["scan"]))
+    mz_mid = float(np.median(data["mz"]))
+    im_mid = float(np.median(data["inv_ion_mobility"]))
+    return [
+        {},
+        {"tof": (0, tof_mid)},
+        {"tof": (tof_mid, tof_mid + 1)},
+        {"scan": (scan_mid, 10**6)},
+        {"min_intensity": int(np.median(data["intensity"]))},
+        {"mz": (mz_mid, 10**4)},
+        {"mz": (0.0, mz_mid)},
+        {"inv_ion_mobility": (im_mid, 10.0)},
+        {"inv_ion_mobility": (0.0, im_mid), "mz": (mz_mid, 10**4)},
+        {"tof": (10**9, 10**9 + 1)},
+    ]
+
+
+def test_box_query_matches_filtered_query(ot):
+    for box in _boxes(ot):
+        expected = _expected(ot, **box)
+        result = ot.box_query(**box)
+        for column, values in expected.items():
+            assert np.array_equal(result[column], values), (box, column)
+
+
+def test_box_query_selected_frames(ot):
+    frame = ot.frames["Id"][-1]
+    result = ot.box_query(frame, columns=("frame", "tof"))
+    assert list(result) == ["frame", "tof"]
+    assert np.array_equal(result["tof"], ot.query(frame, "tof")["tof"])
+
+
+def test_chromatogram(ot):
+    for box in _boxes(ot):
+        chrom = ot.chromatogram(**box)
+        assert np.array_equal(chrom["frame"], ot.frames["Id"])
+        for frame, intensity in zip(chrom["frame"], chrom["intensity"]):
+            assert intensity == _expected(ot, frames=frame, **box)["intensity"].sum(), box
+
+
+def test_zone_maps_prune_frames(ot):
+    stats = ot.frame_stats
+    ot._ensure_zone_maps()
+    frames = ot.frames["Id"].astype(np.uint32)
+    top = int(stats["max_tof"].max())
+    no_limit = [np.iinfo(np.uint32).max]
+    assert list(ot.handle.frames_in_box(frames, [0], no_limit, [0], no_limit, [0])) == list(frames[stats["tic"] > 0])
+    assert len(ot.handle.frames_in_box(frames, [0], no_limit, [top + 1], no_limit, [0])) == 0
+    assert len(ot.handle.frames_in_box(frames, [0], no_limit, [0], no_limit, [int(stats["max_intensity"].max()) + 1])) == 0
+    busiest = frames[np.argmax(stats["max_tof"])]
+    assert list(ot.handle.frames_in_box(frames, [0], no_limit, [top], no_limit, [0])) == [busiest]
+
+
+def test_box_query_does_not_decode_other_frames(synthetic_path):
+    with OpenTIMS(synthetic_path, cm=conversion_method.NoConversion) as fresh:
+        fresh.enable_stats()
+        frame = fresh.frames["Id"][3]
+        top = int(fresh.frames["MaxIntensity"][3])
+        assert len(fresh.box_query(frame, min_intensity=top + 1, columns="intensity")["intensity"]) == 0
+        # Pruned by the Frames table bound, which is MaxIntensity + 1.
+        assert len(fresh.box_query(frame, min_intensity=top + 2, columns="intensity")["intensity"]) == 0
+        brightest = fresh.box_query(frame, min_intensity=top, columns="intensity")["intensity"]
+        assert len(brightest) > 0 and np.all(brightest == top)
+        assert fresh.chromatogram(frame, tof=(0, 10**9))["intensity"][0] == fresh.frames["SummedIntensities"][3]
+        assert fresh.stats()["stages"]["decompress"]["frames"] == 3
+        assert "frame_stats" not in fresh.__dict__
+
+
+def test_box_query_with_understated_max_intensity(synthetic_copy):
+    # Bounds from a Frames table off by rounding may only let more frames through.
+    with sqlite3.connect(synthetic_copy / "analysis.tdf") as conn:
+        conn.execute("UPDATE Frames SET MaxIntensity = MaxIntensity - 1, AccumulationTime = 300")
+    with OpenTIMS(synthetic_copy, cm=conversion_method.NoConversion) as fresh:
+        data = fresh.query(columns=("frame", "intensity"))
+        # The brightest peak of each frame is at its zone map bound.
+        for top in np.unique([data["intensity"][data["frame"] == frame].max() for frame in fresh.frames["Id"]]):
+            result = fresh.box_query(min_intensity=int(top), columns=("frame", "intensity"))
+            mask = data["intensity"] >= top
+            for column in ("frame", "intensity"):
+                assert np.array_equal(result[column], data[column][mask]), top
+        assert "frame_stats" not in fresh.__dict__
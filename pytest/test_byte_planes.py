@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from opentimspy.opentimspy_cpp import byte_plane_implementations, transpose_byte_planes
+
+
+@pytest.mark.parametrize("implementation", ["auto"] + byte_plane_implementations())
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 33, 100, 1027])
+def test_transpose_byte_planes(implementation, size):
+    values = np.random.default_rng(size).integers(0, 2**32, size=size, dtype=np.uint32)
+    planes = values.view(np.uint8).reshape(size, 4).T.ravel()
+    np.testing.assert_array_equal(transpose_byte_planes(planes, implementation), values)
+
+
+def test_unavailable_implementation():
+    with pytest.raises(ValueError):
+        transpose_byte_planes(np.zeros(4, dtype=np.uint8), "no_such_thing")
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from opentimspy import CachedTIMS
+
+columns = ("frame", "scan", "tof", "intensity", "mz")
+
+
+@pytest.fixture(scope="module")
+def cached(synthetic, tmp_path_factory):
+    with synthetic.build_cache(tmp_path_factory.mktemp("cache") / "run.cache", columns=columns) as cache:
+        yield cache
+
+
+def test_query_matches(synthetic, cached):
+    frames = synthetic.frames["Id"]
+    for selection in (None, frames[3:7], frames[[8, 1, 5]], frames[4], frames[:0]):
+        expected = synthetic.query(selection, columns + ("retention_time",))
+        got = cached.query(selection, columns + ("retention_time",))
+        for column in expected:
+            np.testing.assert_array_equal(got[column], expected[column])
+    for ms_level in (1, 2):
+        expected = synthetic.query(columns=columns, ms_level=ms_level)
+        got = cached.query(columns=columns, ms_level=ms_level)
+        np.testing.assert_array_equal(got["tof"], expected["tof"])
+
+
+def test_consecutive_frames_are_views(synthetic, cached):
+    X = cached.query(synthetic.frames["Id"][2:6], columns=("tof", "mz"))
+    assert all(isinstance(a, np.memmap) and not a.flags.writeable for a in X.values())
+
+
+def test_rt_query_and_frame_array(synthetic, cached):
+    times = synthetic.frames["Time"]
+    low, high = times[2], times[9]
+    expected = synthetic.rt_query(low, high, columns=columns)
+    got = cached.rt_query(low, high, columns=columns)
+    for column in columns:
+        np.testing.assert_array_equal(got[column], expected[column])
+    frame = synthetic.frames["Id"][5]
+    np.testing.assert_array_equal(cached.frame_array(frame), synthetic.frame_array(frame))
+    with pytest.raises(IndexError):
+        cached.frame_array(10_000)
+    with pytest.raises(ValueError):
+        cached.query(columns=("inv_ion_mobility",))
+
+
+def test_compact_and_reopen(synthetic, tmp_path):
+    path = tmp_path / "compact.cache"
+    synthetic.build_cache(path, columns=("scan", "mz"), compact=True).close()
+    with CachedTIMS(path) as cache:
+        assert cache.query(columns="scan")["scan"].dtype == np.uint16
+        assert cache.query(columns="mz")["mz"].dtype == np.float32
+        np.testing.assert_array_equal(cache.query(columns="scan")["scan"], synthetic.query(columns="scan")["scan"])
+    (path / "cache.json").unlink()
+    with pytest.raises(ValueError):
+        CachedTIMS(path)
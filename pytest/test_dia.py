@@ -0,0 +1,125 @@
+"""Tests for diaPASEF window-aware extraction."""
+import shutil
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from opentimspy import OpenTIMS, conversion_method
+
+data_path = Path(__file__).parent / "test.d"
+
+# (WindowGroup, ScanNumBegin, ScanNumEnd, IsolationMz, IsolationWidth)
+WINDOWS = [
+    (1, 0, 300, 500.0, 25.0),
+    (1, 250, 600, 525.0, 25.0),
+    (1, 650, 918, 550.0, 25.0),
+    (2, 0, 918, 800.0, 25.0),
+]
+COLUMNS = ("frame", "scan", "tof", "intensity")
+
+
+@pytest.fixture(scope="module")
+def dia_dataset(tmp_path_factory):
+    path = tmp_path_factory.mktemp("dia") / "test.d"
+    shutil.copytree(data_path, path)
+    with sqlite3.connect(path / "analysis.tdf") as conn:
+        conn.execute("DELETE FROM DiaFrameMsMsWindows")
+        conn.executemany(
+            "INSERT INTO DiaFrameMsMsWindows VALUES (?, ?, ?, ?, ?, 30.0)", WINDOWS
+        )
+    return path
+
+
+def _expected(ot, windows, frames=(2,)):
+    data = ot.query(list(frames), columns=COLUMNS)
+    mask = np.zeros(len(data["scan"]), dtype=bool)
+    for _, begin, end, _, _ in windows:
+        mask |= (data["scan"] >= begin) & (data["scan"] < end)
+    return {c: v[mask] for c, v in data.items()}
+
+
+def test_dia_windows(dia_dataset):
+    with OpenTIMS(dia_dataset, cm=conversion_method.NoConversion) as ot:
+        dia = ot.dia_windows
+        assert list(dia.frames) == [2]
+        assert list(dia.frame_groups) == [1]
+        assert list(dia.frame_cycles) == [0]
+        assert list(dia.window_groups) == [1, 2]
+        assert [dia.window(i) for i in dia.group_windows(1)] == [tuple(w) for w in WINDOWS[:3]]
+        assert list(dia.select_windows(isolation_mz=(515.0, 540.0))) == [1, 2]
+
+
+@pytest.mark.parametrize(
+    "isolation_mz, windows",
+    [(None, WINDOWS[:3]), ((530.0, 540.0), WINDOWS[1:3]), ((505.0, 510.0), WINDOWS[:2])],
+)
+def test_dia_query(dia_dataset, isolation_mz, windows):
+    with OpenTIMS(dia_dataset, cm=conversion_method.NoConversion) as ot:
+        res = ot.dia_query(1, isolation_mz=isolation_mz, columns=COLUMNS)
+        expected = _expected(ot, windows)
+        for c in COLUMNS:
+            assert np.array_equal(res[c], expected[c])
+
+
+def test_dia_query_retention_time(dia_dataset):
+    with OpenTIMS(dia_dataset, cm=conversion_method.NoConversion) as ot:
+        rt = ot.retention_times[1]
+        assert len(ot.dia_query(columns="tof", retention_time=(rt, rt + 1))["tof"]) > 0
+        assert len(ot.dia_query(columns="tof", retention_time=(0, rt))["tof"]) == 0
+        assert len(ot.dia_query(2, columns="tof")["tof"]) == 0
+
+
+def test_dia_slabs(dia_dataset):
+    with OpenTIMS(dia_dataset, cm=conversion_method.NoConversion) as ot:
+        slabs = list(ot.dia_slabs(columns=COLUMNS))
+        assert [(cycle, tuple(window)) for cycle, window, _ in slabs] == [(0, w) for w in WINDOWS[:3]]
+        for _, window, data in slabs:
+            expected = _expected(ot, [window])
+            for c in COLUMNS:
+                assert np.array_equal(data[c], expected[c])
+
+
+def test_dia_many_cycles(synthetic_path):
+    with OpenTIMS(synthetic_path, cm=conversion_method.NoConversion) as ot:
+        dia = ot.dia_windows
+        data = ot.query(dia.frames, columns=COLUMNS)
+        groups = dia.frame_groups[np.searchsorted(dia.frames, data["frame"])]
+        in_window = np.zeros((len(dia), len(data["scan"])), dtype=bool)
+        for w in range(len(dia)):
+            in_window[w] = (groups == dia.group[w]) & (dia.scan_begin[w] <= data["scan"]) & (data["scan"] < dia.scan_end[w])
+        res = ot.dia_query(columns=COLUMNS)
+        for c in COLUMNS:
+            assert np.array_equal(res[c], data[c][in_window.any(axis=0)])
+        cycles = dia.frame_cycles[np.searchsorted(dia.frames, data["frame"])]
+        slabs = list(ot.dia_slabs(columns=COLUMNS))
+        assert len({cycle for cycle, _, _ in slabs}) == len(np.unique(dia.frame_cycles))
+        for cycle, window, slab in slabs:
+            w = [tuple(dia.window(i)) for i in range(len(dia))].index(tuple(window))
+            mask = in_window[w] & (cycles == cycle)
+            for c in COLUMNS:
+                assert np.array_equal(slab[c], data[c][mask])
+
+
+def test_not_dia(tmp_path):
+    path = tmp_path / "test.d"
+    shutil.copytree(data_path, path)
+    with sqlite3.connect(path / "analysis.tdf") as conn:
+        conn.execute("DROP TABLE DiaFrameMsMsInfo")
+    with OpenTIMS(path, cm=conversion_method.NoConversion) as ot:
+        with pytest.raises(RuntimeError):
+            ot.dia_query(columns="tof")
+
+
+def test_extract_scan_ranges():
+    with OpenTIMS(data_path, cm=conversion_method.NoConversion) as ot:
+        frames = np.array([1, 1, 2], dtype=np.uint32)
+        begins = np.array([0, 400, 100], dtype=np.uint32)
+        ends = np.array([400, 2000, 0], dtype=np.uint32)
+        offsets, data = ot.handle.extract_scan_ranges(frames, begins, ends)
+        assert offsets[-1] == len(data["tof"])
+        expected = ot.query(1, columns=COLUMNS)
+        assert offsets[2] == len(expected["tof"]) and offsets[3] == offsets[2]
+        for c in COLUMNS:
+            assert np.array_equal(data[c], expected[c])
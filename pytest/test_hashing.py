@@ -0,0 +1,64 @@
+"""Tests for native frame hashing."""
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import opentimspy
+from opentimspy import OpenTIMS, conversion_method
+from opentimspy.opentimspy_cpp import merkle_root
+
+data_path = Path(__file__).parent / "test.d"
+raw_columns = ("frame", "scan", "tof", "intensity")
+
+
+def test_blake2b_matches_hashlib(synthetic):
+    digests = synthetic.frame_digests(algo="blake2b")
+    assert digests.shape == (synthetic.frames_no, 32)
+    for frame, digest in zip(synthetic.frames["Id"], digests):
+        X = synthetic.query(frame, columns=raw_columns)
+        expected = hashlib.blake2b(b"".join(X[c].tobytes() for c in raw_columns), digest_size=32).digest()
+        assert digest.tobytes() == expected
+
+    X = synthetic.query(3, columns=("scan", "intensity"))
+    expected = hashlib.blake2b(X["scan"].tobytes() + X["intensity"].tobytes(), digest_size=32).digest()
+    assert synthetic.frame_digests(3, "blake2b", ("intensity", "scan"))[0].tobytes() == expected
+
+
+def test_xxh64_matches_xxhash(synthetic):
+    xxhash = pytest.importorskip("xxhash")
+    digests = synthetic.get_hashes(algo="xxh64")
+    for frame, digest in zip(synthetic.frames["Id"], digests):
+        X = synthetic.query(frame, columns=raw_columns)
+        assert digest == xxhash.xxh64(b"".join(X[c].tobytes() for c in raw_columns)).digest()
+
+
+def test_merkle_root(synthetic):
+    digests = synthetic.frame_digests(algo="blake2b")
+    level = [d.tobytes() for d in digests]
+    while len(level) > 1:
+        pairs = [hashlib.blake2b(b"\x01" + a + b, digest_size=32).digest() for a, b in zip(level[::2], level[1::2])]
+        level = pairs + level[len(pairs) * 2 :]
+    assert synthetic.get_hash(algo="blake2b") == level[0]
+    assert merkle_root(np.empty((0, 8), dtype=np.uint8), "xxh64") == bytes.fromhex("ef46db3751d8e999")
+
+
+def test_digests_do_not_depend_on_threads(synthetic):
+    opentimspy.set_num_threads(1)
+    try:
+        single = synthetic.get_hash(algo="xxh64")
+    finally:
+        opentimspy.set_num_threads(0)
+    assert synthetic.get_hash(algo="xxh64") == single
+
+
+def test_legacy_hashes_unchanged():
+    with OpenTIMS(data_path, cm=conversion_method.OpenSource) as ot:
+        h = hashlib.blake2b()
+        for X in ot.query_iter(frames=slice(ot.min_frame, ot.max_frame + 1), columns=raw_columns):
+            for c in raw_columns:
+                h.update(X[c])
+        assert ot.get_hash() == h.digest()
+        with pytest.raises(ValueError):
+            ot.frame_digests(algo="md5")
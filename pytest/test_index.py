@@ -0,0 +1,113 @@
+"""Tests for the persistent sidecar index."""
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from opentimspy import OpenTIMS, conversion_method
+from opentimspy.index import TimsIndex, default_index_path, load_index
+
+data_path = Path(__file__).parent / "test.d"
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "test.d"
+    shutil.copytree(data_path, path)
+    return path
+
+
+def _same_dataset(a, b):
+    assert a.GlobalMetadata == b.GlobalMetadata
+    assert list(a.frames) == list(b.frames)
+    for col in a.frames:
+        assert np.array_equal(a.frames[col], b.frames[col])
+    qa, qb = a.query(), b.query()
+    for col in qa:
+        assert np.array_equal(qa[col], qb[col])
+
+
+def test_index_built_and_reused(dataset):
+    index_path = default_index_path(dataset)
+    with OpenTIMS(dataset, cm=conversion_method.OpenSource, index=True) as built:
+        assert built.index is None
+        assert index_path.exists()
+        built_stats = built.frame_stats
+        with OpenTIMS(dataset, cm=conversion_method.OpenSource, index=True) as reused:
+            assert reused.index is not None
+            _same_dataset(built, reused)
+            for stat, values in built_stats.items():
+                assert np.array_equal(reused.frame_stats[stat], values)
+            assert np.array_equal(reused.framesTIC(), built.framesTIC())
+
+
+def test_frame_stats_match_data():
+    with OpenTIMS(data_path, cm=conversion_method.NoConversion) as ot:
+        stats = ot.frame_stats
+        for i, frame in enumerate(ot.frames["Id"]):
+            data = ot.query(frame, ("scan", "tof", "intensity"))
+            if len(data["tof"]) == 0:
+                assert stats["tic"][i] == 0 and stats["max_tof"][i] == 0
+                continue
+            assert stats["tic"][i] == data["intensity"].sum()
+            assert stats["max_intensity"][i] == data["intensity"].max()
+            assert stats["min_tof"][i] == data["tof"].min()
+            assert stats["max_tof"][i] == data["tof"].max()
+            assert stats["min_scan"][i] == data["scan"].min()
+            assert stats["max_scan"][i] == data["scan"].max()
+
+
+def test_stale_index_is_rebuilt(dataset):
+    with OpenTIMS(dataset, cm=conversion_method.NoConversion, index=True):
+        pass
+    index_path = default_index_path(dataset)
+    assert load_index(index_path, dataset) is not None
+
+    tdf_bin = dataset / "analysis.tdf_bin"
+    st = tdf_bin.stat()
+    os.utime(tdf_bin, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert load_index(index_path, dataset) is None
+
+    with OpenTIMS(dataset, cm=conversion_method.NoConversion, index=True) as ot:
+        assert ot.index is None
+    assert load_index(index_path, dataset) is not None
+
+
+def test_index_in_cache_dir(dataset, tmp_path):
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    with OpenTIMS(dataset, cm=conversion_method.NoConversion, index=cache):
+        pass
+    assert default_index_path(dataset, cache).exists()
+    assert not default_index_path(dataset).exists()
+    with OpenTIMS(dataset, cm=conversion_method.NoConversion, index=cache) as ot:
+        assert ot.index is not None
+
+
+def test_corrupt_index_is_ignored(dataset):
+    index_path = default_index_path(dataset)
+    index_path.write_bytes(b"not an index")
+    with pytest.raises(ValueError):
+        TimsIndex(index_path)
+    assert load_index(index_path, dataset) is None
+    with OpenTIMS(dataset, cm=conversion_method.NoConversion, index=True) as ot:
+        assert ot.index is None
+    assert load_index(index_path, dataset) is not None
+
+
+def test_index_keeps_sql_nulls(dataset):
+    with sqlite3.connect(dataset / "analysis.tdf") as db:
+        db.execute("ALTER TABLE Frames ADD COLUMN Comment TEXT")
+        db.execute("UPDATE Frames SET Comment = 'checked' WHERE Id = (SELECT MIN(Id) FROM Frames)")
+    db.close()
+    with OpenTIMS(dataset, cm=conversion_method.NoConversion) as plain:
+        expected = plain.frames["Comment"]
+    assert None in list(expected)
+    with OpenTIMS(dataset, cm=conversion_method.NoConversion, index=True):
+        pass
+    with OpenTIMS(dataset, cm=conversion_method.NoConversion, index=True) as indexed:
+        assert indexed.index is not None
+        assert list(indexed.frames["Comment"]) == list(expected)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from opentimspy import OpenTIMS, conversion_method
+
+raw_columns = ("frame", "scan", "tof", "intensity")
+
+
+@pytest.mark.parametrize("mode", ["mmap", "pread"])
+@pytest.mark.parametrize("access", ["auto", "normal", "sequential", "random"])
+@pytest.mark.parametrize("readahead", [0, 10_000, None])
+def test_io_settings_keep_results(synthetic_path, mode, access, readahead):
+    with OpenTIMS(synthetic_path, cm=conversion_method.OpenSource) as ot:
+        frames = ot.frames["Id"]
+        expected = ot.query(frames, columns=raw_columns)
+        expected_digests = ot.frame_digests()
+
+        ot.set_io(mode=mode, access=access, readahead=readahead)
+        assert ot.io_settings()["mode"] == mode
+        assert ot.io_settings()["access"] == access
+        for order in (frames, frames[::-1]):
+            X = ot.query(order, columns=raw_columns)
+            Y = ot.query(sorted(order), columns=raw_columns)
+            for column in raw_columns:
+                np.testing.assert_array_equal(Y[column], expected[column])
+            assert len(X["frame"]) == len(expected["frame"])
+        compact = ot.query(frames, columns=("scan", "tof"), compact=True)
+        np.testing.assert_array_equal(compact["tof"], expected["tof"])
+        np.testing.assert_array_equal(ot.frame_digests(), expected_digests)
+        assert ot.verify() == []
+
+
+def test_io_settings_validation(synthetic_path):
+    with OpenTIMS(synthetic_path) as ot:
+        assert ot.io_settings() == {"mode": "mmap", "access": "auto", "readahead": 64 * 1024 * 1024}
+        with pytest.raises(ValueError):
+            ot.set_io(mode="carrier_pigeon")
+        with pytest.raises(ValueError):
+            ot.set_io(access="backwards")
+        ot.set_io(readahead=0)
+        assert ot.io_settings()["readahead"] == 0
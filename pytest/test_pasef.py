@@ -0,0 +1,82 @@
+"""Tests for DDA-PASEF fragment spectra extraction."""
+import shutil
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from opentimspy import OpenTIMS, conversion_method
+
+data_path = Path(__file__).parent / "test.d"
+
+# (Frame, ScanNumBegin, ScanNumEnd, Precursor)
+WINDOWS = [
+    (1, 0, 400, 1),
+    (2, 300, 918, 1),
+    (2, 0, 918, 2),
+    (1, 450, 460, 3),
+    (1, 0, 918, 4),
+    (2, 0, 918, 4),
+]
+
+
+@pytest.fixture(scope="module")
+def pasef_dataset(tmp_path_factory):
+    path = tmp_path_factory.mktemp("pasef") / "test.d"
+    shutil.copytree(data_path, path)
+    with sqlite3.connect(path / "analysis.tdf") as conn:
+        conn.execute(
+            "CREATE TABLE PasefFrameMsMsInfo (Frame INTEGER, ScanNumBegin INTEGER, ScanNumEnd INTEGER, "
+            "IsolationMz REAL, IsolationWidth REAL, CollisionEnergy REAL, Precursor INTEGER)"
+        )
+        conn.executemany(
+            "INSERT INTO PasefFrameMsMsInfo VALUES (?, ?, ?, 500.0, 2.0, 30.0, ?)", WINDOWS
+        )
+    return path
+
+
+def _expected_spectrum(ot, precursor):
+    tofs, intensities = [], []
+    for frame, begin, end, prec in WINDOWS:
+        if prec == precursor:
+            data = ot.query(frame, ("scan", "tof", "intensity"))
+            mask = (begin <= data["scan"]) & (data["scan"] < end)
+            tofs.append(data["tof"][mask])
+            intensities.append(data["intensity"][mask])
+    tofs = np.concatenate(tofs)
+    intensities = np.concatenate(intensities).astype(np.uint64)
+    unique_tofs, inverse = np.unique(tofs, return_inverse=True)
+    return unique_tofs, np.bincount(inverse, weights=intensities).astype(np.uint64)
+
+
+def test_pasef_spectra(pasef_dataset):
+    with OpenTIMS(pasef_dataset, cm=conversion_method.OpenSource) as ot:
+        spectra = ot.pasef_spectra()
+        assert list(spectra["precursor"]) == [1, 2, 3, 4]
+        offsets = spectra["offsets"]
+        assert len(offsets) == 5 and offsets[0] == 0 and offsets[-1] == len(spectra["tof"])
+        for ii, precursor in enumerate(spectra["precursor"]):
+            tofs, intensities = _expected_spectrum(ot, precursor)
+            span = slice(offsets[ii], offsets[ii + 1])
+            assert np.array_equal(spectra["tof"][span], tofs)
+            assert np.array_equal(spectra["intensity"][span], intensities)
+            first_frame = min(f for f, _, _, p in WINDOWS if p == precursor)
+            assert np.allclose(spectra["mz"][span], ot.tof_to_mz(tofs, np.full(len(tofs), first_frame)))
+
+
+def test_pasef_spectra_selected_precursors(pasef_dataset):
+    with OpenTIMS(pasef_dataset, cm=conversion_method.NoConversion) as ot:
+        spectra = ot.pasef_spectra([4, 1, 99], columns=("tof", "intensity"))
+        assert list(spectra) == ["precursor", "offsets", "tof", "intensity"]
+        assert list(spectra["precursor"]) == [4, 1, 99]
+        offsets = spectra["offsets"]
+        assert offsets[3] == offsets[2]
+        assert np.array_equal(spectra["tof"][offsets[0]:offsets[1]], _expected_spectrum(ot, 4)[0])
+        assert np.array_equal(spectra["tof"][offsets[1]:offsets[2]], _expected_spectrum(ot, 1)[0])
+
+
+def test_pasef_spectra_requires_pasef_tables():
+    with OpenTIMS(data_path, cm=conversion_method.NoConversion) as ot:
+        with pytest.raises(RuntimeError):
+            ot.pasef_spectra()
@@ -0,0 +1,112 @@
+"""Tests for native frame binning and batch rendering of frames to PNG files."""
+import struct
+import time
+import zlib
+
+import numpy as np
+import pytest
+
+from opentimspy import plotting
+
+
+def _decode_png(data):
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks, pos = {}, 8
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos : pos + 4])
+        tag, body = data[pos + 4 : pos + 8], data[pos + 8 : pos + 8 + length]
+        (crc,) = struct.unpack(">I", data[pos + 8 + length : pos + 12 + length])
+        assert crc == zlib.crc32(tag + body)
+        chunks[tag] = chunks.get(tag, b"") + body
+        pos += 12 + length
+    width, height, depth, color_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert depth == 8
+    channels = 3 if color_type == 2 else 1
+    rows = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, -1)
+    assert np.all(rows[:, 0] == 0)
+    pixels = rows[:, 1:].reshape(height, width, channels)
+    return pixels[:, :, 0] if channels == 1 else pixels
+
+
+@pytest.mark.parametrize("x_axis, x_range, x_resolution", [("mz", (100.0, 1700.0), 2.5), ("tof", (0, 400000), 1000)])
+def test_frame_images_match_mk_bitmap(synthetic, x_axis, x_range, x_resolution):
+    frames = synthetic.frames["Id"][:5]
+    scan_range = (10, 600)
+    images = synthetic.frame_images(frames, x_axis, x_range, x_resolution, scan_range)
+    if x_axis == "tof":  # mk_bitmap only knows how to bin mz and scan
+        plotting.transformations["tof"] = plotting.float_to_idx
+    try:
+        for frame, image in zip(frames, images):
+            expected = plotting.mk_bitmap(
+                synthetic.query(frame, columns=("scan", x_axis, "intensity")),
+                axes=[x_axis, "scan"],
+                xax_min=x_range[0],
+                xax_max=x_range[1],
+                xax_res=x_resolution,
+                yax_min=scan_range[0],
+                yax_max=scan_range[1],
+            )
+            np.testing.assert_array_equal(image, expected.T)
+    finally:
+        plotting.transformations.pop("tof", None)
+
+
+def test_frame_images_default_grid_keeps_all_peaks(synthetic):
+    frames = synthetic.frames["Id"][:3]
+    images = synthetic.frame_images(frames, "tof", (0, 2**20), 64)
+    assert images.shape == (3, synthetic.max_scan + 1, 2**14 + 1)
+    tics = [synthetic.query(frame, columns="intensity")["intensity"].sum() for frame in frames]
+    np.testing.assert_array_equal(images.sum(axis=(1, 2)), tics)
+
+
+def test_encode_png_roundtrip():
+    rng = np.random.default_rng(0)
+    gray = rng.integers(0, 256, size=(7, 13), dtype=np.uint8)
+    rgb = rng.integers(0, 256, size=(5, 3, 3), dtype=np.uint8)
+    np.testing.assert_array_equal(_decode_png(plotting.encode_png(gray)), gray)
+    np.testing.assert_array_equal(_decode_png(plotting.encode_png(rgb, compress_level=1)), rgb)
+
+
+def test_render_frames(synthetic, tmp_path):
+    frames = synthetic.frames["Id"][:7]
+    paths = list(
+        plotting.render_frames(
+            synthetic, frames, tmp_path, x_range=(100.0, 1700.0), x_resolution=4.0, cmap=None, batch_size=3, workers=2
+        )
+    )
+    assert paths == [tmp_path / f"frame_{frame:06d}.png" for frame in frames]
+    images = synthetic.frame_images(frames, "mz", (100.0, 1700.0), 4.0)
+    for path, image in zip(paths, images):
+        expected = plotting.image_pixels(image, synthetic.max_intensity)
+        np.testing.assert_array_equal(_decode_png(path.read_bytes()), expected)
+
+
+def test_encoding_overlaps_binning(synthetic, tmp_path, monkeypatch):
+    # Encoding is pure Python here, so it only makes progress while binning releases the GIL.
+    binned, encoded = [], []
+    frame_images = synthetic.frame_images
+
+    def timed_frame_images(*args):
+        start = time.perf_counter()
+        images = frame_images(*args)
+        binned.append((start, time.perf_counter()))
+        return images
+
+    def slow_encode_png(pixels, compress_level):
+        for _ in range(1000):
+            encoded.append(time.perf_counter())
+        return b""
+
+    monkeypatch.setattr(synthetic, "frame_images", timed_frame_images)
+    monkeypatch.setattr(plotting, "encode_png", slow_encode_png)
+    frames = np.tile(synthetic.frames["Id"], 150)
+    list(
+        plotting.render_frames(
+            synthetic, frames, tmp_path, x_range=(100.0, 1700.0), x_resolution=4.0, scan_range=(0, 3),
+            cmap=None, batch_size=len(frames) // 2, workers=2,
+        )
+    )
+    # The first batch is encoded all the while the second one is binned: no long pause in encoding.
+    start, end = binned[1]
+    pauses = np.diff([start] + [t for t in encoded if start < t < end] + [end])
+    assert pauses.max() < (end - start) / 2
@@ -0,0 +1,128 @@
+"""Tests for the shared handle pool."""
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from opentimspy import HandlePool, OpenTIMS, conversion_method
+from opentimspy.trace import trace
+
+data_path = Path(__file__).parent / "test.d"
+
+
+@pytest.fixture
+def datasets(tmp_path):
+    paths = []
+    for ii in range(3):
+        path = tmp_path / f"run{ii}.d"
+        shutil.copytree(data_path, path)
+        paths.append(path)
+    return paths
+
+
+def test_shared_handle_is_reused(datasets):
+    pool = HandlePool()
+    with pool.open(datasets[0], cm=conversion_method.NoConversion) as a:
+        with pool.open(datasets[0], cm=conversion_method.NoConversion) as b:
+            assert a is not b
+            assert a.handle is b.handle
+            assert np.array_equal(a.query(columns="tof")["tof"], b.query(columns="tof")["tof"])
+    with pool.open(datasets[0], cm=conversion_method.NoConversion) as c:
+        assert len(c) == len(OpenTIMS(datasets[0], cm=conversion_method.NoConversion))
+    assert pool.stats()["hits"] == 2
+    assert pool.stats()["misses"] == 1
+    assert pool.stats()["in_use"] == 0
+
+
+def test_key_includes_conversion_method(datasets):
+    pool = HandlePool()
+    with pool.open(datasets[0], cm=conversion_method.NoConversion) as a:
+        with pool.open(datasets[0], cm=conversion_method.OpenSource) as b:
+            assert a.handle is not b.handle
+    assert len(pool) == 2
+
+
+def test_lru_eviction_skips_handles_in_use(datasets):
+    pool = HandlePool(max_handles=1)
+    in_use = pool.open(datasets[0], cm=conversion_method.NoConversion)
+    with pool.open(datasets[1], cm=conversion_method.NoConversion):
+        assert len(pool) == 2
+    # datasets[1] is idle now and gets evicted; datasets[0] is still in use.
+    assert len(pool) == 1
+    with pool.open(datasets[2], cm=conversion_method.NoConversion):
+        pass
+    in_use.close()
+    assert len(pool) == 1
+    assert pool.stats()["evictions"] == 2
+
+
+def test_changed_files_are_reopened(datasets):
+    pool = HandlePool()
+    old = pool.open(datasets[0], cm=conversion_method.NoConversion)
+    tdf_bin = datasets[0] / "analysis.tdf_bin"
+    st = tdf_bin.stat()
+    os.utime(tdf_bin, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    with pool.open(datasets[0], cm=conversion_method.NoConversion) as new:
+        assert new.handle is not old.handle
+        assert len(old.query(columns="tof")["tof"]) == len(new.query(columns="tof")["tof"])
+    old.close()
+    assert pool.stats()["misses"] == 2
+
+
+def test_open_shared_uses_default_pool():
+    with OpenTIMS.open_shared(data_path, cm=conversion_method.NoConversion) as a:
+        with OpenTIMS.open_shared(data_path, cm=conversion_method.NoConversion) as b:
+            assert a.handle is b.handle
+
+
+def test_handle_settings_are_pool_wide(datasets):
+    pool = HandlePool(io={"mode": "pread", "readahead": 0}, stats=True)
+    with pool.open(datasets[0], cm=conversion_method.NoConversion) as a:
+        with pool.open(datasets[0], cm=conversion_method.NoConversion) as b:
+            assert a.io_settings() == b.io_settings() == {"mode": "pread", "access": "auto", "readahead": 0}
+            assert b.stats()["enabled"]
+            for change in (lambda: a.set_io(mode="mmap"), a.enable_stats, a.reset_stats):
+                with pytest.raises(RuntimeError):
+                    change()
+            with pytest.raises(RuntimeError):
+                with trace(a):
+                    pass
+            a.query(columns="tof")
+            assert b.stats()["stages"]["decode"]["frames"] > 0
+
+
+def test_frame_stats_of_shared_handle_from_threads(synthetic_path):
+    pool = HandlePool()
+    with OpenTIMS(synthetic_path, cm=conversion_method.NoConversion) as ot:
+        expected = ot.handle.frame_stats(ot.frames["Id"])
+
+    def frame_stats(_):
+        with pool.open(synthetic_path, cm=conversion_method.NoConversion) as view:
+            return view.handle.frame_stats(view.frames["Id"])
+
+    with ThreadPoolExecutor(4) as executor:
+        for stats in executor.map(frame_stats, range(16)):
+            for name, values in expected.items():
+                np.testing.assert_array_equal(stats[name], values)
+
+
+def test_queries_of_shared_handle_from_threads(synthetic_path):
+    columns = ("frame", "scan", "tof", "intensity", "mz")
+    with OpenTIMS(synthetic_path, cm=conversion_method.OpenSource) as ot:
+        frames = list(ot.frames["Id"][:4]) * 8
+        expected = ot.query(frames, columns=columns)
+        expected_stats = ot.handle.frame_stats(frames)
+
+    def use_shared(task):
+        with OpenTIMS.open_shared(synthetic_path, cm=conversion_method.OpenSource) as view:
+            if task % 2:
+                return view.handle.frame_stats(frames), expected_stats
+            return view.query(frames, columns=columns), expected
+
+    with ThreadPoolExecutor(4) as executor:
+        for result, wanted in executor.map(use_shared, range(32)):
+            for name, values in wanted.items():
+                np.testing.assert_array_equal(result[name], values)
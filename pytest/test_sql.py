@@ -0,0 +1,113 @@
+"""Tests for the native SQLite table reader."""
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from opentimspy import OpenTIMS, conversion_method
+from opentimspy.sql import sql2dict, table2dict, table2keyed_rows, tables_names
+
+data_path = Path(__file__).parent / "test.d"
+tdf_path = data_path / "analysis.tdf"
+
+
+def _python_table(name):
+    with sqlite3.connect(tdf_path) as conn:
+        cur = conn.execute(f"SELECT * FROM {name}")
+        colnames = [col[0] for col in cur.description]
+        rows = list(cur)
+    return colnames, rows
+
+
+def test_tables_names():
+    with sqlite3.connect(tdf_path) as conn:
+        expected = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE TYPE = 'table'")]
+    assert tables_names(tdf_path) == expected
+
+
+@pytest.mark.parametrize("name", ["Frames", "GlobalMetadata", "DiaFrameMsMsWindows", "MzCalibration", "PropertyDefinitions"])
+def test_table2dict_matches_sqlite3(name):
+    colnames, rows = _python_table(name)
+    native = table2dict(tdf_path, name)
+    assert list(native) == colnames
+    for col, values in zip(colnames, zip(*rows)):
+        expected = np.array(values)
+        if expected.dtype.kind in "iuf":
+            assert native[col].dtype == expected.dtype
+            assert np.array_equal(native[col], expected)
+        else:
+            assert [str(v) for v in native[col]] == [str(v) for v in expected]
+
+
+def test_table2dict_mixed_storage_classes():
+    # GroupProperties.Value mixes integers, reals, text and blobs.
+    colnames, rows = _python_table("GroupProperties")
+    native = table2dict(tdf_path, "GroupProperties")
+    assert len(native["Value"]) == len(rows)
+    assert native["Value"].dtype.kind == "U"
+
+
+def test_table2dict_empty_table():
+    native = table2dict(tdf_path, "FrameMsMsInfo")
+    assert set(native) == {"Frame", "Parent", "TriggerMass", "IsolationWidth", "PrecursorCharge", "CollisionEnergy"}
+    assert all(len(v) == 0 for v in native.values())
+
+
+def test_table2dict_missing_table():
+    with pytest.raises(AssertionError):
+        table2dict(tdf_path, "NoSuchTable")
+
+
+def test_table2dict_quotes_name():
+    with pytest.raises(AssertionError):
+        table2dict(tdf_path, 'Frames"; DROP TABLE Frames; --')
+
+
+def test_sql2dict_params():
+    res = sql2dict(tdf_path, "SELECT Value FROM GlobalMetadata WHERE Key = ?", ["TimsCompressionType"])
+    assert list(res["Value"]) == ["2"]
+
+
+def test_sql2dict_nulls_become_nan():
+    res = sql2dict(tdf_path, "SELECT 1 AS a UNION ALL SELECT NULL ORDER BY a DESC")
+    assert res["a"].dtype == np.float64
+    assert res["a"][0] == 1 and np.isnan(res["a"][1])
+
+
+def test_keyed_rows():
+    colnames, rows = _python_table("Frames")
+    keyed = table2keyed_rows(tdf_path, "Frames")
+    assert len(keyed) == len(rows)
+    for row in rows:
+        assert tuple(keyed[row[0]]) == row
+    assert 12345 not in keyed
+    with pytest.raises(KeyError):
+        keyed[12345]
+    assert [tuple(r) for r in keyed.rows()] == rows
+
+
+def test_frame_properties():
+    colnames, rows = _python_table("Frames")
+    with OpenTIMS(data_path, cm=conversion_method.NoConversion) as ot:
+        props = ot.frame_properties
+        assert list(props) == [row[0] for row in rows]
+        assert props[2].Time == rows[1][colnames.index("Time")]
+        assert props[1]._fields == tuple(colnames)
+
+
+def test_handle_shares_frames_table():
+    with OpenTIMS(data_path, cm=conversion_method.NoConversion) as ot:
+        expected = table2dict(tdf_path, "Frames")
+        order = np.argsort(expected["Id"])
+        assert list(ot.frames) == list(expected)
+        for col, values in ot.frames.items():
+            assert np.array_equal(values, expected[col][order])
+        assert not ot.frames["Id"].flags.writeable
+        assert not ot.frames["Time"].flags.writeable
+
+
+def test_handle_global_metadata():
+    with OpenTIMS(data_path, cm=conversion_method.NoConversion) as ot:
+        expected = table2dict(tdf_path, "GlobalMetadata")
+        assert ot.GlobalMetadata == dict(zip(expected["Key"], expected["Value"]))
@@ -0,0 +1,71 @@
+"""Tests for quick run summaries from metadata and sampled frames."""
+import numpy as np
+import pytest
+
+import opentimspy.summary as summary_module
+from opentimspy import OpenTIMS, conversion_method, summarize, summarize_runs
+
+
+def test_metadata_summary(synthetic_path):
+    summary = summarize(synthetic_path)
+    assert not any(key.startswith("sample_") for key in summary)
+    with OpenTIMS(synthetic_path, cm=conversion_method.NoConversion) as ot:
+        data = ot.query(columns=("frame", "intensity"))
+        assert summary["acquisition"] == "DIA-PASEF"
+        assert summary["frames"] == 22
+        assert summary["ms1_frames"] == len(ot.ms1_frames) == 6
+        assert summary["ms2_frames"] == 16
+        assert summary["cycle_length"] == 4
+        assert summary["rt_total"] == pytest.approx(ot.max_retention_time - ot.min_retention_time)
+        assert summary["cycles_per_minute"] == pytest.approx(60.0 * 22 / summary["rt_total"] / 4)
+        assert summary["peaks"] == len(ot) == len(data["intensity"])
+        assert summary["max_peaks_per_frame"] == ot.frames["NumPeaks"].max()
+        assert summary["tic"] == data["intensity"].sum()
+        ms1_peaks = np.isin(data["frame"], ot.ms1_frames)
+        assert summary["ms1_tic"] == data["intensity"][ms1_peaks].sum()
+        assert summary["max_intensity"] == data["intensity"].max()
+        assert summary["num_scans"] == ot.max_scan + 1
+        assert summary["max_mz"] == ot.max_mz
+
+
+def test_pasef_acquisition(pasef_path):
+    assert summarize(pasef_path)["acquisition"] == "DDA-PASEF"
+
+
+@pytest.mark.parametrize("fraction, frames", [(0.2, [1, 8, 15, 22]), (1.0, list(range(1, 23))), (1e-6, [1])])
+def test_sampled_summary(synthetic_path, fraction, frames):
+    summary = summarize(synthetic_path, sample_fraction=fraction)
+    with OpenTIMS(synthetic_path, cm=conversion_method.NoConversion) as ot:
+        data = ot.query(frames, columns=("scan", "tof", "intensity"))
+    assert summary["sample_frames"] == len(frames)
+    assert summary["sample_peaks"] == len(data["tof"])
+    assert summary["sample_max_tof"] == data["tof"].max()
+    assert summary["sample_min_scan"] == data["scan"].min()
+    assert summary["sample_median_intensity"] == np.median(data["intensity"])
+
+
+def test_sample_fraction_is_checked(synthetic_path):
+    with pytest.raises(ValueError):
+        summarize(synthetic_path, sample_fraction=1.5)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_summarize_runs(synthetic_path, pasef_path, tmp_path, jobs):
+    paths = [synthetic_path, tmp_path / "missing.d", pasef_path]
+    summaries = list(summarize_runs(paths, sample_fraction=0.5, jobs=jobs))
+    assert [s["path"] for s in summaries] == [str(p) for p in paths]
+    assert summaries[0] == summarize(synthetic_path, sample_fraction=0.5)
+    assert "error" in summaries[1]
+    assert summaries[2]["acquisition"] == "DDA-PASEF"
+
+
+def test_sampled_summary_in_chunks(synthetic_path, monkeypatch):
+    monkeypatch.setattr(summary_module, "_SAMPLE_CHUNK_PEAKS", 1500)
+    summary = summarize(synthetic_path, sample_fraction=0.5)
+    with OpenTIMS(synthetic_path, cm=conversion_method.NoConversion) as ot:
+        frames = ot.frames["Id"][np.unique(np.linspace(0, 21, 11).round().astype(int))]
+        intensity = ot.query(frames, columns="intensity")["intensity"]
+    assert summary["sample_peaks"] == len(intensity)
+    assert summary["sample_median_intensity"] == np.median(intensity)
+    assert summary["sample_p99_intensity"] == pytest.approx(np.percentile(intensity, 99))
+    assert summary["sample_mean_intensity"] == pytest.approx(intensity.mean())
@@ -0,0 +1,44 @@
+"""Tests for the synthetic dataset generator."""
+import numpy as np
+import pytest
+
+from opentimspy import OpenTIMS, conversion_method
+
+pytest.importorskip("zstandard")
+
+from opentimspy.testing import synthesize_tdf
+
+COLUMNS = ("frame", "scan", "tof", "intensity")
+
+
+def test_synthesize_and_read(tmp_path):
+    path = synthesize_tdf(tmp_path / "synth.d", n_frames=20, peaks_per_frame=500, num_scans=100, ms2_ratio=0.75, seed=3)
+    with OpenTIMS(path, cm=conversion_method.OpenSource) as ot:
+        assert list(ot.frames["Id"]) == list(range(1, 21))
+        assert list(ot.ms1_frames) == [1, 5, 9, 13, 17]
+        data = ot.query()
+        assert len(data["tof"]) == ot.frames["NumPeaks"].sum()
+        assert data["scan"].max() < 100
+        assert np.all((data["mz"] > 50) & (data["mz"] < 2000))
+        assert np.array_equal(ot.frame_stats["tic"], ot.frames["SummedIntensities"])
+        assert np.array_equal(ot.frame_stats["max_intensity"], ot.frames["MaxIntensity"])
+        assert len(ot.dia_query(1, columns="tof")["tof"]) > 0
+
+
+def test_deterministic(tmp_path):
+    kwargs = dict(n_frames=5, peaks_per_frame=lambda rng, n: np.full(n, 300), num_scans=50, seed=7)
+    datasets = [synthesize_tdf(tmp_path / f"{i}.d", **kwargs) for i in range(2)]
+    assert (datasets[0] / "analysis.tdf_bin").read_bytes() == (datasets[1] / "analysis.tdf_bin").read_bytes()
+    with OpenTIMS(datasets[0], cm=conversion_method.NoConversion) as ot:
+        assert list(ot.frames["NumPeaks"]) == [300] * 5
+        assert len(ot.query(columns="tof")["tof"]) == 1500
+
+
+def test_pasef(tmp_path):
+    path = synthesize_tdf(tmp_path / "pasef.d", n_frames=6, peaks_per_frame=200, ms2_ratio=0.5, acquisition="pasef")
+    with OpenTIMS(path, cm=conversion_method.NoConversion) as ot:
+        spectra = ot.pasef_spectra(columns=("tof", "intensity"))
+        assert len(spectra["precursor"]) == 12
+        assert spectra["offsets"][-1] == len(spectra["tof"])
+    with pytest.raises(FileExistsError):
+        synthesize_tdf(path)
@@ -0,0 +1,34 @@
+"""Tests for tracing native extraction."""
+import json
+from pathlib import Path
+
+import opentimspy
+from opentimspy import OpenTIMS, conversion_method
+
+data_path = Path(__file__).parent / "test.d"
+
+
+def test_trace(tmp_path):
+    with OpenTIMS(data_path, cm=conversion_method.OpenSource) as ot:
+        frames = ot.frames["Id"][:4]
+        ot.query(frames=frames)
+        with opentimspy.trace(ot, path=tmp_path / "trace.json") as t:
+            data = ot.query(frames=frames)
+        ot.query(frames=frames)
+        assert not ot.handle.tracing()
+
+    spans = [e for e in t.events if e["ph"] == "X"]
+    decompressed = sorted(e["args"]["frame"] for e in spans if e["name"] == "decompress")
+    assert decompressed == sorted(frames.tolist())
+    assert sum(e["args"]["peaks"] for e in spans if e["name"] == "decode") == len(data["frame"])
+    assert all(e["dur"] >= 0 for e in spans)
+    assert t.dropped == 0
+    assert json.loads((tmp_path / "trace.json").read_text())["traceEvents"] == t.events
+
+
+def test_trace_ring_buffer():
+    with OpenTIMS(data_path, cm=conversion_method.OpenSource) as ot:
+        with opentimspy.trace(ot, capacity=3) as t:
+            ot.query(frames=ot.frames["Id"][:4])
+    assert len([e for e in t.events if e["ph"] == "X"]) == 3
+    assert t.dropped > 0
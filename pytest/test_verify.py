@@ -0,0 +1,53 @@
+"""Tests for the native integrity checks of frames."""
+import shutil
+import sqlite3
+from pathlib import Path
+
+from opentimspy import OpenTIMS, conversion_method
+
+data_path = Path(__file__).parent / "test.d"
+
+
+def test_verify_clean(synthetic_path):
+    with OpenTIMS(synthetic_path, cm=conversion_method.OpenSource) as ot:
+        assert ot.verify() == []
+    with OpenTIMS(data_path, cm=conversion_method.OpenSource) as ot:
+        assert ot.verify() == []
+
+
+def test_verify_corrupted_payload(synthetic_copy):
+    with sqlite3.connect(synthetic_copy / "analysis.tdf") as conn:
+        tims_id, = conn.execute("SELECT TimsId FROM Frames WHERE Id = 4").fetchone()
+    with open(synthetic_copy / "analysis.tdf_bin", "r+b") as f:
+        f.seek(tims_id + 8)
+        f.write(b"\xff" * 16)
+    with OpenTIMS(synthetic_copy, cm=conversion_method.OpenSource) as ot:
+        problems = ot.verify()
+    assert [frame for frame, _ in problems] == [4]
+    assert "zstd" in problems[0][1]
+
+
+def test_verify_inconsistent_tables(synthetic_copy):
+    with sqlite3.connect(synthetic_copy / "analysis.tdf") as conn:
+        conn.execute("UPDATE Frames SET NumPeaks = NumPeaks + 1 WHERE Id = 2")
+        conn.execute("UPDATE Frames SET NumScans = NumScans - 1 WHERE Id = 7")
+    with OpenTIMS(synthetic_copy, cm=conversion_method.OpenSource) as ot:
+        problems = dict(ot.verify())
+        assert sorted(problems) == [2, 7]
+        assert "bytes instead of" in problems[2]
+        assert "NumScans" in problems[7]
+        assert ot.verify([1, 2]) == [(2, problems[2])]
+
+
+def test_verify_truncated_in_pread_mode(synthetic_copy):
+    bin_path = synthetic_copy / "analysis.tdf_bin"
+    with OpenTIMS(synthetic_copy, cm=conversion_method.OpenSource) as ot:
+        ot.set_io(mode="pread")
+        last = ot.frames["Id"][-1]
+        with sqlite3.connect(synthetic_copy / "analysis.tdf") as conn:
+            tims_id, = conn.execute("SELECT TimsId FROM Frames WHERE Id = ?", (int(last),)).fetchone()
+        with open(bin_path, "r+b") as f:
+            f.truncate(tims_id + 16)
+        problems = ot.verify()
+    assert [frame for frame, _ in problems] == [last]
+    assert "end of file" in problems[0][1]
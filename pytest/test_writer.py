@@ -0,0 +1,111 @@
+"""Tests for writing subsets of datasets in the TDF format."""
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from opentimspy import OpenTIMS, conversion_method
+
+pytest.importorskip("zstandard")
+
+data_path = Path(__file__).parent / "test.d"
+COLUMNS = ("frame", "scan", "tof", "intensity")
+
+
+@pytest.fixture(scope="module")
+def ot():
+    with OpenTIMS(data_path, cm=conversion_method.NoConversion) as handle:
+        yield handle
+
+
+def _assert_same(a, b):
+    for c in COLUMNS:
+        assert np.array_equal(a[c], b[c])
+
+
+def test_roundtrip(ot, tmp_path):
+    out = ot.write_tdf(tmp_path / "copy.d", zstd_level=1)
+    with OpenTIMS(out, cm=conversion_method.NoConversion) as copy:
+        _assert_same(copy.query(columns=COLUMNS), ot.query(columns=COLUMNS))
+        for c in ("Id", "Time", "NumScans", "NumPeaks", "MaxIntensity", "SummedIntensities", "MsMsType"):
+            assert np.array_equal(copy.frames[c], ot.frames[c])
+        assert copy.GlobalMetadata == ot.GlobalMetadata
+
+
+def test_ms_level_subset(ot, tmp_path):
+    out = ot.write_tdf(tmp_path / "ms1.d", ms_level=1)
+    with OpenTIMS(out, cm=conversion_method.NoConversion) as copy:
+        assert list(copy.frames["Id"]) == list(ot.ms1_frames)
+        _assert_same(copy.query(columns=COLUMNS), ot.query(ot.ms1_frames, columns=COLUMNS))
+        assert len(copy.table2dict("DiaFrameMsMsInfo")["Frame"]) == 0
+
+
+@pytest.mark.parametrize("max_peaks", [1, 10**6])
+def test_box_filter(ot, tmp_path, max_peaks):
+    box = dict(scan=(30, 80), min_intensity=11)
+    out = ot.write_tdf(tmp_path / "box.d", max_peaks=max_peaks, **box)
+    expected = ot.box_query(columns=COLUMNS, **box)
+    with OpenTIMS(out, cm=conversion_method.NoConversion) as copy:
+        _assert_same(copy.query(columns=COLUMNS), expected)
+        stats = copy.frame_stats
+        assert np.array_equal(copy.frames["NumPeaks"], np.bincount(expected["frame"], minlength=3)[1:])
+        assert np.array_equal(copy.frames["SummedIntensities"], stats["tic"])
+        assert np.array_equal(copy.frames["MaxIntensity"], stats["max_intensity"])
+
+
+def test_empty_frames(ot, tmp_path):
+    out = ot.write_tdf(tmp_path / "empty.d", tof=(0, 1))
+    with OpenTIMS(out, cm=conversion_method.NoConversion) as copy:
+        assert list(copy.frames["NumPeaks"]) == [0, 0]
+        assert len(copy.query(columns="tof")["tof"]) == 0
+
+
+def test_refuses_to_overwrite(ot, tmp_path):
+    ot.write_tdf(tmp_path / "copy.d")
+    with pytest.raises(FileExistsError):
+        ot.write_tdf(tmp_path / "copy.d")
+    ot.write_tdf(tmp_path / "copy.d", overwrite=True)
+    with pytest.raises(ValueError):
+        ot.write_tdf(data_path, overwrite=True)
+    with sqlite3.connect(tmp_path / "copy.d" / "analysis.tdf") as conn:
+        assert conn.execute("SELECT COUNT(*) FROM Frames").fetchone()[0] == 2
+
+
+def test_pasef_subset_keeps_references(pasef_path, tmp_path):
+    with OpenTIMS(pasef_path, cm=conversion_method.NoConversion) as source:
+        parents = source.table2dict("Precursors")["Parent"]
+        # Leave out the first MS1 frame, keeping the MS2 frames of its cycle.
+        frames = source.frames["Id"][source.frames["Id"] != source.ms1_frames[0]]
+        out = source.write_tdf(tmp_path / "subset.d", frames=frames)
+        kept_precursors = source.table2dict("Precursors")["Id"][parents != source.ms1_frames[0]]
+        assert 0 < len(kept_precursors) < len(parents)
+        expected = source.pasef_spectra(kept_precursors, columns=("tof", "intensity"))
+    with sqlite3.connect(out / "analysis.tdf") as conn:
+        for query in (
+            "SELECT COUNT(*) FROM PasefFrameMsMsInfo WHERE Frame NOT IN (SELECT Id FROM Frames)",
+            "SELECT COUNT(*) FROM Precursors WHERE Parent NOT IN (SELECT Id FROM Frames)",
+            "SELECT COUNT(*) FROM PasefFrameMsMsInfo WHERE Precursor NOT IN (SELECT Id FROM Precursors)",
+        ):
+            assert conn.execute(query).fetchone()[0] == 0
+    with OpenTIMS(out, cm=conversion_method.NoConversion) as copy:
+        assert list(copy.frames["Id"]) == list(frames)
+        assert list(copy.table2dict("Precursors")["Id"]) == list(kept_precursors)
+        spectra = copy.pasef_spectra(columns=("tof", "intensity"))
+        for key in ("precursor", "offsets", "tof", "intensity"):
+            assert np.array_equal(spectra[key], expected[key])
+
+
+def test_raw_frame_intensities(synthetic_copy, tmp_path):
+    # With AccumulationTime != 100 query intensities are corrected, but Frames keeps raw ones.
+    with sqlite3.connect(synthetic_copy / "analysis.tdf") as conn:
+        conn.execute("UPDATE Frames SET AccumulationTime = 200")
+    with OpenTIMS(synthetic_copy, cm=conversion_method.NoConversion) as source:
+        out = source.write_tdf(tmp_path / "copy.d")
+        box = dict(min_intensity=int(np.median(source.frame_stats["max_intensity"])))
+        expected = source.box_query(columns=COLUMNS, **box)
+        assert len(expected["frame"]) > 0
+        with OpenTIMS(out, cm=conversion_method.NoConversion) as copy:
+            for c in ("MaxIntensity", "SummedIntensities"):
+                assert np.array_equal(copy.frames[c], source.frames[c])
+            _assert_same(copy.box_query(columns=COLUMNS, **box), expected)
@@ -73,6 +73,13 @@ parser.add_argument(
     default="",
     choices="log10 sqrt id".split(),
 )
+parser.add_argument(
+    "-b",
+    "--batch",
+    help="With -s: save plain heatmaps (one pixel per bin, no axes nor colorbar) instead of matplotlib plots. "
+    "Frames are binned natively in parallel and encoded by a pool of threads: much faster for many frames.",
+    action="store_true",
+)
 parser.add_argument(
     "-m",
     "--movie",
@@ -101,8 +108,11 @@ if args.movie and not args.save:
     )
     sys.exit(1)
 
+if args.batch and not args.save:
+    print("If -b/--batch is present, then -s/--save is also required")
+    sys.exit(1)
+
 import opentimspy
-from matplotlib import pyplot as plt
 from opentimspy import OpenTIMS, set_num_threads, plotting
 from opentimspy.misc import parse_slice
 
@@ -124,7 +134,10 @@ else:
     )
     sys.exit(1)
 
-set_num_threads(1)
+if not args.batch:
+    from matplotlib import pyplot as plt
+
+    set_num_threads(1)
 
 with OpenTIMS(args.path) as OT:
     max_intens = OT.max_intensity
@@ -179,7 +192,22 @@ with OpenTIMS(args.path) as OT:
 
         progressbar = lambda x: tqdm(x, desc=sys.argv[0], total=len(frames))
 
-    if args.save:
+    if args.batch:
+        args.output.mkdir(parents=True, exist_ok=True)
+        multiproc = lambda x: plotting.render_frames(
+            OT,
+            sorted(x),
+            args.output,
+            x_axis=x_column,
+            x_range=(args.mz_range.min, xax_max),
+            x_resolution=args.mz_resolution,
+            scan_range=args.scan_range,
+            intens_cutoff=args.intensity,
+            transform=args.transform,
+            max_intens=max_intens,
+            workers=args.processes,
+        )
+    elif args.save:
         from multiprocessing import Pool
 
         P = Pool(args.processes)
@@ -1,48 +1,73 @@
 #!/usr/bin/env python3
+import sys
+import json
 from pathlib import Path
 
 
 import argparse
 
 parser = argparse.ArgumentParser(
-    description="Verify the integrity of TDF dataset. Any errors could indicate corruption - or a bug in OpenTIMS."
+    description="Summarize TDF datasets quickly: from metadata alone, or also from a sample of decoded frames."
+)
+parser.add_argument("paths", help="TDF dataset paths", type=Path, nargs="+")
+parser.add_argument(
+    "-s",
+    "--sample",
+    help="Also decode this fraction of frames (evenly spread over the run) for peak-level statistics, example: 0.05. Default: 0 (metadata only)",
+    type=float,
+    default=0.0,
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    help="Number of datasets to summarize concurrently, in separate processes. Default: one per core",
+    type=int,
+    default=None,
+)
+parser.add_argument(
+    "--json", help="Print one JSON object per dataset instead of text", action="store_true"
 )
-parser.add_argument("path", help="TDF dataset path", type=Path)
-# parser.add_argument("-c", "--convert", help="Perform tof->mz and scan->inv_ion_mobility conversions too", action="store_true")
 args = parser.parse_args()
 
-# all_columns = ('frame','scan','tof','intensity','retention_time')
-# if args.convert:
-#    all_columns = ('frame','scan','tof','intensity','mz','inv_ion_mobility','retention_time')
+from opentimspy import summarize_runs
 
-from tqdm import tqdm
-import opentimspy
-from opentimspy import OpenTIMS
-import numpy as np
 
+def print_text(summary):
+    print(f"Dataset: {summary['path']}")
+    if "error" in summary:
+        print(f"Error: {summary['error']}")
+        return
+    print(f"Acquisition: {summary['acquisition']}")
+    print(f"No frames: {summary['frames']}")
+    rt_total = summary["rt_total"]
+    print(
+        f"RT extent: {summary['rt_start']} - {summary['rt_end']}, total: {rt_total}, ({rt_total/60.0} minutes)"
+    )
+    if summary["frames"]:
+        print(f"RT per frame: {rt_total/summary['frames']}")
+    print(f"Frames per minute: {summary['frames_per_minute']}")
+    print(f"DIA cycle length (median): {summary['cycle_length']}")
+    print(f"DIA cycles per minute: {summary['cycles_per_minute']}")
+    print(f"No MS1 frames: {summary['ms1_frames']}")
+    print(f"No MS2 frames: {summary['ms2_frames']}")
+    print(f"No peaks: {summary['peaks']} (mean per frame: {summary['mean_peaks_per_frame']}, max: {summary['max_peaks_per_frame']})")
+    print(f"TIC: {summary['tic']} (MS1: {summary['ms1_tic']}, MS2: {summary['ms2_tic']})")
+    print(f"MS1 TIC apex at RT: {summary['ms1_tic_apex_rt']}")
+    print(f"Max intensity: {summary['max_intensity']}")
+    for key, value in summary.items():
+        if key.startswith("sample_"):
+            print(f"{key[len('sample_'):].replace('_', ' ').capitalize()} (sampled): {value}")
 
-def find_nth(L, what, n):
-    for idx, x in enumerate(L):
-        if x == what:
-            if n == 0:
-                return idx
-            n -= 1
 
+failed = False
+for idx, summary in enumerate(summarize_runs(args.paths, args.sample, args.jobs)):
+    failed |= "error" in summary
+    if args.json:
+        print(json.dumps(summary), flush=True)
+    else:
+        if idx > 0:
+            print()
+        print_text(summary)
+        sys.stdout.flush()
 
-with OpenTIMS(args.path) as D:
-    # print(D.frames)
-    no_frames = len(D.frames["Id"])
-    print(f"No frames: {no_frames}")
-    rt_extent = D.frames["Time"][0], D.frames["Time"][-1]
-    rt_total_time = rt_extent[1] - rt_extent[0]
-    print(
-        f"RT extent: {rt_extent[0]} - {rt_extent[1]}, total: {rt_total_time}, ({rt_total_time/60.0} minutes)"
-    )
-    print(f"RT per frame: {rt_total_time/no_frames}")
-    print(f"Frames per minute: {60.0*no_frames/rt_total_time}")
-    dia_cycle_len = find_nth(D.frames["MsMsType"], 0, 3) - find_nth(
-        D.frames["MsMsType"], 0, 2
-    )
-    print(f"Length of second DIA cycle: {dia_cycle_len}")
-    print(f"DIA cycles per minute: {60.0*no_frames/rt_total_time/dia_cycle_len}")
-    print(f"No MS1 frames: {np.count_nonzero(D.frames['MsMsType'] == 0)}")
+sys.exit(1 if failed else 0)
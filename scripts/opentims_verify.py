@@ -19,19 +19,31 @@ parser.add_argument(
 parser.add_argument(
     "-d",
     "--digest",
-    help="Compute and print SHA256 digest of the dataset",
+    help="Compute and print a digest of the raw data: the root of a Merkle tree of per-frame digests",
     action="store_true",
 )
+parser.add_argument(
+    "--digest-algo",
+    help="Hash function of the digest (default: blake2b)",
+    choices=("blake2b", "xxh64"),
+    default="blake2b",
+)
 parser.add_argument(
     "--opensource",
     help="Use open-source m/z and ion mobility converters instead of Bruker's (less precise). Implies --convert.",
     action="store_true",
 )
+parser.add_argument(
+    "-t",
+    "--threads",
+    help="Number of threads to use (default: all cores)",
+    type=int,
+    default=0,
+)
 args = parser.parse_args()
 
 import opentimspy
 from opentimspy import OpenTIMS
-import hashlib
 
 if args.opensource:
     opentimspy.setup_opensource()
@@ -50,32 +62,33 @@ elif args.convert:
 else:
     do_convert = False
 
-all_columns = ("frame", "scan", "tof", "intensity", "retention_time")
-if do_convert:
-    all_columns = (
-        "frame",
-        "scan",
-        "tof",
-        "intensity",
-        "mz",
-        "inv_ion_mobility",
-        "retention_time",
-    )
-
-if args.digest:
-    sha256 = hashlib.sha256()
+opentimspy.set_num_threads(args.threads)
 
 with OpenTIMS(args.path) as D:
-    frames = D.frames["Id"]
-    # Iterate over frames. This will store only one frame at a time in RAM, preventing out of memory errors.
-    for frame_id in tqdm(sorted(frames)):
-        frame = D.query(frame_id, columns=all_columns)
-        if args.digest:
-            for key in sorted(frame.keys()):
-                sha256.update(frame[key])
+    # Frames are checked natively in parallel, decoding into scratch buffers only.
+    problems = D.verify()
+    for frame_id, reason in problems:
+        print(f"Frame {frame_id}: {reason}", file=sys.stderr)
+    bad = {frame_id for frame_id, _ in problems}
+    good_frames = [f for f in D.frames["Id"] if f not in bad]
+    frames_no = len(D.frames["Id"])
+
+    if do_convert:
+        # Run the conversions too, on frames that passed the checks.
+        for chunk in tqdm(
+            D.iter_chunks(good_frames, columns=("mz", "inv_ion_mobility", "retention_time")),
+            desc="Converting",
+        ):
+            pass
+    if args.digest and not problems:
+        # Frames are hashed natively in parallel, right after decoding.
+        digest = D.get_hash(columns=("frame", "scan", "tof", "intensity"), algo=args.digest_algo)
 
 
+if problems:
+    print(f"{len(problems)} of {frames_no} frames are corrupted.", file=sys.stderr)
+    sys.exit(1)
 if args.digest:
-    print(sha256.hexdigest())
+    print(digest.hex())
 else:
     print("Success! File does not seem to be corrupted.")
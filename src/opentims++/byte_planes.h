@@ -0,0 +1,175 @@
+/*
+ *   OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+ *   Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+ *
+ *   Licensed under the MIT License. See LICENCE file in the project root for details.
+ */
+
+#pragma once
+#include <algorithm>
+#include <cstddef>
+#include <cstdint>
+#include <cstring>
+#include <string>
+#include <stdexcept>
+#include <vector>
+
+// Decompressed frames store uint32 values as four byte planes: the lowest bytes of all values,
+// then the second bytes, and so on. transpose_byte_planes() reassembles the values in bulk,
+// with SSE2/AVX2 (chosen at runtime) or NEON where available, and a scalar loop otherwise.
+
+#if defined(__SSE2__) || defined(_M_X64) || (defined(_M_IX86_FP) && _M_IX86_FP >= 2)
+#define OPENTIMS_BYTE_PLANES_SSE2 1
+#include <emmintrin.h>
+#if (defined(__GNUC__) || defined(__clang__)) && (defined(__x86_64__) || defined(__i386__))
+#define OPENTIMS_BYTE_PLANES_AVX2 1
+#include <immintrin.h>
+#endif
+#elif defined(__ARM_NEON) || defined(__aarch64__)
+#define OPENTIMS_BYTE_PLANES_NEON 1
+#include <arm_neon.h>
+#endif
+
+namespace byte_planes {
+
+//! Reassemble values begin..begin+count from planes of `stride` bytes each, starting at `planes`.
+typedef void (*TransposeFunction)(const char* planes, size_t stride, size_t begin, size_t count, uint32_t* out);
+
+inline void transpose_scalar(const char* planes, size_t stride, size_t begin, size_t count, uint32_t* out)
+{
+    const uint8_t* p0 = reinterpret_cast<const uint8_t*>(planes) + begin;
+    const uint8_t* p1 = p0 + stride;
+    const uint8_t* p2 = p1 + stride;
+    const uint8_t* p3 = p2 + stride;
+    for(size_t ii = 0; ii < count; ii++)
+        out[ii] = uint32_t(p0[ii]) | uint32_t(p1[ii]) << 8 | uint32_t(p2[ii]) << 16 | uint32_t(p3[ii]) << 24;
+}
+
+#if defined(OPENTIMS_BYTE_PLANES_SSE2)
+inline void transpose_sse2(const char* planes, size_t stride, size_t begin, size_t count, uint32_t* out)
+{
+    const char* p0 = planes + begin;
+    const char* p1 = p0 + stride;
+    const char* p2 = p1 + stride;
+    const char* p3 = p2 + stride;
+    size_t ii = 0;
+    for(; ii + 16 <= count; ii += 16)
+    {
+        __m128i a = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p0 + ii));
+        __m128i b = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p1 + ii));
+        __m128i c = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p2 + ii));
+        __m128i d = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p3 + ii));
+        __m128i ab_lo = _mm_unpacklo_epi8(a, b);
+        __m128i ab_hi = _mm_unpackhi_epi8(a, b);
+        __m128i cd_lo = _mm_unpacklo_epi8(c, d);
+        __m128i cd_hi = _mm_unpackhi_epi8(c, d);
+        __m128i* dst = reinterpret_cast<__m128i*>(out + ii);
+        _mm_storeu_si128(dst, _mm_unpacklo_epi16(ab_lo, cd_lo));
+        _mm_storeu_si128(dst + 1, _mm_unpackhi_epi16(ab_lo, cd_lo));
+        _mm_storeu_si128(dst + 2, _mm_unpacklo_epi16(ab_hi, cd_hi));
+        _mm_storeu_si128(dst + 3, _mm_unpackhi_epi16(ab_hi, cd_hi));
+    }
+    transpose_scalar(planes, stride, begin + ii, count - ii, out + ii);
+}
+#endif
+
+#if defined(OPENTIMS_BYTE_PLANES_AVX2)
+__attribute__((target("avx2")))
+inline void transpose_avx2(const char* planes, size_t stride, size_t begin, size_t count, uint32_t* out)
+{
+    const char* p0 = planes + begin;
+    const char* p1 = p0 + stride;
+    const char* p2 = p1 + stride;
+    const char* p3 = p2 + stride;
+    size_t ii = 0;
+    for(; ii + 32 <= count; ii += 32)
+    {
+        __m256i a = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p0 + ii));
+        __m256i b = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p1 + ii));
+        __m256i c = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p2 + ii));
+        __m256i d = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p3 + ii));
+        // Unpacking works within 128-bit lanes: w0 holds values 0-3 and 16-19, w1 4-7 and 20-23, and so on.
+        __m256i ab_lo = _mm256_unpacklo_epi8(a, b);
+        __m256i ab_hi = _mm256_unpackhi_epi8(a, b);
+        __m256i cd_lo = _mm256_unpacklo_epi8(c, d);
+        __m256i cd_hi = _mm256_unpackhi_epi8(c, d);
+        __m256i w0 = _mm256_unpacklo_epi16(ab_lo, cd_lo);
+        __m256i w1 = _mm256_unpackhi_epi16(ab_lo, cd_lo);
+        __m256i w2 = _mm256_unpacklo_epi16(ab_hi, cd_hi);
+        __m256i w3 = _mm256_unpackhi_epi16(ab_hi, cd_hi);
+        __m256i* dst = reinterpret_cast<__m256i*>(out + ii);
+        _mm256_storeu_si256(dst, _mm256_permute2x128_si256(w0, w1, 0x20));
+        _mm256_storeu_si256(dst + 1, _mm256_permute2x128_si256(w2, w3, 0x20));
+        _mm256_storeu_si256(dst + 2, _mm256_permute2x128_si256(w0, w1, 0x31));
+        _mm256_storeu_si256(dst + 3, _mm256_permute2x128_si256(w2, w3, 0x31));
+    }
+    transpose_sse2(planes, stride, begin + ii, count - ii, out + ii);
+}
+#endif
+
+#if defined(OPENTIMS_BYTE_PLANES_NEON)
+inline void transpose_neon(const char* planes, size_t stride, size_t begin, size_t count, uint32_t* out)
+{
+    const uint8_t* p0 = reinterpret_cast<const uint8_t*>(planes) + begin;
+    const uint8_t* p1 = p0 + stride;
+    const uint8_t* p2 = p1 + stride;
+    const uint8_t* p3 = p2 + stride;
+    size_t ii = 0;
+    for(; ii + 16 <= count; ii += 16)
+    {
+        uint8x16x4_t planes_x4 = {{vld1q_u8(p0 + ii), vld1q_u8(p1 + ii), vld1q_u8(p2 + ii), vld1q_u8(p3 + ii)}};
+        vst4q_u8(reinterpret_cast<uint8_t*>(out + ii), planes_x4);
+    }
+    transpose_scalar(planes, stride, begin + ii, count - ii, out + ii);
+}
+#endif
+
+//! Names of the implementations usable on this machine, the best one first.
+inline std::vector<std::string> available_implementations()
+{
+    std::vector<std::string> result;
+#if defined(OPENTIMS_BYTE_PLANES_AVX2)
+    __builtin_cpu_init();
+    if(__builtin_cpu_supports("avx2"))
+        result.push_back("avx2");
+#endif
+#if defined(OPENTIMS_BYTE_PLANES_SSE2)
+    result.push_back("sse2");
+#endif
+#if defined(OPENTIMS_BYTE_PLANES_NEON)
+    result.push_back("neon");
+#endif
+    result.push_back("scalar");
+    return result;
+}
+
+inline TransposeFunction implementation(const std::string& name)
+{
+    const std::vector<std::string> available = available_implementations();
+    if(std::find(available.begin(), available.end(), name) == available.end())
+        throw std::invalid_argument("Unavailable byte plane transposition: " + name);
+#if defined(OPENTIMS_BYTE_PLANES_AVX2)
+    if(name == "avx2")
+        return transpose_avx2;
+#endif
+#if defined(OPENTIMS_BYTE_PLANES_SSE2)
+    if(name == "sse2")
+        return transpose_sse2;
+#endif
+#if defined(OPENTIMS_BYTE_PLANES_NEON)
+    if(name == "neon")
+        return transpose_neon;
+#endif
+    if(name == "scalar")
+        return transpose_scalar;
+    throw std::invalid_argument("Unavailable byte plane transposition: " + name);
+}
+
+} // namespace byte_planes
+
+//! Reassemble values begin..begin+count of a decompressed frame of `stride` values per byte plane.
+inline void transpose_byte_planes(const char* planes, size_t stride, size_t begin, size_t count, uint32_t* out)
+{
+    static const byte_planes::TransposeFunction best = byte_planes::implementation(byte_planes::available_implementations().front());
+    best(planes, stride, begin, count, out);
+}
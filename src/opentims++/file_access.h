@@ -0,0 +1,240 @@
+/*
+ *   OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+ *   Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+ *
+ *   Licensed under the MIT License. See LICENCE file in the project root for details.
+ */
+
+#pragma once
+#include <algorithm>
+#include <atomic>
+#include <cerrno>
+#include <chrono>
+#include <condition_variable>
+#include <cstddef>
+#include <cstdint>
+#include <cstring>
+#include <functional>
+#include <mutex>
+#include <stdexcept>
+#include <string>
+#include <thread>
+#include <utility>
+#include <vector>
+
+#include "platform.h"
+
+#ifdef OPENTIMS_UNIX
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <unistd.h>
+#endif
+
+// Access to analysis.tdf_bin: kernel hints about the access pattern, readahead of the frames
+// that decoders will need next, and reading frames with pread() instead of through the mmap.
+// Hints are no-ops where the platform lacks them.
+
+//! How frame packets are read: through the memory map (default) or with pread() into per-thread buffers.
+enum class IOMode { Mmap, Pread };
+
+//! Access pattern hint for the whole file; Auto picks one per query from the frames requested.
+enum class AccessPattern { Auto, Normal, Sequential, Random };
+
+inline IOMode io_mode_from_name(const std::string& name)
+{
+    if(name == "mmap")
+        return IOMode::Mmap;
+    if(name == "pread")
+    {
+#ifndef OPENTIMS_UNIX
+        throw std::invalid_argument("The pread I/O mode is only available on POSIX systems");
+#endif
+        return IOMode::Pread;
+    }
+    throw std::invalid_argument("Unknown I/O mode: " + name + " (choose mmap or pread)");
+}
+
+inline std::string io_mode_name(IOMode mode)
+{
+    return mode == IOMode::Mmap ? "mmap" : "pread";
+}
+
+inline AccessPattern access_pattern_from_name(const std::string& name)
+{
+    if(name == "auto")
+        return AccessPattern::Auto;
+    if(name == "normal")
+        return AccessPattern::Normal;
+    if(name == "sequential")
+        return AccessPattern::Sequential;
+    if(name == "random")
+        return AccessPattern::Random;
+    throw std::invalid_argument("Unknown access pattern: " + name + " (choose auto, normal, sequential or random)");
+}
+
+inline std::string access_pattern_name(AccessPattern pattern)
+{
+    switch(pattern)
+    {
+        case AccessPattern::Auto: return "auto";
+        case AccessPattern::Normal: return "normal";
+        case AccessPattern::Sequential: return "sequential";
+        default: return "random";
+    }
+}
+
+namespace file_access {
+
+#ifdef OPENTIMS_UNIX
+inline size_t page_size()
+{
+    static const size_t size = static_cast<size_t>(sysconf(_SC_PAGESIZE));
+    return size;
+}
+#endif
+
+//! Hint the access pattern of [begin, begin+length) of a mapping; begin is rounded down to a page.
+inline void advise_mapping([[maybe_unused]] const char* begin, [[maybe_unused]] size_t length, [[maybe_unused]] AccessPattern pattern)
+{
+#ifdef OPENTIMS_UNIX
+    if(length == 0)
+        return;
+    const uintptr_t address = reinterpret_cast<uintptr_t>(begin);
+    const uintptr_t aligned = address - address % page_size();
+    int advice = pattern == AccessPattern::Sequential ? MADV_SEQUENTIAL
+               : pattern == AccessPattern::Random ? MADV_RANDOM
+               : MADV_NORMAL;
+    madvise(reinterpret_cast<void*>(aligned), length + (address - aligned), advice);
+#endif
+}
+
+//! Start reading [begin, begin+length) of a mapping into the page cache, without waiting for it.
+inline void prefetch_mapping([[maybe_unused]] const char* begin, [[maybe_unused]] size_t length)
+{
+#ifdef OPENTIMS_UNIX
+    if(length == 0)
+        return;
+    const uintptr_t address = reinterpret_cast<uintptr_t>(begin);
+    const uintptr_t aligned = address - address % page_size();
+    madvise(reinterpret_cast<void*>(aligned), length + (address - aligned), MADV_WILLNEED);
+#endif
+}
+
+//! Hint the access pattern of a whole file.
+inline void advise_file([[maybe_unused]] int fd, [[maybe_unused]] AccessPattern pattern)
+{
+#if defined(OPENTIMS_UNIX) && defined(POSIX_FADV_NORMAL)
+    int advice = pattern == AccessPattern::Sequential ? POSIX_FADV_SEQUENTIAL
+               : pattern == AccessPattern::Random ? POSIX_FADV_RANDOM
+               : POSIX_FADV_NORMAL;
+    posix_fadvise(fd, 0, 0, advice);
+#endif
+}
+
+//! Start reading [offset, offset+length) of a file into the page cache, without waiting for it.
+inline void prefetch_file([[maybe_unused]] int fd, [[maybe_unused]] size_t offset, [[maybe_unused]] size_t length)
+{
+#if defined(OPENTIMS_UNIX) && defined(POSIX_FADV_WILLNEED)
+    posix_fadvise(fd, static_cast<off_t>(offset), static_cast<off_t>(length), POSIX_FADV_WILLNEED);
+#endif
+}
+
+//! Read exactly length bytes at offset, retrying short reads; throws on errors and on the end of file.
+inline void read_at([[maybe_unused]] int fd, [[maybe_unused]] size_t offset, [[maybe_unused]] size_t length, [[maybe_unused]] char* out)
+{
+#ifdef OPENTIMS_UNIX
+    while(length > 0)
+    {
+        ssize_t got = pread(fd, out, length, static_cast<off_t>(offset));
+        if(got < 0 && errno == EINTR)
+            continue;
+        if(got < 0)
+            throw std::runtime_error(std::string("Error reading analysis.tdf_bin: ") + strerror(errno));
+        if(got == 0)
+            throw std::runtime_error("Error reading analysis.tdf_bin: unexpected end of file");
+        out += got;
+        offset += got;
+        length -= got;
+    }
+#else
+    throw std::runtime_error("The pread I/O mode is only available on POSIX systems");
+#endif
+}
+
+} // namespace file_access
+
+//! Prefetches byte ranges on a helper thread, staying at most `window` bytes ahead of the consumers.
+/**
+ * Ranges are consumed in order; `progress` is the number of ranges taken by the consumers so far
+ * (the task counter of the worker threads). Adjacent ranges are prefetched with a single call.
+ * The helper thread stops once all ranges are prefetched, or when the object is destroyed.
+ */
+class Readahead
+{
+    std::vector<std::pair<size_t, size_t>> ranges; // (offset, length)
+    const std::atomic<size_t>& progress;
+    const size_t window;
+    std::function<void(size_t, size_t)> prefetch;
+    std::mutex mutex;
+    std::condition_variable wake;
+    bool stopping = false;
+    std::thread worker;
+
+    void run()
+    {
+        std::vector<size_t> cumulative(ranges.size() + 1, 0);
+        for(size_t ii = 0; ii < ranges.size(); ii++)
+            cumulative[ii + 1] = cumulative[ii] + ranges[ii].second;
+
+        size_t next = 0;
+        while(next < ranges.size())
+        {
+            const size_t taken = std::min(progress.load(std::memory_order_relaxed), ranges.size());
+            next = std::max(next, taken);
+            if(next >= ranges.size())
+                break;
+            if(next > taken && cumulative[next + 1] - cumulative[taken] > window)
+            {
+                std::unique_lock<std::mutex> lock(mutex);
+                if(wake.wait_for(lock, std::chrono::milliseconds(1), [this]{ return stopping; }))
+                    break;
+                continue;
+            }
+            size_t end = next + 1;
+            while(end < ranges.size() &&
+                  ranges[end].first == ranges[end - 1].first + ranges[end - 1].second &&
+                  cumulative[end + 1] - cumulative[taken] <= window)
+                end++;
+            if(cumulative[end] > cumulative[next])
+                prefetch(ranges[next].first, cumulative[end] - cumulative[next]);
+            next = end;
+
+            std::lock_guard<std::mutex> lock(mutex);
+            if(stopping)
+                break;
+        }
+    }
+
+ public:
+    Readahead(std::vector<std::pair<size_t, size_t>>&& _ranges,
+              const std::atomic<size_t>& _progress,
+              size_t _window,
+              std::function<void(size_t, size_t)> _prefetch)
+    : ranges(std::move(_ranges)), progress(_progress), window(_window), prefetch(std::move(_prefetch))
+    {
+        worker = std::thread([this]{ run(); });
+    }
+
+    ~Readahead()
+    {
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            stopping = true;
+        }
+        wake.notify_all();
+        worker.join();
+    }
+
+    Readahead(const Readahead&) = delete;
+    Readahead& operator=(const Readahead&) = delete;
+};
@@ -0,0 +1,326 @@
+/*
+ *   OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+ *   Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+ *
+ *   Licensed under the MIT License. See LICENCE file in the project root for details.
+ */
+
+#pragma once
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+// Streaming hashes of decoded frames: XXH64 (fast, non-cryptographic) and BLAKE2b (RFC 7693).
+// Both are self-contained, as the copy of xxHash inside the bundled zstd is private to it.
+
+enum class HashAlgorithm { XXH64, BLAKE2b };
+
+inline HashAlgorithm hash_algorithm_from_name(const std::string& name)
+{
+    if(name == "xxh64")
+        return HashAlgorithm::XXH64;
+    if(name == "blake2b")
+        return HashAlgorithm::BLAKE2b;
+    throw std::invalid_argument("Unknown hash algorithm: " + name + " (choose xxh64 or blake2b)");
+}
+
+//! Size in bytes of digests: 8 for XXH64, 32 for BLAKE2b (blake2b with digest_size=32).
+inline size_t hash_digest_size(HashAlgorithm algo)
+{
+    return algo == HashAlgorithm::XXH64 ? 8 : 32;
+}
+
+namespace hashing_detail {
+
+inline uint64_t rotl64(uint64_t x, int r) { return (x << r) | (x >> (64 - r)); }
+inline uint64_t rotr64(uint64_t x, int r) { return (x >> r) | (x << (64 - r)); }
+
+inline uint64_t read64(const uint8_t* p) { uint64_t v; memcpy(&v, p, 8); return v; }
+inline uint32_t read32(const uint8_t* p) { uint32_t v; memcpy(&v, p, 4); return v; }
+
+} // namespace hashing_detail
+
+//! Streaming XXH64, with seed 0; digests are big-endian, as printed by xxhash's hexdigest.
+class XXH64Hasher
+{
+    static constexpr uint64_t P1 = 11400714785074694791ULL;
+    static constexpr uint64_t P2 = 14029467366897019727ULL;
+    static constexpr uint64_t P3 = 1609587929392839161ULL;
+    static constexpr uint64_t P4 = 9650029242287828579ULL;
+    static constexpr uint64_t P5 = 2870177450012600261ULL;
+
+    uint64_t v[4];
+    uint64_t total_len = 0;
+    uint8_t mem[32];
+    size_t mem_size = 0;
+
+    static uint64_t round(uint64_t acc, uint64_t input)
+    {
+        acc += input * P2;
+        acc = hashing_detail::rotl64(acc, 31);
+        return acc * P1;
+    }
+
+    static uint64_t merge_round(uint64_t acc, uint64_t val)
+    {
+        acc ^= round(0, val);
+        return acc * P1 + P4;
+    }
+
+    void consume_stripe(const uint8_t* p)
+    {
+        for(int ii = 0; ii < 4; ii++)
+            v[ii] = round(v[ii], hashing_detail::read64(p + 8 * ii));
+    }
+
+ public:
+    XXH64Hasher() : v{P1 + P2, P2, 0, 0 - P1} {};
+
+    void update(const void* data, size_t len)
+    {
+        if(len == 0)
+            return;
+        const uint8_t* p = static_cast<const uint8_t*>(data);
+        const uint8_t* const end = p + len;
+        total_len += len;
+        if(mem_size + len < 32)
+        {
+            memcpy(mem + mem_size, p, len);
+            mem_size += len;
+            return;
+        }
+        if(mem_size > 0)
+        {
+            memcpy(mem + mem_size, p, 32 - mem_size);
+            p += 32 - mem_size;
+            consume_stripe(mem);
+            mem_size = 0;
+        }
+        for(; p + 32 <= end; p += 32)
+            consume_stripe(p);
+        memcpy(mem, p, end - p);
+        mem_size = end - p;
+    }
+
+    uint64_t digest() const
+    {
+        using hashing_detail::rotl64;
+        uint64_t h;
+        if(total_len >= 32)
+        {
+            h = rotl64(v[0], 1) + rotl64(v[1], 7) + rotl64(v[2], 12) + rotl64(v[3], 18);
+            for(int ii = 0; ii < 4; ii++)
+                h = merge_round(h, v[ii]);
+        }
+        else
+            h = P5;
+        h += total_len;
+
+        const uint8_t* p = mem;
+        const uint8_t* const end = mem + mem_size;
+        for(; p + 8 <= end; p += 8)
+        {
+            h ^= round(0, hashing_detail::read64(p));
+            h = rotl64(h, 27) * P1 + P4;
+        }
+        if(p + 4 <= end)
+        {
+            h ^= static_cast<uint64_t>(hashing_detail::read32(p)) * P1;
+            h = rotl64(h, 23) * P2 + P3;
+            p += 4;
+        }
+        for(; p < end; p++)
+        {
+            h ^= (*p) * P5;
+            h = rotl64(h, 11) * P1;
+        }
+        h ^= h >> 33;
+        h *= P2;
+        h ^= h >> 29;
+        h *= P3;
+        h ^= h >> 32;
+        return h;
+    }
+
+    void digest(uint8_t* out) const
+    {
+        uint64_t h = digest();
+        for(int ii = 0; ii < 8; ii++)
+            out[ii] = static_cast<uint8_t>(h >> (56 - 8 * ii));
+    }
+};
+
+//! Streaming unkeyed BLAKE2b with a 32-byte digest.
+class Blake2bHasher
+{
+    static constexpr size_t out_len = 32;
+    uint64_t h[8];
+    uint64_t t[2] = {0, 0};
+    uint8_t buf[128];
+    size_t buf_len = 0;
+
+    static const uint64_t* iv()
+    {
+        static const uint64_t values[8] = {
+            0x6a09e667f3bcc908ULL, 0xbb67ae8584caa73bULL, 0x3c6ef372fe94f82bULL, 0xa54ff53a5f1d36f1ULL,
+            0x510e527fade682d1ULL, 0x9b05688c2b3e6c1fULL, 0x1f83d9abfb41bd6bULL, 0x5be0cd19137e2179ULL};
+        return values;
+    }
+
+    void increment(size_t n)
+    {
+        t[0] += n;
+        if(t[0] < n)
+            t[1]++;
+    }
+
+    void compress(const uint8_t* block, bool last)
+    {
+        static const uint8_t sigma[12][16] = {
+            {0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15},
+            {14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3},
+            {11, 8, 12, 0, 5, 2, 15, 13, 10, 14, 3, 6, 7, 1, 9, 4},
+            {7, 9, 3, 1, 13, 12, 11, 14, 2, 6, 5, 10, 4, 0, 15, 8},
+            {9, 0, 5, 7, 2, 4, 10, 15, 14, 1, 11, 12, 6, 8, 3, 13},
+            {2, 12, 6, 10, 0, 11, 8, 3, 4, 13, 7, 5, 15, 14, 1, 9},
+            {12, 5, 1, 15, 14, 13, 4, 10, 0, 7, 6, 3, 9, 2, 8, 11},
+            {13, 11, 7, 14, 12, 1, 3, 9, 5, 0, 15, 4, 8, 6, 2, 10},
+            {6, 15, 14, 9, 11, 3, 0, 8, 12, 2, 13, 7, 1, 4, 10, 5},
+            {10, 2, 8, 4, 7, 6, 1, 5, 15, 11, 9, 14, 3, 12, 13, 0},
+            {0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15},
+            {14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3}};
+
+        uint64_t m[16];
+        uint64_t v[16];
+        for(int ii = 0; ii < 16; ii++)
+            m[ii] = hashing_detail::read64(block + 8 * ii);
+        for(int ii = 0; ii < 8; ii++)
+        {
+            v[ii] = h[ii];
+            v[ii + 8] = iv()[ii];
+        }
+        v[12] ^= t[0];
+        v[13] ^= t[1];
+        if(last)
+            v[14] = ~v[14];
+
+        auto g = [&v](int a, int b, int c, int d, uint64_t x, uint64_t y) {
+            using hashing_detail::rotr64;
+            v[a] = v[a] + v[b] + x;
+            v[d] = rotr64(v[d] ^ v[a], 32);
+            v[c] = v[c] + v[d];
+            v[b] = rotr64(v[b] ^ v[c], 24);
+            v[a] = v[a] + v[b] + y;
+            v[d] = rotr64(v[d] ^ v[a], 16);
+            v[c] = v[c] + v[d];
+            v[b] = rotr64(v[b] ^ v[c], 63);
+        };
+        for(int r = 0; r < 12; r++)
+        {
+            const uint8_t* s = sigma[r];
+            g(0, 4, 8, 12, m[s[0]], m[s[1]]);
+            g(1, 5, 9, 13, m[s[2]], m[s[3]]);
+            g(2, 6, 10, 14, m[s[4]], m[s[5]]);
+            g(3, 7, 11, 15, m[s[6]], m[s[7]]);
+            g(0, 5, 10, 15, m[s[8]], m[s[9]]);
+            g(1, 6, 11, 12, m[s[10]], m[s[11]]);
+            g(2, 7, 8, 13, m[s[12]], m[s[13]]);
+            g(3, 4, 9, 14, m[s[14]], m[s[15]]);
+        }
+        for(int ii = 0; ii < 8; ii++)
+            h[ii] ^= v[ii] ^ v[ii + 8];
+    }
+
+ public:
+    Blake2bHasher()
+    {
+        for(int ii = 0; ii < 8; ii++)
+            h[ii] = iv()[ii];
+        h[0] ^= 0x01010000ULL ^ out_len;
+    };
+
+    void update(const void* data, size_t len)
+    {
+        const uint8_t* p = static_cast<const uint8_t*>(data);
+        while(len > 0)
+        {
+            // The last block is compressed differently, so a full buffer waits for more data.
+            if(buf_len == 128)
+            {
+                increment(128);
+                compress(buf, false);
+                buf_len = 0;
+            }
+            size_t n = std::min<size_t>(len, 128 - buf_len);
+            memcpy(buf + buf_len, p, n);
+            buf_len += n;
+            p += n;
+            len -= n;
+        }
+    }
+
+    void digest(uint8_t* out)
+    {
+        increment(buf_len);
+        memset(buf + buf_len, 0, 128 - buf_len);
+        compress(buf, true);
+        uint8_t full[64];
+        for(int ii = 0; ii < 8; ii++)
+            for(int jj = 0; jj < 8; jj++)
+                full[8 * ii + jj] = static_cast<uint8_t>(h[ii] >> (8 * jj));
+        memcpy(out, full, out_len);
+    }
+};
+
+//! Hash of one buffer with the chosen algorithm; out must hold hash_digest_size(algo) bytes.
+inline void hash_bytes(HashAlgorithm algo, const void* data, size_t len, uint8_t* out)
+{
+    if(algo == HashAlgorithm::XXH64)
+    {
+        XXH64Hasher hasher;
+        hasher.update(data, len);
+        hasher.digest(out);
+    }
+    else
+    {
+        Blake2bHasher hasher;
+        hasher.update(data, len);
+        hasher.digest(out);
+    }
+}
+
+//! Root of the Merkle tree over digests (leaves, in the given order).
+/**
+ * Each inner node is the hash of the byte 0x01 followed by the digests of its two children; a node
+ * without a sibling is carried to the next level as it is. The root of no leaves is the hash of nothing.
+ */
+inline std::vector<uint8_t> merkle_root(HashAlgorithm algo, const uint8_t* digests, size_t n)
+{
+    const size_t size = hash_digest_size(algo);
+    std::vector<uint8_t> level(digests, digests + n * size);
+    if(n == 0)
+    {
+        level.resize(size);
+        hash_bytes(algo, nullptr, 0, level.data());
+        return level;
+    }
+    std::vector<uint8_t> pair(1 + 2 * size);
+    pair[0] = 0x01;
+    while(n > 1)
+    {
+        size_t parents = (n + 1) / 2;
+        for(size_t ii = 0; ii < n / 2; ii++)
+        {
+            memcpy(pair.data() + 1, level.data() + 2 * ii * size, 2 * size);
+            hash_bytes(algo, pair.data(), pair.size(), level.data() + ii * size);
+        }
+        if(n % 2 == 1)
+            memmove(level.data() + (parents - 1) * size, level.data() + (n - 1) * size, size);
+        n = parents;
+    }
+    level.resize(size);
+    return level;
+}
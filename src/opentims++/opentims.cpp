@@ -5,6 +5,7 @@
  *   Licensed under the MIT License. See LICENCE file in the project root for details.
  */
 
+#include <algorithm>
 #include <cstdlib>
 #include <cassert>
 #include <cstdint>
@@ -13,17 +14,19 @@
 #include <atomic>
 #include <vector>
 #include <iostream>
-#include <locale>
 #include <memory>
+#include <mutex>
 #include <limits>
 #include <stdexcept>
 #include <thread>
+#include <type_traits>
 #include <unordered_map>
 
 
 #include "platform.h"
 #include "zstd/zstd.h"
 #include "opentims.h"
+#include "byte_planes.h"
 #include "tof2mz_converter.h"
 #include "scan2inv_ion_mobility_converter.h"
 #include "thread_mgr.h"
@@ -50,26 +53,6 @@ TimsFrame::TimsFrame(uint32_t _id,
     time(_time)
 {}
 
-TimsFrame TimsFrame::TimsFrameFromSql(char** sql_row, TimsDataHandle& parent_handle)
-{
-    if(sql_row == nullptr)
-        throw std::runtime_error("TimsFrameFromSql: null SQL row");
-    for(int i = 0; i < 7; i++)
-        if(sql_row[i] == nullptr)
-            throw std::runtime_error("TimsFrameFromSql: null value in SQL column " + std::to_string(i));
-
-    return TimsFrame(
-            atol(sql_row[0]),
-            atol(sql_row[1]),
-            atol(sql_row[2]),
-            atol(sql_row[3]),
-            100.0 / atof(sql_row[4]),
-            atof(sql_row[5]),
-            std::strtoull(sql_row[6], nullptr, 10) + parent_handle.tims_data_bin.data(),
-            parent_handle
-    );
-}
-
 void TimsFrame::print() const
 {
 #ifndef OPENTIMS_BUILDING_R
@@ -80,8 +63,9 @@ void TimsFrame::print() const
 
 void TimsFrame::decompress(char* decompression_buffer, ZSTD_DCtx* decomp_ctx)
 {
-    uint32_t tims_packet_size = *reinterpret_cast<const uint32_t*>(tims_bin_frame);
-    assert(num_scans == *(reinterpret_cast<const uint32_t*>(tims_bin_frame)+1));
+    const char* packet = parent_tdh.frame_packet(*this);
+    uint32_t tims_packet_size = *reinterpret_cast<const uint32_t*>(packet);
+    assert(num_scans == *(reinterpret_cast<const uint32_t*>(packet)+1));
 
     size_t dsbytes = data_size_bytes();
 
@@ -95,7 +79,9 @@ void TimsFrame::decompress(char* decompression_buffer, ZSTD_DCtx* decomp_ctx)
     if(decomp_ctx == nullptr)
         decomp_ctx = parent_tdh.zstd_dctx;
 
-    size_t dec_result = ZSTD_decompressDCtx(decomp_ctx, decompression_buffer, dsbytes, tims_bin_frame + 8, tims_packet_size - 8);
+    StageTimer timer(parent_tdh.perf_counters, PerfStage::Decompress, id, true);
+    size_t dec_result = ZSTD_decompressDCtx(decomp_ctx, decompression_buffer, dsbytes, packet + 8, tims_packet_size - 8);
+    timer.done(tims_packet_size - 8, dsbytes, 1, 0);
     if(ZSTD_isError(dec_result))
     {
         std::string err = "Error uncompressing frame, error code: ";
@@ -113,6 +99,128 @@ void TimsFrame::decompress(char* decompression_buffer, ZSTD_DCtx* decomp_ctx)
     bytes3 = bytes2 + dsints;
 }
 
+void TimsFrame::decompress_into(char* decompression_buffer, ZSTD_DCtx* decomp_ctx) const
+{
+    const char* packet = parent_tdh.frame_packet(*this);
+    uint32_t tims_packet_size = *reinterpret_cast<const uint32_t*>(packet);
+    StageTimer timer(parent_tdh.perf_counters, PerfStage::Decompress, id, true);
+    size_t dec_result = ZSTD_decompressDCtx(decomp_ctx, decompression_buffer, data_size_bytes(), packet + 8, tims_packet_size - 8);
+    timer.done(tims_packet_size - 8, data_size_bytes(), 1, 0);
+    if(ZSTD_isError(dec_result))
+    {
+        std::string err = "Error uncompressing frame, error code: ";
+        err += std::to_string(dec_result);
+        err += " (";
+        err += ZSTD_getErrorName(dec_result);
+        err += "). File is either corrupted, or in a (yet) unsupported variant of the format.";
+        throw std::runtime_error(err);
+    }
+}
+
+std::string TimsFrame::check(char* decompression_buffer, ZSTD_DCtx* decomp_ctx) const
+{
+    const char* bin_begin = parent_tdh.tims_data_bin.data();
+    const size_t bin_size = parent_tdh.tims_data_bin.size();
+    if(tims_bin_frame < bin_begin || static_cast<size_t>(tims_bin_frame - bin_begin) + 8 > bin_size)
+        return "packet header lies outside of analysis.tdf_bin";
+    const size_t offset = tims_bin_frame - bin_begin;
+
+    uint32_t header[2];
+    parent_tdh.read_bin(offset, 8, reinterpret_cast<char*>(header));
+    const uint32_t tims_packet_size = header[0];
+    if(tims_packet_size < 8 || bin_size - offset < tims_packet_size)
+        return "packet size " + std::to_string(tims_packet_size) + " extends beyond the end of analysis.tdf_bin";
+    if(header[1] != num_scans)
+        return "packet holds " + std::to_string(header[1]) + " scans, but NumScans is " + std::to_string(num_scans);
+    if(num_peaks == 0)
+        return "";
+
+    const size_t dsbytes = data_size_bytes();
+    const char* packet = parent_tdh.frame_packet(*this);
+    size_t dec_result = ZSTD_decompressDCtx(decomp_ctx, decompression_buffer, dsbytes, packet + 8, tims_packet_size - 8);
+    if(ZSTD_isError(dec_result))
+        return std::string("zstd decompression failed: ") + ZSTD_getErrorName(dec_result);
+    if(dec_result != dsbytes)
+        return "decompressed to " + std::to_string(dec_result) + " bytes instead of " + std::to_string(dsbytes) + " expected from NumScans and NumPeaks";
+
+    const size_t dsints = data_size_ints();
+    auto data = [decompression_buffer, dsints](size_t index) -> uint32_t {
+        uint32_t ret;
+        char* bytes = reinterpret_cast<char*>(&ret);
+        bytes[0] = decompression_buffer[index];
+        bytes[1] = decompression_buffer[index + dsints];
+        bytes[2] = decompression_buffer[index + 2*dsints];
+        bytes[3] = decompression_buffer[index + 3*dsints];
+        return ret;
+    };
+
+    // Scan headers hold twice the numbers of peaks in scans; the last scan gets the remaining peaks.
+    uint64_t peaks_before = 0;
+    for(uint32_t scan_idx = 0; scan_idx + 1 < num_scans; scan_idx++)
+    {
+        const uint32_t scan_header = data(scan_idx + 1);
+        if(scan_header % 2 != 0)
+            return "odd header of scan " + std::to_string(scan_idx);
+        peaks_before += scan_header / 2;
+        if(peaks_before > num_peaks)
+            return "scan headers account for more than NumPeaks = " + std::to_string(num_peaks) + " peaks by scan " + std::to_string(scan_idx);
+    }
+    return "";
+}
+
+size_t TimsFrame::decode_scan_range(uint32_t scan_begin,
+                                    uint32_t scan_end,
+                                    const char* decompressed,
+                                    uint32_t* scan_ids,
+                                    uint32_t* tofs,
+                                    uint32_t* intensities) const
+{
+    scan_end = std::min(scan_end, num_scans);
+    if(num_peaks == 0 || scan_begin >= scan_end)
+        return 0;
+
+    const size_t dsints = data_size_ints();
+    thread_local std::vector<uint32_t> words;
+    if(words.size() < dsints)
+        words.resize(dsints);
+
+    StageTimer timer(parent_tdh.perf_counters, PerfStage::Decode, id);
+    // Scan headers first, then only the peaks of the chosen scans, see save_to_buffs_impl.
+    transpose_byte_planes(decompressed, dsints, 0, num_scans, words.data());
+    auto peaks_in_scan = [&](uint32_t scan_idx, uint32_t peaks_before) -> uint32_t {
+        return scan_idx + 1 < num_scans ? words[scan_idx+1] / 2 : num_peaks - peaks_before;
+    };
+    uint32_t peaks_before = 0;
+    for(uint32_t scan_idx = 0; scan_idx < scan_begin; scan_idx++)
+        peaks_before += peaks_in_scan(scan_idx, peaks_before);
+    uint32_t peaks_in_range = 0;
+    for(uint32_t scan_idx = scan_begin; scan_idx < scan_end; scan_idx++)
+        peaks_in_range += peaks_in_scan(scan_idx, peaks_before + peaks_in_range);
+
+    size_t read_offset = num_scans + 2 * static_cast<size_t>(peaks_before);
+    transpose_byte_planes(decompressed, dsints, read_offset, 2 * static_cast<size_t>(peaks_in_range), words.data() + read_offset);
+
+    size_t written = 0;
+    for(uint32_t scan_idx = scan_begin; scan_idx < scan_end; scan_idx++)
+    {
+        const uint32_t no_peaks = peaks_in_scan(scan_idx, peaks_before);
+        uint32_t accum_tofs = -1; // 1-indexed deltas, as in save_to_buffs
+        for(uint32_t ii = 0; ii < no_peaks; ii++)
+        {
+            accum_tofs += words[read_offset];
+            tofs[written] = accum_tofs;
+            intensities[written] = static_cast<double>(words[read_offset+1]) * intensity_correction + 0.5;
+            if(scan_ids != nullptr)
+                scan_ids[written] = scan_idx;
+            read_offset += 2;
+            written++;
+        }
+        peaks_before += no_peaks;
+    }
+    timer.done(4 * (scan_end + 2 * static_cast<size_t>(peaks_before)), 12 * written, 0, written);
+    return written;
+}
+
 void TimsFrame::close()
 {
     bytes0 = nullptr;
@@ -131,26 +239,6 @@ void TimsFrame::save_to_buffs(uint32_t* frame_ids,
     if(num_peaks == 0)
         return;
 
-    std::unique_ptr<uint32_t[]> scan_ids_hndl;
-    std::unique_ptr<uint32_t[]> tofs_hndl;
-    std::unique_ptr<uint32_t[]> intensities_hndl;
-
-    if(scan_ids == nullptr && inv_ion_mobilities != nullptr)
-    {
-        scan_ids_hndl = std::make_unique<uint32_t[]>(num_peaks);
-        scan_ids = scan_ids_hndl.get();
-    }
-    if(tofs == nullptr)
-    {
-        tofs_hndl = std::make_unique<uint32_t[]>(num_peaks);
-        tofs = tofs_hndl.get();
-    }
-    if(intensities == nullptr)
-    {
-        intensities_hndl = std::make_unique<uint32_t[]>(num_peaks);
-        intensities = intensities_hndl.get();
-    }
-
     bool needs_closure = false;
     if(bytes0 == nullptr)
     {
@@ -158,131 +246,254 @@ void TimsFrame::save_to_buffs(uint32_t* frame_ids,
         needs_closure = true;
     }
 
-    uint32_t peaks_processed = 0;
-    // The decompressed buffer layout: first num_scans uint32s are scan headers,
-    // each storing the byte offset to the start of that scan's peak data.
-    // Peak data follows: interleaved TOF deltas and intensities (2 words per peak).
-    size_t read_offset = num_scans;
-    uint32_t accum_tofs;
+    decode_into(bytes0, frame_ids, scan_ids, tofs, intensities, mzs, inv_ion_mobilities, retention_times);
 
-    uint32_t num_scans_m1 = num_scans - 1;
-
-    for(uint32_t scan_idx = 0; scan_idx < num_scans_m1; scan_idx++)
-    {
-        // Initialize to UINT32_MAX so that the first delta addition wraps around
-        // correctly: the format stores 1-indexed deltas, so delta=1 means TOF index 0.
-        accum_tofs = -1;
-
-        // Scan header stores byte offset; divide by 2 (words) to get peak count
-        // for this scan (difference from next scan header gives peaks in this scan).
-        const uint32_t no_peaks = back_data(scan_idx+1) / 2;
+    if(needs_closure)
+        close();
+}
 
-        const uint32_t for_loop_end = no_peaks + peaks_processed;
+void TimsFrame::decode_into(const char* decompressed,
+                            uint32_t* frame_ids,
+                            uint32_t* scan_ids,
+                            uint32_t* tofs,
+                            uint32_t* intensities,
+                            double* mzs,
+                            double* inv_ion_mobilities,
+                            double* retention_times) const
+{
+    if(num_peaks == 0)
+        return;
 
-        if(scan_ids != nullptr)
-            for(uint32_t ii = peaks_processed; ii < for_loop_end; ii++)
-                scan_ids[ii] = scan_idx;
+    // Columns the converters need but the caller did not ask for go to per-thread scratch buffers,
+    // which only grow: no heap allocation per frame.
+    thread_local std::vector<uint32_t> scan_ids_scratch;
+    thread_local std::vector<uint32_t> tofs_scratch;
 
-        for(uint32_t ii = 0; ii < no_peaks; ii++)
-        {
-            accum_tofs += back_data(read_offset);
-            tofs[peaks_processed] = accum_tofs;
-            read_offset++;
-            intensities[peaks_processed] = back_data(read_offset);
-            read_offset++;
-            peaks_processed++;
-        }
+    if(scan_ids == nullptr && inv_ion_mobilities != nullptr)
+    {
+        if(scan_ids_scratch.size() < num_peaks)
+            scan_ids_scratch.resize(num_peaks);
+        scan_ids = scan_ids_scratch.data();
+    }
+    if(tofs == nullptr && mzs != nullptr)
+    {
+        if(tofs_scratch.size() < num_peaks)
+            tofs_scratch.resize(num_peaks);
+        tofs = tofs_scratch.data();
     }
 
-    accum_tofs = -1; // same 1-indexed delta convention for the last scan
+    static constexpr auto kernels = decode_kernels(std::make_index_sequence<32>());
+    const size_t mask = (scan_ids != nullptr) | (tofs != nullptr) << 1 | (intensities != nullptr) << 2 |
+                        (frame_ids != nullptr) << 3 | (retention_times != nullptr) << 4;
 
-    const uint32_t nnum_peaks = num_peaks;
+    thread_local std::vector<uint32_t> headers;
+    if(headers.size() < num_scans)
+        headers.resize(num_scans);
 
-    if(scan_ids != nullptr)
-        for(uint32_t ii = peaks_processed; ii < nnum_peaks; ii++)
-            scan_ids[ii] = num_scans_m1;
+    StageTimer decode_timer(parent_tdh.perf_counters, PerfStage::Decode, id);
+    transpose_byte_planes(decompressed, data_size_ints(), 0, num_scans, headers.data());
+    (this->*kernels[mask])(decompressed, headers.data(), frame_ids, scan_ids, tofs, intensities, retention_times);
+    decode_timer.done(data_size_bytes(), 12 * static_cast<uint64_t>(num_peaks), 1, num_peaks);
 
-    while(peaks_processed < nnum_peaks)
+    if(mzs != nullptr)
     {
-        accum_tofs += back_data(read_offset);
-        tofs[peaks_processed] = accum_tofs;
-        read_offset++;
-        intensities[peaks_processed] = back_data(read_offset);
-        read_offset++;
-        peaks_processed++;
+        StageTimer timer(parent_tdh.perf_counters, PerfStage::TofToMz, id);
+        parent_tdh.tof2mz_converter->convert(id, mzs, tofs, num_peaks);
+        timer.done(4 * static_cast<uint64_t>(num_peaks), 8 * static_cast<uint64_t>(num_peaks), 1, num_peaks);
     }
 
+    if(inv_ion_mobilities != nullptr)
+    {
+        StageTimer timer(parent_tdh.perf_counters, PerfStage::ScanToInvIonMobility, id);
+        parent_tdh.scan2inv_ion_mobility_converter->convert(id, inv_ion_mobilities, scan_ids, num_peaks);
+        timer.done(4 * static_cast<uint64_t>(num_peaks), 8 * static_cast<uint64_t>(num_peaks), 1, num_peaks);
+    }
+}
 
-    for(size_t idx = 0; idx < nnum_peaks; idx++)
-        intensities[idx] = static_cast<double>(intensities[idx]) * intensity_correction + 0.5;
-
-    if(mzs != nullptr)
-        parent_tdh.tof2mz_converter->convert(id, mzs, tofs, nnum_peaks);
+template<bool scan_ids_present,
+         bool tofs_present,
+         bool intensities_present,
+         bool frame_ids_present,
+         bool retention_times_present>
+void TimsFrame::save_to_buffs_impl(const char* decompressed,
+                                   const uint32_t* headers,
+                                   uint32_t* frame_ids,
+                                   uint32_t* scan_ids,
+                                   uint32_t* tofs,
+                                   uint32_t* intensities,
+                                   double* retention_times) const
+{
+    // The decompressed buffer layout: first num_scans uint32s are scan headers; header s+1
+    // holds twice the number of peaks in scan s, and the last scan gets the remaining peaks.
+    // Peak data follows: interleaved TOF deltas and intensities (2 words per peak). It is
+    // reassembled from the byte planes in blocks small enough to stay in L1 cache.
+    constexpr uint32_t block_peaks = 1024;
+    uint32_t block[2 * block_peaks];
 
-    if(frame_ids != nullptr)
-        for(size_t idx = 0; idx < nnum_peaks; idx++)
-            frame_ids[idx] = id;
+    const uint32_t nnum_peaks = num_peaks;
+    const uint32_t num_scans_m1 = num_scans - 1;
+    uint32_t scan_idx = 0;
+    uint32_t scan_end = num_scans_m1 > 0 ? headers[1] / 2 : nnum_peaks;
 
-    if(retention_times != nullptr)
-        for(size_t idx = 0; idx < nnum_peaks; idx++)
-            retention_times[idx] = time;
+    // Initialize to UINT32_MAX so that the first delta addition wraps around
+    // correctly: the format stores 1-indexed deltas, so delta=1 means TOF index 0.
+    uint32_t accum_tofs = -1;
 
-    if(inv_ion_mobilities != nullptr)
-        parent_tdh.scan2inv_ion_mobility_converter->convert(id, inv_ion_mobilities, scan_ids, nnum_peaks);
+    for(uint32_t block_begin = 0; block_begin < nnum_peaks; block_begin += block_peaks)
+    {
+        const uint32_t block_end = std::min(block_begin + block_peaks, nnum_peaks);
+        transpose_byte_planes(decompressed, data_size_ints(), num_scans + 2 * static_cast<size_t>(block_begin), 2 * (block_end - block_begin), block);
 
-    if(needs_closure)
-        close();
+        uint32_t peaks_processed = block_begin;
+        while(peaks_processed < block_end)
+        {
+            while(peaks_processed == scan_end)
+            {
+                scan_idx++;
+                scan_end = scan_idx < num_scans_m1 ? scan_end + headers[scan_idx+1] / 2 : nnum_peaks;
+                accum_tofs = -1;
+            }
+            const uint32_t run_end = std::min(scan_end, block_end);
+            for(; peaks_processed < run_end; peaks_processed++)
+            {
+                if constexpr(tofs_present)
+                {
+                    accum_tofs += block[2 * (peaks_processed - block_begin)];
+                    tofs[peaks_processed] = accum_tofs;
+                }
+                if constexpr(intensities_present)
+                    intensities[peaks_processed] = static_cast<double>(block[2 * (peaks_processed - block_begin) + 1]) * intensity_correction + 0.5;
+                if constexpr(scan_ids_present)
+                    scan_ids[peaks_processed] = scan_idx;
+                if constexpr(frame_ids_present)
+                    frame_ids[peaks_processed] = id;
+                if constexpr(retention_times_present)
+                    retention_times[peaks_processed] = time;
+            }
+        }
+    }
 }
 
-int tims_sql_callback(void* out, [[maybe_unused]] int cols, char** row, char**)
+void TimsDataHandle::read_sql()
 {
-    assert(cols == 7);
-    assert(row != NULL);
-    assert(row[0] != NULL);
-    uint32_t frame_id = atol(row[0]);
-    TimsDataHandle* hndl = reinterpret_cast<TimsDataHandle*>(out);
-    hndl->frame_descs.emplace(frame_id, TimsFrame::TimsFrameFromSql(row, *hndl));
-    return 0;
+#ifndef OPENTIMS_BUILDING_R
+    RAIISqlite DB(tims_tdf_path);
+
+    frames_table = DB.select("SELECT * FROM Frames ORDER BY Id;");
+    load_frame_descs();
+
+    read_global_metadata(DB);
+    check_compression();
+#endif
 }
 
-int check_compression(void*, [[maybe_unused]] int cols, char** row, char**)
+void TimsDataHandle::check_compression() const
 {
-    assert(cols == 1);
-    assert(row != NULL);
-    assert(row[0] != NULL);
-    if(atoi(row[0]) != 2)
+    auto compression = global_metadata.find("TimsCompressionType");
+    if(compression != global_metadata.end() && atoi(compression->second.c_str()) != 2)
     {
         std::string error_msg = "Compression algorithm used in your TDF dataset: ";
-        error_msg += row[0];
+        error_msg += compression->second;
         error_msg += " is not (yet) supported by OpenTIMS. Right now only algorithm 2 (zstd) is supported.";
         throw std::runtime_error(error_msg);
     }
-    return 0;
 }
 
-#ifndef OPENTIMS_BUILDING_R
-class RAIILocaleHelper
+void TimsDataHandle::read_global_metadata(RAIISqlite& DB)
 {
-    const std::locale previous_locale;
- public:
-    RAIILocaleHelper() : previous_locale(std::locale::global(std::locale("C"))) {};
-    ~RAIILocaleHelper() { std::locale::global(previous_locale); };
-};
-#endif
+    SqlTable metadata = DB.select("SELECT Key, Value FROM GlobalMetadata;");
+    for(size_t ii = 0; ii < metadata.size(); ii++)
+        global_metadata[metadata["Key"].as_text(ii)] = metadata["Value"].as_text(ii);
+}
 
-void TimsDataHandle::read_sql(const std::string& tims_tdf_path)
+void TimsDataHandle::load_frame_descs()
 {
-#ifndef OPENTIMS_BUILDING_R
-    RAIILocaleHelper locale_guard;
-    RAIISqlite DB(tims_tdf_path);
+    const SqlColumn& ids = frames_table["Id"];
+    const SqlColumn& num_scans = frames_table["NumScans"];
+    const SqlColumn& num_peaks = frames_table["NumPeaks"];
+    const SqlColumn& msms_type = frames_table["MsMsType"];
+    const SqlColumn& accum_time = frames_table["AccumulationTime"];
+    const SqlColumn& time = frames_table["Time"];
+    const SqlColumn& tims_id = frames_table["TimsId"];
+
+    for(const SqlColumn* column : {&ids, &num_scans, &num_peaks, &msms_type, &accum_time, &time, &tims_id})
+        if(column->null_count() > 0)
+            throw std::runtime_error("Frames table: null value in SQL column " + column->name);
+
+    frame_descs.reserve(frames_table.size());
+    for(size_t row = 0; row < frames_table.size(); row++)
+        frame_descs.emplace(ids.as_int(row), TimsFrame(
+                ids.as_int(row),
+                num_scans.as_int(row),
+                num_peaks.as_int(row),
+                msms_type.as_int(row),
+                100.0 / accum_time.as_double(row),
+                time.as_double(row),
+                tims_id.as_int(row) + tims_data_bin.data(),
+                *this));
+}
 
-    const std::string sql = "SELECT Id, NumScans, NumPeaks, MsMsType, AccumulationTime, Time, TimsId from Frames;";
+const std::unordered_map<std::string, std::string>& TimsDataHandle::get_global_metadata()
+{
+    if(global_metadata.empty())
+    {
+        RAIISqlite DB(tims_tdf_path);
+        read_global_metadata(DB);
+    }
+    return global_metadata;
+}
 
-    DB.query(sql, tims_sql_callback, this);
-    DB.query("SELECT Value FROM GlobalMetadata WHERE Key == \"TimsCompressionType\";", check_compression, nullptr);
-#endif
+uint32_t TimsDataHandle::max_num_scans() const
+{
+    uint32_t ret = 0;
+    for(auto it = frame_descs.begin(); it != frame_descs.end(); it++)
+        ret = (std::max)(ret, it->second.num_scans);
+    return ret;
 }
 
+const TimsDataHandle::MsLevelIndex& TimsDataHandle::get_ms_level_index(uint32_t ms_level)
+{
+    if(ms_level > 2)
+        throw std::invalid_argument("MS level must be 1, 2, or 0 (for all frames), got: " + std::to_string(ms_level));
+    if(ms_level_index.empty())
+    {
+        std::vector<uint32_t> ids;
+        ids.reserve(frame_descs.size());
+        for(const auto& it : frame_descs)
+            ids.push_back(it.first);
+        std::sort(ids.begin(), ids.end());
+
+        ms_level_index.resize(3);
+        for(uint32_t id : ids)
+        {
+            const TimsFrame& frame = frame_descs.at(id);
+            for(size_t level : {size_t(0), size_t(frame.msms_type == 0 ? 1 : 2)})
+            {
+                ms_level_index[level].ids.push_back(id);
+                ms_level_index[level].times.push_back(frame.time);
+            }
+        }
+    }
+    return ms_level_index[ms_level];
+}
+
+const std::vector<uint32_t>& TimsDataHandle::ms_level_frames(uint32_t ms_level)
+{
+    return get_ms_level_index(ms_level).ids;
+}
+
+const std::vector<double>& TimsDataHandle::ms_level_retention_times(uint32_t ms_level)
+{
+    return get_ms_level_index(ms_level).times;
+}
+
+std::pair<size_t, size_t> TimsDataHandle::ms_level_rt_range(uint32_t ms_level, double min_rt, double max_rt)
+{
+    const std::vector<double>& times = get_ms_level_index(ms_level).times;
+    const size_t first = std::lower_bound(times.begin(), times.end(), min_rt) - times.begin();
+    const size_t last = std::lower_bound(times.begin(), times.end(), max_rt) - times.begin();
+    return {first, (std::max)(first, last)};
+}
 
 void TimsDataHandle::init(pressure_compensation_strategy pcs,
                           Tof2MzConverterFactory* tof_factory,
@@ -298,6 +509,7 @@ void TimsDataHandle::init(pressure_compensation_strategy pcs,
         decomp_buffer_size = (std::max)(decomp_buffer_size, it->second.data_size_bytes());
     }
     decompression_buffer = std::make_unique<char[]>(decomp_buffer_size);
+    compute_bin_spans();
 
     zstd_dctx = ZSTD_createDCtx();
 
@@ -309,11 +521,11 @@ void TimsDataHandle::init(pressure_compensation_strategy pcs,
         : DefaultScan2InvIonMobilityConverterFactory::produceDefaultConverterInstance(*this, pcs);
 }
 
-TimsDataHandle::TimsDataHandle(const std::string& tims_tdf_bin_path, const std::string& tims_tdf_path, const std::string& tims_data_dir, pressure_compensation_strategy pcs, Tof2MzConverterFactory* tof_factory, Scan2InvIonMobilityConverterFactory* im_factory)
-: tims_dir_path(tims_data_dir), tims_data_bin(tims_tdf_bin_path), zstd_dctx(nullptr)
+TimsDataHandle::TimsDataHandle(const std::string& tims_tdf_bin_path, const std::string& _tims_tdf_path, const std::string& tims_data_dir, pressure_compensation_strategy pcs, Tof2MzConverterFactory* tof_factory, Scan2InvIonMobilityConverterFactory* im_factory)
+: tims_dir_path(tims_data_dir), tims_tdf_path(_tims_tdf_path), tims_data_bin(tims_tdf_bin_path), zstd_dctx(nullptr)
 {
 #ifndef OPENTIMS_BUILDING_R
-    read_sql(tims_tdf_path);
+    read_sql();
 #endif
     init(pcs, tof_factory, im_factory);
 }
@@ -322,6 +534,15 @@ TimsDataHandle::TimsDataHandle(const std::string& tims_data_dir, pressure_compen
 : TimsDataHandle(tims_data_dir + "/analysis.tdf_bin", tims_data_dir + "/analysis.tdf", tims_data_dir, pcs, tof_factory, im_factory)
 {}
 
+TimsDataHandle::TimsDataHandle(const std::string& tims_data_dir, SqlTable&& _frames_table, std::unordered_map<std::string, std::string>&& _global_metadata, pressure_compensation_strategy pcs, Tof2MzConverterFactory* tof_factory, Scan2InvIonMobilityConverterFactory* im_factory)
+: tims_dir_path(tims_data_dir), tims_tdf_path(tims_data_dir + "/analysis.tdf"), tims_data_bin(tims_data_dir + "/analysis.tdf_bin"),
+  frames_table(std::move(_frames_table)), global_metadata(std::move(_global_metadata)), zstd_dctx(nullptr)
+{
+    check_compression();
+    load_frame_descs();
+    init(pcs, tof_factory, im_factory);
+}
+
 #ifdef OPENTIMS_BUILDING_R
 
 union braindead_r
@@ -398,6 +619,114 @@ TimsDataHandle::~TimsDataHandle()
 }
 
 
+int TimsDataHandle::bin_fd() const
+{
+#ifdef OPENTIMS_UNIX
+    return tims_data_bin.file_handle();
+#else
+    return -1;
+#endif
+}
+
+void TimsDataHandle::compute_bin_spans()
+{
+    std::vector<TimsFrame*> by_offset;
+    by_offset.reserve(frame_descs.size());
+    for(auto& [id, frame] : frame_descs)
+        by_offset.push_back(&frame);
+    std::sort(by_offset.begin(), by_offset.end(), [](const TimsFrame* a, const TimsFrame* b) { return a->tims_bin_frame < b->tims_bin_frame; });
+    const char* bin_end = tims_data_bin.data() + tims_data_bin.size();
+    for(size_t ii = 0; ii < by_offset.size(); ii++)
+    {
+        const char* next = ii + 1 < by_offset.size() ? by_offset[ii+1]->tims_bin_frame : bin_end;
+        by_offset[ii]->bin_span = next > by_offset[ii]->tims_bin_frame ? next - by_offset[ii]->tims_bin_frame : 0;
+    }
+}
+
+void TimsDataHandle::read_bin(size_t offset, size_t length, char* out) const
+{
+    if(io_mode == IOMode::Mmap)
+        memcpy(out, tims_data_bin.data() + offset, length);
+    else
+        file_access::read_at(bin_fd(), offset, length, out);
+}
+
+const char* TimsDataHandle::frame_packet(const TimsFrame& frame)
+{
+    if(io_mode == IOMode::Mmap)
+        return frame.tims_bin_frame;
+
+    // One read of everything up to the next packet usually covers the whole packet.
+    thread_local std::vector<char> packet;
+    const size_t offset = frame.tims_bin_frame - tims_data_bin.data();
+    size_t length = std::max<size_t>(frame.bin_span, 8);
+    if(packet.size() < length)
+        packet.resize(length);
+    read_bin(offset, length, packet.data());
+    uint32_t packet_size;
+    memcpy(&packet_size, packet.data(), 4);
+    if(packet_size > length)
+    {
+        packet.resize(packet_size);
+        read_bin(offset + length, packet_size - length, packet.data() + length);
+    }
+    return packet.data();
+}
+
+void TimsDataHandle::set_access_pattern(AccessPattern pattern)
+{
+    access_pattern = pattern;
+    if(pattern == AccessPattern::Auto)
+        return;
+    if(io_mode == IOMode::Mmap)
+        file_access::advise_mapping(tims_data_bin.data(), tims_data_bin.size(), pattern);
+    else
+        file_access::advise_file(bin_fd(), pattern);
+}
+
+std::unique_ptr<Readahead> TimsDataHandle::prepare_access(const std::vector<TimsFrame*>& frames, const std::atomic<size_t>& progress)
+{
+    if(frames.size() < 2)
+        return nullptr;
+
+    if(access_pattern == AccessPattern::Auto)
+    {
+        bool increasing = true;
+        for(size_t ii = 1; ii < frames.size() && increasing; ii++)
+            increasing = frames[ii-1]->tims_bin_frame < frames[ii]->tims_bin_frame;
+        AccessPattern pattern = increasing ? AccessPattern::Sequential : AccessPattern::Random;
+        if(io_mode == IOMode::Mmap)
+            file_access::advise_mapping(tims_data_bin.data(), tims_data_bin.size(), pattern);
+        else
+            file_access::advise_file(bin_fd(), pattern);
+    }
+
+    if(readahead_bytes == 0)
+        return nullptr;
+    std::vector<std::pair<size_t, size_t>> ranges;
+    ranges.reserve(frames.size());
+    for(TimsFrame* frame : frames)
+        ranges.emplace_back(frame->tims_bin_frame - tims_data_bin.data(), frame->bin_span);
+    if(io_mode == IOMode::Mmap)
+    {
+        const char* base = tims_data_bin.data();
+        return std::make_unique<Readahead>(std::move(ranges), progress, readahead_bytes,
+                                           [base](size_t offset, size_t length) { file_access::prefetch_mapping(base + offset, length); });
+    }
+    const int fd = bin_fd();
+    return std::make_unique<Readahead>(std::move(ranges), progress, readahead_bytes,
+                                       [fd](size_t offset, size_t length) { file_access::prefetch_file(fd, offset, length); });
+}
+
+std::unique_ptr<Readahead> TimsDataHandle::prepare_access(const std::vector<uint32_t>& indexes, const std::atomic<size_t>& progress)
+{
+    std::vector<TimsFrame*> frames;
+    frames.reserve(indexes.size());
+    for(uint32_t index : indexes)
+        frames.push_back(&get_frame(index));
+    return prepare_access(frames, progress);
+}
+
 TimsFrame& TimsDataHandle::get_frame(uint32_t frame_no)
 {
     return frame_descs.at(frame_no);
@@ -499,7 +828,20 @@ void TimsDataHandle::extract_frames_slice(uint32_t start,
     }
 }
 
-#define move_ptr(ptr) if(ptr) ptr += n;
+namespace {
+
+template<typename T>
+std::vector<T*> frame_pointers(T* column, const std::vector<size_t>& offsets)
+{
+    // Where the peaks of each frame go in a contiguous output column; all nullptr if the column is not wanted.
+    std::vector<T*> ret(offsets.size() - 1, nullptr);
+    if(column != nullptr)
+        for(size_t ii = 0; ii + 1 < offsets.size(); ii++)
+            ret[ii] = column + offsets[ii];
+    return ret;
+}
+
+}
 
 void TimsDataHandle::extract_frames(const uint32_t* indexes,
                                     size_t no_indexes,
@@ -511,19 +853,20 @@ void TimsDataHandle::extract_frames(const uint32_t* indexes,
                                     double* inv_ion_mobilities,
                                     double* retention_times)
 {
+    // Frames are decoded in parallel, each straight into its place in the output columns.
+    std::vector<uint32_t> ids(indexes, indexes + no_indexes);
+    std::vector<size_t> offsets(no_indexes + 1, 0);
     for(size_t ii = 0; ii < no_indexes; ii++)
-    {
-        TimsFrame& frame = frame_descs.at(indexes[ii]);
-        const size_t n = frame.num_peaks;
-        frame_descs.at(indexes[ii]).save_to_buffs(frame_ids, scan_ids, tofs, intensities, mzs, inv_ion_mobilities, retention_times, zstd_dctx);
-        move_ptr(frame_ids);
-        move_ptr(scan_ids);
-        move_ptr(tofs);
-        move_ptr(intensities);
-        move_ptr(mzs);
-        move_ptr(inv_ion_mobilities);
-        move_ptr(retention_times);
-    }
+        offsets[ii + 1] = offsets[ii] + frame_descs.at(ids[ii]).num_peaks;
+
+    extract_frames(ids,
+                   frame_pointers(frame_ids, offsets).data(),
+                   frame_pointers(scan_ids, offsets).data(),
+                   frame_pointers(tofs, offsets).data(),
+                   frame_pointers(intensities, offsets).data(),
+                   frame_pointers(mzs, offsets).data(),
+                   frame_pointers(inv_ion_mobilities, offsets).data(),
+                   frame_pointers(retention_times, offsets).data());
 }
 
 void TimsDataHandle::extract_frames_slice(uint32_t start,
@@ -539,19 +882,10 @@ void TimsDataHandle::extract_frames_slice(uint32_t start,
 {
     if(step == 0)
         throw std::runtime_error("extract_frames_slice: step must be > 0");
+    std::vector<uint32_t> ids;
     for(uint32_t ii = start; ii < end; ii += step)
-    {
-        TimsFrame& frame = frame_descs.at(ii);
-        const size_t n = frame.num_peaks;
-        frame_descs.at(ii).save_to_buffs(frame_ids, scan_ids, tofs, intensities, mzs, inv_ion_mobilities, retention_times, zstd_dctx);
-        move_ptr(frame_ids);
-        move_ptr(scan_ids);
-        move_ptr(tofs);
-        move_ptr(intensities);
-        move_ptr(mzs);
-        move_ptr(inv_ion_mobilities);
-        move_ptr(retention_times);
-    }
+        ids.push_back(ii);
+    extract_frames(ids.data(), ids.size(), frame_ids, scan_ids, tofs, intensities, mzs, inv_ion_mobilities, retention_times);
 }
 
 
@@ -598,33 +932,204 @@ void TimsDataHandle::extract_frames(const std::vector<uint32_t>& indexes,
                                     double* const * retention_times)
 {
     std::atomic<size_t> current_task(0);
+    std::unique_ptr<Readahead> readahead = prepare_access(indexes, current_task);
+    std::exception_ptr error;
+    std::mutex error_mutex;
 
     ThreadingManager::get_instance().set_shared_threading();
-    size_t n_threads = ThreadingManager::get_instance().get_no_opentims_threads();
+    size_t n_threads = std::min(ThreadingManager::get_instance().get_no_opentims_threads(), std::max<size_t>(indexes.size(), 1));
 
     std::vector<std::thread> threads;
     for(size_t ii=0; ii<n_threads; ii++)
-        threads.emplace_back([&](){
+        threads.emplace_back([&, ii](){
+            PerfCounters::thread_slot() = ii + 1;
             std::unique_ptr<ZSTD_DCtx, decltype(&ZSTD_freeDCtx)> zstd(ZSTD_createDCtx(), &ZSTD_freeDCtx);
             std::unique_ptr<char[]> decomp_buffer = std::make_unique<char[]>(decomp_buffer_size);
             while(true)
             {
                 size_t my_task = current_task.fetch_add(1);
-                if(my_task < indexes.size())
+                if(my_task >= indexes.size())
+                    break;
+                try
                 {
-                    TimsFrame& frame = get_frame(indexes[my_task]);
-                    frame.decompress(decomp_buffer.get(), zstd.get());
-                    frame.save_to_buffs(frame_ids[my_task], scan_ids[my_task], tofs[my_task], intensities[my_task], mzs[my_task], inv_ion_mobilities[my_task], retention_times[my_task], zstd.get());
-                    frame.close();
+                    // Frames are decoded without touching their state: the same frame may come up in several tasks.
+                    const TimsFrame& frame = get_frame(indexes[my_task]);
+                    if(frame.num_peaks == 0)
+                        continue;
+                    frame.decompress_into(decomp_buffer.get(), zstd.get());
+                    frame.decode_into(decomp_buffer.get(), frame_ids[my_task], scan_ids[my_task], tofs[my_task], intensities[my_task], mzs[my_task], inv_ion_mobilities[my_task], retention_times[my_task]);
                 }
-                else
+                catch(...)
+                {
+                    std::lock_guard<std::mutex> lock(error_mutex);
+                    if(!error)
+                        error = std::current_exception();
+                    current_task = indexes.size();
                     break;
+                }
             }
         });
     for (auto& th : threads) th.join();
     ThreadingManager::get_instance().set_converter_threading();
+    if(error)
+        std::rethrow_exception(error);
+}
+
+
+namespace {
+
+template<typename Out, typename In>
+void store_values(void* data, size_t offset, const In* values, size_t n)
+{
+    Out* out = static_cast<Out*>(data) + offset;
+    for(size_t ii = 0; ii < n; ii++)
+        out[ii] = static_cast<Out>(values[ii]);
+}
+
+template<typename In>
+void store_column(const TypedColumn& column, size_t offset, const In* values, size_t n)
+{
+    switch(column.type)
+    {
+        case ColumnType::UInt16:  store_values<uint16_t>(column.data, offset, values, n); break;
+        case ColumnType::UInt32:  store_values<uint32_t>(column.data, offset, values, n); break;
+        case ColumnType::Float32: store_values<float>(column.data, offset, values, n); break;
+        case ColumnType::Float64: store_values<double>(column.data, offset, values, n); break;
+    }
+}
+
+template<typename Native>
+constexpr ColumnType native_column_type()
+{
+    return std::is_same<Native, double>::value ? ColumnType::Float64 : ColumnType::UInt32;
+}
+
+// Where save_to_buffs should write a column: straight into the output if it has the native type,
+// otherwise into a scratch buffer that is narrowed afterwards; nullptr if the column is not wanted.
+template<typename Native>
+Native* decode_target(const TypedColumn& column, size_t offset, Native* scratch)
+{
+    if(column.data == nullptr)
+        return nullptr;
+    if(column.type == native_column_type<Native>())
+        return static_cast<Native*>(column.data) + offset;
+    return scratch;
 }
 
+template<typename Native>
+void check_column_type(const TypedColumn& column, const char* name)
+{
+    bool is_float = column.type == ColumnType::Float32 || column.type == ColumnType::Float64;
+    if(column.data != nullptr && is_float != std::is_floating_point<Native>::value)
+        throw std::invalid_argument(std::string("extract_frames_typed: unsupported type of column ") + name);
+}
+
+} // namespace
+
+void TimsDataHandle::extract_frames_typed(const std::vector<uint32_t>& indexes,
+                                          const TypedColumn& frame_ids,
+                                          const TypedColumn& scan_ids,
+                                          const TypedColumn& tofs,
+                                          const TypedColumn& intensities,
+                                          const TypedColumn& mzs,
+                                          const TypedColumn& inv_ion_mobilities,
+                                          const TypedColumn& retention_times)
+{
+    check_column_type<uint32_t>(frame_ids, "frame");
+    check_column_type<uint32_t>(scan_ids, "scan");
+    check_column_type<uint32_t>(tofs, "tof");
+    check_column_type<uint32_t>(intensities, "intensity");
+    check_column_type<double>(mzs, "mz");
+    check_column_type<double>(inv_ion_mobilities, "inv_ion_mobility");
+    check_column_type<double>(retention_times, "retention_time");
+
+    std::vector<TimsFrame*> frames;
+    frames.reserve(indexes.size());
+    std::vector<size_t> offsets(indexes.size() + 1, 0);
+    size_t max_peaks = 0;
+    for(size_t ii = 0; ii < indexes.size(); ii++)
+    {
+        frames.push_back(&get_frame(indexes[ii]));
+        offsets[ii + 1] = offsets[ii] + frames.back()->num_peaks;
+        max_peaks = std::max<size_t>(max_peaks, frames.back()->num_peaks);
+    }
+
+    std::atomic<size_t> current_task(0);
+    std::unique_ptr<Readahead> readahead = prepare_access(frames, current_task);
+    std::exception_ptr error;
+    std::mutex error_mutex;
+
+    ThreadingManager::get_instance().set_shared_threading();
+    size_t n_threads = std::min(ThreadingManager::get_instance().get_no_opentims_threads(), std::max<size_t>(frames.size(), 1));
+
+    std::vector<std::thread> threads;
+    for(size_t ii=0; ii<n_threads; ii++)
+        threads.emplace_back([&, ii](){
+            PerfCounters::thread_slot() = ii + 1;
+            std::unique_ptr<ZSTD_DCtx, decltype(&ZSTD_freeDCtx)> zstd(ZSTD_createDCtx(), &ZSTD_freeDCtx);
+            std::unique_ptr<char[]> decomp_buffer = std::make_unique<char[]>(decomp_buffer_size);
+            std::unique_ptr<uint32_t[]> scans = std::make_unique<uint32_t[]>(max_peaks);
+            std::unique_ptr<uint32_t[]> tof_values = std::make_unique<uint32_t[]>(max_peaks);
+            std::unique_ptr<uint32_t[]> intensity_values = std::make_unique<uint32_t[]>(max_peaks);
+            std::unique_ptr<double[]> mz_values = std::make_unique<double[]>(max_peaks);
+            std::unique_ptr<double[]> inv_ion_mobility_values = std::make_unique<double[]>(max_peaks);
+            while(true)
+            {
+                size_t my_task = current_task.fetch_add(1);
+                if(my_task >= frames.size())
+                    break;
+
+                const TimsFrame& frame = *frames[my_task];
+                const size_t offset = offsets[my_task];
+                const size_t n = frame.num_peaks;
+                try
+                {
+                    if(n == 0)
+                        continue;
+                    uint32_t* scan_target = decode_target(scan_ids, offset, scans.get());
+                    uint32_t* tof_target = decode_target(tofs, offset, tof_values.get());
+                    uint32_t* intensity_target = decode_target(intensities, offset, intensity_values.get());
+                    double* mz_target = decode_target(mzs, offset, mz_values.get());
+                    double* inv_ion_mobility_target = decode_target(inv_ion_mobilities, offset, inv_ion_mobility_values.get());
+                    frame.decompress_into(decomp_buffer.get(), zstd.get());
+                    frame.decode_into(decomp_buffer.get(), nullptr, scan_target, tof_target, intensity_target, mz_target, inv_ion_mobility_target, nullptr);
+
+                    if(scan_target == scans.get())
+                        store_column(scan_ids, offset, scan_target, n);
+                    if(tof_target == tof_values.get())
+                        store_column(tofs, offset, tof_target, n);
+                    if(intensity_target == intensity_values.get())
+                        store_column(intensities, offset, intensity_target, n);
+                    if(mz_target == mz_values.get())
+                        store_column(mzs, offset, mz_target, n);
+                    if(inv_ion_mobility_target == inv_ion_mobility_values.get())
+                        store_column(inv_ion_mobilities, offset, inv_ion_mobility_target, n);
+                    if(frame_ids.data != nullptr)
+                    {
+                        std::fill_n(scans.get(), n, frame.id);
+                        store_column(frame_ids, offset, scans.get(), n);
+                    }
+                    if(retention_times.data != nullptr)
+                    {
+                        std::fill_n(mz_values.get(), n, frame.time);
+                        store_column(retention_times, offset, mz_values.get(), n);
+                    }
+                }
+                catch(...)
+                {
+                    std::lock_guard<std::mutex> lock(error_mutex);
+                    if(!error)
+                        error = std::current_exception();
+                    current_task = frames.size();
+                    break;
+                }
+            }
+        });
+    for (auto& th : threads) th.join();
+    ThreadingManager::get_instance().set_converter_threading();
+    if(error)
+        std::rethrow_exception(error);
+}
 
 void TimsDataHandle::per_frame_TIC(uint32_t* result)
 {
@@ -643,3 +1148,733 @@ void TimsDataHandle::per_frame_TIC(uint32_t* result)
         result[it->first - _min_frame_id] = acc;
     }
 }
+
+template<typename Callback>
+void TimsDataHandle::for_each_decoded_frame(const std::vector<TimsFrame*>& frames, Callback callback, bool converts)
+{
+    // Calls callback(task_no, frame, scans, tofs, intensities) for each frame, from multiple threads.
+    // Callbacks calling the converters must say so: the Bruker converter runs threads of its own.
+    size_t max_peaks = 0;
+    for(TimsFrame* frame : frames)
+        max_peaks = std::max<size_t>(max_peaks, frame->num_peaks);
+
+    std::atomic<size_t> current_task(0);
+    std::unique_ptr<Readahead> readahead = prepare_access(frames, current_task);
+    std::exception_ptr error;
+    std::mutex error_mutex;
+
+    if(converts)
+        ThreadingManager::get_instance().set_shared_threading();
+    else
+        ThreadingManager::get_instance().set_opentims_threading();
+    size_t n_threads = std::min(ThreadingManager::get_instance().get_no_opentims_threads(), std::max<size_t>(frames.size(), 1));
+
+    std::vector<std::thread> threads;
+    for(size_t ii=0; ii<n_threads; ii++)
+        threads.emplace_back([&, ii](){
+            PerfCounters::thread_slot() = ii + 1;
+            std::unique_ptr<ZSTD_DCtx, decltype(&ZSTD_freeDCtx)> zstd(ZSTD_createDCtx(), &ZSTD_freeDCtx);
+            std::unique_ptr<char[]> decomp_buffer = std::make_unique<char[]>(decomp_buffer_size);
+            std::unique_ptr<uint32_t[]> scans = std::make_unique<uint32_t[]>(max_peaks);
+            std::unique_ptr<uint32_t[]> tofs = std::make_unique<uint32_t[]>(max_peaks);
+            std::unique_ptr<uint32_t[]> intensities = std::make_unique<uint32_t[]>(max_peaks);
+            while(true)
+            {
+                size_t my_task = current_task.fetch_add(1);
+                if(my_task >= frames.size())
+                    break;
+
+                TimsFrame& frame = *frames[my_task];
+                try
+                {
+                    // Frames are decoded without touching their state, so that concurrent calls may share them.
+                    if(frame.num_peaks > 0)
+                    {
+                        frame.decompress_into(decomp_buffer.get(), zstd.get());
+                        frame.decode_scan_range(0, frame.num_scans, decomp_buffer.get(), scans.get(), tofs.get(), intensities.get());
+                    }
+                    callback(my_task, frame, scans.get(), tofs.get(), intensities.get());
+                }
+                catch(...)
+                {
+                    std::lock_guard<std::mutex> lock(error_mutex);
+                    if(!error)
+                        error = std::current_exception();
+                    current_task = frames.size();
+                    break;
+                }
+            }
+        });
+    for (auto& th : threads) th.join();
+    ThreadingManager::get_instance().set_converter_threading();
+    if(error)
+        std::rethrow_exception(error);
+}
+
+namespace {
+
+template<typename Hasher>
+void hash_frame_columns(Hasher& hasher, const TimsFrame& frame, unsigned columns, const uint32_t* scans, const uint32_t* tofs, const uint32_t* intensities)
+{
+    const size_t n = frame.num_peaks;
+    if(columns & 1)
+    {
+        // The frame column is constant: feed it in chunks rather than materializing it.
+        uint32_t ids[256];
+        std::fill_n(ids, 256, frame.id);
+        for(size_t done = 0; done < n; done += 256)
+            hasher.update(ids, 4 * std::min<size_t>(256, n - done));
+    }
+    if(columns & 2)
+        hasher.update(scans, 4 * n);
+    if(columns & 4)
+        hasher.update(tofs, 4 * n);
+    if(columns & 8)
+        hasher.update(intensities, 4 * n);
+}
+
+} // namespace
+
+void TimsDataHandle::frame_digests(const std::vector<uint32_t>& indexes, HashAlgorithm algo, unsigned columns, uint8_t* digests)
+{
+    std::vector<TimsFrame*> frames;
+    frames.reserve(indexes.size());
+    for(uint32_t index : indexes)
+        frames.push_back(&get_frame(index));
+
+    const size_t size = hash_digest_size(algo);
+    for_each_decoded_frame(frames, [&](size_t task, TimsFrame& frame, const uint32_t* scans, const uint32_t* tofs, const uint32_t* intensities)
+    {
+        if(algo == HashAlgorithm::XXH64)
+        {
+            XXH64Hasher hasher;
+            hash_frame_columns(hasher, frame, columns, scans, tofs, intensities);
+            hasher.digest(digests + task * size);
+        }
+        else
+        {
+            Blake2bHasher hasher;
+            hash_frame_columns(hasher, frame, columns, scans, tofs, intensities);
+            hasher.digest(digests + task * size);
+        }
+    });
+}
+
+std::vector<std::pair<uint32_t, std::string>> TimsDataHandle::verify(const std::vector<uint32_t>& indexes)
+{
+    std::vector<TimsFrame*> frames;
+    frames.reserve(indexes.size());
+    size_t max_bytes = 0;
+    for(uint32_t index : indexes)
+    {
+        frames.push_back(&get_frame(index));
+        max_bytes = std::max(max_bytes, frames.back()->data_size_bytes());
+    }
+
+    std::vector<std::string> problems(frames.size());
+    std::atomic<size_t> current_task(0);
+    std::unique_ptr<Readahead> readahead = prepare_access(frames, current_task);
+
+    ThreadingManager::get_instance().set_opentims_threading();
+    size_t n_threads = std::min(ThreadingManager::get_instance().get_no_opentims_threads(), std::max<size_t>(frames.size(), 1));
+
+    std::vector<std::thread> threads;
+    for(size_t ii=0; ii<n_threads; ii++)
+        threads.emplace_back([&, ii](){
+            PerfCounters::thread_slot() = ii + 1;
+            std::unique_ptr<ZSTD_DCtx, decltype(&ZSTD_freeDCtx)> zstd(ZSTD_createDCtx(), &ZSTD_freeDCtx);
+            std::unique_ptr<char[]> decomp_buffer = std::make_unique<char[]>(max_bytes);
+            while(true)
+            {
+                size_t my_task = current_task.fetch_add(1);
+                if(my_task >= frames.size())
+                    break;
+                // Reads of the pread I/O mode may throw, e.g. for a file truncated after it was opened.
+                try
+                {
+                    problems[my_task] = frames[my_task]->check(decomp_buffer.get(), zstd.get());
+                }
+                catch(const std::exception& e)
+                {
+                    problems[my_task] = e.what();
+                }
+            }
+        });
+    for (auto& th : threads) th.join();
+    ThreadingManager::get_instance().set_converter_threading();
+
+    std::vector<std::pair<uint32_t, std::string>> result;
+    for(size_t ii = 0; ii < frames.size(); ii++)
+        if(!problems[ii].empty())
+            result.emplace_back(frames[ii]->id, std::move(problems[ii]));
+    return result;
+}
+
+void TimsDataHandle::frame_stats(const std::vector<uint32_t>& indexes,
+                                 uint64_t* tic,
+                                 uint32_t* max_intensity,
+                                 uint32_t* min_tof,
+                                 uint32_t* max_tof,
+                                 uint32_t* min_scan,
+                                 uint32_t* max_scan)
+{
+    std::vector<TimsFrame*> frames;
+    frames.reserve(indexes.size());
+    for(uint32_t frame_id : indexes)
+        frames.push_back(&frame_descs.at(frame_id));
+
+    for_each_decoded_frame(frames, [&](size_t task, TimsFrame& frame, const uint32_t* scans, const uint32_t* tofs, const uint32_t* intensities)
+    {
+        uint64_t f_tic = 0;
+        uint32_t f_max_intensity = 0;
+        uint32_t f_min_tof = std::numeric_limits<uint32_t>::max();
+        uint32_t f_max_tof = 0;
+        uint32_t f_min_scan = std::numeric_limits<uint32_t>::max();
+        uint32_t f_max_scan = 0;
+
+        const size_t n_peaks = frame.num_peaks;
+        for(size_t ii = 0; ii < n_peaks; ii++)
+        {
+            f_tic += intensities[ii];
+            f_max_intensity = std::max(f_max_intensity, intensities[ii]);
+            f_min_tof = std::min(f_min_tof, tofs[ii]);
+            f_max_tof = std::max(f_max_tof, tofs[ii]);
+        }
+        if(n_peaks > 0)
+        {
+            // Peaks are ordered by scan.
+            f_min_scan = scans[0];
+            f_max_scan = scans[n_peaks-1];
+        }
+
+        tic[task] = f_tic;
+        max_intensity[task] = f_max_intensity;
+        min_tof[task] = f_min_tof;
+        max_tof[task] = f_max_tof;
+        min_scan[task] = f_min_scan;
+        max_scan[task] = f_max_scan;
+    });
+}
+
+void TimsDataHandle::set_zone_maps(const std::vector<uint32_t>& indexes,
+                                   const uint32_t* min_tof,
+                                   const uint32_t* max_tof,
+                                   const uint32_t* max_intensity,
+                                   const uint32_t* min_scan,
+                                   const uint32_t* max_scan)
+{
+    for(size_t ii = 0; ii < indexes.size(); ii++)
+        zone_maps[indexes[ii]] = FrameZoneMap{min_tof[ii], max_tof[ii], max_intensity[ii], min_scan[ii], max_scan[ii]};
+}
+
+bool TimsDataHandle::frame_may_contain(uint32_t frame_id, const PeakBox& box) const
+{
+    if(frame_descs.at(frame_id).num_peaks == 0)
+        return false;
+    auto it = zone_maps.find(frame_id);
+    return it == zone_maps.end() || box.may_overlap(it->second);
+}
+
+std::vector<TimsFrame*> TimsDataHandle::boxed_frames(const std::vector<uint32_t>& indexes,
+                                                     const std::vector<PeakBox>& boxes,
+                                                     std::vector<size_t>& positions)
+{
+    if(boxes.size() != 1 && boxes.size() != indexes.size())
+        throw std::invalid_argument("Expected either one box, or one box per frame");
+
+    std::vector<TimsFrame*> frames;
+    for(size_t ii = 0; ii < indexes.size(); ii++)
+        if(frame_may_contain(indexes[ii], boxes.size() == 1 ? boxes[0] : boxes[ii]))
+        {
+            frames.push_back(&frame_descs.at(indexes[ii]));
+            positions.push_back(ii);
+        }
+    return frames;
+}
+
+std::vector<uint32_t> TimsDataHandle::frames_in_box(const std::vector<uint32_t>& indexes, const std::vector<PeakBox>& boxes)
+{
+    std::vector<size_t> positions;
+    std::vector<uint32_t> result;
+    for(TimsFrame* frame : boxed_frames(indexes, boxes, positions))
+        result.push_back(frame->id);
+    return result;
+}
+
+void TimsDataHandle::extract_box(const std::vector<uint32_t>& indexes,
+                                 const std::vector<PeakBox>& boxes,
+                                 std::vector<uint32_t>& frame_ids,
+                                 std::vector<uint32_t>& scan_ids,
+                                 std::vector<uint32_t>& tofs,
+                                 std::vector<uint32_t>& intensities)
+{
+    std::vector<size_t> positions;
+    std::vector<TimsFrame*> frames = boxed_frames(indexes, boxes, positions);
+
+    std::vector<std::vector<uint32_t> > selected(frames.size());
+
+    for_each_decoded_frame(frames, [&](size_t task, TimsFrame& frame, const uint32_t* f_scans, const uint32_t* f_tofs, const uint32_t* f_intensities)
+    {
+        const PeakBox& box = boxes.size() == 1 ? boxes[0] : boxes[positions[task]];
+        std::vector<uint32_t>& peaks = selected[task];
+        for(uint32_t ii = 0; ii < frame.num_peaks; ii++)
+            if(box.contains(f_scans[ii], f_tofs[ii], f_intensities[ii]))
+            {
+                peaks.push_back(f_scans[ii]);
+                peaks.push_back(f_tofs[ii]);
+                peaks.push_back(f_intensities[ii]);
+            }
+    });
+
+    size_t total = 0;
+    for(const std::vector<uint32_t>& peaks : selected)
+        total += peaks.size() / 3;
+    frame_ids.reserve(frame_ids.size() + total);
+    scan_ids.reserve(scan_ids.size() + total);
+    tofs.reserve(tofs.size() + total);
+    intensities.reserve(intensities.size() + total);
+
+    for(size_t task = 0; task < frames.size(); task++)
+    {
+        const std::vector<uint32_t>& peaks = selected[task];
+        for(size_t ii = 0; ii < peaks.size(); ii += 3)
+        {
+            frame_ids.push_back(frames[task]->id);
+            scan_ids.push_back(peaks[ii]);
+            tofs.push_back(peaks[ii+1]);
+            intensities.push_back(peaks[ii+2]);
+        }
+    }
+}
+
+void TimsDataHandle::box_TIC(const std::vector<uint32_t>& indexes,
+                             const std::vector<PeakBox>& boxes,
+                             uint64_t* result)
+{
+    std::fill(result, result + indexes.size(), 0);
+
+    std::vector<size_t> positions;
+    std::vector<TimsFrame*> frames = boxed_frames(indexes, boxes, positions);
+
+    for_each_decoded_frame(frames, [&](size_t task, TimsFrame& frame, const uint32_t* f_scans, const uint32_t* f_tofs, const uint32_t* f_intensities)
+    {
+        const PeakBox& box = boxes.size() == 1 ? boxes[0] : boxes[positions[task]];
+        uint64_t acc = 0;
+        for(uint32_t ii = 0; ii < frame.num_peaks; ii++)
+            if(box.contains(f_scans[ii], f_tofs[ii], f_intensities[ii]))
+                acc += f_intensities[ii];
+        result[positions[task]] = acc;
+    });
+}
+
+void TimsDataHandle::frame_images(const std::vector<uint32_t>& indexes,
+                                  bool use_mz,
+                                  double x_min,
+                                  double x_max,
+                                  double x_resolution,
+                                  uint32_t scan_min,
+                                  size_t width,
+                                  size_t height,
+                                  uint32_t* images)
+{
+    if(!(x_resolution > 0.0))
+        throw std::invalid_argument("frame_images: x_resolution must be positive");
+
+    std::vector<TimsFrame*> frames;
+    frames.reserve(indexes.size());
+    for(uint32_t frame_id : indexes)
+        frames.push_back(&frame_descs.at(frame_id));
+
+    const size_t image_size = width * height;
+    std::fill(images, images + frames.size() * image_size, 0);
+    const double inv_resolution = 1.0 / x_resolution;
+
+    for_each_decoded_frame(frames, [&](size_t task, TimsFrame& frame, const uint32_t* scans, const uint32_t* tofs, const uint32_t* intensities)
+    {
+        const size_t n_peaks = frame.num_peaks;
+        thread_local std::vector<double> xs;
+        xs.resize(n_peaks);
+        if(use_mz)
+            tof2mz_converter->convert(frame.id, xs.data(), tofs, n_peaks);
+        else
+            std::copy(tofs, tofs + n_peaks, xs.begin());
+
+        uint32_t* image = images + task * image_size;
+        for(size_t ii = 0; ii < n_peaks; ii++)
+        {
+            if(scans[ii] < scan_min)
+                continue;
+            const size_t row = scans[ii] - scan_min;
+            if(row >= height)
+                break; // peaks are ordered by scan
+            const double x = xs[ii];
+            if(x < x_min || x > x_max)
+                continue;
+            const size_t column = static_cast<size_t>((x - x_min) * inv_resolution + 0.5);
+            if(column < width)
+                image[row * width + column] += intensities[ii];
+        }
+    }, use_mz);
+}
+
+void TimsDataHandle::merge_scan_ranges(const std::vector<uint32_t>& frames,
+                                       const std::vector<uint32_t>& scan_begins,
+                                       const std::vector<uint32_t>& scan_ends,
+                                       const std::vector<uint64_t>& group_offsets,
+                                       std::vector<uint64_t>& spectrum_offsets,
+                                       std::vector<uint32_t>& tofs,
+                                       std::vector<uint64_t>& intensities)
+{
+    if(scan_begins.size() != frames.size() || scan_ends.size() != frames.size())
+        throw std::invalid_argument("merge_scan_ranges: frames, scan_begins and scan_ends must have the same length");
+    if(group_offsets.empty() || group_offsets.front() != 0 || group_offsets.back() != frames.size() ||
+       !std::is_sorted(group_offsets.begin(), group_offsets.end()))
+        throw std::invalid_argument("merge_scan_ranges: group_offsets must grow from 0 to the number of frames");
+
+    std::vector<TimsFrame*> frame_ptrs;
+    frame_ptrs.reserve(frames.size());
+    size_t max_peaks = 0;
+    for(uint32_t frame_id : frames)
+    {
+        frame_ptrs.push_back(&frame_descs.at(frame_id));
+        max_peaks = std::max<size_t>(max_peaks, frame_ptrs.back()->num_peaks);
+    }
+
+    const size_t no_groups = group_offsets.size() - 1;
+    std::vector<std::vector<std::pair<uint32_t, uint64_t> > > spectra(no_groups);
+
+    std::atomic<size_t> current_task(0);
+    std::exception_ptr error;
+    std::mutex error_mutex;
+
+    ThreadingManager::get_instance().set_opentims_threading();
+    size_t n_threads = std::min(ThreadingManager::get_instance().get_no_opentims_threads(), std::max<size_t>(no_groups, 1));
+
+    std::vector<std::thread> threads;
+    for(size_t ii=0; ii<n_threads; ii++)
+        threads.emplace_back([&, ii](){
+            PerfCounters::thread_slot() = ii + 1;
+            std::unique_ptr<ZSTD_DCtx, decltype(&ZSTD_freeDCtx)> zstd(ZSTD_createDCtx(), &ZSTD_freeDCtx);
+            std::unique_ptr<char[]> decomp_buffer = std::make_unique<char[]>(decomp_buffer_size);
+            std::unique_ptr<uint32_t[]> range_tofs = std::make_unique<uint32_t[]>(max_peaks);
+            std::unique_ptr<uint32_t[]> range_intensities = std::make_unique<uint32_t[]>(max_peaks);
+            while(true)
+            {
+                size_t group = current_task.fetch_add(1);
+                if(group >= no_groups)
+                    break;
+                try
+                {
+                    std::vector<std::pair<uint32_t, uint64_t> >& peaks = spectra[group];
+                    for(size_t row = group_offsets[group]; row < group_offsets[group+1]; row++)
+                    {
+                        if(row == group_offsets[group] || frames[row] != frames[row-1])
+                            frame_ptrs[row]->decompress_into(decomp_buffer.get(), zstd.get());
+                        const size_t n = frame_ptrs[row]->decode_scan_range(scan_begins[row], scan_ends[row], decomp_buffer.get(),
+                                                                            nullptr, range_tofs.get(), range_intensities.get());
+                        for(size_t jj = 0; jj < n; jj++)
+                            peaks.emplace_back(range_tofs[jj], range_intensities[jj]);
+                    }
+                    std::sort(peaks.begin(), peaks.end());
+                    size_t merged = 0;
+                    for(size_t jj = 0; jj < peaks.size(); jj++)
+                        if(merged > 0 && peaks[merged-1].first == peaks[jj].first)
+                            peaks[merged-1].second += peaks[jj].second;
+                        else
+                            peaks[merged++] = peaks[jj];
+                    peaks.resize(merged);
+                }
+                catch(...)
+                {
+                    std::lock_guard<std::mutex> lock(error_mutex);
+                    if(!error)
+                        error = std::current_exception();
+                    current_task = no_groups;
+                    break;
+                }
+            }
+        });
+    for (auto& th : threads) th.join();
+    ThreadingManager::get_instance().set_converter_threading();
+    if(error)
+        std::rethrow_exception(error);
+
+    size_t total = 0;
+    for(const auto& peaks : spectra)
+        total += peaks.size();
+    spectrum_offsets.reserve(no_groups + 1);
+    tofs.reserve(total);
+    intensities.reserve(total);
+    spectrum_offsets.push_back(0);
+    for(const auto& peaks : spectra)
+    {
+        for(const auto& peak : peaks)
+        {
+            tofs.push_back(peak.first);
+            intensities.push_back(peak.second);
+        }
+        spectrum_offsets.push_back(tofs.size());
+    }
+}
+
+void TimsDataHandle::extract_scan_ranges(const std::vector<uint32_t>& frames,
+                                         const std::vector<uint32_t>& scan_begins,
+                                         const std::vector<uint32_t>& scan_ends,
+                                         std::vector<uint64_t>& row_offsets,
+                                         std::vector<uint32_t>& frame_ids,
+                                         std::vector<uint32_t>& scan_ids,
+                                         std::vector<uint32_t>& tofs,
+                                         std::vector<uint32_t>& intensities)
+{
+    if(scan_begins.size() != frames.size() || scan_ends.size() != frames.size())
+        throw std::invalid_argument("extract_scan_ranges: frames, scan_begins and scan_ends must have the same length");
+
+    // Runs of consecutive rows of the same frame are the units of work.
+    std::vector<size_t> run_starts;
+    std::vector<TimsFrame*> frame_ptrs;
+    for(size_t row = 0; row < frames.size(); row++)
+        if(row == 0 || frames[row] != frames[row-1])
+        {
+            run_starts.push_back(row);
+            frame_ptrs.push_back(&frame_descs.at(frames[row]));
+        }
+    run_starts.push_back(frames.size());
+
+    size_t max_peaks = 0;
+    for(TimsFrame* frame : frame_ptrs)
+        max_peaks = std::max<size_t>(max_peaks, frame->num_peaks);
+
+    // Peaks of each row, as (scan, tof, intensity) triples.
+    std::vector<std::vector<uint32_t> > row_peaks(frames.size());
+
+    std::atomic<size_t> current_task(0);
+    std::exception_ptr error;
+    std::mutex error_mutex;
+
+    ThreadingManager::get_instance().set_opentims_threading();
+    size_t n_threads = std::min(ThreadingManager::get_instance().get_no_opentims_threads(), std::max<size_t>(frame_ptrs.size(), 1));
+
+    std::vector<std::thread> threads;
+    for(size_t ii=0; ii<n_threads; ii++)
+        threads.emplace_back([&, ii](){
+            PerfCounters::thread_slot() = ii + 1;
+            std::unique_ptr<ZSTD_DCtx, decltype(&ZSTD_freeDCtx)> zstd(ZSTD_createDCtx(), &ZSTD_freeDCtx);
+            std::unique_ptr<char[]> decomp_buffer = std::make_unique<char[]>(decomp_buffer_size);
+            std::unique_ptr<uint32_t[]> range_scans = std::make_unique<uint32_t[]>(max_peaks);
+            std::unique_ptr<uint32_t[]> range_tofs = std::make_unique<uint32_t[]>(max_peaks);
+            std::unique_ptr<uint32_t[]> range_intensities = std::make_unique<uint32_t[]>(max_peaks);
+            while(true)
+            {
+                size_t run = current_task.fetch_add(1);
+                if(run >= frame_ptrs.size())
+                    break;
+                try
+                {
+                    const TimsFrame& frame = *frame_ptrs[run];
+                    if(frame.num_peaks == 0)
+                        continue;
+                    frame.decompress_into(decomp_buffer.get(), zstd.get());
+                    for(size_t row = run_starts[run]; row < run_starts[run+1]; row++)
+                    {
+                        const size_t n = frame.decode_scan_range(scan_begins[row], scan_ends[row], decomp_buffer.get(),
+                                                                 range_scans.get(), range_tofs.get(), range_intensities.get());
+                        std::vector<uint32_t>& peaks = row_peaks[row];
+                        peaks.reserve(3*n);
+                        for(size_t jj = 0; jj < n; jj++)
+                        {
+                            peaks.push_back(range_scans[jj]);
+                            peaks.push_back(range_tofs[jj]);
+                            peaks.push_back(range_intensities[jj]);
+                        }
+                    }
+                }
+                catch(...)
+                {
+                    std::lock_guard<std::mutex> lock(error_mutex);
+                    if(!error)
+                        error = std::current_exception();
+                    current_task = frame_ptrs.size();
+                    break;
+                }
+            }
+        });
+    for (auto& th : threads) th.join();
+    ThreadingManager::get_instance().set_converter_threading();
+    if(error)
+        std::rethrow_exception(error);
+
+    size_t total = 0;
+    for(const std::vector<uint32_t>& peaks : row_peaks)
+        total += peaks.size() / 3;
+    row_offsets.reserve(frames.size() + 1);
+    frame_ids.reserve(total);
+    scan_ids.reserve(total);
+    tofs.reserve(total);
+    intensities.reserve(total);
+
+    row_offsets.push_back(0);
+    for(size_t row = 0; row < frames.size(); row++)
+    {
+        const std::vector<uint32_t>& peaks = row_peaks[row];
+        for(size_t jj = 0; jj < peaks.size(); jj += 3)
+        {
+            frame_ids.push_back(frames[row]);
+            scan_ids.push_back(peaks[jj]);
+            tofs.push_back(peaks[jj+1]);
+            intensities.push_back(peaks[jj+2]);
+        }
+        row_offsets.push_back(tofs.size());
+    }
+}
+
+namespace {
+
+struct EncodedFrame
+{
+    std::vector<uint8_t> payload;
+    uint32_t num_peaks = 0;
+    uint32_t max_intensity = 0;
+    uint64_t summed_intensity = 0;
+};
+
+// Decoded (scan headers, TOF deltas, raw intensities) of one frame, filtered by box and laid out in byte planes.
+void encode_frame(const TimsFrame& frame, const char* decompressed, const PeakBox& box, EncodedFrame& out)
+{
+    std::vector<uint32_t> scan_peaks(frame.num_scans, 0);
+    std::vector<uint32_t> pairs;
+
+    if(decompressed != nullptr)
+    {
+        const size_t dsints = frame.data_size_bytes() / 4;
+        auto data = [decompressed, dsints](size_t index) -> uint32_t {
+            uint32_t ret;
+            char* bytes = reinterpret_cast<char*>(&ret);
+            bytes[0] = decompressed[index];
+            bytes[1] = decompressed[index + dsints];
+            bytes[2] = decompressed[index + 2*dsints];
+            bytes[3] = decompressed[index + 3*dsints];
+            return ret;
+        };
+        size_t read_offset = frame.num_scans;
+        uint32_t peaks_before = 0;
+        for(uint32_t scan_idx = 0; scan_idx < frame.num_scans; scan_idx++)
+        {
+            const uint32_t no_peaks = scan_idx + 1 < frame.num_scans ? data(scan_idx+1) / 2 : frame.num_peaks - peaks_before;
+            uint32_t accum_tofs = -1;
+            uint32_t last_kept = -1;
+            for(uint32_t ii = 0; ii < no_peaks; ii++)
+            {
+                accum_tofs += data(read_offset);
+                const uint32_t raw_intensity = data(read_offset+1);
+                const uint32_t intensity = static_cast<double>(raw_intensity) * frame.intensity_correction + 0.5;
+                if(box.contains(scan_idx, accum_tofs, intensity))
+                {
+                    pairs.push_back(accum_tofs - last_kept);
+                    pairs.push_back(raw_intensity);
+                    last_kept = accum_tofs;
+                    scan_peaks[scan_idx]++;
+                    // Frames.MaxIntensity and SummedIntensities hold raw intensities, as the peaks themselves.
+                    out.max_intensity = (std::max)(out.max_intensity, raw_intensity);
+                    out.summed_intensity += raw_intensity;
+                }
+                read_offset += 2;
+            }
+            peaks_before += no_peaks;
+        }
+    }
+    out.num_peaks = pairs.size() / 2;
+
+    const size_t dsints = frame.num_scans + pairs.size();
+    out.payload.resize(4 * dsints);
+    auto put = [&out, dsints](size_t index, uint32_t value) {
+        const char* bytes = reinterpret_cast<const char*>(&value);
+        for(size_t plane = 0; plane < 4; plane++)
+            out.payload[index + plane*dsints] = bytes[plane];
+    };
+    // As in files written by the instrument, the first header holds the number of scans.
+    if(frame.num_scans > 0)
+        put(0, frame.num_scans);
+    for(uint32_t scan_idx = 0; scan_idx + 1 < frame.num_scans; scan_idx++)
+        put(scan_idx + 1, 2 * scan_peaks[scan_idx]);
+    for(size_t ii = 0; ii < pairs.size(); ii++)
+        put(frame.num_scans + ii, pairs[ii]);
+}
+
+} // namespace
+
+void TimsDataHandle::encode_frames(const std::vector<uint32_t>& indexes,
+                                   const std::vector<PeakBox>& boxes,
+                                   std::vector<uint8_t>& payloads,
+                                   std::vector<uint64_t>& payload_offsets,
+                                   std::vector<uint32_t>& num_peaks,
+                                   std::vector<uint32_t>& max_intensity,
+                                   std::vector<uint64_t>& summed_intensity)
+{
+    if(boxes.size() != 1 && boxes.size() != indexes.size())
+        throw std::invalid_argument("Expected either one box, or one box per frame");
+
+    std::vector<TimsFrame*> frames;
+    frames.reserve(indexes.size());
+    for(uint32_t index : indexes)
+        frames.push_back(&frame_descs.at(index));
+
+    std::vector<EncodedFrame> encoded(frames.size());
+
+    std::atomic<size_t> current_task(0);
+    std::exception_ptr error;
+    std::mutex error_mutex;
+
+    ThreadingManager::get_instance().set_opentims_threading();
+    size_t n_threads = std::min(ThreadingManager::get_instance().get_no_opentims_threads(), std::max<size_t>(frames.size(), 1));
+
+    std::vector<std::thread> threads;
+    for(size_t ii=0; ii<n_threads; ii++)
+        threads.emplace_back([&, ii](){
+            PerfCounters::thread_slot() = ii + 1;
+            std::unique_ptr<ZSTD_DCtx, decltype(&ZSTD_freeDCtx)> zstd(ZSTD_createDCtx(), &ZSTD_freeDCtx);
+            std::unique_ptr<char[]> decomp_buffer = std::make_unique<char[]>(decomp_buffer_size);
+            while(true)
+            {
+                size_t task = current_task.fetch_add(1);
+                if(task >= frames.size())
+                    break;
+                try
+                {
+                    const TimsFrame& frame = *frames[task];
+                    const PeakBox& box = boxes.size() == 1 ? boxes[0] : boxes[task];
+                    const bool decode = frame.num_peaks > 0 && frame_may_contain(frame.id, box);
+                    if(decode)
+                        frame.decompress_into(decomp_buffer.get(), zstd.get());
+                    encode_frame(frame, decode ? decomp_buffer.get() : nullptr, box, encoded[task]);
+                }
+                catch(...)
+                {
+                    std::lock_guard<std::mutex> lock(error_mutex);
+                    if(!error)
+                        error = std::current_exception();
+                    current_task = frames.size();
+                    break;
+                }
+            }
+        });
+    for (auto& th : threads) th.join();
+    ThreadingManager::get_instance().set_converter_threading();
+    if(error)
+        std::rethrow_exception(error);
+
+    size_t total = 0;
+    for(const EncodedFrame& ef : encoded)
+        total += ef.payload.size();
+    payloads.reserve(total);
+    payload_offsets.reserve(frames.size() + 1);
+    payload_offsets.push_back(0);
+    for(EncodedFrame& ef : encoded)
+    {
+        payloads.insert(payloads.end(), ef.payload.begin(), ef.payload.end());
+        ef.payload = std::vector<uint8_t>();
+        payload_offsets.push_back(payloads.size());
+        num_peaks.push_back(ef.num_peaks);
+        max_intensity.push_back(ef.max_intensity);
+        summed_intensity.push_back(ef.summed_intensity);
+    }
+}
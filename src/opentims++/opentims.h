@@ -6,6 +6,7 @@
  */
 
 #pragma once
+#include <array>
 #include <cstdlib>
 #include <cstdint>
 #include <memory>
@@ -13,6 +14,7 @@
 #include <iostream>
 #include <vector>
 #include <unordered_map>
+#include <utility>
 
 #include "platform.h"
 #include "bruker_api.h"
@@ -26,6 +28,10 @@
 #endif
 
 #include "zstd/zstd.h"
+#include "sqlite_helper.h"
+#include "perf_counters.h"
+#include "hashing.h"
+#include "file_access.h"
 
 
 #ifdef OPENTIMS_BUILDING_R
@@ -40,8 +46,6 @@
 
 class TimsDataHandle;
 
-int tims_sql_callback(void* out, int cols, char** row, char** colnames);
-
 class TimsFrame
 {
     std::unique_ptr<char[]> back_buffer;
@@ -66,27 +70,40 @@ class TimsFrame
 
     const char * const tims_bin_frame;
 
+    //! Bytes from the start of this frame's packet to the next packet (or to the end of analysis.tdf_bin).
+    size_t bin_span = 0;
+
     friend class TimsDataHandle;
-    friend int tims_sql_callback(void* out, int cols, char** row, char** colnames);
 
     TimsDataHandle& parent_tdh;
 
-    /* TODO: implement the below one day.
-    template void save_to_buffs_impl<bool frame_ids_present,
-                                     bool scan_ids_present,
-                                     bool intensities_present,
-                                     bool mzs_present,
-                                     bool inv_ion_mobilities_present,
-                                     bool retention_times_present,
-                                     > (uint32_t* frame_ids,
-                                        uint32_t* scan_ids,
-                                        uint32_t* tofs,
-                                        uint32_t* intensities,
-                                        double* mzs,
-                                        double* inv_ion_mobilities,
-                                        double* retention_times,
-                                        ZSTD_DCtx* decomp_ctx = nullptr);
-    */
+    //! Decode the decompressed frame in one pass, writing only the columns present.
+    /**
+     * Takes the scan headers, already reassembled from the byte planes; peak data is reassembled
+     * block by block with transpose_byte_planes(). TOF delta decoding, intensity correction and
+     * the writes of constant frame ids and retention times are fused; save_to_buffs() dispatches
+     * to the specialization for the requested columns.
+     */
+    template<bool scan_ids_present,
+             bool tofs_present,
+             bool intensities_present,
+             bool frame_ids_present,
+             bool retention_times_present>
+    void save_to_buffs_impl(const char* decompressed,
+                            const uint32_t* headers,
+                            uint32_t* frame_ids,
+                            uint32_t* scan_ids,
+                            uint32_t* tofs,
+                            uint32_t* intensities,
+                            double* retention_times) const;
+
+    typedef void (TimsFrame::*DecodeKernel)(const char*, const uint32_t*, uint32_t*, uint32_t*, uint32_t*, uint32_t*, double*) const;
+
+    template<size_t... masks>
+    static constexpr std::array<DecodeKernel, sizeof...(masks)> decode_kernels(std::index_sequence<masks...>)
+    {
+        return {&TimsFrame::save_to_buffs_impl<bool(masks & 1), bool(masks & 2), bool(masks & 4), bool(masks & 8), bool(masks & 16)>...};
+    }
 
     TimsFrame(uint32_t _id,
               uint32_t _num_scans,
@@ -98,9 +115,6 @@ class TimsFrame
               TimsDataHandle& parent_hndl
             );
 
-    static TimsFrame TimsFrameFromSql(char** sql_row,
-                                      TimsDataHandle& parent_handle);
-
     inline size_t data_size_ints() const { return num_scans + num_peaks + num_peaks; };
 
 
@@ -168,6 +182,63 @@ public:
                        double* retention_times,
                        ZSTD_DCtx* decomp_ctx = nullptr);
 
+    //! Decompress the frame into the passed buffer, without changing the state of the frame.
+    /**
+     * As the frame itself is not modified, this (together with decode_scan_range()) may be
+     * called from many threads at once, also on the same frame, as long as each thread
+     * passes its own buffer and context.
+     *
+     * @param decompression_buffer  Buffer of at least data_size_bytes() bytes.
+     * @param decomp_ctx            Decompression context.
+     */
+    void decompress_into(char* decompression_buffer, ZSTD_DCtx* decomp_ctx) const;
+
+    //! Retrieve the MS peak data from a buffer filled by decompress_into(), as save_to_buffs() does.
+    /**
+     * As the frame itself is not modified, this may be called from many threads at once, also
+     * on the same frame.
+     *
+     * @param decompressed  Buffer filled by decompress_into().
+     * @param frame_ids, scan_ids, tofs, intensities, mzs, inv_ion_mobilities, retention_times
+     *                      Outputs as in save_to_buffs(); nullptr for columns not wanted.
+     */
+    void decode_into(const char* decompressed,
+                     uint32_t* frame_ids,
+                     uint32_t* scan_ids,
+                     uint32_t* tofs,
+                     uint32_t* intensities,
+                     double* mzs,
+                     double* inv_ion_mobilities,
+                     double* retention_times) const;
+
+    //! Check the stored packet of this frame for consistency, without throwing.
+    /**
+     * Checks that the packet lies within analysis.tdf_bin, that its header agrees with
+     * num_scans, that it decompresses to exactly data_size_bytes(), and that the scan headers
+     * account for at most num_peaks peaks.
+     *
+     * @param decompression_buffer  Buffer of at least data_size_bytes() bytes.
+     * @param decomp_ctx            Decompression context.
+     * @return                      Description of the first problem found; empty if there is none.
+     */
+    std::string check(char* decompression_buffer, ZSTD_DCtx* decomp_ctx) const;
+
+    //! Retrieve the MS peaks of a range of scans from a buffer filled by decompress_into().
+    /**
+     * Only the peaks of scans in [scan_begin, scan_end) are decoded, located using the scan headers.
+     *
+     * @param decompressed          Buffer filled by decompress_into().
+     * @param scan_ids, tofs, intensities   Outputs, each able to hold at least this->num_peaks values;
+     *                              scan_ids may be nullptr.
+     * @return                      The number of peaks written.
+     */
+    size_t decode_scan_range(uint32_t scan_begin,
+                             uint32_t scan_end,
+                             const char* decompressed,
+                             uint32_t* scan_ids,
+                             uint32_t* tofs,
+                             uint32_t* intensities) const;
+
     //! This function is deprecated and intentionally undocumented; do not use.
     void save_to_matrix_buffer(uint32_t* buf,
                                ZSTD_DCtx* decomp_ctx = nullptr)
@@ -176,6 +247,39 @@ public:
     friend class TimsDataHandle;
 };
 
+//! Summary of the peaks held by a frame, used to skip frames which cannot contain peaks matching a filter.
+struct FrameZoneMap
+{
+    uint32_t min_tof;
+    uint32_t max_tof;
+    uint32_t max_intensity;
+    uint32_t min_scan;
+    uint32_t max_scan;
+};
+
+//! A filter on peaks: half-open scan and TOF ranges, and a minimal intensity.
+struct PeakBox
+{
+    uint32_t scan_begin;
+    uint32_t scan_end;
+    uint32_t tof_begin;
+    uint32_t tof_end;
+    uint32_t min_intensity;
+
+    bool contains(uint32_t scan, uint32_t tof, uint32_t intensity) const
+    {
+        return scan_begin <= scan && scan < scan_end && tof_begin <= tof && tof < tof_end && intensity >= min_intensity;
+    };
+
+    //! False if no peak summarized by the zone map can be contained in the box.
+    bool may_overlap(const FrameZoneMap& zm) const
+    {
+        return zm.min_tof < tof_end && tof_begin <= zm.max_tof &&
+               zm.min_scan < scan_end && scan_begin <= zm.max_scan &&
+               zm.max_intensity >= min_intensity;
+    };
+};
+
 class BrukerTof2MzConverter;
 class Tof2MzConverter;
 class Tof2MzConverterFactory;
@@ -183,6 +287,16 @@ class BrukerScan2InvIonMobilityConverter;
 class Scan2InvIonMobilityConverter;
 class Scan2InvIonMobilityConverterFactory;
 
+//! Element type of an output column of TimsDataHandle::extract_frames_typed.
+enum class ColumnType { UInt16, UInt32, Float32, Float64 };
+
+//! An output buffer of TimsDataHandle::extract_frames_typed; data == nullptr means the column is not wanted.
+struct TypedColumn
+{
+    void* data = nullptr;
+    ColumnType type = ColumnType::UInt32;
+};
+
 class TimsDataHandle
 {
 friend class BrukerTof2MzConverter;
@@ -190,9 +304,27 @@ friend class BrukerScan2InvIonMobilityConverter;
 
 private:
     const std::string tims_dir_path;
+    const std::string tims_tdf_path;
     mio::mmap_source tims_data_bin;
     std::unordered_map<uint32_t, TimsFrame> frame_descs;
-    void read_sql(const std::string& tims_tdf_path);
+    SqlTable frames_table;
+    std::unordered_map<std::string, std::string> global_metadata;
+    void read_sql();
+    void read_global_metadata(RAIISqlite& DB);
+    void check_compression() const;
+    void load_frame_descs();
+    std::unordered_map<uint32_t, FrameZoneMap> zone_maps;
+
+    struct MsLevelIndex
+    {
+        std::vector<uint32_t> ids;
+        std::vector<double> times;
+    };
+    std::vector<MsLevelIndex> ms_level_index; // all frames, MS1, MS2; built on first use
+    const MsLevelIndex& get_ms_level_index(uint32_t ms_level);
+
+    template<typename Callback> void for_each_decoded_frame(const std::vector<TimsFrame*>& frames, Callback callback, bool converts = false);
+    std::vector<TimsFrame*> boxed_frames(const std::vector<uint32_t>& indexes, const std::vector<PeakBox>& boxes, std::vector<size_t>& positions);
     uint32_t _min_frame_id;
     uint32_t _max_frame_id;
 
@@ -205,12 +337,25 @@ private:
 
     ZSTD_DCtx* zstd_dctx;
 
+    IOMode io_mode = IOMode::Mmap;
+    AccessPattern access_pattern = AccessPattern::Auto;
+    size_t readahead_bytes = 64 * 1024 * 1024;
+    int bin_fd() const;
+    void compute_bin_spans();
+    void read_bin(size_t offset, size_t length, char* out) const;
+    std::unique_ptr<Readahead> prepare_access(const std::vector<TimsFrame*>& frames, const std::atomic<size_t>& progress);
+    std::unique_ptr<Readahead> prepare_access(const std::vector<uint32_t>& indexes, const std::atomic<size_t>& progress);
+
 public:
     size_t get_decomp_buffer_size() const { return decomp_buffer_size; };
     const std::string& get_tims_dir_path() const { return tims_dir_path; };
+    const std::string& get_tims_tdf_path() const { return tims_tdf_path; };
     std::unique_ptr<Tof2MzConverter> tof2mz_converter;
     std::unique_ptr<Scan2InvIonMobilityConverter> scan2inv_ion_mobility_converter;
 
+    //! Per-stage timings of data extraction; disabled by default, see PerfCounters.
+    PerfCounters perf_counters;
+
 private:
     void init(pressure_compensation_strategy pcs,
              Tof2MzConverterFactory* tof_factory = nullptr,
@@ -246,6 +391,23 @@ public:
                    Tof2MzConverterFactory* tof_factory = nullptr,
                    Scan2InvIonMobilityConverterFactory* im_factory = nullptr);
 
+    //! Open TimsTOF dataset, using previously read contents of its Frames and GlobalMetadata tables.
+    /**
+     * Same as the constructor above, except that analysis.tdf is not queried: the frame
+     * descriptors and converters are set up from the passed tables instead. The caller is
+     * responsible for the tables matching the dataset (e.g. by keeping them in an index
+     * that is invalidated whenever the dataset changes).
+     *
+     * @param frames_table      The Frames table, sorted by frame ID.
+     * @param global_metadata   The GlobalMetadata table, as a key -> value mapping.
+     */
+    TimsDataHandle(const std::string& tims_data_dir,
+                   SqlTable&& frames_table,
+                   std::unordered_map<std::string, std::string>&& global_metadata,
+                   pressure_compensation_strategy pcs = NoPressureCompensation,
+                   Tof2MzConverterFactory* tof_factory = nullptr,
+                   Scan2InvIonMobilityConverterFactory* im_factory = nullptr);
+
 #ifdef OPENTIMS_BUILDING_R
     //! Internal use only.
     TimsDataHandle(const std::string& tims_data_dir, const Rcpp::List& analysis_tdf, pressure_compensation_strategy pcs = NoPressureCompensation);
@@ -260,6 +422,37 @@ public:
     //! Access a dictionary containing all the frames from this dataset, keyed by ID.
     std::unordered_map<uint32_t, TimsFrame>& get_frame_descs();
 
+    //! Access the full Frames table of analysis.tdf, sorted by frame ID, as read when the dataset was opened.
+    /**
+     * Empty if the frame descriptors were not read by the handle itself (as in the R bindings).
+     */
+    const SqlTable& get_frames_table() const { return frames_table; };
+
+    //! Access the contents of the GlobalMetadata table of analysis.tdf, as a key -> value mapping.
+    /**
+     * The table is read together with the Frames table when the dataset is opened; if that
+     * did not happen (as in the R bindings) it is read on first access.
+     */
+    const std::unordered_map<std::string, std::string>& get_global_metadata();
+
+    //! IDs of frames of an MS level, in ascending order.
+    /**
+     * @param ms_level  1 for MS1 frames (MsMsType 0), 2 for all the others, 0 for all frames.
+     */
+    const std::vector<uint32_t>& ms_level_frames(uint32_t ms_level);
+
+    //! Retention times of the frames returned by ms_level_frames(ms_level).
+    const std::vector<double>& ms_level_retention_times(uint32_t ms_level);
+
+    //! Positions [first, second) in ms_level_frames(ms_level) of frames with retention times in [min_rt, max_rt).
+    /**
+     * Retention times are assumed not to decrease with frame ID, as in TDF files.
+     */
+    std::pair<size_t, size_t> ms_level_rt_range(uint32_t ms_level, double min_rt, double max_rt);
+
+    //! Returns the highest number of scans in any frame of this dataset.
+    uint32_t max_num_scans() const;
+
     //! Returns the total number of MS peaks in this handle.
     size_t no_peaks_total() const;
 
@@ -333,6 +526,7 @@ public:
      * may be passed as the corresponding pointer.
      * The buffers are passed and returned by columns. Each row corresponds to one MS peak.
      * Each buffer must be able to hold at least no_peaks_in_frames(indexes) values.
+     * Frames are decoded in parallel, each directly into its place in the buffers.
      *
      * @param indexes       Set of indexes of frames for which data is to be obtained.
      * @param frame_ids     The IDs of frames containing the associated peaks.
@@ -368,7 +562,7 @@ public:
      * The buffers are passed and returned by columns. Each row corresponds to one MS peak.
      * Each buffer must be able to hold at least no_peaks_in_slice(start, stop, end) values.
      *
-     * IDs of the returned frames come from start:stop:step slice.
+     * IDs of the returned frames come from start:stop:step slice. Frames are decoded in parallel.
      *
      * @param indexes       Start of the slice.
      * @param end           End of the slice.
@@ -420,6 +614,63 @@ public:
                         double* const * inv_ion_mobilities,
                         double* const * retention_times);
 
+    //! Extract a subset of frames, selected by indexes, into buffers of chosen element types.
+    /**
+     * Like extract_frames, but frames are decoded in parallel and every column is written with
+     * its own type: frame_ids, scan_ids, tofs and intensities as UInt16 or UInt32, the rest as
+     * Float32 or Float64. Values are narrowed with static_cast: the caller is responsible for
+     * them fitting. Columns with data == nullptr are not extracted.
+     * Each buffer must be able to hold at least no_peaks_in_frames(indexes) values.
+     */
+    void extract_frames_typed(const std::vector<uint32_t>& indexes,
+                              const TypedColumn& frame_ids,
+                              const TypedColumn& scan_ids,
+                              const TypedColumn& tofs,
+                              const TypedColumn& intensities,
+                              const TypedColumn& mzs,
+                              const TypedColumn& inv_ion_mobilities,
+                              const TypedColumn& retention_times);
+
+    //! Hash the decoded peaks of each of the chosen frames, in parallel.
+    /**
+     * The digest of a frame is the hash of its chosen columns (in the order frame, scan, tof,
+     * intensity), each laid out as little-endian uint32 values, as in extract_frames.
+     *
+     * @param indexes       Frames to hash.
+     * @param algo          Hash algorithm.
+     * @param columns       Bitmask of the hashed columns: 1 - frame, 2 - scan, 4 - tof, 8 - intensity.
+     * @param digests       Output: indexes.size() * hash_digest_size(algo) bytes.
+     */
+    void frame_digests(const std::vector<uint32_t>& indexes, HashAlgorithm algo, unsigned columns, uint8_t* digests);
+
+    //! Check the chosen frames in parallel, see TimsFrame::check().
+    /**
+     * @return  Problems found, as (frame id, description) pairs, in the order of indexes.
+     */
+    std::vector<std::pair<uint32_t, std::string>> verify(const std::vector<uint32_t>& indexes);
+
+    //! Read frame packets through the memory map (default) or with pread() into per-thread buffers.
+    /**
+     * pread() avoids page faults on the mapping, which are slow on some network filesystems.
+     */
+    void set_io_mode(IOMode mode) { io_mode = mode; };
+    IOMode get_io_mode() const { return io_mode; };
+
+    //! Hint the kernel about how analysis.tdf_bin will be accessed.
+    /**
+     * With AccessPattern::Auto (default), every multi-frame extraction hints sequential access
+     * if its frames lie in increasing order in the file, and random access otherwise.
+     */
+    void set_access_pattern(AccessPattern pattern);
+    AccessPattern get_access_pattern() const { return access_pattern; };
+
+    //! How far ahead of the decoders multi-frame extractions prefetch frames, in bytes; 0 disables readahead.
+    void set_readahead(size_t bytes) { readahead_bytes = bytes; };
+    size_t get_readahead() const { return readahead_bytes; };
+
+    //! The packet of the frame ([uint32 size][uint32 num_scans][zstd data]), valid until the next call on this thread.
+    const char* frame_packet(const TimsFrame& frame);
+
     void allocate_buffers();
 
     inline void ensure_buffers_allocated() { if(_scan_ids_buffer) return; allocate_buffers(); };
@@ -448,7 +699,157 @@ public:
      */
     void per_frame_TIC(uint32_t* result);
 
-    friend int tims_sql_callback(void* out, int cols, char** row, char** colnames);
+    //! Compute summary statistics of the peaks in a selection of frames, using multiple threads.
+    /**
+     * Each output buffer must hold at least indexes.size() values; the i-th value describes
+     * frame indexes[i]. Intensities are corrected in the same way as in save_to_buffs().
+     * For frames without peaks, min_* are set to UINT32_MAX and max_* (and tic) to 0.
+     *
+     * @param indexes        IDs of frames to summarize.
+     * @param tic            Total ion current (sum of intensities).
+     * @param max_intensity  Highest intensity of a peak.
+     * @param min_tof        Lowest time of flight index of a peak.
+     * @param max_tof        Highest time of flight index of a peak.
+     * @param min_scan       Lowest scan number containing a peak.
+     * @param max_scan       Highest scan number containing a peak.
+     */
+    void frame_stats(const std::vector<uint32_t>& indexes,
+                     uint64_t* tic,
+                     uint32_t* max_intensity,
+                     uint32_t* min_tof,
+                     uint32_t* max_tof,
+                     uint32_t* min_scan,
+                     uint32_t* max_scan);
+
+    //! Merge the peaks of groups of scan ranges into spectra, using multiple threads (one group at a time).
+    /**
+     * Each group consists of scan ranges [scan_begins[i], scan_ends[i]) of frames frames[i], for i in
+     * [group_offsets[g], group_offsets[g+1]), for instance all the PASEF windows in which a precursor
+     * was fragmented. The peaks of a group are summed by TOF into one spectrum, sorted by TOF.
+     *
+     * @param group_offsets     Start of each group in frames, scan_begins and scan_ends, followed by their length.
+     * @param spectrum_offsets  Output: start of each spectrum in tofs and intensities, followed by their length.
+     * @param tofs              Output: TOFs of the peaks of the spectra.
+     * @param intensities       Output: summed intensities of the peaks of the spectra.
+     */
+    void merge_scan_ranges(const std::vector<uint32_t>& frames,
+                           const std::vector<uint32_t>& scan_begins,
+                           const std::vector<uint32_t>& scan_ends,
+                           const std::vector<uint64_t>& group_offsets,
+                           std::vector<uint64_t>& spectrum_offsets,
+                           std::vector<uint32_t>& tofs,
+                           std::vector<uint64_t>& intensities);
+
+    //! Re-encode frames in the TDF frame layout, keeping only the peaks inside boxes.
+    /**
+     * For each of the frames, produce the contents of its analysis.tdf_bin packet before
+     * zstd compression: scan headers and (TOF delta, intensity) pairs, split into byte planes.
+     * Intensities are stored as in the source, before the accumulation time correction, so the
+     * frames decode to the same values as long as their AccumulationTime is kept. Frames are
+     * processed in multiple threads; the ones ruled out by zone maps are not decompressed.
+     *
+     * @param indexes       Frames to encode.
+     * @param boxes         Either one box for all frames, or one box per frame.
+     * @param payloads      Output: the payload of frame i takes bytes payload_offsets[i] to payload_offsets[i+1].
+     * @param num_peaks, max_intensity, summed_intensity    Output: per-frame statistics of the kept peaks.
+     */
+    void encode_frames(const std::vector<uint32_t>& indexes,
+                       const std::vector<PeakBox>& boxes,
+                       std::vector<uint8_t>& payloads,
+                       std::vector<uint64_t>& payload_offsets,
+                       std::vector<uint32_t>& num_peaks,
+                       std::vector<uint32_t>& max_intensity,
+                       std::vector<uint64_t>& summed_intensity);
+
+    //! Retrieve the peaks of many scan ranges, using multiple threads.
+    /**
+     * Row i selects scans [scan_begins[i], scan_ends[i]) of frame frames[i]. Consecutive rows
+     * of the same frame share one decompression of the frame. The peaks of row i are output at
+     * positions row_offsets[i] to row_offsets[i+1] of the other outputs.
+     */
+    void extract_scan_ranges(const std::vector<uint32_t>& frames,
+                             const std::vector<uint32_t>& scan_begins,
+                             const std::vector<uint32_t>& scan_ends,
+                             std::vector<uint64_t>& row_offsets,
+                             std::vector<uint32_t>& frame_ids,
+                             std::vector<uint32_t>& scan_ids,
+                             std::vector<uint32_t>& tofs,
+                             std::vector<uint32_t>& intensities);
+
+    //! Set zone maps (see FrameZoneMap) for frames, enabling pruning in extract_box() and box_TIC().
+    /**
+     * The arrays are as output by frame_stats(), for frames with given IDs.
+     */
+    void set_zone_maps(const std::vector<uint32_t>& indexes,
+                       const uint32_t* min_tof,
+                       const uint32_t* max_tof,
+                       const uint32_t* max_intensity,
+                       const uint32_t* min_scan,
+                       const uint32_t* max_scan);
+
+    //! Check whether zone maps were set for this handle.
+    bool has_zone_maps() const { return !zone_maps.empty(); };
+
+    //! Check whether a frame may contain peaks within the box, without decompressing it.
+    /**
+     * Only the number of peaks in the frame is considered if no zone map is known for the frame.
+     */
+    bool frame_may_contain(uint32_t frame_id, const PeakBox& box) const;
+
+    //! Select the frames which may contain peaks within their boxes.
+    /**
+     * @param indexes  IDs of frames to consider.
+     * @param boxes    Either one box, used for all frames, or one box per frame.
+     * @return         The subset of indexes which cannot be ruled out based on zone maps.
+     */
+    std::vector<uint32_t> frames_in_box(const std::vector<uint32_t>& indexes, const std::vector<PeakBox>& boxes);
+
+    //! Retrieve the peaks within a box, using multiple threads.
+    /**
+     * Frames ruled out by zone maps are not decompressed. The peaks are returned ordered as
+     * the frames in indexes, and within a frame by scan.
+     *
+     * @param indexes  IDs of frames to consider.
+     * @param boxes    Either one box, used for all frames, or one box per frame.
+     */
+    void extract_box(const std::vector<uint32_t>& indexes,
+                     const std::vector<PeakBox>& boxes,
+                     std::vector<uint32_t>& frame_ids,
+                     std::vector<uint32_t>& scan_ids,
+                     std::vector<uint32_t>& tofs,
+                     std::vector<uint32_t>& intensities);
+
+    //! Sum intensities of peaks within a box, per frame (i.e. an extracted ion chromatogram), using multiple threads.
+    /**
+     * Frames ruled out by zone maps are not decompressed, and get 0.
+     *
+     * @param indexes  IDs of frames to consider.
+     * @param boxes    Either one box, used for all frames, or one box per frame.
+     * @param result   Output, must hold indexes.size() values.
+     */
+    void box_TIC(const std::vector<uint32_t>& indexes,
+                 const std::vector<PeakBox>& boxes,
+                 uint64_t* result);
+
+    //! Bin the peaks of frames into dense images (scan by TOF or m/z), using multiple threads.
+    /**
+     * Image i sums the intensities of the peaks of frame indexes[i]. A peak with scan s and x value v
+     * (its TOF, or its m/z if use_mz) goes to row s - scan_min and column (v - x_min) / x_resolution,
+     * rounded, provided that x_min <= v <= x_max; peaks falling outside of the image are skipped.
+     *
+     * @param indexes       IDs of frames to bin.
+     * @param use_mz        Bin by m/z instead of TOF; requires a conversion method.
+     * @param images        Output, must hold indexes.size() * height * width values, image after image, row after row.
+     */
+    void frame_images(const std::vector<uint32_t>& indexes,
+                      bool use_mz,
+                      double x_min,
+                      double x_max,
+                      double x_resolution,
+                      uint32_t scan_min,
+                      size_t width,
+                      size_t height,
+                      uint32_t* images);
 
     friend class TimsFrame;
 };
@@ -8,9 +8,12 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/numpy.h>
 #include <pybind11/stl.h>
+#include <algorithm>
 #include <cstdint>
+#include <limits>
 #include "platform.h"
 #include "opentims_all.h"
+#include "byte_planes.h"
 
 namespace py = pybind11;
 using namespace pybind11::literals;
@@ -44,6 +47,57 @@ std::unique_ptr<T*[]> extract_ptrs(std::vector<py::array_t<T> > V, size_t size)
     return A;
 }
 
+static const char* raw_hash_columns[] = {"frame", "scan", "tof", "intensity"};
+
+TypedColumn typed_column(py::buffer& buf)
+{
+    py::buffer_info info = buf.request(true);
+    TypedColumn column;
+    if(info.size == 0)
+        return column;
+    column.data = info.ptr;
+    if(info.format == py::format_descriptor<uint16_t>::format())
+        column.type = ColumnType::UInt16;
+    else if(info.format == py::format_descriptor<uint32_t>::format())
+        column.type = ColumnType::UInt32;
+    else if(info.format == py::format_descriptor<float>::format())
+        column.type = ColumnType::Float32;
+    else if(info.format == py::format_descriptor<double>::format())
+        column.type = ColumnType::Float64;
+    else
+        throw std::invalid_argument("Unsupported array type: " + info.format);
+    return column;
+}
+
+py::dict stage_counters_dict(const StageCounters& c)
+{
+    return py::dict("calls"_a=c.calls, "seconds"_a=c.nanoseconds * 1e-9, "bytes_in"_a=c.bytes_in, "bytes_out"_a=c.bytes_out,
+                    "frames"_a=c.frames, "peaks"_a=c.peaks, "minor_faults"_a=c.minor_faults, "major_faults"_a=c.major_faults);
+}
+
+py::dict perf_counters_dict(PerfCounters& perf)
+{
+    // Totals per stage, followed by the breakdown per worker thread slot.
+    std::map<size_t, StagesCounters> per_thread = perf.snapshot();
+    StagesCounters totals;
+    py::dict threads;
+    for(const auto& [slot, stages] : per_thread)
+    {
+        py::dict thread;
+        for(size_t ii = 0; ii < stages.size(); ii++)
+            if(stages[ii].calls > 0)
+            {
+                totals[ii] += stages[ii];
+                thread[perf_stage_name(static_cast<PerfStage>(ii))] = stage_counters_dict(stages[ii]);
+            }
+        threads[py::int_(slot)] = thread;
+    }
+    py::dict stages;
+    for(size_t ii = 0; ii < totals.size(); ii++)
+        stages[perf_stage_name(static_cast<PerfStage>(ii))] = stage_counters_dict(totals[ii]);
+    return py::dict("enabled"_a=perf.is_enabled(), "stages"_a=stages, "per_thread"_a=threads);
+}
+
 std::tuple<
     std::vector<py::array_t<uint32_t> >,
     std::vector<py::array_t<uint32_t> >,
@@ -117,6 +171,149 @@ extract_separate_frames(
     };
 }
 
+template<typename T>
+py::array_t<T> vector_to_numpy(std::vector<T>&& vec)
+{
+    std::vector<T>* owned = new std::vector<T>(std::move(vec));
+    py::capsule free_when_done(owned, [](void* p) { delete reinterpret_cast<std::vector<T>*>(p); });
+    return py::array_t<T>(owned->size(), owned->data(), free_when_done);
+}
+
+template<typename T>
+py::array_t<T> array_view_numpy(const T* data, size_t size, py::handle owner)
+{
+    // Read-only view that keeps owner alive for as long as the array exists.
+    py::array_t<T> arr(size, data, owner);
+    py::detail::array_proxy(arr.ptr())->flags &= ~py::detail::npy_api::NPY_ARRAY_WRITEABLE_;
+    return arr;
+}
+
+template<typename T>
+py::array_t<T> vector_view_numpy(const std::vector<T>& vec, py::handle owner)
+{
+    return array_view_numpy(vec.data(), vec.size(), owner);
+}
+
+py::array_t<double> sql_column_with_nulls_to_numpy(const SqlColumn& column)
+{
+    std::vector<double> as_reals(column.size());
+    for(size_t ii = 0; ii < column.size(); ii++)
+        as_reals[ii] = column.is_null(ii) ? std::numeric_limits<double>::quiet_NaN() : column.as_double(ii);
+    return vector_to_numpy(std::move(as_reals));
+}
+
+py::list sql_text_column_to_python(const SqlColumn& column)
+{
+    // Text, blobs and all-NULL columns: hand a list to Python and let numpy pick the dtype.
+    py::list values(column.size());
+    for(size_t ii = 0; ii < column.size(); ii++)
+        if(column.is_null(ii))
+            values[ii] = py::none();
+        else if(column.type == SqlColumn::Blob)
+            values[ii] = py::bytes(column.texts[ii]);
+        else
+            values[ii] = py::reinterpret_steal<py::object>(PyUnicode_DecodeUTF8(column.texts[ii].data(), column.texts[ii].size(), "replace"));
+    return values;
+}
+
+py::object sql_column_to_python(SqlColumn& column)
+{
+    switch(column.type)
+    {
+        case SqlColumn::Integer:
+            if(column.null_count() == 0)
+                return vector_to_numpy(std::move(column.ints));
+            return sql_column_with_nulls_to_numpy(column);
+        case SqlColumn::Real:
+            return vector_to_numpy(std::move(column.reals));
+        default:
+            return sql_text_column_to_python(column);
+    }
+}
+
+py::object sql_column_view(const SqlColumn& column, py::handle owner)
+{
+    switch(column.type)
+    {
+        case SqlColumn::Integer:
+            if(column.null_count() == 0)
+                return vector_view_numpy(column.ints, owner);
+            return sql_column_with_nulls_to_numpy(column);
+        case SqlColumn::Real:
+            return vector_view_numpy(column.reals, owner);
+        default:
+            return sql_text_column_to_python(column);
+    }
+}
+
+py::dict sql_table_to_python(SqlTable&& table)
+{
+    py::dict result;
+    for(SqlColumn& column : table.columns)
+        result[py::str(column.name)] = sql_column_to_python(column);
+    return result;
+}
+
+std::pair<Tof2MzConverterFactory*, Scan2InvIonMobilityConverterFactory*> converter_factories(ConversionMethod cm)
+{
+    switch(cm) {
+        case ConversionMethod::Default:
+            break; // nullptr = use global default
+        case ConversionMethod::Bruker:
+            if (!bruker_so_initialized)
+                throw std::runtime_error("conversion_method.Bruker requested but Bruker bridge has not been initialized (call setup_bruker_so first)");
+            return {&BrukerTof2MzConverterFactory::instance(bruker_so_path), &BrukerScan2InvIonMobilityConverterFactory::instance(bruker_so_path)};
+        case ConversionMethod::OpenSource:
+            return {&OpenSourceTof2MzConverterFactory::instance(), &OpenSourceScan2ImConverterFactory::instance()};
+        case ConversionMethod::NoConversion:
+            return {&ErrorTof2MzConverterFactory::instance(), &ErrorScan2InvIonMobilityConverterFactory::instance()};
+    }
+    return {nullptr, nullptr};
+}
+
+SqlTable sql_table_from_python(py::dict columns)
+{
+    SqlTable table;
+    for(auto item : columns)
+    {
+        const std::string name = item.first.cast<std::string>();
+        py::array values = py::array::ensure(item.second);
+        if(values && values.dtype().kind() == 'i')
+            table.columns.emplace_back(name, values.cast<std::vector<int64_t> >());
+        else if(values && values.dtype().kind() == 'f')
+            table.columns.emplace_back(name, values.cast<std::vector<double> >());
+        else
+        {
+            // Text columns may hold None for SQL NULLs.
+            std::vector<std::string> texts;
+            std::vector<uint8_t> nulls;
+            for(auto value : item.second)
+            {
+                nulls.push_back(value.is_none());
+                texts.push_back(value.is_none() ? std::string() : value.cast<std::string>());
+            }
+            table.columns.emplace_back(name, std::move(texts), std::move(nulls));
+        }
+    }
+    return table;
+}
+
+std::vector<PeakBox> make_boxes(const std::vector<uint32_t>& scan_begin,
+                                const std::vector<uint32_t>& scan_end,
+                                const std::vector<uint32_t>& tof_begin,
+                                const std::vector<uint32_t>& tof_end,
+                                const std::vector<uint32_t>& min_intensity)
+{
+    const size_t n = scan_begin.size();
+    if(scan_end.size() != n || tof_begin.size() != n || tof_end.size() != n || min_intensity.size() != n)
+        throw std::invalid_argument("All box bounds must have the same length");
+    std::vector<PeakBox> boxes;
+    boxes.reserve(n);
+    for(size_t ii = 0; ii < n; ii++)
+        boxes.push_back(PeakBox{scan_begin[ii], scan_end[ii], tof_begin[ii], tof_end[ii], min_intensity[ii]});
+    return boxes;
+}
+
 PYBIND11_MODULE(opentimspy_cpp, m) {
     py::enum_<ConversionMethod>(m, "conversion_method")
         .value("Default", ConversionMethod::Default)
@@ -149,29 +346,75 @@ PYBIND11_MODULE(opentimspy_cpp, m) {
     py::class_<TimsDataHandle>(m, "TimsDataHandle")
         .def(py::init<const std::string &, pressure_compensation_strategy>())
         .def(py::init([](const std::string& path, pressure_compensation_strategy pcs, ConversionMethod cm) {
-            Tof2MzConverterFactory* tof_fac = nullptr;
-            Scan2InvIonMobilityConverterFactory* im_fac = nullptr;
-            switch(cm) {
-                case ConversionMethod::Default:
-                    break; // nullptr = use global default
-                case ConversionMethod::Bruker:
-                    if (!bruker_so_initialized)
-                        throw std::runtime_error("conversion_method.Bruker requested but Bruker bridge has not been initialized (call setup_bruker_so first)");
-                    tof_fac = &BrukerTof2MzConverterFactory::instance(bruker_so_path);
-                    im_fac = &BrukerScan2InvIonMobilityConverterFactory::instance(bruker_so_path);
-                    break;
-                case ConversionMethod::OpenSource:
-                    tof_fac = &OpenSourceTof2MzConverterFactory::instance();
-                    im_fac = &OpenSourceScan2ImConverterFactory::instance();
-                    break;
-                case ConversionMethod::NoConversion:
-                    tof_fac = &ErrorTof2MzConverterFactory::instance();
-                    im_fac = &ErrorScan2InvIonMobilityConverterFactory::instance();
-                    break;
-            }
-            return new TimsDataHandle(path, pcs, tof_fac, im_fac);
+            auto factories = converter_factories(cm);
+            return new TimsDataHandle(path, pcs, factories.first, factories.second);
         }), py::arg("path"), py::arg("pcs") = pressure_compensation_strategy::NoPressureCompensation, py::arg("conversion_method") = ConversionMethod::Default)
+        .def(py::init([](const std::string& path, py::dict frames_table, std::unordered_map<std::string, std::string> global_metadata, pressure_compensation_strategy pcs, ConversionMethod cm) {
+            auto factories = converter_factories(cm);
+            return new TimsDataHandle(path, sql_table_from_python(frames_table), std::move(global_metadata), pcs, factories.first, factories.second);
+        }), py::arg("path"), py::arg("frames_table"), py::arg("global_metadata"), py::arg("pcs") = pressure_compensation_strategy::NoPressureCompensation, py::arg("conversion_method") = ConversionMethod::Default)
         .def("no_peaks_total", &TimsDataHandle::no_peaks_total)
+        .def("enable_perf_counters", [](TimsDataHandle& dh, bool enabled) { dh.perf_counters.enable(enabled); }, py::arg("enabled") = true)
+        .def("perf_counters_enabled", [](TimsDataHandle& dh) { return dh.perf_counters.is_enabled(); })
+        .def("reset_perf_counters", [](TimsDataHandle& dh) { dh.perf_counters.reset(); })
+        .def("perf_counters", [](TimsDataHandle& dh) { return perf_counters_dict(dh.perf_counters); })
+        .def("start_trace", [](TimsDataHandle& dh, size_t capacity) { dh.perf_counters.trace.start(capacity); }, py::arg("capacity") = 1000000)
+        .def("stop_trace", [](TimsDataHandle& dh) { dh.perf_counters.trace.stop(); })
+        .def("tracing", [](TimsDataHandle& dh) { return dh.perf_counters.trace.is_enabled(); })
+        .def("take_trace", [](TimsDataHandle& dh) {
+                                    // Recorded spans, oldest first, as columns; stages are indexes into "stage_names".
+                                    auto [spans, dropped] = dh.perf_counters.trace.take();
+                                    py::array_t<uint64_t> start(spans.size()), duration(spans.size()), peaks(spans.size());
+                                    py::array_t<uint32_t> frame(spans.size()), thread(spans.size()), stage(spans.size());
+                                    for(size_t ii = 0; ii < spans.size(); ii++)
+                                    {
+                                        start.mutable_at(ii) = spans[ii].start_ns;
+                                        duration.mutable_at(ii) = spans[ii].duration_ns;
+                                        peaks.mutable_at(ii) = spans[ii].peaks;
+                                        frame.mutable_at(ii) = spans[ii].frame;
+                                        thread.mutable_at(ii) = spans[ii].thread_slot;
+                                        stage.mutable_at(ii) = static_cast<uint32_t>(spans[ii].stage);
+                                    }
+                                    py::list stage_names;
+                                    for(size_t ii = 0; ii < static_cast<size_t>(PerfStage::Count); ii++)
+                                        stage_names.append(perf_stage_name(static_cast<PerfStage>(ii)));
+                                    return py::dict("start_ns"_a=start, "duration_ns"_a=duration, "peaks"_a=peaks, "frame"_a=frame,
+                                                    "thread"_a=thread, "stage"_a=stage, "stage_names"_a=stage_names, "dropped"_a=dropped);
+                                })
+        .def("record_allocation", [](TimsDataHandle& dh, double seconds, uint64_t bytes, uint64_t peaks) {
+                                    // Output arrays are allocated by the Python side; it reports the time here.
+                                    if(!dh.perf_counters.is_enabled())
+                                        return;
+                                    StageCounters c;
+                                    c.calls = 1;
+                                    c.nanoseconds = static_cast<uint64_t>(seconds * 1e9);
+                                    c.bytes_out = bytes;
+                                    c.peaks = peaks;
+                                    dh.perf_counters.add(PerfStage::Allocation, c);
+                                }, py::arg("seconds"), py::arg("bytes"), py::arg("peaks"))
+        .def("ms_level_frames", [](py::object self, uint32_t ms_level, double min_rt, double max_rt) {
+                                    // Read-only view into the handle's frame index.
+                                    TimsDataHandle& dh = self.cast<TimsDataHandle&>();
+                                    const std::vector<uint32_t>& ids = dh.ms_level_frames(ms_level);
+                                    auto range = dh.ms_level_rt_range(ms_level, min_rt, max_rt);
+                                    return array_view_numpy(ids.data() + range.first, range.second - range.first, self);
+                                },
+                                py::arg("ms_level") = 0,
+                                py::arg("min_rt") = -std::numeric_limits<double>::infinity(),
+                                py::arg("max_rt") = std::numeric_limits<double>::infinity())
+        .def("ms_level_retention_times", [](py::object self, uint32_t ms_level) {
+                                    return vector_view_numpy(self.cast<TimsDataHandle&>().ms_level_retention_times(ms_level), self);
+                                }, py::arg("ms_level") = 0)
+        .def("frames_table", [](py::object self) {
+                                    // Columns of the Frames table as read when the handle was opened;
+                                    // numeric columns are read-only views into the handle's memory.
+                                    const SqlTable& table = self.cast<TimsDataHandle&>().get_frames_table();
+                                    py::dict result;
+                                    for(const SqlColumn& column : table.columns)
+                                        result[py::str(column.name)] = sql_column_view(column, self);
+                                    return result;
+                                })
+        .def("global_metadata", &TimsDataHandle::get_global_metadata)
         .def("min_frame_id", &TimsDataHandle::min_frame_id)
         .def("max_frame_id", &TimsDataHandle::max_frame_id)
         .def("get_frame", &TimsDataHandle::get_frame, py::return_value_policy::reference)
@@ -225,6 +468,31 @@ PYBIND11_MODULE(opentimspy_cpp, m) {
             py::arg("inv_ion_mobility"),
             py::arg("retention_time")
         )
+        .def("extract_frames_typed",
+            [](
+                TimsDataHandle& dh,
+                const std::vector<uint32_t>& indexes,
+                py::buffer& frame_ids,
+                py::buffer& scan_ids,
+                py::buffer& tofs,
+                py::buffer& intensities,
+                py::buffer& mzs,
+                py::buffer& inv_ion_mobilities,
+                py::buffer& retention_times)
+                {
+                    TypedColumn columns[] = {typed_column(frame_ids), typed_column(scan_ids), typed_column(tofs), typed_column(intensities),
+                                             typed_column(mzs), typed_column(inv_ion_mobilities), typed_column(retention_times)};
+                    dh.extract_frames_typed(indexes, columns[0], columns[1], columns[2], columns[3], columns[4], columns[5], columns[6]);
+                },
+            py::arg("frames"),
+            py::arg("frame"),
+            py::arg("scan"),
+            py::arg("tof"),
+            py::arg("intensity"),
+            py::arg("mz"),
+            py::arg("inv_ion_mobility"),
+            py::arg("retention_time")
+        )
         .def("extract_frames_slice",
             [](TimsDataHandle& dh, size_t start, size_t end, size_t step, py::buffer& result_b)
             {
@@ -278,6 +546,166 @@ PYBIND11_MODULE(opentimspy_cpp, m) {
                 dh.per_frame_TIC(get_ptr<uint32_t>(tics));
             }
         )
+        .def("frame_digests",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames, const std::string& algo, const std::vector<std::string>& columns)
+            {
+                HashAlgorithm algorithm = hash_algorithm_from_name(algo);
+                unsigned mask = 0;
+                for(const std::string& column : columns)
+                {
+                    auto it = std::find(std::begin(raw_hash_columns), std::end(raw_hash_columns), column);
+                    if(it == std::end(raw_hash_columns))
+                        throw std::invalid_argument("Only frame, scan, tof and intensity can be hashed natively, not " + column);
+                    mask |= 1u << (it - std::begin(raw_hash_columns));
+                }
+                const size_t size = hash_digest_size(algorithm);
+                py::array_t<uint8_t> digests({frames.size(), size});
+                dh.frame_digests(frames, algorithm, mask, digests.mutable_data());
+                return digests;
+            }, py::arg("frames"), py::arg("algo") = "xxh64", py::arg("columns") = std::vector<std::string>{"frame", "scan", "tof", "intensity"})
+        .def("verify", &TimsDataHandle::verify, py::arg("frames"))
+        .def("set_io_mode", [](TimsDataHandle& dh, const std::string& mode) { dh.set_io_mode(io_mode_from_name(mode)); }, py::arg("mode"))
+        .def("io_mode", [](TimsDataHandle& dh) { return io_mode_name(dh.get_io_mode()); })
+        .def("set_access_pattern", [](TimsDataHandle& dh, const std::string& pattern) { dh.set_access_pattern(access_pattern_from_name(pattern)); }, py::arg("pattern"))
+        .def("access_pattern", [](TimsDataHandle& dh) { return access_pattern_name(dh.get_access_pattern()); })
+        .def("set_readahead", &TimsDataHandle::set_readahead, py::arg("bytes"))
+        .def("readahead", &TimsDataHandle::get_readahead)
+        .def("frame_stats",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames)
+            {
+                const size_t n = frames.size();
+                py::array_t<uint64_t> tic(n);
+                py::array_t<uint32_t> max_intensity(n), min_tof(n), max_tof(n), min_scan(n), max_scan(n);
+                {
+                    // Safe on handles shared between threads: decoding only uses per-thread buffers.
+                    py::gil_scoped_release release;
+                    dh.frame_stats(frames, tic.mutable_data(), max_intensity.mutable_data(), min_tof.mutable_data(),
+                                   max_tof.mutable_data(), min_scan.mutable_data(), max_scan.mutable_data());
+                }
+                return py::dict("tic"_a=tic, "max_intensity"_a=max_intensity, "min_tof"_a=min_tof,
+                                "max_tof"_a=max_tof, "min_scan"_a=min_scan, "max_scan"_a=max_scan);
+            },
+            py::arg("frames")
+        )
+        .def("set_zone_maps",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames,
+               py::array_t<uint32_t, py::array::c_style | py::array::forcecast> min_tof,
+               py::array_t<uint32_t, py::array::c_style | py::array::forcecast> max_tof,
+               py::array_t<uint32_t, py::array::c_style | py::array::forcecast> max_intensity,
+               py::array_t<uint32_t, py::array::c_style | py::array::forcecast> min_scan,
+               py::array_t<uint32_t, py::array::c_style | py::array::forcecast> max_scan)
+            {
+                for(auto* arr : {&min_tof, &max_tof, &max_intensity, &min_scan, &max_scan})
+                    if(static_cast<size_t>(arr->size()) != frames.size())
+                        throw std::invalid_argument("Zone map arrays must have one value per frame");
+                dh.set_zone_maps(frames, min_tof.data(), max_tof.data(), max_intensity.data(), min_scan.data(), max_scan.data());
+            },
+            py::arg("frames"), py::arg("min_tof"), py::arg("max_tof"), py::arg("max_intensity"), py::arg("min_scan"), py::arg("max_scan")
+        )
+        .def("has_zone_maps", &TimsDataHandle::has_zone_maps)
+        .def("frames_in_box",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames,
+               const std::vector<uint32_t>& scan_begin, const std::vector<uint32_t>& scan_end,
+               const std::vector<uint32_t>& tof_begin, const std::vector<uint32_t>& tof_end,
+               const std::vector<uint32_t>& min_intensity)
+            {
+                return vector_to_numpy(dh.frames_in_box(frames, make_boxes(scan_begin, scan_end, tof_begin, tof_end, min_intensity)));
+            },
+            py::arg("frames"), py::arg("scan_begin"), py::arg("scan_end"), py::arg("tof_begin"), py::arg("tof_end"), py::arg("min_intensity")
+        )
+        .def("extract_box",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames,
+               const std::vector<uint32_t>& scan_begin, const std::vector<uint32_t>& scan_end,
+               const std::vector<uint32_t>& tof_begin, const std::vector<uint32_t>& tof_end,
+               const std::vector<uint32_t>& min_intensity)
+            {
+                std::vector<uint32_t> frame_ids, scan_ids, tofs, intensities;
+                dh.extract_box(frames, make_boxes(scan_begin, scan_end, tof_begin, tof_end, min_intensity),
+                               frame_ids, scan_ids, tofs, intensities);
+                return py::dict("frame"_a=vector_to_numpy(std::move(frame_ids)),
+                                "scan"_a=vector_to_numpy(std::move(scan_ids)),
+                                "tof"_a=vector_to_numpy(std::move(tofs)),
+                                "intensity"_a=vector_to_numpy(std::move(intensities)));
+            },
+            py::arg("frames"), py::arg("scan_begin"), py::arg("scan_end"), py::arg("tof_begin"), py::arg("tof_end"), py::arg("min_intensity")
+        )
+        .def("box_TIC",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames,
+               const std::vector<uint32_t>& scan_begin, const std::vector<uint32_t>& scan_end,
+               const std::vector<uint32_t>& tof_begin, const std::vector<uint32_t>& tof_end,
+               const std::vector<uint32_t>& min_intensity)
+            {
+                py::array_t<uint64_t> result(frames.size());
+                dh.box_TIC(frames, make_boxes(scan_begin, scan_end, tof_begin, tof_end, min_intensity), result.mutable_data());
+                return result;
+            },
+            py::arg("frames"), py::arg("scan_begin"), py::arg("scan_end"), py::arg("tof_begin"), py::arg("tof_end"), py::arg("min_intensity")
+        )
+        .def("frame_images",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames, const std::string& x_axis,
+               double x_min, double x_max, double x_resolution, uint32_t scan_min, size_t width, size_t height)
+            {
+                if(x_axis != "mz" && x_axis != "tof")
+                    throw std::invalid_argument("Images can be binned by mz or tof, not " + x_axis);
+                py::array_t<uint32_t> images({frames.size(), height, width});
+                uint32_t* data = images.mutable_data();
+                {
+                    // Lets render_frames encode the previous batch meanwhile; decoding only uses per-thread buffers.
+                    py::gil_scoped_release release;
+                    dh.frame_images(frames, x_axis == "mz", x_min, x_max, x_resolution, scan_min, width, height, data);
+                }
+                return images;
+            },
+            py::arg("frames"), py::arg("x_axis"), py::arg("x_min"), py::arg("x_max"), py::arg("x_resolution"),
+            py::arg("scan_min"), py::arg("width"), py::arg("height")
+        )
+        .def("encode_frames",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames,
+               const std::vector<uint32_t>& scan_begin, const std::vector<uint32_t>& scan_end,
+               const std::vector<uint32_t>& tof_begin, const std::vector<uint32_t>& tof_end,
+               const std::vector<uint32_t>& min_intensity)
+            {
+                std::vector<uint8_t> payloads;
+                std::vector<uint64_t> payload_offsets, summed_intensity;
+                std::vector<uint32_t> num_peaks, max_intensity;
+                dh.encode_frames(frames, make_boxes(scan_begin, scan_end, tof_begin, tof_end, min_intensity),
+                                 payloads, payload_offsets, num_peaks, max_intensity, summed_intensity);
+                return py::dict("payloads"_a=vector_to_numpy(std::move(payloads)),
+                                "payload_offsets"_a=vector_to_numpy(std::move(payload_offsets)),
+                                "num_peaks"_a=vector_to_numpy(std::move(num_peaks)),
+                                "max_intensity"_a=vector_to_numpy(std::move(max_intensity)),
+                                "summed_intensity"_a=vector_to_numpy(std::move(summed_intensity)));
+            },
+            py::arg("frames"), py::arg("scan_begin"), py::arg("scan_end"), py::arg("tof_begin"), py::arg("tof_end"), py::arg("min_intensity")
+        )
+        .def("extract_scan_ranges",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames, const std::vector<uint32_t>& scan_begins,
+               const std::vector<uint32_t>& scan_ends)
+            {
+                std::vector<uint64_t> row_offsets;
+                std::vector<uint32_t> frame_ids, scan_ids, tofs, intensities;
+                dh.extract_scan_ranges(frames, scan_begins, scan_ends, row_offsets, frame_ids, scan_ids, tofs, intensities);
+                return py::make_tuple(vector_to_numpy(std::move(row_offsets)),
+                                      py::dict("frame"_a=vector_to_numpy(std::move(frame_ids)),
+                                               "scan"_a=vector_to_numpy(std::move(scan_ids)),
+                                               "tof"_a=vector_to_numpy(std::move(tofs)),
+                                               "intensity"_a=vector_to_numpy(std::move(intensities))));
+            },
+            py::arg("frames"), py::arg("scan_begins"), py::arg("scan_ends")
+        )
+        .def("merge_scan_ranges",
+            [](TimsDataHandle& dh, const std::vector<uint32_t>& frames, const std::vector<uint32_t>& scan_begins,
+               const std::vector<uint32_t>& scan_ends, const std::vector<uint64_t>& group_offsets)
+            {
+                std::vector<uint64_t> spectrum_offsets, intensities;
+                std::vector<uint32_t> tofs;
+                dh.merge_scan_ranges(frames, scan_begins, scan_ends, group_offsets, spectrum_offsets, tofs, intensities);
+                return py::make_tuple(vector_to_numpy(std::move(spectrum_offsets)),
+                                      vector_to_numpy(std::move(tofs)),
+                                      vector_to_numpy(std::move(intensities)));
+            },
+            py::arg("frames"), py::arg("scan_begins"), py::arg("scan_ends"), py::arg("group_offsets")
+        )
         .def("tof_to_mz",
                 [](
                     TimsDataHandle& dh,
@@ -350,10 +778,46 @@ PYBIND11_MODULE(opentimspy_cpp, m) {
                                 {
                                     setup_opensource();
                                 });
+    m.def("merkle_root", [](py::array_t<uint8_t, py::array::c_style | py::array::forcecast> digests, const std::string& algo)
+    {
+        // Dataset-wide digest combining per-frame digests (rows of the array), see merkle_root in hashing.h.
+        HashAlgorithm algorithm = hash_algorithm_from_name(algo);
+        const size_t size = hash_digest_size(algorithm);
+        if(digests.ndim() != 2 || static_cast<size_t>(digests.shape(1)) != size)
+            throw std::invalid_argument("merkle_root: expected an array of shape (n, " + std::to_string(size) + ")");
+        std::vector<uint8_t> root = merkle_root(algorithm, digests.data(), digests.shape(0));
+        return py::bytes(reinterpret_cast<const char*>(root.data()), root.size());
+    }, py::arg("digests"), py::arg("algo") = "xxh64");
+    m.def("byte_plane_implementations", &byte_planes::available_implementations);
+    m.def("transpose_byte_planes", [](py::array_t<uint8_t, py::array::c_style | py::array::forcecast> planes, const std::string& implementation)
+    {
+        // Reassembles uint32 values from 4 consecutive byte planes, as in decompressed frames; for testing.
+        if(planes.ndim() != 1 || planes.shape(0) % 4 != 0)
+            throw std::invalid_argument("transpose_byte_planes: expected a 1-D array of length divisible by 4");
+        const size_t stride = planes.shape(0) / 4;
+        byte_planes::TransposeFunction transpose = implementation == "auto" ? transpose_byte_planes : byte_planes::implementation(implementation);
+        py::array_t<uint32_t> result(stride);
+        transpose(reinterpret_cast<const char*>(planes.data()), stride, 0, stride, result.mutable_data());
+        return result;
+    }, py::arg("planes"), py::arg("implementation") = "auto");
     m.def("set_num_threads", [](size_t n)
                                 {
                                     ThreadingManager::get_instance().set_num_threads(n);
                                 });
+    m.def("sql_query", [](const std::string& path, const std::string& sql, const std::vector<std::string>& params)
+                                {
+                                    RAIISqlite DB(path);
+                                    return sql_table_to_python(DB.select(sql, params));
+                                },
+          py::arg("path"), py::arg("sql"), py::arg("params") = std::vector<std::string>());
+    m.def("read_sql_table", [](const std::string& path, const std::string& name) -> py::object
+                                {
+                                    RAIISqlite DB(path);
+                                    if(!DB.has_table(name))
+                                        return py::none();
+                                    return sql_table_to_python(DB.read_table(name));
+                                },
+          py::arg("path"), py::arg("name"));
     m.def("setup_sqlite_so", []([[maybe_unused]] const std::string& path)
                                 {
 #ifndef OPENTIMS_LINK_SQLITE_STATICALLY
@@ -0,0 +1,323 @@
+/*
+ *   OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+ *   Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+ *
+ *   Licensed under the MIT License. See LICENCE file in the project root for details.
+ */
+
+#pragma once
+#include <algorithm>
+#include <array>
+#include <atomic>
+#include <chrono>
+#include <cstdint>
+#include <map>
+#include <mutex>
+#include <utility>
+#include <vector>
+
+#if defined(__linux__)
+#include <sys/resource.h>
+#endif
+
+//! Stages of data extraction timed by PerfCounters.
+enum class PerfStage : size_t
+{
+    Decompress,             ///< zstd decompression of frames (including page faults on the memory-mapped file)
+    Decode,                 ///< Decoding of scans, TOFs and intensities from the byte planes, including intensity correction
+    TofToMz,                ///< TOF to m/z conversion
+    ScanToInvIonMobility,   ///< Scan to inverse ion mobility conversion
+    Allocation,             ///< Allocation of output arrays (reported by the bindings)
+    Count
+};
+
+inline const char* perf_stage_name(PerfStage stage)
+{
+    static const char* names[] = {"decompress", "decode", "tof_to_mz", "scan_to_inv_ion_mobility", "allocation"};
+    return names[static_cast<size_t>(stage)];
+}
+
+struct StageCounters
+{
+    uint64_t calls = 0;
+    uint64_t nanoseconds = 0;
+    uint64_t bytes_in = 0;
+    uint64_t bytes_out = 0;
+    uint64_t frames = 0;
+    uint64_t peaks = 0;
+    uint64_t minor_faults = 0;  ///< Only counted on Linux
+    uint64_t major_faults = 0;  ///< Only counted on Linux
+
+    StageCounters& operator+=(const StageCounters& other)
+    {
+        calls += other.calls;
+        nanoseconds += other.nanoseconds;
+        bytes_in += other.bytes_in;
+        bytes_out += other.bytes_out;
+        frames += other.frames;
+        peaks += other.peaks;
+        minor_faults += other.minor_faults;
+        major_faults += other.major_faults;
+        return *this;
+    }
+};
+
+typedef std::array<StageCounters, static_cast<size_t>(PerfStage::Count)> StagesCounters;
+
+//! One timed execution of a stage on one frame, as recorded by TraceBuffer.
+struct TraceSpan
+{
+    uint64_t start_ns;      ///< steady_clock time since its epoch
+    uint64_t duration_ns;
+    uint64_t peaks;
+    uint32_t frame;
+    uint32_t thread_slot;
+    PerfStage stage;
+};
+
+//! Ring buffer of the most recent spans, for tracing the work of threads.
+class TraceBuffer
+{
+    std::atomic<bool> enabled{false};
+    std::mutex mutex;
+    std::vector<TraceSpan> spans;
+    size_t capacity = 0;
+    size_t next = 0;
+    uint64_t dropped = 0;
+
+ public:
+    bool is_enabled() const { return enabled.load(std::memory_order_relaxed); };
+
+    //! Start recording from scratch, keeping at most _capacity most recent spans.
+    void start(size_t _capacity)
+    {
+        std::lock_guard<std::mutex> lock(mutex);
+        spans.clear();
+        spans.reserve(_capacity);
+        capacity = _capacity;
+        next = 0;
+        dropped = 0;
+        enabled.store(capacity > 0, std::memory_order_relaxed);
+    };
+
+    void stop() { enabled.store(false, std::memory_order_relaxed); };
+
+    void record(const TraceSpan& span)
+    {
+        std::lock_guard<std::mutex> lock(mutex);
+        if(spans.size() < capacity)
+            spans.push_back(span);
+        else if(capacity > 0)
+        {
+            spans[next] = span;
+            next = (next + 1) % capacity;
+            dropped++;
+        }
+    };
+
+    //! Remove the recorded spans, oldest first; also return how many were overwritten.
+    std::pair<std::vector<TraceSpan>, uint64_t> take()
+    {
+        std::lock_guard<std::mutex> lock(mutex);
+        std::vector<TraceSpan> result;
+        result.reserve(spans.size());
+        result.insert(result.end(), spans.begin() + next, spans.end());
+        result.insert(result.end(), spans.begin(), spans.begin() + next);
+        std::pair<std::vector<TraceSpan>, uint64_t> taken(std::move(result), dropped);
+        spans.clear();
+        next = 0;
+        dropped = 0;
+        return taken;
+    };
+};
+
+//! Opt-in per-stage performance counters of a TimsDataHandle.
+/**
+ * Counters are kept per thread slot: 0 for the calling thread, and 1 + the index of a worker
+ * thread within a multithreaded extraction. Each slot is allocated on first use and updated
+ * with relaxed atomic additions, so recording takes no lock and threads do not share counters
+ * (except for concurrent extractions on the same handle, whose workers share slots safely).
+ * When disabled (the default), recording costs one relaxed atomic load. Spans of individual
+ * stages can additionally be traced.
+ */
+class PerfCounters
+{
+ public:
+    //! Slots beyond the last one share it.
+    static constexpr size_t max_slots = 256;
+
+ private:
+    struct alignas(64) SlotCounters
+    {
+        std::array<std::array<std::atomic<uint64_t>, 8>, static_cast<size_t>(PerfStage::Count)> stages{};
+
+        void add(PerfStage stage, const StageCounters& c)
+        {
+            std::array<std::atomic<uint64_t>, 8>& s = stages[static_cast<size_t>(stage)];
+            const uint64_t values[8] = {c.calls, c.nanoseconds, c.bytes_in, c.bytes_out, c.frames, c.peaks, c.minor_faults, c.major_faults};
+            for(size_t ii = 0; ii < 8; ii++)
+                if(values[ii] != 0)
+                    s[ii].fetch_add(values[ii], std::memory_order_relaxed);
+        };
+
+        StagesCounters load() const
+        {
+            StagesCounters result;
+            for(size_t stage = 0; stage < stages.size(); stage++)
+            {
+                const std::array<std::atomic<uint64_t>, 8>& s = stages[stage];
+                StageCounters& c = result[stage];
+                c.calls = s[0].load(std::memory_order_relaxed);
+                c.nanoseconds = s[1].load(std::memory_order_relaxed);
+                c.bytes_in = s[2].load(std::memory_order_relaxed);
+                c.bytes_out = s[3].load(std::memory_order_relaxed);
+                c.frames = s[4].load(std::memory_order_relaxed);
+                c.peaks = s[5].load(std::memory_order_relaxed);
+                c.minor_faults = s[6].load(std::memory_order_relaxed);
+                c.major_faults = s[7].load(std::memory_order_relaxed);
+            }
+            return result;
+        };
+
+        void clear()
+        {
+            for(auto& s : stages)
+                for(auto& value : s)
+                    value.store(0, std::memory_order_relaxed);
+        };
+    };
+
+    std::atomic<bool> enabled{false};
+    std::array<std::atomic<SlotCounters*>, max_slots> slots{};
+
+    SlotCounters& slot_counters(size_t slot)
+    {
+        std::atomic<SlotCounters*>& entry = slots[std::min(slot, max_slots - 1)];
+        SlotCounters* counters = entry.load(std::memory_order_acquire);
+        if(counters == nullptr)
+        {
+            SlotCounters* fresh = new SlotCounters();
+            if(entry.compare_exchange_strong(counters, fresh, std::memory_order_acq_rel))
+                counters = fresh;
+            else
+                delete fresh;  // another thread allocated the slot first; counters now points to its slot
+        }
+        return *counters;
+    };
+
+ public:
+    TraceBuffer trace;
+
+    PerfCounters() = default;
+    PerfCounters(const PerfCounters&) = delete;
+    PerfCounters& operator=(const PerfCounters&) = delete;
+    ~PerfCounters()
+    {
+        for(auto& entry : slots)
+            delete entry.load(std::memory_order_relaxed);
+    };
+
+    bool is_enabled() const { return enabled.load(std::memory_order_relaxed); };
+    void enable(bool on) { enabled.store(on, std::memory_order_relaxed); };
+
+    //! The slot under which the calling thread records its counters; worker threads set it to 1 + their index.
+    static size_t& thread_slot()
+    {
+        thread_local size_t slot = 0;
+        return slot;
+    };
+
+    void add(PerfStage stage, const StageCounters& counters)
+    {
+        slot_counters(thread_slot()).add(stage, counters);
+    };
+
+    void reset()
+    {
+        for(auto& entry : slots)
+            if(SlotCounters* counters = entry.load(std::memory_order_acquire))
+                counters->clear();
+    };
+
+    //! Counters of the slots which recorded anything.
+    std::map<size_t, StagesCounters> snapshot() const
+    {
+        std::map<size_t, StagesCounters> result;
+        for(size_t slot = 0; slot < max_slots; slot++)
+            if(const SlotCounters* counters = slots[slot].load(std::memory_order_acquire))
+            {
+                StagesCounters stages = counters->load();
+                for(const StageCounters& stage : stages)
+                    if(stage.calls > 0)
+                    {
+                        result.emplace(slot, stages);
+                        break;
+                    }
+            }
+        return result;
+    };
+};
+
+//! Times one execution of a stage on a frame, if counters or tracing are enabled; call done() to record it.
+class StageTimer
+{
+    PerfCounters* counters;
+    PerfStage stage;
+    uint32_t frame;
+    bool count;
+    bool traced;
+    std::chrono::steady_clock::time_point start;
+#if defined(__linux__)
+    struct rusage usage_start;
+#endif
+
+ public:
+    StageTimer(PerfCounters& _counters, PerfStage _stage, uint32_t _frame, bool count_faults = false)
+    : counters(nullptr), stage(_stage), frame(_frame), count(_counters.is_enabled()), traced(_counters.trace.is_enabled())
+    {
+        if(!count && !traced)
+            return;
+        counters = &_counters;
+#if defined(__linux__) && defined(RUSAGE_THREAD)
+        if(count && count_faults)
+            getrusage(RUSAGE_THREAD, &usage_start);
+        else
+            usage_start.ru_minflt = usage_start.ru_majflt = -1;
+#else
+        (void) count_faults;
+#endif
+        start = std::chrono::steady_clock::now();
+    };
+
+    void done(uint64_t bytes_in, uint64_t bytes_out, uint64_t frames, uint64_t peaks)
+    {
+        if(counters == nullptr)
+            return;
+        uint64_t nanoseconds = std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::steady_clock::now() - start).count();
+        if(traced)
+            counters->trace.record(TraceSpan{
+                static_cast<uint64_t>(std::chrono::duration_cast<std::chrono::nanoseconds>(start.time_since_epoch()).count()),
+                nanoseconds, peaks, frame, static_cast<uint32_t>(PerfCounters::thread_slot()), stage});
+        if(count)
+        {
+            StageCounters c;
+            c.nanoseconds = nanoseconds;
+            c.calls = 1;
+            c.bytes_in = bytes_in;
+            c.bytes_out = bytes_out;
+            c.frames = frames;
+            c.peaks = peaks;
+#if defined(__linux__) && defined(RUSAGE_THREAD)
+            if(usage_start.ru_minflt != -1)
+            {
+                struct rusage usage_end;
+                getrusage(RUSAGE_THREAD, &usage_end);
+                c.minor_faults = usage_end.ru_minflt - usage_start.ru_minflt;
+                c.major_faults = usage_end.ru_majflt - usage_start.ru_majflt;
+            }
+#endif
+            counters->add(stage, c);
+        }
+        counters = nullptr;
+    };
+};
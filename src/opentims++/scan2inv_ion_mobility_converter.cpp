@@ -203,45 +203,6 @@ std::string OpenSourceScan2ImConverter::description() const
  * OpenSourceScan2ImConverterFactory implementation
  */
 
-namespace {
-struct Scan2ImMetadata
-{
-    double im_min = 0;
-    double im_max = 0;
-};
-
-int scan2im_metadata_callback(void* out, int cols, char** row, char** colnames)
-{
-    (void)cols;
-    (void)colnames;
-    Scan2ImMetadata* meta = reinterpret_cast<Scan2ImMetadata*>(out);
-    if (row[0] == nullptr || row[1] == nullptr)
-        return 0;
-    const char* key = row[0];
-    const char* val = row[1];
-    if (std::strcmp(key, "OneOverK0AcqRangeLower") == 0)
-        meta->im_min = std::atof(val);
-    else if (std::strcmp(key, "OneOverK0AcqRangeUpper") == 0)
-        meta->im_max = std::atof(val);
-    return 0;
-}
-
-struct ScanMaxResult
-{
-    uint32_t scan_max = 0;
-};
-
-int scan_max_callback(void* out, int cols, char** row, char** colnames)
-{
-    (void)cols;
-    (void)colnames;
-    ScanMaxResult* res = reinterpret_cast<ScanMaxResult*>(out);
-    if (row[0] != nullptr)
-        res->scan_max = static_cast<uint32_t>(std::atol(row[0]));
-    return 0;
-}
-} // anonymous namespace
-
 std::unique_ptr<Scan2InvIonMobilityConverter> OpenSourceScan2ImConverterFactory::produce(
     TimsDataHandle& TDH, pressure_compensation_strategy pcs)
 {
@@ -250,21 +211,28 @@ std::unique_ptr<Scan2InvIonMobilityConverter> OpenSourceScan2ImConverterFactory:
             "Pressure compensation is not supported by the open-source ion mobility converter. "
             "Use Bruker's proprietary library for pressure compensation, or disable it.");
 
-    std::string tdf_path = TDH.get_tims_dir_path() + "/analysis.tdf";
-    RAIISqlite db(tdf_path);
+    const std::unordered_map<std::string, std::string>& metadata = TDH.get_global_metadata();
+    auto value = [&metadata](const char* key) -> const char* {
+        auto it = metadata.find(key);
+        return it == metadata.end() ? "" : it->second.c_str();
+    };
 
-    Scan2ImMetadata meta;
-    db.query(
-        "SELECT Key, Value FROM GlobalMetadata "
-        "WHERE Key IN ('OneOverK0AcqRangeLower','OneOverK0AcqRangeUpper')",
-        scan2im_metadata_callback, &meta);
+    const double im_min = std::atof(value("OneOverK0AcqRangeLower"));
+    const double im_max = std::atof(value("OneOverK0AcqRangeUpper"));
 
-    ScanMaxResult scan_res;
-    db.query("SELECT MAX(NumScans) FROM Frames", scan_max_callback, &scan_res);
+    uint32_t scan_max = TDH.max_num_scans();
+    if (scan_max == 0)
+    {
+        // Frame descriptors not loaded by the handle (R bindings fill them in later).
+        RAIISqlite db(TDH.get_tims_tdf_path());
+        SqlTable res = db.select("SELECT MAX(NumScans) FROM Frames");
+        if (res.size() > 0 && !res.columns[0].is_null(0))
+            scan_max = static_cast<uint32_t>(res.columns[0].as_int(0));
+    }
 
-    if (meta.im_min <= 0 || meta.im_max <= meta.im_min || scan_res.scan_max == 0)
+    if (im_min <= 0 || im_max <= im_min || scan_max == 0)
         throw std::runtime_error(
-            "OpenSourceScan2ImConverterFactory: invalid calibration metadata in " + tdf_path);
+            "OpenSourceScan2ImConverterFactory: invalid calibration metadata in " + TDH.get_tims_tdf_path());
 
-    return std::make_unique<OpenSourceScan2ImConverter>(meta.im_min, meta.im_max, scan_res.scan_max);
+    return std::make_unique<OpenSourceScan2ImConverter>(im_min, im_max, scan_max);
 }
@@ -1,5 +1,235 @@
+#include <cmath>
+#include <cstdio>
+#include <limits>
+#include <memory>
+
 #include "sqlite_helper.h"
 
 #if !defined(OPENTIMS_BUILDING_R) && !defined(OPENTIMS_LINK_SQLITE_STATICALLY)
 std::optional<LoadedLibraryHandle> ot_sqlite::sqlite_so_handle;
 #endif
+
+
+static std::string sql_number_to_text(double value)
+{
+    char buf[32];
+    snprintf(buf, sizeof(buf), "%.15g", value);
+    return std::string(buf);
+}
+
+void SqlColumn::promote(Type new_type)
+{
+    switch(new_type)
+    {
+        case Integer:
+            ints.resize(rows, 0);
+            break;
+        case Real:
+            reals.reserve(rows);
+            if(type == Integer)
+                for(size_t ii = 0; ii < rows; ii++)
+                    reals.push_back(is_null(ii) ? std::numeric_limits<double>::quiet_NaN() : static_cast<double>(ints[ii]));
+            else
+                reals.resize(rows, std::numeric_limits<double>::quiet_NaN());
+            ints = std::vector<int64_t>();
+            break;
+        case Text:
+        case Blob:
+            if(type == Text || type == Blob)
+                break;
+            texts.reserve(rows);
+            for(size_t ii = 0; ii < rows; ii++)
+                if(is_null(ii))
+                    texts.emplace_back();
+                else if(type == Integer)
+                    texts.push_back(std::to_string(ints[ii]));
+                else if(type == Real)
+                    texts.push_back(sql_number_to_text(reals[ii]));
+            ints = std::vector<int64_t>();
+            reals = std::vector<double>();
+            break;
+        case Null:
+            break;
+    }
+    type = new_type;
+}
+
+void SqlColumn::append_placeholder()
+{
+    switch(type)
+    {
+        case Integer:
+            ints.push_back(0);
+            break;
+        case Real:
+            reals.push_back(std::numeric_limits<double>::quiet_NaN());
+            break;
+        case Text:
+        case Blob:
+            texts.emplace_back();
+            break;
+        case Null:
+            break;
+    }
+}
+
+void SqlColumn::append(sqlite3_stmt* stmt, int col)
+{
+    switch(ot_sqlite::sqlite3_column_type(stmt, col))
+    {
+        case SQLITE_NULL:
+            nulls.resize(rows+1, 0);
+            nulls[rows] = 1;
+            no_nulls++;
+            append_placeholder();
+            break;
+        case SQLITE_INTEGER:
+            if(type == Null)
+                promote(Integer);
+            if(type == Integer)
+                ints.push_back(ot_sqlite::sqlite3_column_int64(stmt, col));
+            else if(type == Real)
+                reals.push_back(static_cast<double>(ot_sqlite::sqlite3_column_int64(stmt, col)));
+            else
+                texts.emplace_back(reinterpret_cast<const char*>(ot_sqlite::sqlite3_column_text(stmt, col)));
+            break;
+        case SQLITE_FLOAT:
+            if(type == Null || type == Integer)
+                promote(Real);
+            if(type == Real)
+                reals.push_back(ot_sqlite::sqlite3_column_double(stmt, col));
+            else
+                texts.emplace_back(reinterpret_cast<const char*>(ot_sqlite::sqlite3_column_text(stmt, col)));
+            break;
+        case SQLITE_BLOB:
+            if(type != Text && type != Blob)
+                promote(rows == no_nulls ? Blob : Text);
+            {
+                const char* data = static_cast<const char*>(ot_sqlite::sqlite3_column_blob(stmt, col));
+                texts.emplace_back(data, data + ot_sqlite::sqlite3_column_bytes(stmt, col));
+            }
+            break;
+        default: // SQLITE_TEXT
+            if(type != Text)
+                promote(Text);
+            {
+                const char* data = reinterpret_cast<const char*>(ot_sqlite::sqlite3_column_text(stmt, col));
+                texts.emplace_back(data, data + ot_sqlite::sqlite3_column_bytes(stmt, col));
+            }
+            break;
+    }
+    rows++;
+}
+
+double SqlColumn::as_double(size_t idx) const
+{
+    switch(type)
+    {
+        case Integer:
+            return static_cast<double>(ints[idx]);
+        case Real:
+            return reals[idx];
+        case Text:
+            return std::strtod(texts[idx].c_str(), nullptr);
+        default:
+            throw std::runtime_error("SQL column " + name + " does not hold numeric values");
+    }
+}
+
+int64_t SqlColumn::as_int(size_t idx) const
+{
+    switch(type)
+    {
+        case Integer:
+            return ints[idx];
+        case Real:
+            return static_cast<int64_t>(reals[idx]);
+        case Text:
+            return std::strtoll(texts[idx].c_str(), nullptr, 10);
+        default:
+            throw std::runtime_error("SQL column " + name + " does not hold numeric values");
+    }
+}
+
+std::string SqlColumn::as_text(size_t idx) const
+{
+    if(is_null(idx))
+        return std::string();
+    switch(type)
+    {
+        case Integer:
+            return std::to_string(ints[idx]);
+        case Real:
+            return sql_number_to_text(reals[idx]);
+        case Text:
+        case Blob:
+            return texts[idx];
+        default:
+            return std::string();
+    }
+}
+
+const SqlColumn& SqlTable::operator[](const std::string& name) const
+{
+    for(const SqlColumn& column : columns)
+        if(column.name == name)
+            return column;
+    throw std::out_of_range("No such column in SQL result: " + name);
+}
+
+bool SqlTable::has_column(const std::string& name) const
+{
+    for(const SqlColumn& column : columns)
+        if(column.name == name)
+            return true;
+    return false;
+}
+
+SqlTable RAIISqlite::select(const std::string& sql, const std::vector<std::string>& params)
+{
+    sqlite3_stmt* raw_stmt = nullptr;
+    if(ot_sqlite::sqlite3_prepare_v2(db_conn, sql.c_str(), -1, &raw_stmt, nullptr) != SQLITE_OK)
+        throw std::runtime_error(std::string("ERROR preparing SQL query. SQLite error msg: ") + ot_sqlite::sqlite3_errmsg(db_conn));
+    std::unique_ptr<sqlite3_stmt, int(*)(sqlite3_stmt*)> stmt(raw_stmt, &ot_sqlite::sqlite3_finalize);
+
+    for(size_t ii = 0; ii < params.size(); ii++)
+        if(ot_sqlite::sqlite3_bind_text(stmt.get(), ii+1, params[ii].c_str(), params[ii].size(), SQLITE_TRANSIENT) != SQLITE_OK)
+            throw std::runtime_error(std::string("ERROR binding SQL parameter. SQLite error msg: ") + ot_sqlite::sqlite3_errmsg(db_conn));
+
+    SqlTable result;
+    const int no_cols = ot_sqlite::sqlite3_column_count(stmt.get());
+    result.columns.reserve(no_cols);
+    for(int col = 0; col < no_cols; col++)
+        result.columns.emplace_back(ot_sqlite::sqlite3_column_name(stmt.get(), col));
+
+    while(true)
+    {
+        const int rc = ot_sqlite::sqlite3_step(stmt.get());
+        if(rc == SQLITE_DONE)
+            break;
+        if(rc != SQLITE_ROW)
+            throw std::runtime_error(std::string("ERROR performing SQL query. SQLite error msg: ") + ot_sqlite::sqlite3_errmsg(db_conn));
+        for(int col = 0; col < no_cols; col++)
+            result.columns[col].append(stmt.get(), col);
+    }
+
+    return result;
+}
+
+bool RAIISqlite::has_table(const std::string& name)
+{
+    return select("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", {name}).size() > 0;
+}
+
+SqlTable RAIISqlite::read_table(const std::string& name)
+{
+    std::string quoted = "\"";
+    for(char c : name)
+    {
+        if(c == '"')
+            quoted += '"';
+        quoted += c;
+    }
+    quoted += '"';
+    return select("SELECT * FROM " + quoted);
+}
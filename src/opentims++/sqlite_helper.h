@@ -2,6 +2,8 @@
 
 #include <string>
 #include <stdexcept>
+#include <cstdint>
+#include <vector>
 
 #if defined(OPENTIMS_BUILDING_R)
 // R builds: use the bundled sqlite3 amalgamation compiled in via sqlite3_cpl.c.
@@ -15,6 +17,18 @@ public:
     static int sqlite3_exec(sqlite3* db, const char* query, int (*callback)(void*,int,char**,char**), void* arg, char **err) { return ::sqlite3_exec(db, query, callback, arg, err); }
     static void sqlite3_free(void* ptr) { ::sqlite3_free(ptr); }
     static const char* sqlite3_errmsg(sqlite3* db) { return ::sqlite3_errmsg(db); }
+    static int sqlite3_prepare_v2(sqlite3* db, const char* sql, int n, sqlite3_stmt** stmt, const char** tail) { return ::sqlite3_prepare_v2(db, sql, n, stmt, tail); }
+    static int sqlite3_bind_text(sqlite3_stmt* stmt, int idx, const char* val, int n, void(*destructor)(void*)) { return ::sqlite3_bind_text(stmt, idx, val, n, destructor); }
+    static int sqlite3_step(sqlite3_stmt* stmt) { return ::sqlite3_step(stmt); }
+    static int sqlite3_finalize(sqlite3_stmt* stmt) { return ::sqlite3_finalize(stmt); }
+    static int sqlite3_column_count(sqlite3_stmt* stmt) { return ::sqlite3_column_count(stmt); }
+    static const char* sqlite3_column_name(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_name(stmt, col); }
+    static int sqlite3_column_type(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_type(stmt, col); }
+    static sqlite3_int64 sqlite3_column_int64(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_int64(stmt, col); }
+    static double sqlite3_column_double(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_double(stmt, col); }
+    static const unsigned char* sqlite3_column_text(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_text(stmt, col); }
+    static const void* sqlite3_column_blob(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_blob(stmt, col); }
+    static int sqlite3_column_bytes(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_bytes(stmt, col); }
 };
 
 #elif defined(OPENTIMS_LINK_SQLITE_STATICALLY)
@@ -30,6 +44,18 @@ public:
     static int sqlite3_exec(sqlite3* db, const char* query, int (*callback)(void*,int,char**,char**), void* arg, char **err) { return ::sqlite3_exec(db, query, callback, arg, err); }
     static void sqlite3_free(void* ptr) { ::sqlite3_free(ptr); }
     static const char* sqlite3_errmsg(sqlite3* db) { return ::sqlite3_errmsg(db); }
+    static int sqlite3_prepare_v2(sqlite3* db, const char* sql, int n, sqlite3_stmt** stmt, const char** tail) { return ::sqlite3_prepare_v2(db, sql, n, stmt, tail); }
+    static int sqlite3_bind_text(sqlite3_stmt* stmt, int idx, const char* val, int n, void(*destructor)(void*)) { return ::sqlite3_bind_text(stmt, idx, val, n, destructor); }
+    static int sqlite3_step(sqlite3_stmt* stmt) { return ::sqlite3_step(stmt); }
+    static int sqlite3_finalize(sqlite3_stmt* stmt) { return ::sqlite3_finalize(stmt); }
+    static int sqlite3_column_count(sqlite3_stmt* stmt) { return ::sqlite3_column_count(stmt); }
+    static const char* sqlite3_column_name(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_name(stmt, col); }
+    static int sqlite3_column_type(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_type(stmt, col); }
+    static sqlite3_int64 sqlite3_column_int64(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_int64(stmt, col); }
+    static double sqlite3_column_double(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_double(stmt, col); }
+    static const unsigned char* sqlite3_column_text(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_text(stmt, col); }
+    static const void* sqlite3_column_blob(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_blob(stmt, col); }
+    static int sqlite3_column_bytes(sqlite3_stmt* stmt, int col) { return ::sqlite3_column_bytes(stmt, col); }
 };
 
 #else // dynamic loading via so_manager
@@ -76,10 +102,165 @@ public:
             fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_errmsg)>("sqlite3_errmsg");
         return fun(db);
     }
+    static int sqlite3_prepare_v2(sqlite3* db, const char* sql, int n, sqlite3_stmt** stmt, const char** tail)
+    {
+        static decltype(::sqlite3_prepare_v2)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_prepare_v2)>("sqlite3_prepare_v2");
+        return fun(db, sql, n, stmt, tail);
+    }
+    static int sqlite3_bind_text(sqlite3_stmt* stmt, int idx, const char* val, int n, void(*destructor)(void*))
+    {
+        static decltype(::sqlite3_bind_text)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_bind_text)>("sqlite3_bind_text");
+        return fun(stmt, idx, val, n, destructor);
+    }
+    static int sqlite3_step(sqlite3_stmt* stmt)
+    {
+        static decltype(::sqlite3_step)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_step)>("sqlite3_step");
+        return fun(stmt);
+    }
+    static int sqlite3_finalize(sqlite3_stmt* stmt)
+    {
+        static decltype(::sqlite3_finalize)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_finalize)>("sqlite3_finalize");
+        return fun(stmt);
+    }
+    static int sqlite3_column_count(sqlite3_stmt* stmt)
+    {
+        static decltype(::sqlite3_column_count)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_column_count)>("sqlite3_column_count");
+        return fun(stmt);
+    }
+    static const char* sqlite3_column_name(sqlite3_stmt* stmt, int col)
+    {
+        static decltype(::sqlite3_column_name)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_column_name)>("sqlite3_column_name");
+        return fun(stmt, col);
+    }
+    static int sqlite3_column_type(sqlite3_stmt* stmt, int col)
+    {
+        static decltype(::sqlite3_column_type)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_column_type)>("sqlite3_column_type");
+        return fun(stmt, col);
+    }
+    static sqlite3_int64 sqlite3_column_int64(sqlite3_stmt* stmt, int col)
+    {
+        static decltype(::sqlite3_column_int64)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_column_int64)>("sqlite3_column_int64");
+        return fun(stmt, col);
+    }
+    static double sqlite3_column_double(sqlite3_stmt* stmt, int col)
+    {
+        static decltype(::sqlite3_column_double)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_column_double)>("sqlite3_column_double");
+        return fun(stmt, col);
+    }
+    static const unsigned char* sqlite3_column_text(sqlite3_stmt* stmt, int col)
+    {
+        static decltype(::sqlite3_column_text)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_column_text)>("sqlite3_column_text");
+        return fun(stmt, col);
+    }
+    static const void* sqlite3_column_blob(sqlite3_stmt* stmt, int col)
+    {
+        static decltype(::sqlite3_column_blob)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_column_blob)>("sqlite3_column_blob");
+        return fun(stmt, col);
+    }
+    static int sqlite3_column_bytes(sqlite3_stmt* stmt, int col)
+    {
+        static decltype(::sqlite3_column_bytes)* fun = nullptr;
+        if(fun == nullptr)
+            fun = sqlite_so_handle.value().symbol_lookup<decltype(::sqlite3_column_bytes)>("sqlite3_column_bytes");
+        return fun(stmt, col);
+    }
 
 };
 #endif // ot_sqlite implementation selector
 
+//! A single column of an SQL query result, stored contiguously.
+/**
+ * SQLite is dynamically typed, so the storage type of a column is decided by the values
+ * actually found in it: a column holding only integers is stored as int64, one holding
+ * any floating point value as double, and one holding any text (or blob) as strings.
+ * NULLs are recorded in a separate mask and stored as 0 / NaN / "" respectively.
+ */
+class SqlColumn
+{
+ public:
+    enum Type { Null, Integer, Real, Text, Blob };
+
+    std::string name;
+    Type type;
+    std::vector<int64_t> ints;
+    std::vector<double> reals;
+    std::vector<std::string> texts;
+
+    SqlColumn(const std::string& _name) : name(_name), type(Null), rows(0), no_nulls(0) {};
+
+    //! Build a column from values held elsewhere (e.g. a previously saved copy of a table).
+    SqlColumn(const std::string& _name, std::vector<int64_t>&& values) :
+        name(_name), type(Integer), ints(std::move(values)), rows(ints.size()), no_nulls(0) {};
+    SqlColumn(const std::string& _name, std::vector<double>&& values) :
+        name(_name), type(Real), reals(std::move(values)), rows(reals.size()), no_nulls(0) {};
+    SqlColumn(const std::string& _name, std::vector<std::string>&& values) :
+        name(_name), type(Text), texts(std::move(values)), rows(texts.size()), no_nulls(0) {};
+    //! As above, with the NULL mask of the text column (nonzero for NULL rows, whose values are "").
+    SqlColumn(const std::string& _name, std::vector<std::string>&& values, std::vector<uint8_t>&& null_mask) :
+        name(_name), type(Text), texts(std::move(values)), rows(texts.size()), no_nulls(0), nulls(std::move(null_mask))
+    {
+        for(uint8_t is_null : nulls)
+            no_nulls += is_null != 0;
+    };
+
+    //! Append the value found in column col of the current row of stmt.
+    void append(sqlite3_stmt* stmt, int col);
+
+    size_t size() const { return rows; };
+    size_t null_count() const { return no_nulls; };
+    bool is_null(size_t idx) const { return idx < nulls.size() && nulls[idx] != 0; };
+
+    //! Numeric value of the idx-th row, regardless of the storage type.
+    double as_double(size_t idx) const;
+    int64_t as_int(size_t idx) const;
+
+    //! Textual value of the idx-th row, regardless of the storage type ("" for NULL).
+    std::string as_text(size_t idx) const;
+
+ private:
+    size_t rows;
+    size_t no_nulls;
+    std::vector<uint8_t> nulls;
+
+    void promote(Type new_type);
+    void append_placeholder();
+};
+
+//! Result of an SQL query, stored column by column.
+class SqlTable
+{
+ public:
+    std::vector<SqlColumn> columns;
+
+    size_t size() const { return columns.empty() ? 0 : columns[0].size(); };
+
+    //! Access a column by name; throws std::out_of_range if there is no such column.
+    const SqlColumn& operator[](const std::string& name) const;
+    bool has_column(const std::string& name) const;
+};
+
 class RAIISqlite
 {
     sqlite3* db_conn;
@@ -107,4 +288,16 @@ class RAIISqlite
         }
     }
 
+    //! Run a query and collect its whole result into typed columns.
+    /**
+     * @param sql       The query; may contain ? placeholders.
+     * @param params    Text values bound to the placeholders, in order.
+     */
+    SqlTable select(const std::string& sql, const std::vector<std::string>& params = {});
+
+    //! Check whether a table with the given name exists in the database.
+    bool has_table(const std::string& name);
+
+    //! Read a whole table into typed columns. The name is quoted, so it is safe to pass anything.
+    SqlTable read_table(const std::string& name);
 };
@@ -209,36 +209,6 @@ void OpenSourceTof2MzConverter::updateCalibration(double new_intercept, double n
  * OpenSourceTof2MzConverterFactory implementation
  */
 
-namespace {
-struct Tof2MzMetadata
-{
-    double mz_min = 0;
-    double mz_max = 0;
-    uint32_t tof_max = 0;
-    bool is_otof = false;
-};
-
-int tof2mz_metadata_callback(void* out, int cols, char** row, char** colnames)
-{
-    (void)cols;
-    (void)colnames;
-    Tof2MzMetadata* meta = reinterpret_cast<Tof2MzMetadata*>(out);
-    if (row[0] == nullptr || row[1] == nullptr)
-        return 0;
-    const char* key = row[0];
-    const char* val = row[1];
-    if (std::strcmp(key, "MzAcqRangeLower") == 0)
-        meta->mz_min = std::atof(val);
-    else if (std::strcmp(key, "MzAcqRangeUpper") == 0)
-        meta->mz_max = std::atof(val);
-    else if (std::strcmp(key, "DigitizerNumSamples") == 0)
-        meta->tof_max = static_cast<uint32_t>(std::atol(val));
-    else if (std::strcmp(key, "AcquisitionSoftware") == 0)
-        meta->is_otof = (std::strcmp(val, "Bruker otofControl") == 0);
-    return 0;
-}
-} // anonymous namespace
-
 std::unique_ptr<Tof2MzConverter> OpenSourceTof2MzConverterFactory::produce(
     TimsDataHandle& TDH, pressure_compensation_strategy pcs)
 {
@@ -247,18 +217,20 @@ std::unique_ptr<Tof2MzConverter> OpenSourceTof2MzConverterFactory::produce(
             "Pressure compensation is not supported by the open-source m/z converter. "
             "Use Bruker's proprietary library for pressure compensation, or disable it.");
 
-    std::string tdf_path = TDH.get_tims_dir_path() + "/analysis.tdf";
-    RAIISqlite db(tdf_path);
+    const std::unordered_map<std::string, std::string>& metadata = TDH.get_global_metadata();
+    auto value = [&metadata](const char* key) -> const char* {
+        auto it = metadata.find(key);
+        return it == metadata.end() ? "" : it->second.c_str();
+    };
 
-    Tof2MzMetadata meta;
-    db.query(
-        "SELECT Key, Value FROM GlobalMetadata "
-        "WHERE Key IN ('MzAcqRangeLower','MzAcqRangeUpper','DigitizerNumSamples','AcquisitionSoftware')",
-        tof2mz_metadata_callback, &meta);
+    const double mz_min = std::atof(value("MzAcqRangeLower"));
+    const double mz_max = std::atof(value("MzAcqRangeUpper"));
+    const uint32_t tof_max = static_cast<uint32_t>(std::atol(value("DigitizerNumSamples")));
+    const bool is_otof = std::strcmp(value("AcquisitionSoftware"), "Bruker otofControl") == 0;
 
-    if (meta.mz_min <= 0 || meta.mz_max <= meta.mz_min || meta.tof_max == 0)
+    if (mz_min <= 0 || mz_max <= mz_min || tof_max == 0)
         throw std::runtime_error(
-            "OpenSourceTof2MzConverterFactory: invalid calibration metadata in " + tdf_path);
+            "OpenSourceTof2MzConverterFactory: invalid calibration metadata in " + TDH.get_tims_tdf_path());
 
-    return std::make_unique<OpenSourceTof2MzConverter>(meta.mz_min, meta.mz_max, meta.tof_max, meta.is_otof);
+    return std::make_unique<OpenSourceTof2MzConverter>(mz_min, mz_max, tof_max, is_otof);
 }
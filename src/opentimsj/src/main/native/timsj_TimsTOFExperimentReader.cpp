@@ -1,25 +1,15 @@
-#include <ctype.h>
 #include <string.h>
 #include <vector>
 
-#include <iostream>
-#include <cstdlib>
-#include <stdio.h>
+#include <cstdint>
+#include <memory>
+#include <stdexcept>
+#include <string>
 
 #include "timsj_TimsTOFExperimentReader.h"
 #include "../../../../opentims++/opentims_all.cpp"
 
 
-struct TimsFramePl {
-    int frameId; // coordinate
-    std::vector<double> mzs, intensities, inv_ion_mobs; // data
-    std::vector<int> scans, tofs; // data
-    // constructors
-    TimsFramePl(){}
-    TimsFramePl(int id, std::vector<int> scan, std::vector<double> mz, std::vector<double> intensity, std::vector<int> tof, std::vector<double> inv_ion_mob):
-    frameId(id), mzs(mz), intensities(intensity), scans(scan), tofs(tof), inv_ion_mobs(inv_ion_mob){}
-};
-
 /**
  * helper for TDH initialization
  * @param dp data path
@@ -36,7 +26,8 @@ TimsDataHandle get_tdh(std::string dp, std::string bp){
 }
 
 /**
- *
+ * an opened experiment; the Java side keeps a pointer to it between calls, so the SQLite
+ * metadata and the Bruker converters are loaded once per reader, not once per call
  */
 class ExposedTimsDataHandle{
 private:
@@ -48,7 +39,7 @@ public:
     // handle to read from raw data
     ExposedTimsDataHandle(std::string dp, std::string bp);
 
-    TimsFramePl getTimsFramePl(const int frameId);
+    TimsDataHandle& tdh() { return handle; }
 };
 
 ExposedTimsDataHandle::ExposedTimsDataHandle(std::string dp, std::string bp) : handle(get_tdh(dp, bp)) {
@@ -56,43 +47,6 @@ ExposedTimsDataHandle::ExposedTimsDataHandle(std::string dp, std::string bp) : h
     binaryPath = bp;
 };
 
-
-TimsFramePl ExposedTimsDataHandle::getTimsFramePl(const int frameId) {
-    // allocate buffer
-    const size_t buffer_size_needed = handle.max_peaks_in_frame();
-    std::unique_ptr<uint32_t[]> scan_ids = std::make_unique<uint32_t[]>(buffer_size_needed);
-    std::unique_ptr<uint32_t[]> intens = std::make_unique<uint32_t[]>(buffer_size_needed);
-    std::unique_ptr<uint32_t[]> tofs = std::make_unique<uint32_t[]>(buffer_size_needed);
-    std::unique_ptr<double[]> inv_ion_mob = std::make_unique<double[]>(buffer_size_needed);
-    std::unique_ptr<double[]> mz = std::make_unique<double[]>(buffer_size_needed);
-
-    // fetch
-    TimsFrame& frame = handle.get_frame(frameId);
-    frame.save_to_buffs(nullptr, scan_ids.get(), tofs.get(), intens.get(), mz.get(), inv_ion_mob.get(), nullptr);
-
-    // allocate concrete vectors
-    std::vector<double> mzs, intensities, inv_ion_mobility;
-    std::vector<int> scans, tof;
-
-    // pre-allocate to avoid resizing on fill
-    mzs.reserve(frame.num_peaks);
-    intensities.reserve(frame.num_peaks);
-    inv_ion_mobility.reserve(frame.num_peaks);
-    scans.reserve(frame.num_peaks);
-    tof.reserve(frame.num_peaks);
-
-    // copy
-    for(size_t peak_id = 0; peak_id < frame.num_peaks; peak_id++) {
-        tof.push_back(tofs[peak_id]);
-        inv_ion_mobility.push_back(inv_ion_mob[peak_id]);
-        intensities.push_back(intens[peak_id]);
-        mzs.push_back(mz[peak_id]);
-        scans.push_back(scan_ids[peak_id]);
-    }
-
-    return TimsFramePl(frameId, scans, mzs, intensities, tof, inv_ion_mobility);
-}
-
 // helper to convert from jstring to c++ string
 std::string jstring2string(JNIEnv *env, jstring jStr) {
   if (!jStr)
@@ -113,94 +67,84 @@ std::string jstring2string(JNIEnv *env, jstring jStr) {
   return ret;
 }
 
+// helper to raise a java exception; the native method must return right after
+void throwJava(JNIEnv *env, const char* className, const std::string& message) {
+  jclass cls = env->FindClass(className);
+  if (cls != NULL)
+    env->ThrowNew(cls, message.c_str());
+}
+
+// helper to get the handle behind a pointer held by the java side
+ExposedTimsDataHandle* handleFromPointer(JNIEnv *env, jlong ptr) {
+  if (ptr == 0)
+    throwJava(env, "java/lang/IllegalStateException", "TimsTOFExperimentReader is closed");
+  return reinterpret_cast<ExposedTimsDataHandle*>(ptr);
+}
+
+// helper to copy a java int array of frame ids
+std::vector<uint32_t> frameIdsFromJava(JNIEnv *env, jintArray frameIds) {
+  const size_t length = env->GetArrayLength(frameIds);
+  std::vector<uint32_t> ids(length);
+  env->GetIntArrayRegion(frameIds, 0, length, reinterpret_cast<jint*>(ids.data()));
+  return ids;
+}
+
+/**
+ * helper for the conversion calls: applies convert(frameId, out, in, length) to a java int array
+ * @return a new java double array, NULL if a java exception is pending
+ */
+template<typename Convert>
+jdoubleArray convertArray(JNIEnv *env, jint frameId, jintArray values, Convert convert) {
+  const size_t length = env->GetArrayLength(values);
+  jdoubleArray result = env->NewDoubleArray(length);
+  if (result == NULL)
+    return NULL;
+
+  std::vector<uint32_t> values_c(length);
+  env->GetIntArrayRegion(values, 0, length, reinterpret_cast<jint*>(values_c.data()));
+  std::vector<double> converted(length);
+  try {
+    convert(frameId, converted.data(), values_c.data(), length);
+  } catch (const std::exception& e) {
+    throwJava(env, "java/lang/RuntimeException", e.what());
+    return NULL;
+  }
+  env->SetDoubleArrayRegion(result, 0, length, converted.data());
+  return result;
+}
+
 /*
  * Class:     timsj_TimsTOFExperimentReader
  * Method:    scanToOneOverK0Native
- * Signature: (I[ILjava/lang/String;Ljava/lang/String;)[D
+ * Signature: (I[IJ)[D
  */
 JNIEXPORT jdoubleArray JNICALL Java_timsj_TimsTOFExperimentReader_scanToOneOverK0Native
-(JNIEnv *env, jobject obj, jint frameId, jintArray scans, jstring d, jstring b){
-
-    const std::string data_path = jstring2string(env, d);
-    const std::string bruker_binary_lib_path = jstring2string(env, b);
-
-    DefaultTof2MzConverterFactory::setAsDefault<BrukerTof2MzConverterFactory, const char*>(bruker_binary_lib_path.c_str());
-    DefaultScan2InvIonMobilityConverterFactory::setAsDefault<BrukerScan2InvIonMobilityConverterFactory, const char*>(bruker_binary_lib_path.c_str());
-
-    // Open the dataset
-    TimsDataHandle TDH(data_path);
-
-    const size_t length = env->GetArrayLength(scans);
-    uint32_t scans_c[length] = { 0 };
-    double oneOverK0s[length];
+(JNIEnv *env, jobject obj, jint frameId, jintArray scans, jlong ptr){
 
-    jint *body = env->GetIntArrayElements(scans, 0);
-    for(size_t i = 0; i < length; i++) {
-        scans_c[i] = body[i];
-    }
-
-    TDH.scan2inv_ion_mobility_converter->convert(frameId, oneOverK0s, scans_c, length);
-
-    jdoubleArray resultOneOverK0s = env->NewDoubleArray(length);
-
-    if (resultOneOverK0s == NULL)
+    ExposedTimsDataHandle *tdh = handleFromPointer(env, ptr);
+    if (tdh == NULL)
         return NULL;
 
-    jdouble *pK0s = env->GetDoubleArrayElements(resultOneOverK0s, NULL);
-
-    // copy values into java arrays
-    for(size_t i = 0; i < length; i++) {
-        pK0s[i] = oneOverK0s[i];
-    }
-
-    env->ReleaseDoubleArrayElements(resultOneOverK0s, pK0s, NULL);
-
-    return resultOneOverK0s;
+    return convertArray(env, frameId, scans, [&](uint32_t frame, double* out, const uint32_t* in, uint32_t size){
+        tdh->tdh().scan2inv_ion_mobility_converter->convert(frame, out, in, size);
+    });
 }
 
 /*
  * Class:     timsj_TimsTOFExperimentReader
  * Method:    tofToMzNative
- * Signature: (I[ILjava/lang/String;Ljava/lang/String;)[D
+ * Signature: (I[IJ)[D
  */
 JNIEXPORT jdoubleArray JNICALL Java_timsj_TimsTOFExperimentReader_tofToMzNative
-(JNIEnv *env, jobject obj, jint frameId, jintArray tofs, jstring d, jstring b){
-
-    const std::string data_path = jstring2string(env, d);
-    const std::string bruker_binary_lib_path = jstring2string(env, b);
-
-    DefaultTof2MzConverterFactory::setAsDefault<BrukerTof2MzConverterFactory, const char*>(bruker_binary_lib_path.c_str());
-    DefaultScan2InvIonMobilityConverterFactory::setAsDefault<BrukerScan2InvIonMobilityConverterFactory, const char*>(bruker_binary_lib_path.c_str());
-
-    // Open the dataset
-    TimsDataHandle TDH(data_path);
+(JNIEnv *env, jobject obj, jint frameId, jintArray tofs, jlong ptr){
 
-    const size_t length = env->GetArrayLength(tofs);
-    uint32_t tofs_c[length] = { 0 };
-    double mzs[length];
-
-    jint *body = env->GetIntArrayElements(tofs, 0);
-    for(size_t i = 0; i < length; i++) {
-        tofs_c[i] = body[i];
-    }
-
-    TDH.tof2mz_converter->convert(frameId, mzs, tofs_c, length);
-
-    jdoubleArray resultMzs = env->NewDoubleArray(length);
-
-    if (resultMzs == NULL)
-          return NULL;
-
-    jdouble *pMzs = env->GetDoubleArrayElements(resultMzs, NULL);
-
-      // copy values into java arrays
-    for(size_t i = 0; i < length; i++) {
-        pMzs[i] = mzs[i];
-    }
-
-    env->ReleaseDoubleArrayElements(resultMzs, pMzs, NULL);
+    ExposedTimsDataHandle *tdh = handleFromPointer(env, ptr);
+    if (tdh == NULL)
+        return NULL;
 
-    return resultMzs;
+    return convertArray(env, frameId, tofs, [&](uint32_t frame, double* out, const uint32_t* in, uint32_t size){
+        tdh->tdh().tof2mz_converter->convert(frame, out, in, size);
+    });
 }
 
 /*
@@ -210,49 +154,65 @@ JNIEXPORT jdoubleArray JNICALL Java_timsj_TimsTOFExperimentReader_tofToMzNative
  */
 JNIEXPORT jlong JNICALL Java_timsj_TimsTOFExperimentReader_getDataHandlePointer
 (JNIEnv *env, jobject obj, jstring d, jstring b){
-  
+
   const std::string data_path = jstring2string(env, d);
   const std::string bruker_binary_lib_path = jstring2string(env, b);
 
-  DefaultTof2MzConverterFactory::setAsDefault<BrukerTof2MzConverterFactory, const char*>(bruker_binary_lib_path.c_str());
-  DefaultScan2InvIonMobilityConverterFactory::setAsDefault<BrukerScan2InvIonMobilityConverterFactory, const char*>(bruker_binary_lib_path.c_str());
+  try {
+    return reinterpret_cast<jlong>(new ExposedTimsDataHandle(data_path, bruker_binary_lib_path));
+  } catch (const std::exception& e) {
+    throwJava(env, "java/lang/RuntimeException", e.what());
+    return 0;
+  }
+}
+
+/*
+ * Class:     timsj_TimsTOFExperimentReader
+ * Method:    closeNative
+ * Signature: (J)V
+ */
+JNIEXPORT void JNICALL Java_timsj_TimsTOFExperimentReader_closeNative
+(JNIEnv *env, jobject obj, jlong ptr){
 
-  // Open the dataset
-  // ExposedTimsDataHandle tdh = new ExposedTimsDataHandle(data_path, bruker_binary_lib_path);
-  
-  return (long)(new ExposedTimsDataHandle(data_path, bruker_binary_lib_path));
+  delete reinterpret_cast<ExposedTimsDataHandle*>(ptr);
 }
 
 /*
  * Class:     timsj_TimsTOFExperimentReader
  * Method:    getTimsTofRawFrameNative
- * Signature: (IJ;)Ltimsj/TimsTOFRawFrame;
+ * Signature: (IJ)Ltimsj/TimsTOFRawFrame;
  */
 JNIEXPORT jobject JNICALL Java_timsj_TimsTOFExperimentReader_getTimsTofRawFrameNative
 (JNIEnv *env, jobject obj, jint frameId, jlong ptr){
 
-  // get tdh object by pointer (god help me.)
-  ExposedTimsDataHandle *tdh  = (ExposedTimsDataHandle *) ptr;
-  TimsFramePl frame = tdh->getTimsFramePl(frameId);
+  ExposedTimsDataHandle *tdh = handleFromPointer(env, ptr);
+  if (tdh == NULL)
+    return NULL;
 
-  // get java class 
+  // get java class
   jclass scalaFrame = env->FindClass("timsj/TimsTOFRawFrame");
-
-  // check for class
-  if (NULL == scalaFrame)
-    std::cout << "/* class could not be found. */" << '\n';
+  if (scalaFrame == NULL)
+    return NULL;
 
   // check for class method
   jmethodID constructor = env->GetMethodID(scalaFrame, "<init>", "(ID[I[I[I[D[D)V");
-  if(NULL == constructor)
-    std::cout << "/* method could not be found. */" << '\n';
+  if (constructor == NULL)
+    return NULL;
+
+  TimsFrame* frame;
+  try {
+    frame = &tdh->tdh().get_frame(frameId);
+  } catch (const std::exception& e) {
+    throwJava(env, "java/lang/IllegalArgumentException", e.what());
+    return NULL;
+  }
 
-  jintArray resultScans = env->NewIntArray(frame.mzs.size());
-  jintArray resultTofs = env->NewIntArray(frame.mzs.size());
-  jintArray resultIntensities = env->NewIntArray(frame.mzs.size());
+  jintArray resultScans = env->NewIntArray(frame->num_peaks);
+  jintArray resultTofs = env->NewIntArray(frame->num_peaks);
+  jintArray resultIntensities = env->NewIntArray(frame->num_peaks);
 
-  jdoubleArray resultMzs = env->NewDoubleArray(frame.mzs.size());
-  jdoubleArray resultOneOverK0s = env->NewDoubleArray(frame.mzs.size());
+  jdoubleArray resultMzs = env->NewDoubleArray(frame->num_peaks);
+  jdoubleArray resultOneOverK0s = env->NewDoubleArray(frame->num_peaks);
 
   // check for allocation failure
   if (resultScans == NULL ||
@@ -263,39 +223,158 @@ JNIEXPORT jobject JNICALL Java_timsj_TimsTOFExperimentReader_getTimsTofRawFrameN
       return NULL;
   }
 
-  jint *pScans = env->GetIntArrayElements(resultScans, NULL);
-  jint *pTofs = env->GetIntArrayElements(resultTofs, NULL);
-  jint *pIntens = env->GetIntArrayElements(resultIntensities, NULL);
-
-  jdouble *pMzs = env->GetDoubleArrayElements(resultMzs, NULL);
-  jdouble *pK0s = env->GetDoubleArrayElements(resultOneOverK0s, NULL);
-
-  // copy values into java arrays
-  for(size_t peak_id = 0; peak_id < frame.mzs.size(); peak_id++) {
-
-    pScans[peak_id] = frame.scans[peak_id];
-    pTofs[peak_id] = frame.tofs[peak_id];
-    pIntens[peak_id] = frame.intensities[peak_id];
-
-    pMzs[peak_id] = frame.mzs[peak_id];
-    pK0s[peak_id] = frame.inv_ion_mobs[peak_id];
+  // decode straight into the java arrays; nothing may call back into the JVM until they are released
+  void *pScans = env->GetPrimitiveArrayCritical(resultScans, NULL);
+  void *pTofs = env->GetPrimitiveArrayCritical(resultTofs, NULL);
+  void *pIntens = env->GetPrimitiveArrayCritical(resultIntensities, NULL);
+  void *pMzs = env->GetPrimitiveArrayCritical(resultMzs, NULL);
+  void *pK0s = env->GetPrimitiveArrayCritical(resultOneOverK0s, NULL);
+
+  std::string error;
+  if (pScans == NULL || pTofs == NULL || pIntens == NULL || pMzs == NULL || pK0s == NULL)
+    error = "could not access the result arrays";
+  else {
+    try {
+      frame->save_to_buffs(nullptr,
+                           static_cast<uint32_t*>(pScans),
+                           static_cast<uint32_t*>(pTofs),
+                           static_cast<uint32_t*>(pIntens),
+                           static_cast<double*>(pMzs),
+                           static_cast<double*>(pK0s),
+                           nullptr);
+    } catch (const std::exception& e) {
+      error = e.what();
+    }
   }
 
   // expose to garbage collection
-  env->ReleaseIntArrayElements(resultScans, pScans, NULL);
-  env->ReleaseIntArrayElements(resultTofs, pTofs, NULL);
-  env->ReleaseIntArrayElements(resultIntensities, pIntens, NULL);
-
-  env->ReleaseDoubleArrayElements(resultMzs, pMzs, NULL);
-  env->ReleaseDoubleArrayElements(resultOneOverK0s, pK0s, NULL);
+  if (pK0s != NULL) env->ReleasePrimitiveArrayCritical(resultOneOverK0s, pK0s, 0);
+  if (pMzs != NULL) env->ReleasePrimitiveArrayCritical(resultMzs, pMzs, 0);
+  if (pIntens != NULL) env->ReleasePrimitiveArrayCritical(resultIntensities, pIntens, 0);
+  if (pTofs != NULL) env->ReleasePrimitiveArrayCritical(resultTofs, pTofs, 0);
+  if (pScans != NULL) env->ReleasePrimitiveArrayCritical(resultScans, pScans, 0);
+
+  if (!error.empty()) {
+    throwJava(env, "java/lang/RuntimeException", error);
+    return NULL;
+  }
 
   // instanciate java object
   return env->NewObject(scalaFrame, constructor,
-    frame.frameId,
-    0.0,
+    frameId,
+    frame->time,
     resultScans,
     resultTofs,
     resultIntensities,
     resultMzs,
     resultOneOverK0s);
-}
\ No newline at end of file
+}
+
+/*
+ * Class:     timsj_TimsTOFExperimentReader
+ * Method:    peakCountNative
+ * Signature: ([IJ)J
+ */
+JNIEXPORT jlong JNICALL Java_timsj_TimsTOFExperimentReader_peakCountNative
+(JNIEnv *env, jobject obj, jintArray frameIds, jlong ptr){
+
+  ExposedTimsDataHandle *tdh = handleFromPointer(env, ptr);
+  if (tdh == NULL)
+    return 0;
+
+  try {
+    return tdh->tdh().no_peaks_in_frames(frameIdsFromJava(env, frameIds));
+  } catch (const std::exception& e) {
+    throwJava(env, "java/lang/IllegalArgumentException", e.what());
+    return 0;
+  }
+}
+
+/**
+ * helper for fetchFramesNative: address of a direct buffer able to hold `values` elements of `size` bytes
+ * @return the address, NULL if the column is not wanted or a java exception was raised
+ */
+void* bufferAddress(JNIEnv *env, jobject buffer, const char* column, size_t values, size_t size, bool& failed) {
+  if (buffer == NULL || failed)
+    return NULL;
+  void* address = env->GetDirectBufferAddress(buffer);
+  if (address == NULL) {
+    throwJava(env, "java/lang/IllegalArgumentException", std::string(column) + " buffer is not a direct ByteBuffer");
+    failed = true;
+    return NULL;
+  }
+  const jlong capacity = env->GetDirectBufferCapacity(buffer);
+  if (capacity < 0 || static_cast<size_t>(capacity) < values * size) {
+    throwJava(env, "java/lang/IllegalArgumentException",
+              std::string(column) + " buffer holds " + std::to_string(capacity) + " bytes, " +
+              std::to_string(values * size) + " are needed");
+    failed = true;
+    return NULL;
+  }
+  if (reinterpret_cast<uintptr_t>(address) % size != 0) {
+    throwJava(env, "java/lang/IllegalArgumentException", std::string(column) + " buffer is not aligned");
+    failed = true;
+    return NULL;
+  }
+  return address;
+}
+
+/*
+ * Class:     timsj_TimsTOFExperimentReader
+ * Method:    fetchFramesNative
+ * Signature: ([IJLjava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;)J
+ */
+JNIEXPORT jlong JNICALL Java_timsj_TimsTOFExperimentReader_fetchFramesNative
+(JNIEnv *env, jobject obj, jintArray frameIds, jlong ptr,
+ jobject frames, jobject scans, jobject tofs, jobject intensities,
+ jobject mzs, jobject oneOverK0s, jobject retentionTimes){
+
+  ExposedTimsDataHandle *tdh = handleFromPointer(env, ptr);
+  if (tdh == NULL)
+    return 0;
+
+  const std::vector<uint32_t> ids = frameIdsFromJava(env, frameIds);
+  size_t peaks;
+  try {
+    peaks = tdh->tdh().no_peaks_in_frames(ids);
+  } catch (const std::exception& e) {
+    throwJava(env, "java/lang/IllegalArgumentException", e.what());
+    return 0;
+  }
+
+  bool failed = false;
+  uint32_t* pFrames = static_cast<uint32_t*>(bufferAddress(env, frames, "frame", peaks, sizeof(uint32_t), failed));
+  uint32_t* pScans = static_cast<uint32_t*>(bufferAddress(env, scans, "scan", peaks, sizeof(uint32_t), failed));
+  uint32_t* pTofs = static_cast<uint32_t*>(bufferAddress(env, tofs, "tof", peaks, sizeof(uint32_t), failed));
+  uint32_t* pIntens = static_cast<uint32_t*>(bufferAddress(env, intensities, "intensity", peaks, sizeof(uint32_t), failed));
+  double* pMzs = static_cast<double*>(bufferAddress(env, mzs, "mz", peaks, sizeof(double), failed));
+  double* pK0s = static_cast<double*>(bufferAddress(env, oneOverK0s, "oneOverK0", peaks, sizeof(double), failed));
+  double* pTimes = static_cast<double*>(bufferAddress(env, retentionTimes, "retentionTime", peaks, sizeof(double), failed));
+  if (failed)
+    return 0;
+
+  // direct buffers live outside the java heap, so the frames are decoded in parallel
+  // without holding up the garbage collector
+  try {
+    tdh->tdh().extract_frames(ids, pFrames, pScans, pTofs, pIntens, pMzs, pK0s, pTimes);
+  } catch (const std::exception& e) {
+    throwJava(env, "java/lang/RuntimeException", e.what());
+    return 0;
+  }
+  return peaks;
+}
+
+/*
+ * Class:     timsj_TimsTOFExperimentReader
+ * Method:    setNumThreadsNative
+ * Signature: (I)V
+ */
+JNIEXPORT void JNICALL Java_timsj_TimsTOFExperimentReader_setNumThreadsNative
+(JNIEnv *env, jobject obj, jint n){
+
+  if (n < 0) {
+    throwJava(env, "java/lang/IllegalArgumentException", "number of threads must be >= 0");
+    return;
+  }
+  ThreadingManager::get_instance().set_num_threads(n);
+}
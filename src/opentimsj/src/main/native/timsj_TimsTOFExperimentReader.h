@@ -10,19 +10,18 @@ extern "C" {
 /*
  * Class:     timsj_TimsTOFExperimentReader
  * Method:    scanToOneOverK0Native
- * Signature: (I[ILjava/lang/String;Ljava/lang/String;)[D
+ * Signature: (I[IJ)[D
  */
 JNIEXPORT jdoubleArray JNICALL Java_timsj_TimsTOFExperimentReader_scanToOneOverK0Native
-  (JNIEnv *, jobject, jint, jintArray, jstring, jstring);
+  (JNIEnv *, jobject, jint, jintArray, jlong);
 
 /*
  * Class:     timsj_TimsTOFExperimentReader
  * Method:    tofToMzNative
- * Signature: (I[ILjava/lang/String;Ljava/lang/String;)[D
+ * Signature: (I[IJ)[D
  */
 JNIEXPORT jdoubleArray JNICALL Java_timsj_TimsTOFExperimentReader_tofToMzNative
-  (JNIEnv *, jobject, jint, jintArray, jstring, jstring);
-
+  (JNIEnv *, jobject, jint, jintArray, jlong);
 
 /*
  * Class:     timsj_TimsTOFExperimentReader
@@ -30,16 +29,47 @@ JNIEXPORT jdoubleArray JNICALL Java_timsj_TimsTOFExperimentReader_tofToMzNative
  * Signature: (Ljava/lang/String;Ljava/lang/String;)J
  */
 JNIEXPORT jlong JNICALL Java_timsj_TimsTOFExperimentReader_getDataHandlePointer
-  (JNIEnv *env, jobject obj, jstring d, jstring b);
+  (JNIEnv *, jobject, jstring, jstring);
 
+/*
+ * Class:     timsj_TimsTOFExperimentReader
+ * Method:    closeNative
+ * Signature: (J)V
+ */
+JNIEXPORT void JNICALL Java_timsj_TimsTOFExperimentReader_closeNative
+  (JNIEnv *, jobject, jlong);
 
 /*
  * Class:     timsj_TimsTOFExperimentReader
  * Method:    getTimsTofRawFrameNative
- * Signature: (IJ;)Ltimsj/TimsTOFRawFrame;
+ * Signature: (IJ)Ltimsj/TimsTOFRawFrame;
  */
 JNIEXPORT jobject JNICALL Java_timsj_TimsTOFExperimentReader_getTimsTofRawFrameNative
-(JNIEnv *env, jobject obj, jint frameId, jlong ptr);
+  (JNIEnv *, jobject, jint, jlong);
+
+/*
+ * Class:     timsj_TimsTOFExperimentReader
+ * Method:    peakCountNative
+ * Signature: ([IJ)J
+ */
+JNIEXPORT jlong JNICALL Java_timsj_TimsTOFExperimentReader_peakCountNative
+  (JNIEnv *, jobject, jintArray, jlong);
+
+/*
+ * Class:     timsj_TimsTOFExperimentReader
+ * Method:    fetchFramesNative
+ * Signature: ([IJLjava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;Ljava/nio/ByteBuffer;)J
+ */
+JNIEXPORT jlong JNICALL Java_timsj_TimsTOFExperimentReader_fetchFramesNative
+  (JNIEnv *, jobject, jintArray, jlong, jobject, jobject, jobject, jobject, jobject, jobject, jobject);
+
+/*
+ * Class:     timsj_TimsTOFExperimentReader
+ * Method:    setNumThreadsNative
+ * Signature: (I)V
+ */
+JNIEXPORT void JNICALL Java_timsj_TimsTOFExperimentReader_setNumThreadsNative
+  (JNIEnv *, jobject, jint);
 
 #ifdef __cplusplus
 }
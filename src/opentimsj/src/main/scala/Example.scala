@@ -25,4 +25,13 @@ object Example extends App {
   val metaData = timsTofExpReader.getFrameMetaData
 
   println(timsTofExpReader.getTimsTofRawFrame(frameId))
+
+  // decode this frame and the next ones in one call, in parallel, into direct buffers
+  val frameIds = metaData.keys.filter(id => id >= frameId && id < frameId + 10).toArray.sorted
+  val buffers = timsTofExpReader.allocateFrameBuffers(frameIds)
+  val peaks = timsTofExpReader.fetchFrames(frameIds, buffers)
+  println(s"fetched $peaks peaks from ${frameIds.length} frames")
+  if (peaks > 0) println(s"first mz: ${buffers.mzs.getDouble(0)}")
+
+  timsTofExpReader.close()
 }
\ No newline at end of file
@@ -3,16 +3,27 @@ package timsj
 import com.almworks.sqlite4java.SQLiteConnection
 
 import java.io.File
+import java.nio.ByteBuffer
 
 /**
  * connector for reading of raw timsTOF data
  * @param experimentPath path to timsTOF experiment (.d)
  * @param brukerBinaryPath path to binary for bruker file format reading (.so or .dll)
  */
-class TimsTOFExperimentReader(experimentPath: String, brukerBinaryPath: String) {
+class TimsTOFExperimentReader(experimentPath: String, brukerBinaryPath: String) extends AutoCloseable {
 
-  // store pointer to C++ TimsDataHandle
-  private val ptr: Long = getDataHandlePointer(experimentPath, brukerBinaryPath)
+  // store pointer to C++ TimsDataHandle, 0 once closed
+  private var ptr: Long = getDataHandlePointer(experimentPath, brukerBinaryPath)
+
+  /**
+   * release the native data handle; the reader cannot be used afterwards
+   */
+  override def close(): Unit = synchronized {
+    if (ptr != 0) {
+      closeNative(ptr)
+      ptr = 0
+    }
+  }
 
   /**
    * get all available meta data of frames present in a given experiment
@@ -82,6 +93,61 @@ class TimsTOFExperimentReader(experimentPath: String, brukerBinaryPath: String)
    */
   @native private def getTimsTofRawFrameNative(frameId: Int, ptr: Long): TimsTOFRawFrame
 
+  /**
+   * @param ptr pointer to the native data handle
+   */
+  @native private def closeNative(ptr: Long): Unit
+
+  /**
+   * total number of peaks in a set of frames, i.e. the number of values fetchFrames writes to each buffer
+   * @param frameIds ids of raw frames
+   * @return number of peaks
+   */
+  def peakCount(frameIds: Array[Int]): Long = {
+    peakCountNative(frameIds, ptr)
+  }
+
+  /**
+   * allocate direct buffers, in native byte order, for fetchFrames of the given frames
+   * @param frameIds ids of raw frames that should be fetched
+   * @return buffers for the scan, tof, intensity, mz and one-over-k0 columns
+   */
+  def allocateFrameBuffers(frameIds: Array[Int]): TimsTOFFrameBuffers = {
+    TimsTOFFrameBuffers.allocate(peakCount(frameIds))
+  }
+
+  /**
+   * decode many raw frames in parallel, straight into direct buffers
+   *
+   * Peaks of all frames are written one after another, in the order of frameIds, as native order
+   * 32 bit integers (frame, scan, tof, intensity) or 64 bit doubles (mz, oneOverK0, retentionTime),
+   * starting at the beginning of each buffer; buffer positions and limits are left as they are.
+   * Columns whose buffer is null are not decoded. Each buffer must hold peakCount(frameIds) values.
+   * @param frameIds ids of raw frames that should be fetched
+   * @param buffers direct buffers to write to
+   * @return number of peaks written
+   */
+  def fetchFrames(frameIds: Array[Int], buffers: TimsTOFFrameBuffers): Long = {
+    fetchFramesNative(frameIds, ptr, buffers.frames, buffers.scans, buffers.tofs, buffers.intensities,
+      buffers.mzs, buffers.oneOverK0s, buffers.retentionTimes)
+  }
+
+  /**
+   * set the number of threads used by fetchFrames, for all readers; 0 means one per core
+   * @param n number of threads
+   */
+  def setNumThreads(n: Int): Unit = {
+    setNumThreadsNative(n)
+  }
+
+  @native private def peakCountNative(frameIds: Array[Int], ptr: Long): Long
+
+  @native private def fetchFramesNative(frameIds: Array[Int], ptr: Long, frames: ByteBuffer, scans: ByteBuffer,
+                                        tofs: ByteBuffer, intensities: ByteBuffer, mzs: ByteBuffer,
+                                        oneOverK0s: ByteBuffer, retentionTimes: ByteBuffer): Long
+
+  @native private def setNumThreadsNative(n: Int): Unit
+
   /**
    * convert scan number to 1/K0 value
    * @param frameId id of raw frame that should be fetched
@@ -89,19 +155,17 @@ class TimsTOFExperimentReader(experimentPath: String, brukerBinaryPath: String)
    * @return vector of one-over-k0 values
    */
   def scanToOneOverK0(frameId: Int, scans: Array[Int]): Array[Double] = {
-    scanToOneOverK0Native(frameId, scans, experimentPath, brukerBinaryPath)
+    scanToOneOverK0Native(frameId, scans, ptr)
   }
 
   /**
-   * hidden native call to opentims++ and bruker SDK for data conversion
+   * hidden native call to opentims++ and bruker SDK for data conversion, on the opened data handle
    * @param frameId id of raw frame that should be fetched
    * @param scans array of scans to convert
-   * @param expPath path to experiment
-   * @param brukerLibPath path to bruker binary
+   * @param ptr pointer to the native data handle
    * @return array of one-over-k0 values
    */
-  @native private def scanToOneOverK0Native(frameId: Int, scans: Array[Int], expPath: String = experimentPath,
-                                            brukerLibPath: String = brukerBinaryPath): Array[Double]
+  @native private def scanToOneOverK0Native(frameId: Int, scans: Array[Int], ptr: Long): Array[Double]
 
   /**
    * convert tof to mz value
@@ -110,17 +174,15 @@ class TimsTOFExperimentReader(experimentPath: String, brukerBinaryPath: String)
    * @return vector of mz values
    */
   def tofToMz(frameId: Int, tofs: Array[Int]): Array[Double] = {
-    tofToMzNative(frameId, tofs, experimentPath, brukerBinaryPath)
+    tofToMzNative(frameId, tofs, ptr)
   }
 
   /**
-   * hidden native call to opentims++ and bruker SDK for data conversion
+   * hidden native call to opentims++ and bruker SDK for data conversion, on the opened data handle
    * @param frameId id of raw frame that should be fetched
    * @param tofs array of tof values to convert
-   * @param expPath path to experiment
-   * @param brukerLibPath path to bruker binary
+   * @param ptr pointer to the native data handle
    * @return array of mz values
    */
-  @native private def tofToMzNative(frameId: Int, tofs: Array[Int], expPath: String = experimentPath,
-                                            brukerLibPath: String = brukerBinaryPath): Array[Double]
+  @native private def tofToMzNative(frameId: Int, tofs: Array[Int], ptr: Long): Array[Double]
 }
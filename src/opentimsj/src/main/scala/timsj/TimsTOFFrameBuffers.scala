@@ -0,0 +1,43 @@
+package timsj
+
+import java.nio.{ByteBuffer, ByteOrder}
+
+/**
+ * direct buffers filled by TimsTOFExperimentReader.fetchFrames, one column each; null columns are not decoded
+ *
+ * @param frames         frame identifiers, 32 bit integers
+ * @param scans          scan identifiers, 32 bit integers
+ * @param tofs           tof values, 32 bit integers
+ * @param intensities    intensity values, 32 bit integers
+ * @param mzs            mz values, doubles
+ * @param oneOverK0s     inverse mobility values, doubles
+ * @param retentionTimes retention times in seconds, doubles
+ */
+case class TimsTOFFrameBuffers(frames: ByteBuffer = null, scans: ByteBuffer = null, tofs: ByteBuffer = null,
+                               intensities: ByteBuffer = null, mzs: ByteBuffer = null,
+                               oneOverK0s: ByteBuffer = null, retentionTimes: ByteBuffer = null)
+
+object TimsTOFFrameBuffers {
+
+  /**
+   * allocate a direct buffer, in native byte order, for a number of values
+   * @param values number of values
+   * @param valueSize size of a value in bytes
+   * @return the buffer
+   */
+  def allocateColumn(values: Long, valueSize: Int): ByteBuffer = {
+    val bytes = values * valueSize
+    require(bytes <= Int.MaxValue, s"$values values do not fit in one ByteBuffer, fetch fewer frames at a time")
+    ByteBuffer.allocateDirect(bytes.toInt).order(ByteOrder.nativeOrder())
+  }
+
+  /**
+   * allocate buffers for the scan, tof, intensity, mz and one-over-k0 columns
+   * @param peaks number of peaks, see TimsTOFExperimentReader.peakCount
+   * @return the buffers
+   */
+  def allocate(peaks: Long): TimsTOFFrameBuffers = {
+    TimsTOFFrameBuffers(scans = allocateColumn(peaks, 4), tofs = allocateColumn(peaks, 4),
+      intensities = allocateColumn(peaks, 4), mzs = allocateColumn(peaks, 8), oneOverK0s = allocateColumn(peaks, 8))
+  }
+}
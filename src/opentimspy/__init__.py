@@ -102,6 +102,8 @@ def get_module_dir():
 from opentimspy.opentims import (
     OpenTIMS,
     column_to_dtype,
+    compact_columns_dtype,
+    supported_columns_dtypes,
     all_columns,
     all_columns_dtype,
     available_columns,
@@ -109,6 +111,10 @@ from opentimspy.opentims import (
     conversion_method,
     setup_opensource,
 )
+from opentimspy.pool import HandlePool
+from opentimspy.cache import CachedTIMS
+from opentimspy.summary import summarize, summarize_runs
+from opentimspy.trace import trace
 
 
 def set_num_threads(n):
@@ -0,0 +1,256 @@
+#    OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+#    Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+#
+#    Licensed under the MIT License. See LICENCE file in the project root for details.
+"""Columnar cache of decoded peaks, for datasets that are read over and over.
+
+    with OpenTIMS("run.d") as ot:
+        ot.build_cache("run.cache", columns=("frame", "scan", "mz", "intensity"))
+    with CachedTIMS("run.cache") as cached:
+        cached.query(range(100, 200), columns=("mz", "intensity"))
+
+A cache is a directory of .npy files:
+
+    <column>.npy        one flat array per cached column, peaks of all frames in the order of frame Ids
+    frames.npy          Ids of the cached frames, increasing
+    offsets.npy         int64, peaks offsets[i]:offsets[i+1] belong to frames[i]
+    times.npy           retention times of the frames (in seconds)
+    msms_types.npy      MsMsType of the frames
+    cache.json          format version, cached columns with their types, and the fingerprint of the dataset
+
+cache.json is written last, so a cache without it is incomplete. Columns are
+memory-mapped: queries of consecutive frames return views into the files and
+decode nothing, so reads of a hot cache are page-cache reads.
+"""
+from __future__ import annotations
+
+import json
+import pathlib
+import typing
+
+import numpy as np
+import numpy.typing as npt
+
+from .index import dataset_fingerprint
+
+if typing.TYPE_CHECKING:
+    from .opentims import OpenTIMS
+
+CACHE_VERSION = 1
+
+_HEADER = "cache.json"
+_INDEX_ARRAYS = ("frames", "offsets", "times", "msms_types")
+
+
+def write_cache(
+    ot: OpenTIMS,
+    path: str | pathlib.Path,
+    columns: tuple[str, ...],
+    dtypes: dict | None = None,
+    compact: bool = False,
+) -> pathlib.Path:
+    """Decode all frames of a dataset into a cache directory, see OpenTIMS.build_cache."""
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    (path / _HEADER).unlink(missing_ok=True)
+    fingerprint = dataset_fingerprint(ot.analysis_directory)
+
+    frames = np.asarray(ot.frames["Id"], dtype=np.uint32)
+    counts = np.asarray(ot.frames["NumPeaks"], dtype=np.int64)
+    offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    np.save(path / "frames.npy", frames)
+    np.save(path / "offsets.npy", offsets)
+    np.save(path / "times.npy", np.asarray(ot.frames["Time"], dtype=np.float64))
+    np.save(path / "msms_types.npy", np.asarray(ot.frames["MsMsType"], dtype=np.uint32))
+
+    # The parallel extractor writes straight into memory-mapped <column>.npy files.
+    data = ot.query(frames, columns, max_memory=0, spill_dir=path, compact=compact, dtypes=dtypes)
+    for column, values in data.items():
+        if isinstance(values, np.memmap):
+            values.flush()
+        else:  # no peaks at all: nothing was spilled
+            np.save(path / f"{column}.npy", values)
+
+    header = {
+        "version": CACHE_VERSION,
+        "analysis_directory": str(pathlib.Path(ot.analysis_directory).resolve()),
+        "fingerprint": fingerprint,
+        "columns": {column: np.dtype(values.dtype).str for column, values in data.items()},
+    }
+    with open(path / _HEADER, "w") as f:
+        json.dump(header, f)
+    return path
+
+
+class CachedTIMS:
+    """Reads of a cache built by OpenTIMS.build_cache, with the query API of OpenTIMS."""
+
+    def __init__(self, path: str | pathlib.Path, check_source: bool = True):
+        """Open a cache.
+
+        Args:
+            path (str, Path): The cache directory.
+            check_source (bool): Refuse a cache of a dataset that changed since the cache was built.
+                Caches of datasets that no longer exist are opened anyway.
+
+        Raises:
+            ValueError: if the directory holds no complete cache in the current format, or a stale one.
+        """
+        self.path = pathlib.Path(path)
+        try:
+            with open(self.path / _HEADER) as f:
+                header = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Not a complete OpenTIMS cache: {self.path}") from e
+        if header.get("version") != CACHE_VERSION:
+            raise ValueError(
+                f"Unsupported cache version {header.get('version')} (expected {CACHE_VERSION}): {self.path}"
+            )
+        self.analysis_directory = pathlib.Path(header["analysis_directory"])
+        self.fingerprint = header["fingerprint"]
+        if check_source and self.analysis_directory.exists() and not self.is_fresh():
+            raise ValueError(f"Cache {self.path} is stale: {self.analysis_directory} changed since it was built.")
+
+        index = {name: np.load(self.path / f"{name}.npy") for name in _INDEX_ARRAYS}
+        self.offsets = index["offsets"]
+        self.frames = {
+            "Id": index["frames"],
+            "NumPeaks": np.diff(self.offsets),
+            "Time": index["times"],
+            "MsMsType": index["msms_types"],
+        }
+        self.columns = tuple(header["columns"])
+        self._data = {column: np.load(self.path / f"{column}.npy", mmap_mode="r") for column in self.columns}
+        self.peaks_cnt = int(self.offsets[-1])
+
+    def is_fresh(self) -> bool:
+        """Check whether the cache still describes its dataset."""
+        try:
+            return self.fingerprint == dataset_fingerprint(self.analysis_directory)
+        except OSError:
+            return False
+
+    def __len__(self):
+        return self.peaks_cnt
+
+    def __repr__(self):
+        return f"CachedTIMS({str(self.path)})"
+
+    def close(self):
+        self._data = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _positions(self, frames) -> npt.NDArray[np.int64]:
+        frames = np.r_[frames].astype(np.int64)
+        positions = np.searchsorted(self.frames["Id"], frames)
+        missing = (positions >= len(self.frames["Id"])) | (
+            self.frames["Id"][np.minimum(positions, len(self.frames["Id"]) - 1)] != frames
+        )
+        if missing.any():
+            raise IndexError(f"Frames not in the cache: {frames[missing][:10].tolist()}")
+        return positions
+
+    def _select_frames(self, frames, ms_level: int | None, retention_time: tuple[float, float] | None):
+        mask = np.ones(len(self.frames["Id"]), dtype=bool)
+        if ms_level is not None:
+            if ms_level not in (1, 2):
+                raise ValueError(f"MS level must be 1 or 2, got: {ms_level}")
+            mask &= (self.frames["MsMsType"] == 0) == (ms_level == 1)
+        if retention_time is not None:
+            times = self.frames["Time"]
+            mask &= (times >= retention_time[0]) & (times < retention_time[1])
+        if frames is None:
+            return np.flatnonzero(mask)
+        positions = self._positions(frames)
+        return positions[mask[positions]]
+
+    def _column(self, column: str, positions: npt.NDArray[np.int64]) -> npt.NDArray:
+        starts = self.offsets[positions]
+        counts = self.offsets[positions + 1] - starts
+        if column not in self._data:
+            # frame and retention_time are constant within frames, so they follow from the frame index.
+            if column == "frame":
+                return np.repeat(self.frames["Id"][positions], counts)
+            if column == "retention_time":
+                return np.repeat(self.frames["Time"][positions], counts)
+            raise ValueError(f"Column {column} is not cached; cached columns: {self.columns}")
+        data = self._data[column]
+        if len(positions) == 0:
+            return data[:0]
+        if np.all(np.diff(positions) == 1):
+            return data[starts[0] : starts[0] + counts.sum()]
+        # Scattered frames: gather their peaks into a new array.
+        total = int(counts.sum())
+        shifts = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return data[np.arange(total, dtype=np.int64) + shifts]
+
+    def query(
+        self,
+        frames=None,
+        columns: str | tuple[str, ...] | None = None,
+        ms_level: int | None = None,
+    ) -> dict[str, npt.NDArray]:
+        """Get data from a selection of frames.
+
+        Peaks of frames that follow each other in the cache are returned as read-only views of
+        the memory-mapped columns; other selections are copied.
+
+        Args:
+            frames (int, iterable, None): Frames to choose. Default: all of them.
+            columns (tuple|str|None): Columns to get. Default: all cached columns. Besides cached columns,
+                frame and retention_time are always available.
+            ms_level (int, None): Only choose frames of this MS level: 1 for MS1 frames, 2 for all others.
+
+        Returns:
+            dict: column to numpy array mapping.
+        """
+        if columns is None:
+            columns = self.columns
+        elif isinstance(columns, str):
+            columns = (columns,)
+        positions = self._select_frames(frames, ms_level, None)
+        return {column: self._column(column, positions) for column in columns}
+
+    def rt_query(
+        self,
+        min_retention_time: float,
+        max_retention_time: float,
+        columns: str | tuple[str, ...] | None = None,
+        ms_level: int | None = None,
+    ) -> dict[str, npt.NDArray]:
+        """Get data from frames with retention times in [min_retention_time, max_retention_time), in seconds.
+
+        Args:
+            min_retention_time (float): Minimal retention time (in seconds).
+            max_retention_time (float): Maximal retention time, exclusive (in seconds).
+            columns (tuple|str|None): Columns to get, as in query.
+            ms_level (int, None): Only choose frames of this MS level: 1 for MS1 frames, 2 for all others.
+
+        Returns:
+            dict: column to numpy array mapping.
+        """
+        if isinstance(columns, str):
+            columns = (columns,)
+        positions = self._select_frames(None, ms_level, (min_retention_time, max_retention_time))
+        return {column: self._column(column, positions) for column in (self.columns if columns is None else columns)}
+
+    def frame_array(self, frame: int) -> npt.NDArray[np.uint32]:
+        """Get a 2D array of data for a given frame, as OpenTIMS.frame_array.
+
+        Returns:
+            np.array: Array with 4 columns: frame numbers, scan numbers, time of flights, and intensities in the selected frame.
+        """
+        try:
+            positions = self._positions(frame)
+        except IndexError:
+            raise IndexError(f"Frame {frame} is not in the cache.")
+        X = np.empty(shape=(int(self.frames["NumPeaks"][positions[0]]), 4), dtype=np.uint32, order="F")
+        for ii, column in enumerate(("frame", "scan", "tof", "intensity")):
+            X[:, ii] = self._column(column, positions)
+        return X
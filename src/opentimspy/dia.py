@@ -0,0 +1,119 @@
+#    OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+#    Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+#
+#    Licensed under the MIT License. See LICENCE file in the project root for details.
+"""Index of the isolation windows of a diaPASEF dataset."""
+from __future__ import annotations
+
+import typing
+
+import numpy as np
+import numpy.typing as npt
+
+
+def concatenated_ranges(starts: npt.NDArray, counts: npt.NDArray) -> npt.NDArray[np.int64]:
+    """np.concatenate([np.arange(start, start + count) for start, count in zip(starts, counts)]), without the loop."""
+    counts = np.asarray(counts, dtype=np.int64)
+    ends = np.cumsum(counts)
+    return np.repeat(np.asarray(starts, dtype=np.int64) - (ends - counts), counts) + np.arange(
+        ends[-1] if len(ends) else 0, dtype=np.int64
+    )
+
+
+class DiaWindow(typing.NamedTuple):
+    """One row of the DiaFrameMsMsWindows table; scans are [scan_begin, scan_end)."""
+
+    window_group: int
+    scan_begin: int
+    scan_end: int
+    isolation_mz: float
+    isolation_width: float
+
+
+class DiaWindows:
+    """The DiaFrameMsMsInfo and DiaFrameMsMsWindows tables, as sorted arrays.
+
+    Attributes:
+        frames (np.ndarray): Ids of diaPASEF frames, ascending.
+        frame_groups (np.ndarray): Window group of each of these frames.
+        frame_cycles (np.ndarray): Cycle of each of these frames: cycles are numbered from 0 by
+            the MS1 frames that start them (frames preceding the first MS1 frame belong to cycle 0).
+        group, scan_begin, scan_end, isolation_mz, isolation_width (np.ndarray): The windows,
+            sorted by window group and then by scan_begin.
+    """
+
+    def __init__(self, info: dict[str, npt.NDArray], windows: dict[str, npt.NDArray], ms1_frames: npt.NDArray):
+        """Build the index.
+
+        Args:
+            info (dict): The DiaFrameMsMsInfo table.
+            windows (dict): The DiaFrameMsMsWindows table.
+            ms1_frames (np.ndarray): Ids of MS1 frames, ascending.
+        """
+        order = np.argsort(info["Frame"], kind="stable")
+        self.frames = info["Frame"][order].astype(np.uint32)
+        self.frame_groups = info["WindowGroup"][order].astype(np.int64)
+        self.frame_cycles = np.maximum(
+            np.searchsorted(ms1_frames, self.frames, side="right") - 1, 0
+        )
+
+        order = np.lexsort((windows["ScanNumBegin"], windows["WindowGroup"]))
+        self.group = windows["WindowGroup"][order].astype(np.int64)
+        self.scan_begin = windows["ScanNumBegin"][order].astype(np.uint32)
+        self.scan_end = windows["ScanNumEnd"][order].astype(np.uint32)
+        self.isolation_mz = windows["IsolationMz"][order].astype(np.double)
+        self.isolation_width = windows["IsolationWidth"][order].astype(np.double)
+        self.window_groups = np.unique(self.group)
+
+    def __len__(self):
+        return len(self.group)
+
+    def window(self, idx: int) -> DiaWindow:
+        return DiaWindow(
+            int(self.group[idx]),
+            int(self.scan_begin[idx]),
+            int(self.scan_end[idx]),
+            float(self.isolation_mz[idx]),
+            float(self.isolation_width[idx]),
+        )
+
+    def group_windows(self, group: int) -> npt.NDArray[np.int64]:
+        """Indices of the windows of a window group."""
+        return np.arange(
+            np.searchsorted(self.group, group, side="left"),
+            np.searchsorted(self.group, group, side="right"),
+        )
+
+    def select_windows(
+        self,
+        window_group: int | typing.Iterable[int] | None = None,
+        isolation_mz: tuple[float, float] | None = None,
+    ) -> npt.NDArray[np.int64]:
+        """Indices of windows in the given groups whose isolation range overlaps [isolation_mz[0], isolation_mz[1])."""
+        if window_group is None:
+            selected = np.ones(len(self), dtype=bool)
+        else:
+            selected = np.isin(self.group, np.r_[window_group])
+        if isolation_mz is not None:
+            half_width = self.isolation_width / 2.0
+            selected &= self.isolation_mz - half_width < isolation_mz[1]
+            selected &= self.isolation_mz + half_width >= isolation_mz[0]
+        return np.flatnonzero(selected)
+
+    def merged_scan_ranges(self, windows: npt.NDArray[np.int64]) -> dict[int, tuple[npt.NDArray, npt.NDArray]]:
+        """Union of the scan ranges of the given windows, per window group, as (begins, ends) of disjoint ranges."""
+        ranges = {}
+        for group in np.unique(self.group[windows]):
+            idx = windows[self.group[windows] == group]
+            begins, ends = [], []
+            for begin, end in zip(self.scan_begin[idx], self.scan_end[idx]):
+                if begins and begin <= ends[-1]:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    begins.append(begin)
+                    ends.append(end)
+            ranges[int(group)] = (
+                np.array(begins, dtype=np.uint32),
+                np.array(ends, dtype=np.uint32),
+            )
+        return ranges
@@ -0,0 +1,248 @@
+#    OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+#    Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+#
+#    Licensed under the MIT License. See LICENCE file in the project root for details.
+"""Persistent sidecar index of a TDF dataset.
+
+The index holds everything OpenTIMS needs to open a dataset without touching
+analysis.tdf (the Frames and GlobalMetadata tables, which include frame offsets
+and peak counts), together with per-frame peak statistics that otherwise cost a
+full pass over analysis.tdf_bin.
+
+File layout (all integers little-endian):
+
+    8 bytes     magic: b"OTIDX\\0\\0\\0"
+    8 bytes     uint64, length of the JSON header
+    header      UTF-8 JSON: format version, dataset fingerprint, GlobalMetadata,
+                text columns of the Frames table, and for each array its
+                dtype, shape and offset from the start of the file
+    arrays      raw C-ordered arrays, each aligned to 64 bytes
+
+so that every array can be memory-mapped directly. An index is stale as soon as
+the size, modification time or the first and last megabyte of analysis.tdf_bin,
+or the size or modification time of analysis.tdf, change; stale indexes are
+ignored.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pathlib
+import struct
+
+import numpy as np
+import numpy.typing as npt
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".otidx"
+
+_MAGIC = b"OTIDX\0\0\0"
+_ALIGNMENT = 64
+_FINGERPRINT_BLOCK = 1 << 20
+
+
+def dataset_fingerprint(analysis_directory: str | pathlib.Path) -> dict:
+    """Cheaply identify the state of a dataset on disk.
+
+    Args:
+        analysis_directory (str, Path): folder containing 'analysis.tdf' and 'analysis.tdf_bin'.
+
+    Returns:
+        dict: JSON-serializable description, equal for unchanged datasets.
+    """
+    analysis_directory = pathlib.Path(analysis_directory)
+    fingerprint = {}
+    for name in ("analysis.tdf", "analysis.tdf_bin"):
+        stat = (analysis_directory / name).stat()
+        fingerprint[name] = [stat.st_size, stat.st_mtime_ns]
+    tdf_bin = analysis_directory / "analysis.tdf_bin"
+    size = fingerprint["analysis.tdf_bin"][0]
+    h = hashlib.blake2b(digest_size=16)
+    with open(tdf_bin, "rb") as f:
+        h.update(f.read(_FINGERPRINT_BLOCK))
+        if size > _FINGERPRINT_BLOCK:
+            f.seek(max(size - _FINGERPRINT_BLOCK, _FINGERPRINT_BLOCK))
+            h.update(f.read(_FINGERPRINT_BLOCK))
+    fingerprint["analysis.tdf_bin blake2b"] = h.hexdigest()
+    return fingerprint
+
+
+def default_index_path(
+    analysis_directory: str | pathlib.Path,
+    cache_dir: str | pathlib.Path | None = None,
+) -> pathlib.Path:
+    """Where the index of a dataset is kept.
+
+    Args:
+        analysis_directory (str, Path): folder containing 'analysis.tdf' and 'analysis.tdf_bin'.
+        cache_dir (str, Path, None): if None, the index lives next to 'analysis.tdf_bin'.
+            Otherwise it is stored in this directory, under a name derived from the
+            absolute path of the dataset.
+
+    Returns:
+        pathlib.Path: Path to the index file.
+    """
+    analysis_directory = pathlib.Path(analysis_directory)
+    if cache_dir is None:
+        return analysis_directory / ("analysis.tdf_bin" + INDEX_SUFFIX)
+    key = hashlib.blake2b(
+        str(analysis_directory.resolve()).encode(), digest_size=16
+    ).hexdigest()
+    return pathlib.Path(cache_dir) / (key + INDEX_SUFFIX)
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def write_index(
+    path: str | pathlib.Path,
+    fingerprint: dict,
+    global_metadata: dict[str, str],
+    frames: dict[str, npt.NDArray],
+    frame_stats: dict[str, npt.NDArray],
+) -> pathlib.Path:
+    """Save an index.
+
+    The file is written under a temporary name and moved into place, so that
+    readers never see a partially written index.
+
+    Args:
+        path (str, Path): Where to save the index.
+        fingerprint (dict): Result of dataset_fingerprint() taken before the dataset was read.
+        global_metadata (dict): The GlobalMetadata table, as a key -> value mapping.
+        frames (dict): The Frames table, sorted by frame Id.
+        frame_stats (dict): Per-frame statistics, as returned by TimsDataHandle.frame_stats.
+
+    Returns:
+        pathlib.Path: Path to the index file.
+    """
+    path = pathlib.Path(path)
+    arrays = {}
+    text_columns = {}
+    for column, values in frames.items():
+        values = np.asarray(values)
+        if values.dtype.kind in "iuf":
+            arrays["frames/" + column] = values
+        else:
+            # SQL NULLs are kept as JSON nulls, so that the column reads back as from SQLite.
+            text_columns[column] = [None if v is None else str(v) for v in values]
+    for stat, values in frame_stats.items():
+        arrays["frame_stats/" + stat] = np.asarray(values)
+
+    arrays = {name: np.ascontiguousarray(a, dtype=a.dtype.newbyteorder("<")) for name, a in arrays.items()}
+
+    def header_bytes(layout):
+        header = {
+            "version": INDEX_VERSION,
+            "fingerprint": fingerprint,
+            "global_metadata": global_metadata,
+            "frames_columns": list(frames),
+            "text_columns": text_columns,
+            "arrays": layout,
+        }
+        return json.dumps(header).encode()
+
+    # Offsets depend on the header length and vice versa: lay the arrays out after
+    # a generous estimate of the header size, growing it until everything fits.
+    reserved = _aligned(len(header_bytes({})) + 64 * len(arrays) + 256)
+    while True:
+        layout = {}
+        offset = reserved
+        for name, a in arrays.items():
+            layout[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset}
+            offset = _aligned(offset + a.nbytes)
+        header = header_bytes(layout)
+        if len(_MAGIC) + 8 + len(header) <= reserved:
+            break
+        reserved = _aligned(len(_MAGIC) + 8 + len(header))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for name, a in arrays.items():
+                f.seek(layout[name]["offset"])
+                f.write(a.tobytes())
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return path
+
+
+class TimsIndex:
+    """A sidecar index, with its arrays memory-mapped from disk."""
+
+    def __init__(self, path: str | pathlib.Path):
+        """Open an index.
+
+        Args:
+            path (str, Path): Path to the index file.
+
+        Raises:
+            ValueError: if the file is not an index in the current format.
+        """
+        self.path = pathlib.Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"Not an OpenTIMS index: {self.path}")
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len))
+        if header.get("version") != INDEX_VERSION:
+            raise ValueError(
+                f"Unsupported index version {header.get('version')} (expected {INDEX_VERSION}): {self.path}"
+            )
+        self.fingerprint = header["fingerprint"]
+        self.global_metadata = header["global_metadata"]
+        arrays = {
+            name: self._map(desc["dtype"], desc["shape"], desc["offset"])
+            for name, desc in header["arrays"].items()
+        }
+        self.frames = {}
+        for column in header["frames_columns"]:
+            if column in header["text_columns"]:
+                self.frames[column] = np.array(header["text_columns"][column])
+            else:
+                self.frames[column] = arrays["frames/" + column]
+        self.frame_stats = {
+            name[len("frame_stats/"):]: a
+            for name, a in arrays.items()
+            if name.startswith("frame_stats/")
+        }
+
+    def _map(self, dtype: str, shape: list, offset: int) -> npt.NDArray:
+        if np.prod(shape) == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=tuple(shape))
+
+    def is_fresh(self, analysis_directory: str | pathlib.Path) -> bool:
+        """Check whether the index still describes the dataset."""
+        try:
+            return self.fingerprint == dataset_fingerprint(analysis_directory)
+        except OSError:
+            return False
+
+
+def load_index(
+    path: str | pathlib.Path,
+    analysis_directory: str | pathlib.Path,
+) -> TimsIndex | None:
+    """Open the index of a dataset, if it exists and is up to date.
+
+    Args:
+        path (str, Path): Path to the index file.
+        analysis_directory (str, Path): folder containing 'analysis.tdf' and 'analysis.tdf_bin'.
+
+    Returns:
+        TimsIndex or None: None if the index is missing, unreadable or stale.
+    """
+    try:
+        index = TimsIndex(path)
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+    return index if index.is_fresh(analysis_directory) else None
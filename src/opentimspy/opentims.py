@@ -8,7 +8,10 @@ import functools
 import hashlib
 import pathlib
 import sqlite3
+import tempfile
+import time
 import typing
+import warnings
 from functools import cached_property
 
 import numpy as np
@@ -16,12 +19,14 @@ import numpy.typing as npt
 import opentimspy
 from opentimspy.opentimspy_cpp import pressure_compensation_strategy, conversion_method
 
+from .dia import DiaWindow, DiaWindows, concatenated_ranges
 from .dimension_translations import (
     cast_to_numpy_arrays,
     translate_values_frame_sorted,
     translate_values_frames_not_guaranteed_sorted,
 )
-from .sql import table2dict, table2keyed_dict, tables_names
+from .index import dataset_fingerprint, default_index_path, load_index, write_index
+from .sql import KeyedRows, table2dict, table2keyed_rows, tables_names
 
 all_columns = (
     "frame",
@@ -37,6 +42,16 @@ available_columns = (
 )
 all_columns_dtype = (np.uint32,) * 4 + (np.double,) * 3
 column_to_dtype = dict(zip(all_columns, all_columns_dtype))
+compact_columns_dtype = {"scan": np.uint16, "mz": np.float32, "inv_ion_mobility": np.float32}
+supported_columns_dtypes = {
+    "frame": (np.uint16, np.uint32),
+    "scan": (np.uint16, np.uint32),
+    "tof": (np.uint32,),
+    "intensity": (np.uint32,),
+    "mz": (np.float32, np.double),
+    "inv_ion_mobility": (np.float32, np.double),
+    "retention_time": (np.float32, np.double),
+}
 
 
 def setup_opensource():
@@ -74,11 +89,19 @@ COLUMNS_TYPE = typing.Union[str, typing.Tuple[str, ...]]
 
 # TODO: make lazy evaluation for loading sqlite data frames
 class OpenTIMS:
+    # Called once on close(); used by HandlePool to learn that a shared view is no longer in use.
+    _on_close = None
+    # Set on views handed out by HandlePool, whose handle (with its I/O settings and counters) other views share.
+    _shared = False
+    # Whether the handle's zone maps hold the exact per-frame bounds of frame_stats, see _ensure_zone_maps.
+    _exact_zone_maps = False
+
     def __init__(
         self,
         analysis_directory: str | pathlib.Path,
         pcs: pressure_compensation_strategy = pressure_compensation_strategy.NoPressureCompensation,
         cm: conversion_method | None = None,
+        index: bool | str | pathlib.Path = False,
     ):
         """Initialize OpenTIMS.
 
@@ -91,8 +114,16 @@ class OpenTIMS:
                 conversion_method.Bruker: force Bruker conversion (errors if bridge not initialized).
                 conversion_method.OpenSource: force the built-in open-source converter (less precise).
                 conversion_method.NoConversion: skip conversion entirely.
+            index: use a persistent sidecar index (see opentimspy.index) to open the dataset
+                without reading analysis.tdf, and to get per-frame statistics without a pass over the data.
+                False (default): do not use an index.
+                True: keep the index next to 'analysis.tdf_bin'.
+                A path to an existing directory: keep the index in that cache directory.
+                Any other path: the index file itself.
+                A missing or stale index is (re)built while opening, which costs one pass over the data.
         """
         self.handle = None
+        self.index = None
         self.analysis_directory = pathlib.Path(analysis_directory)
         if not self.analysis_directory.exists():
             raise RuntimeError(f"No such directory: {str(self.analysis_directory)}")
@@ -107,13 +138,28 @@ class OpenTIMS:
                 f"Missing: {str(self.analysis_directory / 'analysis.tdf_bin')}"
             )
         cpp_cm = conversion_method.Default if cm is None else cm
-        self.handle = opentimspy.opentimspy_cpp.TimsDataHandle(
-            str(analysis_directory), pcs, cpp_cm
-        )
-        self.GlobalMetadata = self.table2dict("GlobalMetadata")
-        self.GlobalMetadata = dict(
-            zip(self.GlobalMetadata["Key"], self.GlobalMetadata["Value"])
-        )
+        index_path = self._index_path(index)
+        if index_path is not None:
+            self.index = load_index(index_path, self.analysis_directory)
+        if self.index is None:
+            fingerprint = None if index_path is None else dataset_fingerprint(self.analysis_directory)
+            self.handle = opentimspy.opentimspy_cpp.TimsDataHandle(
+                str(analysis_directory), pcs, cpp_cm
+            )
+        else:
+            self.handle = opentimspy.opentimspy_cpp.TimsDataHandle(
+                str(analysis_directory),
+                self.index.frames,
+                self.index.global_metadata,
+                pcs,
+                cpp_cm,
+            )
+        # GlobalMetadata and Frames were already read by the handle while opening the dataset.
+        self.GlobalMetadata = dict(self.handle.global_metadata())
+        if index_path is not None and self.index is None:
+            self._build_index(index_path, fingerprint)
+        if self.index is not None:
+            self._ensure_zone_maps()
         if int(self.GlobalMetadata["TimsCompressionType"]) != 2:
             raise RuntimeError(
                 f"Unsupported TimsCompressionType: {self.GlobalMetadata['TimsCompressionType']}. Updating your acquisition software *might* solve the problem."
@@ -122,6 +168,29 @@ class OpenTIMS:
         self.all_columns = all_columns
         self.all_columns_dtypes = all_columns_dtype
 
+    @classmethod
+    def open_shared(
+        cls,
+        analysis_directory: str | pathlib.Path,
+        pcs: pressure_compensation_strategy = pressure_compensation_strategy.NoPressureCompensation,
+        cm: conversion_method | None = None,
+        pool=None,
+    ) -> OpenTIMS:
+        """Open a dataset through a HandlePool, reusing the handle of a previous open if possible.
+
+        Args:
+            analysis_directory (str, unicode string): path to the folder containing 'analysis.tdf' and 'analysis.tdf_bin'.
+            pcs: pressure compensation strategy, as in the constructor.
+            cm: conversion method, as in the constructor.
+            pool (HandlePool or None): the pool to use; None for the process-wide default pool.
+
+        Returns:
+            OpenTIMS: a view of the shared dataset; close it (or use it as a context manager) when done.
+        """
+        from .pool import default_pool
+
+        return (default_pool if pool is None else pool).open(analysis_directory, pcs, cm)
+
     @property
     def min_inv_ion_mobility(self) -> float:
         return float(self.GlobalMetadata["OneOverK0AcqRangeLower"])
@@ -140,12 +209,11 @@ class OpenTIMS:
 
     @cached_property
     def frames(self) -> dict[str, npt.NDArray]:
-        frames = self.table2dict("Frames")
-        # make sure it is all sorted by retention time / frame number
-        sort_order = np.argsort(frames["Id"])
-        for column in frames:
-            frames[column] = frames[column][sort_order]
-        return frames
+        # Shared with the handle, which reads the table sorted by frame Id; numeric columns are read-only.
+        return {
+            column: values if isinstance(values, np.ndarray) else np.array(values)
+            for column, values in self.handle.frames_table().items()
+        }
 
     @property
     def retention_times(self) -> RETENTION_TIMES_TYPE:
@@ -194,7 +262,7 @@ class OpenTIMS:
 
     @cached_property
     def ms1_frames(self) -> FRAMES_TYPE:
-        return np.arange(self.min_frame, self.max_frame + 1)[self.ms_types == 0]
+        return self.handle.ms_level_frames(1)
 
     @cached_property
     def _ms1_mask(self) -> npt.NDArray[np.bool_]:
@@ -204,11 +272,46 @@ class OpenTIMS:
 
     @cached_property
     def ms2_frames(self) -> FRAMES_TYPE:
-        return np.arange(self.min_frame, self.max_frame + 1)[~self._ms1_mask]
+        return self.handle.ms_level_frames(2)
+
+    @cached_property
+    def frame_properties(self) -> KeyedRows:
+        """Frame Id to a namedtuple with the respective row of the Frames table; rows are built on access."""
+        return KeyedRows("Frames", self.frames, "Id")
 
     @cached_property
-    def frame_properties(self) -> dict[str, npt.NDArray]:
-        return self.table2keyed_dict("Frames")
+    def frame_stats(self) -> dict[str, npt.NDArray]:
+        """Per-frame peak statistics, aligned with self.frames.
+
+        Keys: 'tic', 'max_intensity', 'min_tof', 'max_tof', 'min_scan', 'max_scan'.
+        Frames without peaks have min_* set to the maximal uint32 value and max_* to 0.
+        Taken from the index if one is used, otherwise computed with one (multithreaded) pass over the data.
+        """
+        if self.index is not None:
+            return self.index.frame_stats
+        return self.handle.frame_stats(self.frames["Id"])
+
+    def _index_path(self, index) -> pathlib.Path | None:
+        if index is False or index is None:
+            return None
+        if index is True:
+            return default_index_path(self.analysis_directory)
+        index = pathlib.Path(index)
+        if index.is_dir():
+            return default_index_path(self.analysis_directory, cache_dir=index)
+        return index
+
+    def _build_index(self, index_path: pathlib.Path, fingerprint: dict):
+        try:
+            write_index(
+                index_path,
+                fingerprint,
+                self.GlobalMetadata,
+                self.frames,
+                self.frame_stats,
+            )
+        except OSError as e:
+            warnings.warn(f"Could not save the index to {index_path}: {e}")
 
     def __len__(self):
         return self.peaks_cnt
@@ -223,6 +326,9 @@ class OpenTIMS:
         if not self.handle is None:
             del self.handle
             self.handle = None
+            if self._on_close is not None:
+                on_close, self._on_close = self._on_close, None
+                on_close()
 
     def __enter__(self):
         return self
@@ -240,8 +346,7 @@ class OpenTIMS:
         return table2dict(self.analysis_directory / "analysis.tdf", name)
 
     def table2keyed_dict(self, name: str):
-        with self.get_sql_connection() as sqlcon:
-            return table2keyed_dict(sqlcon, name)
+        return table2keyed_rows(self.analysis_directory / "analysis.tdf", name)
 
     def frame2retention_time(self, frames: FRAMES_TYPE):
         frames = np.r_[frames]
@@ -270,43 +375,189 @@ class OpenTIMS:
         self,
         size,
         selected_columns=all_columns,
+        dtypes: dict | None = None,
     ):
-        """Return a dictionary of empty numpy arrays to be filled with raw data. Some are left empty and thus not filled."""
+        """Return a dictionary of empty numpy arrays to be filled with raw data. Some are left empty and thus not filled.
+
+        dtypes may override the types of some columns.
+        """
+        dtypes = {} if dtypes is None else dtypes
         assert all(
             c in self.all_columns for c in selected_columns
         ), f"Accepted column names: {self.all_columns}"
 
-        return {
-            col: np.empty(shape=size if col in selected_columns else 0, dtype=dtype)
+        timed = self.handle.perf_counters_enabled()
+        if timed:
+            started = time.perf_counter()
+        arrays = {
+            col: np.empty(shape=size if col in selected_columns else 0, dtype=dtypes.get(col, dtype))
             for col, dtype in zip(self.all_columns, self.all_columns_dtypes)
         }
+        if timed:
+            self.handle.record_allocation(
+                time.perf_counter() - started, sum(a.nbytes for a in arrays.values()), size
+            )
+        return arrays
+
+    def _get_spilled_arrays(
+        self,
+        size: int,
+        selected_columns: tuple,
+        spill_dir: str | pathlib.Path | None = None,
+        dtypes: dict | None = None,
+    ) -> dict[str, npt.NDArray]:
+        """Like _get_empty_arrays, but with the selected columns memory-mapped to files.
+
+        Without spill_dir, the files are anonymous temporary files, removed once the arrays are garbage collected.
+        Otherwise, they are saved there as <column>.npy.
+        """
+        arrays = self._get_empty_arrays(0, ())
+        if spill_dir is not None:
+            spill_dir = pathlib.Path(spill_dir)
+            spill_dir.mkdir(parents=True, exist_ok=True)
+        for col in selected_columns:
+            dtype = column_to_dtype[col] if dtypes is None else dtypes.get(col, column_to_dtype[col])
+            if spill_dir is None:
+                with tempfile.TemporaryFile() as f:
+                    # The mapping stays valid after the file is closed.
+                    arrays[col] = np.memmap(f, dtype=dtype, mode="w+", shape=size)
+            else:
+                arrays[col] = np.lib.format.open_memmap(spill_dir / f"{col}.npy", mode="w+", dtype=dtype, shape=(size,))
+        return arrays
+
+    def _check_not_shared(self, setting: str):
+        if self._shared:
+            raise RuntimeError(
+                f"{setting} would change the handle shared by all views of this dataset; set it for the whole HandlePool instead."
+            )
+
+    def enable_stats(self, enabled: bool = True):
+        """Turn the per-stage performance counters of the handle on or off. They are off by default.
+
+        Not available on views from a HandlePool, whose counters are turned on with HandlePool(stats=True).
+        """
+        self._check_not_shared("enable_stats")
+        self.handle.enable_perf_counters(enabled)
+
+    def stats(self) -> dict:
+        """Per-stage performance counters of data extraction, collected since enable_stats() or reset_stats().
+
+        Returns:
+            dict: "enabled", "stages" mapping each stage (decompress, decode, tof_to_mz, scan_to_inv_ion_mobility,
+            allocation) to its counters (calls, seconds, bytes_in, bytes_out, frames,
+            peaks, minor_faults, major_faults) summed over threads, and "per_thread" with the same counters
+            for the calling thread (0) and each worker thread (1, 2, ...). Page faults are counted for decompression, on Linux only.
+            On views from a HandlePool, the counters cover all views of the dataset.
+        """
+        return self.handle.perf_counters()
+
+    def reset_stats(self):
+        """Zero the performance counters. Not available on views from a HandlePool."""
+        self._check_not_shared("reset_stats")
+        self.handle.reset_perf_counters()
+
+    def set_io(self, mode: str | None = None, access: str | None = None, readahead: int | None = None):
+        """Choose how analysis.tdf_bin is read. Arguments left as None keep their current values.
+
+        Args:
+            mode (str): "mmap" (default) reads frames through a memory map; "pread" reads them with pread()
+                into per-thread buffers, avoiding page faults that are slow on some network filesystems.
+            access (str): access pattern hinted to the kernel: "auto" (default) hints sequential access for
+                queries of frames in increasing order and random access otherwise; "normal", "sequential"
+                and "random" apply to all queries.
+            readahead (int): how many bytes of upcoming frames multi-frame queries prefetch ahead of the
+                decoders, on a helper thread; 0 disables readahead. Default: 64 MiB.
+
+        Not available on views from a HandlePool, which applies HandlePool(io=...) to all its datasets.
+        """
+        self._check_not_shared("set_io")
+        if mode is not None:
+            self.handle.set_io_mode(mode)
+        if access is not None:
+            self.handle.set_access_pattern(access)
+        if readahead is not None:
+            self.handle.set_readahead(readahead)
+
+    def io_settings(self) -> dict:
+        """Current settings of set_io(), as a dict with keys "mode", "access" and "readahead"."""
+        return {"mode": self.handle.io_mode(), "access": self.handle.access_pattern(), "readahead": self.handle.readahead()}
+
+    def _column_dtypes(self, compact: bool = False, dtypes: dict | None = None) -> dict[str, np.dtype]:
+        """Validated types of columns that differ from the defaults, given compact and per-column dtypes."""
+        chosen = dict(compact_columns_dtype) if compact else {}
+        chosen.update({} if dtypes is None else dtypes)
+        result = {}
+        for col, dtype in chosen.items():
+            assert col in self.all_columns, f"Accepted column names: {self.all_columns}"
+            dtype = np.dtype(dtype)
+            if dtype not in [np.dtype(d) for d in supported_columns_dtypes[col]]:
+                raise ValueError(
+                    f"Column {col} cannot be stored as {dtype}; supported types: {[np.dtype(d).name for d in supported_columns_dtypes[col]]}"
+                )
+            bound = {"frame": self.max_frame, "scan": self.max_scan}.get(col, 0)
+            if dtype.kind == "u" and bound > np.iinfo(dtype).max:
+                raise ValueError(f"Values of column {col} reach {bound} and do not fit in {dtype}.")
+            if dtype != np.dtype(column_to_dtype[col]):
+                result[col] = dtype
+        return result
 
     def _sanitize_user_provided_arrays(
         self,
         size: int,
         arrays: dict[str, npt.NDArray],
+        dtypes: dict | None = None,
     ) -> dict[str, npt.NDArray]:
+        dtypes = {} if dtypes is None else dtypes
         final_arrays = {}
         for col, col_dtype in zip(self.all_columns, self.all_columns_dtypes):
             if col in arrays:
                 arr = arrays[col]
-                assert arr.dtype == col_dtype
+                assert arr.dtype == dtypes.get(col, col_dtype)
                 assert len(arr) == size
             else:
                 arr = np.empty(shape=0, dtype=col_dtype)
             final_arrays[col] = arr
         return final_arrays
 
+    def _select_frames(
+        self,
+        frames: FRAMES_TYPE = None,
+        ms_level: int | None = None,
+        retention_time: tuple[float, float] | None = None,
+    ) -> npt.NDArray[np.uint32]:
+        """Ids of the chosen frames, restricted to an MS level and a half-open retention time range (in seconds)."""
+        if ms_level is None and retention_time is None:
+            return self.frames["Id"] if frames is None else frames
+        if retention_time is None:
+            retention_time = (-np.inf, np.inf)
+        selected = self.handle.ms_level_frames(0 if ms_level is None else ms_level, *retention_time)
+        if frames is None:
+            return selected
+        frames = np.r_[frames].astype(np.uint32)
+        return frames[np.isin(frames, selected)]
+
     def query(
         self,
         frames: FRAMES_TYPE = None,
         columns: COLUMNS_TYPE | dict[str, npt.NDArray] = all_columns,
+        ms_level: int | None = None,
+        max_memory: int | None = None,
+        spill_dir: str | pathlib.Path | None = None,
+        compact: bool = False,
+        dtypes: dict | None = None,
+        run_length: bool = False,
     ):
         """Get data from a selection of frames.
 
         Args:
             frames (int, iterable, None): Frames to choose. Passing an integer results in extracting that one frame. Default: all of them.
             columns (tuple|str|dict): which columns to extract? Be default, provide a tuple with column name strings. If you provide one string, it will be a column. If you provide a dictionary, it should map column names to arrays you provide yourself for the outputs instead of having to trouble us. The latter makes sense if you want to store data on disk in a memory mapped files. We do check if your arrays match necessry column types and size.
+            ms_level (int, None): Only choose frames of this MS level: 1 for MS1 frames, 2 for all others. Default: no restriction.
+            max_memory (int, None): Budget in bytes for the results. If they would take more, they are written to memory-mapped files instead of RAM. Default: no limit.
+            spill_dir (str, pathlib.Path, None): Where to keep the memory-mapped results, as <column>.npy files. Default: temporary files removed together with the arrays.
+            compact (bool): Return narrower types, written directly by the native extraction: uint16 scans, float32 m/z and inverse ion mobilities (see compact_columns_dtype).
+            dtypes (dict, None): Types of chosen columns, overriding the defaults and compact; see supported_columns_dtypes. Arrays passed in columns may also have these types.
+            run_length (bool): Return frame and retention_time as pairs (values, offsets): peaks offsets[i]:offsets[i+1] come from the i-th chosen frame.
         Returns:
             dict: columns to numpy array mapping.
         """
@@ -317,19 +568,33 @@ class OpenTIMS:
             c in self.all_columns for c in columns
         ), f"Accepted column names: {self.all_columns}"
 
-        if frames is None:
-            frames = self.frames["Id"]
+        frames = self._select_frames(frames, ms_level)
+        if isinstance(columns, dict):
+            dtypes = {c: a.dtype for c, a in columns.items()}
+        dtypes = self._column_dtypes(compact, dtypes)
+        run_length_columns = ("frame", "retention_time") if run_length else ()
 
         try:
             frames = np.r_[frames].astype(np.uint32)
             size = self.peaks_per_frame_cnts(frames, convert=False)
-            arrays = (
-                self._sanitize_user_provided_arrays(size, columns)
-                if isinstance(columns, dict)
-                else self._get_empty_arrays(size, columns)
-            )
+            extracted = tuple(c for c in columns if c not in run_length_columns)
+            if isinstance(columns, dict):
+                arrays = self._sanitize_user_provided_arrays(size, columns, dtypes)
+            elif (
+                max_memory is not None
+                and size > 0
+                and size * sum(np.dtype(dtypes.get(c, column_to_dtype[c])).itemsize for c in extracted) > max_memory
+            ):
+                arrays = self._get_spilled_arrays(size, extracted, spill_dir, dtypes)
+            else:
+                arrays = self._get_empty_arrays(size, extracted, dtypes)
 
-            self.handle.extract_frames(frames, **arrays)  # packs arrays with data
+            if dtypes or run_length:
+                for c in run_length_columns:
+                    arrays[c] = arrays[c][:0]
+                self.handle.extract_frames_typed(frames, **arrays)
+            else:
+                self.handle.extract_frames(frames, **arrays)  # packs arrays with data
         except RuntimeError as e:
             # C++ throws std::logic_error (mapped to RuntimeError by pybind11) when
             # no conversion method was set up before opening the handle.
@@ -338,8 +603,43 @@ class OpenTIMS:
                     "Please install 'opentims_bruker_bridge' if you want to use Bruker's conversion methods."
                 ) from e
             raise
+        if run_length:
+            positions = np.searchsorted(self.frames["Id"], frames)
+            offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+            np.cumsum(self.frames["NumPeaks"][positions], out=offsets[1:])
+            arrays["frame"] = (frames.astype(dtypes.get("frame", np.uint32)), offsets)
+            arrays["retention_time"] = (
+                self.frames["Time"][positions].astype(dtypes.get("retention_time", np.double)),
+                offsets,
+            )
         return {c: arrays[c] for c in columns}
 
+    def build_cache(
+        self,
+        path: str | pathlib.Path,
+        columns: COLUMNS_TYPE = all_columns,
+        dtypes: dict | None = None,
+        compact: bool = False,
+    ):
+        """Decode all frames once into a columnar cache that reopens without decoding (see opentimspy.cache).
+
+        The parallel extractor writes each column directly into its memory-mapped file.
+
+        Args:
+            path (str, pathlib.Path): Directory of the cache; an existing cache there is overwritten.
+            columns (tuple|str): Columns to cache.
+            dtypes (dict, None): Types of chosen columns, as in query.
+            compact (bool): Store narrower types, as in query.
+        Returns:
+            CachedTIMS: the cache, opened.
+        """
+        from .cache import CachedTIMS, write_cache
+
+        if isinstance(columns, str):
+            columns = (columns,)
+        self._check_columns(columns)
+        return CachedTIMS(write_cache(self, path, tuple(columns), dtypes, compact))
+
     def query_iter(
         self, frames: FRAMES_TYPE = None, columns: COLUMNS_TYPE = all_columns
     ):
@@ -361,11 +661,47 @@ class OpenTIMS:
     def __iter__(self):
         yield from self.query_iter()
 
+    def iter_chunks(
+        self,
+        frames: FRAMES_TYPE = None,
+        columns: COLUMNS_TYPE = all_columns,
+        ms_level: int | None = None,
+        retention_time: tuple[float, float] | None = None,
+        max_peaks: int = 10_000_000,
+    ):
+        """Iterate data from a selection of frames, in chunks of whole frames.
+
+        Each chunk is extracted with one (multithreaded) call, like query, and holds as many
+        consecutive chosen frames as fit in max_peaks peaks (but always at least one frame).
+
+        Args:
+            frames (int, iterable, slice, None): Frames to choose. Default: all of them.
+            columns (tuple): which columns to extract? Defaults to all possible columns.
+            ms_level (int, None): Only choose frames of this MS level: 1 for MS1 frames, 2 for all others.
+            retention_time (tuple): Only choose frames with retention times in this half-open range (in seconds).
+            max_peaks (int): Maximal number of peaks in a chunk, unless a single frame holds more.
+
+        Yields:
+            dict: column to numpy array mapping.
+        """
+        frames = self._select_frames(frames, ms_level, retention_time)
+        frames = np.r_[frames].astype(np.uint32)
+        peaks = np.cumsum(
+            self.frames["NumPeaks"][np.searchsorted(self.frames["Id"], frames)], dtype=np.int64
+        )
+        start = 0
+        while start < len(frames):
+            already = peaks[start - 1] if start > 0 else 0
+            end = max(np.searchsorted(peaks, already + max_peaks, side="right"), start + 1)
+            yield self.query(frames[start:end], columns)
+            start = end
+
     def rt_query(
         self,
         min_retention_time: float,
         max_retention_time: float,
         columns: COLUMNS_TYPE = all_columns,
+        ms_level: int | None = None,
     ):
         """Get data from a selection of frames based on retention times.
 
@@ -376,20 +712,24 @@ class OpenTIMS:
             min_retention_time (float): Minimal retention time (in seconds).
             max_retention_time (float): Maximal retention time, exclusive (in seconds).
             columns (tuple): which columns to extract? Defaults to all possible columns.
+            ms_level (int, None): Only choose frames of this MS level: 1 for MS1 frames, 2 for all others.
 
         Returns:
             dict: column to numpy array mapping.
         """
-        min_frame, max_frame = (
-            np.searchsorted(
-                self.retention_times, (min_retention_time, max_retention_time)
-            )
-            + 1
+        return self.query(
+            self.handle.ms_level_frames(
+                0 if ms_level is None else ms_level, min_retention_time, max_retention_time
+            ),
+            columns,
         )
-        return self.query(slice(min_frame, max_frame), columns)
 
     def rt_query_iter(
-        self, min_retention_time: float, max_retention_time: float, columns=all_columns
+        self,
+        min_retention_time: float,
+        max_retention_time: float,
+        columns=all_columns,
+        ms_level: int | None = None,
     ):
         """Iterate data from a selection of frames based on retention times.
 
@@ -400,17 +740,468 @@ class OpenTIMS:
             min_retention_time (float): Minimal retention time (in seconds).
             max_retention_time (float): Maximal retention time, exclusive (in seconds).
             columns (tuple): which columns to extract? Defaults to all possible columns.
+            ms_level (int, None): Only choose frames of this MS level: 1 for MS1 frames, 2 for all others.
 
         Yields:
             dict: column to numpy array mapping.
         """
-        min_frame, max_frame = (
-            np.searchsorted(
-                self.retention_times, (min_retention_time, max_retention_time)
+        yield from self.query_iter(
+            self.handle.ms_level_frames(
+                0 if ms_level is None else ms_level, min_retention_time, max_retention_time
+            ),
+            columns,
+        )
+
+    def _ensure_zone_maps(self):
+        """Give the handle zone maps for pruning box queries, without decoding any frame.
+
+        Exact bounds are used once frame_stats is known (from the index, or computed earlier);
+        until then the Frames table bounds intensities (MaxIntensity) and scans (NumScans) only.
+        """
+        if self.index is not None or "frame_stats" in self.__dict__:
+            if not self._exact_zone_maps:
+                stats = self.frame_stats
+                self.handle.set_zone_maps(
+                    self.frames["Id"],
+                    stats["min_tof"],
+                    stats["max_tof"],
+                    stats["max_intensity"],
+                    stats["min_scan"],
+                    stats["max_scan"],
+                )
+                self._exact_zone_maps = True
+        elif not self.handle.has_zone_maps():
+            ids = self.frames["Id"]
+            # MaxIntensity is stored before the pressure compensation applied while decoding; the bound
+            # is rounded up with a margin, so that values off by rounding can only let frames through.
+            corrected = self.frames["MaxIntensity"] * (100.0 / self.frames["AccumulationTime"])
+            max_intensity = np.minimum(np.ceil(corrected) + 1, np.iinfo(np.uint32).max).astype(np.uint32)
+            unbounded = np.full(len(ids), np.iinfo(np.uint32).max, dtype=np.uint32)
+            self.handle.set_zone_maps(
+                ids,
+                np.zeros(len(ids), dtype=np.uint32),
+                unbounded,
+                max_intensity,
+                np.zeros(len(ids), dtype=np.uint32),
+                np.maximum(self.frames["NumScans"], 1).astype(np.uint32) - 1,
             )
-            + 1
+
+    @staticmethod
+    def _first_index_reaching(to_value, from_value, frame, value, increasing, upper):
+        """Smallest index in [0, upper] whose value is >= value (for increasing) or < value (for decreasing conversions)."""
+
+        def reached(indices):
+            values = to_value(frame, np.asarray(indices, dtype=np.uint32))
+            return values >= value if increasing else values < value
+
+        # The inverse conversion gives a good guess, possibly off by rounding.
+        guess = int(from_value(frame, np.array([value], dtype=np.double))[0])
+        candidates = np.clip(np.arange(guess - 2, guess + 3), 0, upper)
+        hits = reached(candidates)
+        if hits[-1] and (not hits[0] or candidates[0] == 0):
+            return int(candidates[np.argmax(hits)])
+        lo, hi = 0, upper
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if reached([mid])[0]:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _peak_boxes(self, frames, scan, tof, mz, inv_ion_mobility, min_intensity):
+        """Bounds of the boxes for extract_box and box_TIC: one box, or one per frame if m/z or ion mobility need translating."""
+        uint32_max = np.iinfo(np.uint32).max
+        scan_begin, scan_end = (0, uint32_max) if scan is None else scan
+        tof_begin, tof_end = (0, uint32_max) if tof is None else tof
+        size = 1 if mz is None and inv_ion_mobility is None else len(frames)
+        bounds = [
+            np.full(size, np.clip(value, 0, uint32_max), dtype=np.uint32)
+            for value in (scan_begin, scan_end, tof_begin, tof_end, min_intensity)
+        ]
+        tof_upper = int(self.GlobalMetadata.get("DigitizerNumSamples", uint32_max))
+        scan_upper = int(self.frames["NumScans"].max())
+        for ii, frame in enumerate(frames if size > 1 else ()):
+            if mz is not None:
+                # m/z grows with TOF.
+                begin, end = (
+                    self._first_index_reaching(self.handle.tof_to_mz, self.handle.mz_to_tof, frame, value, True, tof_upper)
+                    for value in mz
+                )
+                bounds[2][ii] = max(bounds[2][ii], begin)
+                bounds[3][ii] = min(bounds[3][ii], end)
+            if inv_ion_mobility is not None:
+                # Inverse ion mobility decreases with scan number.
+                begin, end = (
+                    self._first_index_reaching(self.handle.scan_to_inv_mobility, self.handle.inv_mobility_to_scan, frame, value, False, scan_upper)
+                    for value in inv_ion_mobility[::-1]
+                )
+                bounds[0][ii] = max(bounds[0][ii], begin)
+                bounds[1][ii] = min(bounds[1][ii], end)
+        return bounds
+
+    def _frame_ids(self, frames: FRAMES_TYPE | None) -> npt.NDArray[np.uint32]:
+        if frames is None:
+            return self.frames["Id"].astype(np.uint32)
+        return np.r_[frames].astype(np.uint32)
+
+    def box_query(
+        self,
+        frames: FRAMES_TYPE | None = None,
+        scan: tuple[int, int] | None = None,
+        tof: tuple[int, int] | None = None,
+        mz: tuple[float, float] | None = None,
+        inv_ion_mobility: tuple[float, float] | None = None,
+        min_intensity: int = 0,
+        columns: COLUMNS_TYPE = all_columns,
+    ):
+        """Get the peaks within a box.
+
+        All ranges are half-open, [begin, end), and None means no restriction.
+        Frames whose zone maps (per-frame TOF, scan and intensity bounds, see frame_stats) rule out
+        any match are not decompressed; the rest are filtered in multiple threads. Until frame_stats
+        is known, the zone maps only bound intensities and scans, using the Frames table.
+
+        Args:
+            frames (int, iterable, slice, None): Frames to choose. Default: all of them.
+            scan (tuple): Range of scans.
+            tof (tuple): Range of time of flight indices.
+            mz (tuple): Range of m/z values; requires a conversion method.
+            inv_ion_mobility (tuple): Range of inverse ion mobilities; requires a conversion method.
+            min_intensity (int): Only report peaks at least this intense.
+            columns (tuple|str): which columns to extract? Defaults to all possible columns.
+
+        Returns:
+            dict: column to numpy array mapping.
+        """
+        columns = self._check_columns(columns)
+        frames = self._frame_ids(frames)
+        self._ensure_zone_maps()
+        data = self.handle.extract_box(
+            frames, *self._peak_boxes(frames, scan, tof, mz, inv_ion_mobility, min_intensity)
+        )
+        return self._derived_columns(data, columns)
+
+    def _check_columns(self, columns: COLUMNS_TYPE) -> tuple:
+        if isinstance(columns, str):
+            columns = (columns,)
+        assert all(
+            c in self.all_columns for c in columns
+        ), f"Accepted column names: {self.all_columns}"
+        return columns
+
+    def _derived_columns(self, data: dict[str, npt.NDArray], columns: tuple) -> dict[str, npt.NDArray]:
+        """Complete the frame, scan, tof and intensity columns of extracted peaks with the requested ones."""
+        if "mz" in columns:
+            data["mz"] = self.tof_to_mz(data["tof"], data["frame"])
+        if "inv_ion_mobility" in columns:
+            data["inv_ion_mobility"] = self.scan_to_inv_ion_mobility(data["scan"], data["frame"])
+        if "retention_time" in columns:
+            data["retention_time"] = self.retention_times[
+                np.searchsorted(self.frames["Id"], data["frame"])
+            ]
+        return {c: data[c] for c in columns}
+
+    def chromatogram(
+        self,
+        frames: FRAMES_TYPE | None = None,
+        scan: tuple[int, int] | None = None,
+        tof: tuple[int, int] | None = None,
+        mz: tuple[float, float] | None = None,
+        inv_ion_mobility: tuple[float, float] | None = None,
+        min_intensity: int = 0,
+    ):
+        """Get the summed intensity of peaks within a box, per frame (an extracted ion chromatogram).
+
+        Arguments are as in box_query; frames ruled out by their zone maps are not decompressed.
+
+        Returns:
+            dict: 'frame', 'retention_time' and 'intensity' (sum of intensities, np.uint64) arrays, one value per frame.
+        """
+        frames = self._frame_ids(frames)
+        self._ensure_zone_maps()
+        intensity = self.handle.box_TIC(
+            frames, *self._peak_boxes(frames, scan, tof, mz, inv_ion_mobility, min_intensity)
+        )
+        return {
+            "frame": frames,
+            "retention_time": self.retention_times[np.searchsorted(self.frames["Id"], frames)],
+            "intensity": intensity,
+        }
+
+    def frame_images(
+        self,
+        frames: FRAMES_TYPE | None = None,
+        x_axis: str = "mz",
+        x_range: tuple[float, float] = (0.0, 2000.0),
+        x_resolution: float = 1.0,
+        scan_range: tuple[int, int] | None = None,
+    ) -> npt.NDArray[np.uint32]:
+        """Bin the peaks of frames into dense scan by m/z (or TOF) images, in multiple threads.
+
+        All frames share one grid: row r holds scan scan_range[0] + r, and column c the peaks with
+        x values within x_resolution/2 of x_range[0] + c * x_resolution. Both ranges are inclusive,
+        as in plotting.mk_bitmap, whose transposed output this matches.
+
+        Args:
+            frames (int, iterable, slice, None): Frames to choose. Default: all of them.
+            x_axis (str): 'mz' (requires a conversion method) or 'tof'.
+            x_range (tuple): Lowest and highest x value.
+            x_resolution (float): Width of a column.
+            scan_range (tuple): Lowest and highest scan. Default: all scans.
+
+        Returns:
+            np.array: Array of shape (frames, rows, columns): summed intensities of the peaks in each bin.
+        """
+        frames = self._frame_ids(frames)
+        if scan_range is None:
+            scan_range = (self.min_scan, self.max_scan)
+        width = int((x_range[1] - x_range[0]) / x_resolution) + 1
+        height = int(scan_range[1]) - int(scan_range[0]) + 1
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Empty image grid: x_range={x_range}, scan_range={scan_range}")
+        return self.handle.frame_images(
+            frames, x_axis, x_range[0], x_range[1], x_resolution, scan_range[0], width, height
+        )
+
+    def pasef_spectra(
+        self,
+        precursor_ids: typing.Iterable[int] | None = None,
+        columns: COLUMNS_TYPE = ("tof", "mz", "intensity"),
+    ):
+        """Get DDA-PASEF fragment spectra, one per precursor.
+
+        For each precursor, the scan windows (ScanNumBegin to ScanNumEnd, exclusive) of all the MS2 frames
+        listed for it in the PasefFrameMsMsInfo table are decoded, and their peaks are summed by TOF.
+        Only the scans within the windows are decoded, and precursors are processed in multiple threads.
+
+        Args:
+            precursor_ids (iterable, None): Ids of precursors (from the Precursors table). Default: all precursors with fragment spectra.
+            columns (tuple|str): Which peak columns to report: any of 'tof', 'mz' (from the calibration of the first frame of a precursor) and 'intensity' (summed, np.uint64).
+
+        Returns:
+            dict: The spectra as a CSR-style batch: 'precursor' holds the precursor Ids, and the peaks of the
+                i-th spectrum are at positions offsets[i]:offsets[i+1] of the peak columns.
+        """
+        if isinstance(columns, str):
+            columns = (columns,)
+        assert all(
+            c in ("tof", "mz", "intensity") for c in columns
+        ), "Accepted column names: ('tof', 'mz', 'intensity')"
+        if "PasefFrameMsMsInfo" not in self.tables_names():
+            raise RuntimeError(
+                "No PasefFrameMsMsInfo table: this does not look like a DDA-PASEF dataset."
+            )
+        info = self.table2dict("PasefFrameMsMsInfo")
+        order = np.lexsort((info["Frame"], info["Precursor"]))
+        precursors = info["Precursor"][order]
+        frames = info["Frame"][order]
+        scan_begins = info["ScanNumBegin"][order]
+        scan_ends = info["ScanNumEnd"][order]
+
+        if precursor_ids is None:
+            precursor_ids = np.unique(precursors)
+        else:
+            precursor_ids = np.r_[precursor_ids].astype(precursors.dtype)
+        starts = np.searchsorted(precursors, precursor_ids, side="left")
+        ends = np.searchsorted(precursors, precursor_ids, side="right")
+        rows = np.concatenate(
+            [np.arange(b, e) for b, e in zip(starts, ends)] + [np.empty(0, dtype=np.int64)]
+        )
+        group_offsets = np.concatenate(([0], np.cumsum(ends - starts))).astype(np.uint64)
+
+        offsets, tofs, intensities = self.handle.merge_scan_ranges(
+            frames[rows].astype(np.uint32),
+            scan_begins[rows].astype(np.uint32),
+            scan_ends[rows].astype(np.uint32),
+            group_offsets,
+        )
+        offsets = offsets.astype(np.int64)
+        spectra = {"precursor": precursor_ids, "offsets": offsets}
+        if "tof" in columns:
+            spectra["tof"] = tofs
+        if "mz" in columns:
+            # Convert each spectrum with the calibration of the first frame of its precursor.
+            first_frames = np.repeat(
+                frames[starts[ends > starts]], np.diff(offsets)[ends > starts]
+            )
+            spectra["mz"] = self.tof_to_mz(tofs, first_frames)
+        if "intensity" in columns:
+            spectra["intensity"] = intensities
+        return spectra
+
+    @cached_property
+    def dia_windows(self) -> DiaWindows:
+        """The diaPASEF isolation windows (see DiaWindows), read on first use.
+
+        Raises:
+            RuntimeError: if the dataset has no DiaFrameMsMsInfo or DiaFrameMsMsWindows table.
+        """
+        tables = self.tables_names()
+        if "DiaFrameMsMsInfo" not in tables or "DiaFrameMsMsWindows" not in tables:
+            raise RuntimeError(
+                "No DiaFrameMsMsInfo or DiaFrameMsMsWindows table: this does not look like a diaPASEF dataset."
+            )
+        return DiaWindows(
+            self.table2dict("DiaFrameMsMsInfo"),
+            self.table2dict("DiaFrameMsMsWindows"),
+            self.ms1_frames,
+        )
+
+    def _dia_frames(self, window_groups, retention_time) -> npt.NDArray[np.int64]:
+        """Indices (into self.dia_windows.frames) of diaPASEF frames of the given groups, in the retention time range."""
+        dia = self.dia_windows
+        selected = np.isin(dia.frame_groups, window_groups)
+        if retention_time is not None:
+            times = self.retention_times[np.searchsorted(self.frames["Id"], dia.frames)]
+            selected &= (times >= retention_time[0]) & (times < retention_time[1])
+        return np.flatnonzero(selected)
+
+    def dia_query(
+        self,
+        window_group: int | typing.Iterable[int] | None = None,
+        isolation_mz: tuple[float, float] | None = None,
+        retention_time: tuple[float, float] | None = None,
+        columns: COLUMNS_TYPE = all_columns,
+    ):
+        """Get the peaks of diaPASEF frames within chosen isolation windows.
+
+        Only the scans covered by the chosen windows are decoded, and frames are processed in multiple threads.
+        Peaks are reported once even if they fall into several (overlapping) windows.
+
+        Args:
+            window_group (int, iterable, None): Window groups to choose. Default: all of them.
+            isolation_mz (tuple): Only choose windows whose isolation range (IsolationMz +/- IsolationWidth/2) overlaps this half-open m/z range.
+            retention_time (tuple): Half-open range of retention times of frames to choose.
+            columns (tuple|str): which columns to extract? Defaults to all possible columns.
+
+        Returns:
+            dict: column to numpy array mapping.
+        """
+        columns = self._check_columns(columns)
+        dia = self.dia_windows
+        ranges = dia.merged_scan_ranges(dia.select_windows(window_group, isolation_mz))
+        groups = np.array(sorted(ranges), dtype=np.int64)
+        empty = [np.empty(0, dtype=np.uint32)]
+        scan_begins = np.concatenate([ranges[g][0] for g in groups] + empty)
+        scan_ends = np.concatenate([ranges[g][1] for g in groups] + empty)
+        counts = np.array([len(ranges[g][0]) for g in groups], dtype=np.int64)
+        first_range = np.cumsum(counts) - counts
+        frame_idx = self._dia_frames(groups, retention_time)
+        # Each frame gets the ranges of its group.
+        group_pos = np.searchsorted(groups, dia.frame_groups[frame_idx])
+        rows = concatenated_ranges(first_range[group_pos], counts[group_pos])
+        _, data = self.handle.extract_scan_ranges(
+            np.repeat(dia.frames[frame_idx], counts[group_pos]),
+            scan_begins[rows],
+            scan_ends[rows],
+        )
+        return self._derived_columns(data, columns)
+
+    def dia_slabs(
+        self,
+        window_group: int | typing.Iterable[int] | None = None,
+        isolation_mz: tuple[float, float] | None = None,
+        retention_time: tuple[float, float] | None = None,
+        columns: COLUMNS_TYPE = all_columns,
+    ) -> typing.Iterator[tuple[int, DiaWindow, dict[str, npt.NDArray]]]:
+        """Iterate over the peaks of diaPASEF frames, one (cycle, window) slab at a time.
+
+        Arguments are as in dia_query. Each cycle is decoded in one multithreaded pass, so at most
+        one cycle worth of peaks is held in memory at a time.
+
+        Yields:
+            tuple: The cycle number (see DiaWindows.frame_cycles), the window (a DiaWindow), and the
+                peaks of the cycle's frames within the window, as a column to numpy array mapping.
+        """
+        columns = self._check_columns(columns)
+        dia = self.dia_windows
+        # Windows are sorted by group, so those of each group are consecutive.
+        windows = dia.select_windows(window_group, isolation_mz)
+        groups, first_window, counts = np.unique(dia.group[windows], return_index=True, return_counts=True)
+        frame_idx = self._dia_frames(groups, retention_time)
+        group_pos = np.searchsorted(groups, dia.frame_groups[frame_idx])
+        cycles = dia.frame_cycles[frame_idx]
+        # Frames are sorted, hence so are their cycles.
+        bounds = np.r_[0, np.flatnonzero(np.diff(cycles)) + 1, len(cycles)]
+        for cycle_begin, cycle_end in zip(bounds[:-1], bounds[1:]):
+            if cycle_begin == cycle_end:
+                continue
+            cycle_groups = group_pos[cycle_begin:cycle_end]
+            slab_windows = windows[concatenated_ranges(first_window[cycle_groups], counts[cycle_groups])]
+            row_offsets, data = self.handle.extract_scan_ranges(
+                np.repeat(dia.frames[frame_idx[cycle_begin:cycle_end]], counts[cycle_groups]),
+                dia.scan_begin[slab_windows],
+                dia.scan_end[slab_windows],
+            )
+            data = self._derived_columns(data, columns)
+            # Rows of the same window (from different frames of the cycle) make up one slab:
+            # gather the peaks of rows ordered by window, then cut them into slabs.
+            order = np.argsort(slab_windows, kind="stable")
+            row_offsets = np.asarray(row_offsets, dtype=np.int64)
+            row_sizes = np.diff(row_offsets)[order]
+            peaks = concatenated_ranges(row_offsets[:-1][order], row_sizes)
+            data = {c: data[c][peaks] for c in columns}
+            slab_windows, slab_rows = np.unique(slab_windows[order], return_index=True)
+            slab_bounds = np.r_[0, np.cumsum(row_sizes)][np.r_[slab_rows, len(order)]]
+            for window, begin, end in zip(slab_windows, slab_bounds[:-1], slab_bounds[1:]):
+                yield int(cycles[cycle_begin]), dia.window(window), {c: data[c][begin:end] for c in columns}
+
+    def write_tdf(
+        self,
+        out_dir: str | pathlib.Path,
+        frames: FRAMES_TYPE | None = None,
+        ms_level: int | None = None,
+        retention_time: tuple[float, float] | None = None,
+        scan: tuple[int, int] | None = None,
+        tof: tuple[int, int] | None = None,
+        mz: tuple[float, float] | None = None,
+        inv_ion_mobility: tuple[float, float] | None = None,
+        min_intensity: int = 0,
+        zstd_level: int = 3,
+        max_peaks: int = 10_000_000,
+        overwrite: bool = False,
+    ) -> pathlib.Path:
+        """Save a subset of the dataset as a new .d directory, readable by OpenTIMS.
+
+        The chosen frames are re-encoded, with only the peaks within the box described by the ranges
+        (half-open, None for no restriction, as in box_query), and compressed with zstd in multiple threads.
+        The new analysis.tdf is a copy of the original one with the Frames table updated, and rows of
+        other tables referring to frames that were left out (through a Frame column) removed. So are
+        precursors whose parent frame was left out, together with the rows referring to them (through
+        a Precursor column).
+        Frame Ids are kept. Requires the 'zstandard' package.
+
+        Args:
+            out_dir (str, Path): Directory to create the dataset in.
+            frames (int, iterable, slice, None): Frames to choose. Default: all of them.
+            ms_level (int, None): Only choose frames of this MS level: 1 for MS1 frames, 2 for all others.
+            retention_time (tuple): Only choose frames with retention times in this range (in seconds).
+            scan, tof, mz, inv_ion_mobility, min_intensity: Box to keep peaks from, as in box_query.
+            zstd_level (int): zstd compression level.
+            max_peaks (int): Number of source peaks to re-encode at a time; bounds memory use.
+            overwrite (bool): Replace an existing dataset in out_dir.
+
+        Returns:
+            pathlib.Path: out_dir.
+        """
+        from .writer import write_tdf
+
+        return write_tdf(
+            self,
+            out_dir,
+            frames,
+            ms_level,
+            retention_time,
+            scan,
+            tof,
+            mz,
+            inv_ion_mobility,
+            min_intensity,
+            zstd_level,
+            max_peaks,
+            overwrite,
         )
-        yield from self.query_iter(range(min_frame, max_frame), columns)
 
     def frame_array(self, frame: int):
         """Get a 2D array of data for a given frame.
@@ -509,6 +1300,43 @@ class OpenTIMS:
             return self.frame_arrays_slice(frames)
         return self.frame_arrays(frames)
 
+    def frame_digests(
+        self,
+        frames: FRAMES_TYPE = None,
+        algo: str = "xxh64",
+        columns: COLUMNS_TYPE = ("frame", "scan", "tof", "intensity"),
+    ) -> npt.NDArray[np.uint8]:
+        """Hash frames natively, in parallel.
+
+        The digest of a frame is the hash of its chosen raw columns concatenated in the order frame, scan, tof, intensity,
+        e.g. hashlib.blake2b(b"".join(X[c].tobytes() for c in columns), digest_size=32) for algo="blake2b".
+
+        Args:
+            frames (int, iterable, None): Frames to hash. Default: all of them.
+            algo (str): "xxh64" (fast, 8 byte digests, big-endian as in xxhash's digest) or "blake2b" (32 byte digests).
+            columns (tuple): Subset of the raw columns frame, scan, tof and intensity.
+        Returns:
+            np.ndarray: Digests of the frames, one row (np.uint8) per frame.
+        """
+        if isinstance(columns, str):
+            columns = (columns,)
+        frames = self._frame_ids(frames)
+        return self.handle.frame_digests(frames, algo, [c for c in all_columns if c in columns])
+
+    def verify(self, frames: FRAMES_TYPE = None) -> list[tuple[int, str]]:
+        """Check stored frames for corruption, in parallel, without extracting their peaks.
+
+        Checks that each packet lies within analysis.tdf_bin and agrees with the Frames table: its number of scans,
+        its successful decompression to the size implied by NumScans and NumPeaks, and scan headers accounting for
+        at most NumPeaks peaks.
+
+        Args:
+            frames (int, iterable, None): Frames to check. Default: all of them.
+        Returns:
+            list: (frame, description of the problem) for each bad frame; empty if all are fine.
+        """
+        return self.handle.verify(self._frame_ids(frames))
+
     def get_hash(
         self,
         columns: COLUMNS_TYPE = ("frame", "scan", "tof", "intensity"),
@@ -520,10 +1348,14 @@ class OpenTIMS:
 
         Args:
             columns (list): Columns for which to calculate the hash.
-            algo (object): Class with a call method for restarting hash calculations and an update method that accepts data.
+            algo (object|str): Class with a call method for restarting hash calculations and an update method that accepts data.
+                Or "xxh64"/"blake2b": then frames are hashed natively (see frame_digests) and the result is the root of
+                a Merkle tree over frame digests in frame order, which does not depend on the number of threads.
         Returns:
             binary str: A hash.
         """
+        if isinstance(algo, str):
+            return opentimspy.opentimspy_cpp.merkle_root(self.frame_digests(None, algo, columns), algo)
         h = algo()
         for X in self.query_iter(
             frames=slice(self.min_frame, self.max_frame + 1), columns=columns
@@ -543,10 +1375,13 @@ class OpenTIMS:
 
         Args:
             columns (list): Columns for which to calculate the hash.
-            algo (object): Class with a call method for restarting hash calculations and an update method that accepts data.
+            algo (object|str): Class with a call method for restarting hash calculations and an update method that accepts data.
+                Or "xxh64"/"blake2b": then frames are hashed natively, see frame_digests.
         Returns:
-            list: Frame specifc hashes.
+            list: Frame specifc hashes: per column hashes, or one digest per frame for native hashing.
         """
+        if isinstance(algo, str):
+            return [row.tobytes() for row in self.frame_digests(None, algo, columns)]
         return [
             hash_frame(X, columns, algo)
             for X in self.query_iter(
@@ -597,7 +1432,7 @@ class OpenTIMS:
         retention_time = np.array(
             retention_time
         )  # if someone passes a float or a pandas.Series
-        all_ms1_rts = self.retention_times[self.ms1_frames - 1]
+        all_ms1_rts = self.handle.ms_level_retention_times(1)
         assert all(
             retention_time <= all_ms1_rts[-1] + _buffer
         ), "Some retention times were higher than the last MS1 one."
@@ -901,6 +1736,10 @@ class OpenTIMS:
         Returns:
             np.array: Total Ion Current values per each frame. Frame N has its TIC at index N - min_frame.
         """
+        if self.index is not None:
+            res = np.zeros(shape=self.frames_no, dtype=np.uint32)
+            res[self.frames["Id"] - self.min_frame] = self.frame_stats["tic"]
+            return res
         res = np.empty(shape=self.frames_no, dtype=np.uint32)
         self.handle.per_frame_TIC(res)
         return res
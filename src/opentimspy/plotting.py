@@ -1,3 +1,11 @@
+from __future__ import annotations
+
+import collections
+import pathlib
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import numpy.typing as npt
 
@@ -155,3 +163,120 @@ def do_plot(
         plt.colorbar(label="intensity", shrink=0.4, aspect=6)
     else:
         plt.colorbar(label=transform + "(intensity)", shrink=0.4, aspect=6)
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + tag
+        + data
+        + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    )
+
+
+def encode_png(pixels: npt.NDArray[np.uint8], compress_level: int = 6) -> bytes:
+    """Encode an 8-bit image as PNG: pixels of shape (rows, columns) are grayscale, (rows, columns, 3) RGB."""
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    height, width = pixels.shape[:2]
+    color_type = 2 if pixels.ndim == 3 else 0
+    rows = np.zeros((height, 1 + pixels[0].size), dtype=np.uint8)  # each row starts with filter type 0
+    rows[:, 1:] = pixels.reshape(height, -1)
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(rows.tobytes(), compress_level))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def colormap_lut(cmap: str | None = "viridis") -> npt.NDArray[np.uint8] | None:
+    """256 RGB colors of a matplotlib colormap, or None (grayscale) for cmap=None or without matplotlib."""
+    if cmap is None:
+        return None
+    try:
+        from matplotlib import colormaps
+    except ImportError:
+        return None
+    colors = colormaps[cmap](np.linspace(0.0, 1.0, 256))[:, :3]
+    return np.uint8(colors * 255.0 + 0.5)
+
+
+def image_pixels(
+    image: npt.NDArray,
+    vmax: float,
+    intens_cutoff=0,
+    transform="",
+    lut: npt.NDArray[np.uint8] | None = None,
+) -> npt.NDArray[np.uint8]:
+    """Turn binned intensities into 8-bit pixels, scaled as in do_plot: 0 to transform(vmax)."""
+    if intens_cutoff > 0:
+        image = np.where(image < intens_cutoff, 0, image)
+    values = transforms[transform](image.astype(np.float64))
+    scale = 255.0 / transforms[transform](vmax) if vmax > 0 else 0.0
+    levels = np.uint8(np.clip(values * scale + 0.5, 0.0, 255.0))
+    return levels if lut is None else lut[levels]
+
+
+def render_frames(
+    ot,
+    frames,
+    output_dir: str | pathlib.Path,
+    x_axis: str = "mz",
+    x_range: tuple[float, float] = (0.0, 2000.0),
+    x_resolution: float = 1.0,
+    scan_range: tuple[int, int] | None = None,
+    intens_cutoff=0,
+    transform="",
+    max_intens=None,
+    cmap: str | None = "viridis",
+    workers: int | None = None,
+    batch_size: int = 32,
+    compress_level: int = 1,
+    name: str = "frame_{frame:06d}.png",
+):
+    """Save heatmaps of many frames as PNG files, without matplotlib figures.
+
+    Frames are binned batch by batch on one grid by OpenTIMS.frame_images, in multiple threads, while
+    the images of the previous batch are encoded by a pool of worker threads. Each bin is one pixel:
+    rows are scans (lowest at the top, as in do_plot) and columns x values; there are no axes.
+
+    Args:
+        ot (OpenTIMS): The dataset.
+        frames (iterable): Frames to render.
+        output_dir (str, Path): Directory to save the images to.
+        x_axis, x_range, x_resolution, scan_range: The grid, see OpenTIMS.frame_images.
+        intens_cutoff (int): Clamp binned intensities below this threshold to 0.
+        transform (str): Transform the intensities before scaling, see transforms.
+        max_intens (int): Intensity shown with the brightest color. Default: ot.max_intensity.
+        cmap (str, None): Matplotlib colormap, or None for grayscale (also used without matplotlib).
+        workers (int): Number of encoding threads. Default: as for ThreadPoolExecutor.
+        batch_size (int): Frames binned at once; at most about two batches of images are kept in memory.
+        compress_level (int): zlib compression level of the PNG files; higher levels make somewhat smaller
+            files, but encode several times slower.
+        name (str): Format of the file names, given the frame Id.
+
+    Yields:
+        pathlib.Path: The saved files, in the order of frames.
+    """
+    output_dir = pathlib.Path(output_dir)
+    frames = np.r_[frames].astype(np.uint32)
+    vmax = ot.max_intensity if max_intens is None else max_intens
+    lut = colormap_lut(cmap)
+
+    def save(frame_id, image):
+        path = output_dir / name.format(frame=int(frame_id))
+        pixels = image_pixels(image, vmax, intens_cutoff, transform, lut)
+        path.write_bytes(encode_png(pixels, compress_level))
+        return path
+
+    with ThreadPoolExecutor(workers) as pool:
+        pending = collections.deque()
+        for start in range(0, len(frames), batch_size):
+            batch = frames[start : start + batch_size]
+            images = ot.frame_images(batch, x_axis, x_range, x_resolution, scan_range)
+            pending.extend(pool.submit(save, frame_id, image) for frame_id, image in zip(batch, images))
+            while len(pending) > batch_size:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
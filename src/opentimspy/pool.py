@@ -0,0 +1,203 @@
+#    OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+#    Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+#
+#    Licensed under the MIT License. See LICENCE file in the project root for details.
+"""A process-wide cache of open datasets for long-running services."""
+from __future__ import annotations
+
+import copy
+import pathlib
+import threading
+from collections import OrderedDict
+
+from opentimspy.opentimspy_cpp import pressure_compensation_strategy, conversion_method
+
+from .opentims import OpenTIMS
+
+
+def _file_state(analysis_directory: pathlib.Path) -> tuple:
+    state = []
+    for name in ("analysis.tdf", "analysis.tdf_bin"):
+        stat = (analysis_directory / name).stat()
+        state.append((stat.st_size, stat.st_mtime_ns))
+    return tuple(state)
+
+
+class _PoolEntry:
+    def __init__(self, ot: OpenTIMS, file_state: tuple):
+        self.ot = ot
+        self.file_state = file_state
+        self.refcount = 0
+        self.stale = False
+
+    @property
+    def mapped_bytes(self) -> int:
+        return self.file_state[1][0]
+
+
+class HandlePool:
+    """Keep datasets open between uses and hand out shared views of them.
+
+    Each call to open() returns a separate OpenTIMS object, but all objects for the same
+    (path, pcs, conversion method) share one underlying TimsDataHandle, so the SQLite
+    parsing, memory mapping, buffer allocation and converter setup are only paid on the
+    first open. Closing such an object (or letting it be garbage collected) returns it to
+    the pool; the handle itself stays open until it is evicted.
+
+    Datasets are evicted, least recently used first, when more than max_handles of them
+    are open or when their analysis.tdf_bin files add up to more than max_mapped_bytes.
+    Datasets still in use are never evicted, so these limits may be exceeded temporarily.
+    A dataset whose files changed on disk since it was opened is reopened on the next
+    open(); the old handle is closed once it is no longer in use.
+
+    Shared handles are safe to use from multiple threads: frames are decoded into per-thread
+    buffers without changing the frame objects of the handle, and the methods which release
+    the GIL (frame_stats, frame_images) touch no other mutable state of the handle.
+
+    Settings kept by the handle, rather than by the OpenTIMS object, would leak from one
+    view to the others, so they are set for the whole pool: set_io(), enable_stats() and
+    reset_stats() raise on pooled views. Zone maps, being derived from the data alone, are
+    shared by all views.
+    """
+
+    def __init__(
+        self,
+        max_handles: int = 16,
+        max_mapped_bytes: int | None = None,
+        io: dict | None = None,
+        stats: bool = False,
+    ):
+        """Create an empty pool.
+
+        Args:
+            max_handles (int): Maximal number of datasets kept open (each takes a file descriptor and a memory mapping).
+            max_mapped_bytes (int or None): Maximal total size of memory-mapped analysis.tdf_bin files; None for no limit.
+            io (dict or None): Keyword arguments of OpenTIMS.set_io, applied to every dataset the pool opens.
+            stats (bool): Turn on the performance counters of every dataset the pool opens; see OpenTIMS.stats.
+        """
+        assert max_handles >= 0
+        self.max_handles = max_handles
+        self.max_mapped_bytes = max_mapped_bytes
+        self.io = {} if io is None else dict(io)
+        self.stats_enabled = stats
+        self._entries = OrderedDict()
+        # Reentrant: a view garbage collected while the lock is held releases itself.
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def open(
+        self,
+        analysis_directory: str | pathlib.Path,
+        pcs: pressure_compensation_strategy = pressure_compensation_strategy.NoPressureCompensation,
+        cm: conversion_method | None = None,
+    ) -> OpenTIMS:
+        """Get an OpenTIMS object for a dataset, reusing an open handle if possible.
+
+        Args:
+            analysis_directory (str, Path): path to the folder containing 'analysis.tdf' and 'analysis.tdf_bin'.
+            pcs: pressure compensation strategy, as in OpenTIMS.
+            cm: conversion method, as in OpenTIMS.
+
+        Returns:
+            OpenTIMS: a view of the shared dataset; close it (or use it as a context manager) when done.
+        """
+        analysis_directory = pathlib.Path(analysis_directory)
+        key = (
+            str(analysis_directory.resolve()),
+            pcs,
+            conversion_method.Default if cm is None else cm,
+        )
+        file_state = _file_state(analysis_directory)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.file_state != file_state:
+                self._detach(key, entry)
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                entry.refcount += 1
+                return self._lease(key, entry)
+            self.misses += 1
+
+        # Open outside of the lock, so that other datasets stay available meanwhile.
+        ot = OpenTIMS(analysis_directory, pcs, cm)
+        ot.set_io(**self.io)
+        ot.enable_stats(self.stats_enabled)
+        new_entry = _PoolEntry(ot, file_state)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.file_state != file_state:
+                if entry is not None:
+                    self._detach(key, entry)
+                entry = new_entry
+                self._entries[key] = entry
+            else:
+                # Another thread opened the same dataset in the meantime.
+                new_entry.ot.close()
+            entry.refcount += 1
+            self._evict()
+            return self._lease(key, entry)
+
+    def _lease(self, key, entry: _PoolEntry) -> OpenTIMS:
+        ot = copy.copy(entry.ot)
+        ot._shared = True
+        ot._on_close = lambda: self._release(key, entry)
+        return ot
+
+    def _release(self, key, entry: _PoolEntry):
+        with self._lock:
+            entry.refcount -= 1
+            if entry.stale and entry.refcount == 0:
+                entry.ot.close()
+            else:
+                self._evict()
+
+    def _detach(self, key, entry: _PoolEntry):
+        del self._entries[key]
+        entry.stale = True
+        if entry.refcount == 0:
+            entry.ot.close()
+
+    def _over_limits(self) -> bool:
+        if len(self._entries) > self.max_handles:
+            return True
+        if self.max_mapped_bytes is not None:
+            return sum(e.mapped_bytes for e in self._entries.values()) > self.max_mapped_bytes
+        return False
+
+    def _evict(self):
+        for key in list(self._entries):
+            if not self._over_limits():
+                break
+            entry = self._entries[key]
+            if entry.refcount == 0:
+                del self._entries[key]
+                entry.ot.close()
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Close all datasets not in use; the ones in use are closed when released."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                self._detach(key, entry)
+
+    def stats(self) -> dict:
+        """Counters describing the pool's effectiveness."""
+        with self._lock:
+            return {
+                "open": len(self._entries),
+                "in_use": sum(e.refcount > 0 for e in self._entries.values()),
+                "mapped_bytes": sum(e.mapped_bytes for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+default_pool = HandlePool()
@@ -1,12 +1,33 @@
 import numpy as np
-import sqlite3
 from collections import namedtuple
+from collections.abc import Mapping
 
+import opentimspy.opentimspy_cpp as opentimspy_cpp
 
-def _sql2list(path, query):
-    with sqlite3.connect(path) as conn:
-        c = conn.cursor()
-        return list(c.execute(query))
+
+def _as_arrays(columns):
+    return {
+        col: values if isinstance(values, np.ndarray) else np.array(values)
+        for col, values in columns.items()
+    }
+
+
+def sql2dict(path, query, params=()):
+    """Run a query against the SQLite db and return its result column by column.
+
+    The query is executed natively and numeric columns are filled directly into numpy arrays.
+
+    Arguments:
+        path (str): Path to the sqlite db.
+        query (str): The SQL query; may contain '?' placeholders.
+        params (iterable): Strings bound to the placeholders.
+
+    Returns:
+        dict: Maps column name to a numpy array of values.
+    """
+    return _as_arrays(
+        opentimspy_cpp.sql_query(str(path), query, [str(p) for p in params])
+    )
 
 
 def tables_names(path):
@@ -19,27 +40,92 @@ def tables_names(path):
         list: Names of tables in 'analysis.tdf'.
     """
     sql = "SELECT name FROM sqlite_master WHERE TYPE = 'table'"
-    return [name_tup[0] for name_tup in _sql2list(path, sql)]
+    return list(sql2dict(path, sql)["name"])
 
 
 def table2dict(path, name):
     """Retrieve a dictionary from a table with a given name.
 
-    This function is simply great for injection attacks (:
-    Don't do that.
+    The table is read natively in a single pass: integer columns become int64 arrays,
+    columns with any floating point value become float64 arrays (NULLs in numeric
+    columns become NaN), and text columns become arrays of strings.
 
     Args:
         name (str): Name of the table to extract.
     Returns:
-        dict: Maps column name to a list of values.
+        dict: Maps column name to a numpy array of values.
+    """
+    columns = opentimspy_cpp.read_sql_table(str(path), name)
+    assert columns is not None, f"Table '{name}' is not in the database."
+    return _as_arrays(columns)
+
+
+class KeyedRows(Mapping):
+    """Read-only mapping from primary key to a row namedtuple.
+
+    Rows are built from the underlying columns only when they are accessed,
+    so wrapping a large table costs nothing up front.
     """
-    assert name in tables_names(path), f"Table '{name}' is not in the database."
-    _, colnames, _, _, _, _ = zip(*_sql2list(path, f"PRAGMA table_info({name});"))
-    rows = _sql2list(path, f"SELECT * FROM {name}")
-    if not rows:
-        return {col: np.array([]) for col in colnames}
-    colvalues = zip(*rows)
-    return dict(zip(colnames, (np.array(values) for values in colvalues)))
+
+    def __init__(self, name, columns, key):
+        self.name = name
+        self.columns = columns
+        self.key = key
+        self._row_type = namedtuple(name + "_row", columns)
+        keys = columns[key]
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._order]
+
+    def _row_idx(self, key):
+        pos = np.searchsorted(self._sorted_keys, key)
+        if pos >= len(self._sorted_keys) or self._sorted_keys[pos] != key:
+            raise KeyError(key)
+        return self._order[pos]
+
+    def _row(self, idx):
+        return self._row_type(
+            *(
+                values[idx].item() if isinstance(values[idx], np.generic) else values[idx]
+                for values in self.columns.values()
+            )
+        )
+
+    def __getitem__(self, key):
+        return self._row(self._row_idx(key))
+
+    def __iter__(self):
+        return iter(self.columns[self.key].tolist())
+
+    def __len__(self):
+        return len(self.columns[self.key])
+
+    def __contains__(self, key):
+        try:
+            self._row_idx(key)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def rows(self):
+        """Iterate over the rows of the table, lazily, in storage order."""
+        for idx in range(len(self)):
+            yield self._row(idx)
+
+
+def table2keyed_rows(path, name):
+    """Retrieve a lazy mapping from the primary key of a table to its rows.
+
+    Args:
+        path (str): Path to the sqlite db.
+        name (str): Name of the table to extract.
+    Returns:
+        KeyedRows: Maps primary key value to a namedtuple containing the row.
+    """
+    sql_key = sql2dict(
+        path, "SELECT name FROM pragma_table_info(?) WHERE pk == 1", [name]
+    )["name"]
+    assert len(sql_key) == 1
+    return KeyedRows(name, table2dict(path, name), sql_key[0])
 
 
 def table2keyed_dict(connection, tblname):
@@ -0,0 +1,231 @@
+#    OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+#    Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+#
+#    Licensed under the MIT License. See LICENCE file in the project root for details.
+"""Quick summaries of runs, for triaging many datasets.
+
+    summarize("run.d")                          # metadata only: reads analysis.tdf, not analysis.tdf_bin
+    summarize("run.d", sample_fraction=0.05)    # also decodes 5% of the frames, evenly spread over the run
+    for summary in summarize_runs(paths, jobs=8):
+        ...
+
+Metadata statistics come from the Frames table (NumPeaks, NumScans, SummedIntensities,
+MaxIntensity, MsMsType, Time) and GlobalMetadata; peak-level statistics, prefixed with
+"sample_", come from the decoded sample.
+"""
+from __future__ import annotations
+
+import functools
+import os
+import pathlib
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import opentimspy.opentimspy_cpp as opentimspy_cpp
+
+from .opentims import OpenTIMS, conversion_method
+from .sql import sql2dict, table2dict
+
+_FRAME_COLUMNS = ("Id", "Time", "MsMsType", "NumScans", "NumPeaks", "SummedIntensities", "MaxIntensity")
+
+# Peaks decoded at a time by sample_summary.
+_SAMPLE_CHUNK_PEAKS = 1_000_000
+
+# MsMsType of the MS2 frames of each acquisition mode.
+_ACQUISITIONS = {8: "DDA-PASEF", 9: "DIA-PASEF"}
+
+
+def _float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def metadata_summary(analysis_directory: str | pathlib.Path) -> dict:
+    """Summarize a run from analysis.tdf alone; see summarize."""
+    tdf = pathlib.Path(analysis_directory) / "analysis.tdf"
+    if not tdf.exists():
+        raise RuntimeError(f"Missing: {tdf}")
+    frames = sql2dict(tdf, f"SELECT {', '.join(_FRAME_COLUMNS)} FROM Frames ORDER BY Id")
+    metadata = table2dict(tdf, "GlobalMetadata")
+    metadata = {str(key): str(value) for key, value in zip(metadata["Key"], metadata["Value"])}
+
+    times = frames["Time"].astype(np.float64)
+    ms_types = frames["MsMsType"]
+    num_peaks = frames["NumPeaks"].astype(np.int64)
+    tic = frames["SummedIntensities"].astype(np.int64)
+    ms1 = ms_types == 0
+    ms2_types = set(np.unique(ms_types[~ms1]).tolist())
+
+    n_frames = len(times)
+    rt_total = float(times[-1] - times[0]) if n_frames else 0.0
+    ms1_positions = np.flatnonzero(ms1)
+    # Frames from one MS1 frame to the next; the median is robust to an interrupted first or last cycle.
+    cycle_length = float(np.median(np.diff(ms1_positions))) if len(ms1_positions) > 1 else None
+
+    if not ms2_types:
+        acquisition = "MS1"
+    elif len(ms2_types) == 1 and next(iter(ms2_types)) in _ACQUISITIONS:
+        acquisition = _ACQUISITIONS[next(iter(ms2_types))]
+    else:
+        acquisition = "MsMsType " + ",".join(map(str, sorted(ms2_types)))
+
+    frames_per_minute = 60.0 * n_frames / rt_total if rt_total > 0 else None
+    return {
+        "path": str(analysis_directory),
+        "acquisition": acquisition,
+        "acquisition_date": metadata.get("AcquisitionDateTime"),
+        "instrument": metadata.get("InstrumentName"),
+        "frames": n_frames,
+        "ms1_frames": int(ms1.sum()),
+        "ms2_frames": int((~ms1).sum()),
+        "rt_start": float(times[0]) if n_frames else None,
+        "rt_end": float(times[-1]) if n_frames else None,
+        "rt_total": rt_total,
+        "frames_per_minute": frames_per_minute,
+        "cycle_length": cycle_length,
+        "cycles_per_minute": frames_per_minute / cycle_length if frames_per_minute and cycle_length else None,
+        "num_scans": int(frames["NumScans"].max()) if n_frames else 0,
+        "peaks": int(num_peaks.sum()),
+        "mean_peaks_per_frame": float(num_peaks.mean()) if n_frames else None,
+        "max_peaks_per_frame": int(num_peaks.max()) if n_frames else 0,
+        "tic": int(tic.sum()),
+        "ms1_tic": int(tic[ms1].sum()),
+        "ms2_tic": int(tic[~ms1].sum()),
+        "ms1_tic_apex_rt": float(times[ms1_positions[np.argmax(tic[ms1])]]) if len(ms1_positions) else None,
+        "max_intensity": int(frames["MaxIntensity"].max()) if n_frames else 0,
+        "min_mz": _float(metadata.get("MzAcqRangeLower")),
+        "max_mz": _float(metadata.get("MzAcqRangeUpper")),
+        "min_inv_ion_mobility": _float(metadata.get("OneOverK0AcqRangeLower")),
+        "max_inv_ion_mobility": _float(metadata.get("OneOverK0AcqRangeUpper")),
+    }
+
+
+def _quantile(values: np.ndarray, counts: np.ndarray, q: float) -> float:
+    """q-th quantile of data given as sorted distinct values and their counts, interpolated linearly as by np.quantile."""
+    position = q * (counts.sum() - 1)
+    below = int(np.floor(position))
+    ends = np.cumsum(counts)
+    low, high = values[np.searchsorted(ends, [below, below + 1], side="right").clip(max=len(values) - 1)]
+    return float(low + (float(high) - float(low)) * (position - below))
+
+
+def sample_summary(analysis_directory: str | pathlib.Path, sample_fraction: float) -> dict:
+    """Peak-level statistics of a sample of the frames of a run; see summarize.
+
+    The sample is decoded chunk by chunk, keeping running extremes and sums, and the counts of distinct
+    intensities for the quantiles: memory does not grow with the size of the sample.
+    """
+    if not 0.0 < sample_fraction <= 1.0:
+        raise ValueError(f"sample_fraction must be in (0, 1], got: {sample_fraction}")
+    summary = {
+        "sample_frames": 0,
+        "sample_peaks": 0,
+        "sample_min_scan": None,
+        "sample_max_scan": None,
+        "sample_min_tof": None,
+        "sample_max_tof": None,
+        "sample_mean_intensity": None,
+        "sample_median_intensity": None,
+        "sample_p99_intensity": None,
+    }
+    peaks = 0
+    summed = 0
+    lowest, highest = {}, {}
+    intensities = np.empty(0, dtype=np.uint32)
+    counts = np.empty(0, dtype=np.int64)
+    with OpenTIMS(analysis_directory, cm=conversion_method.NoConversion) as ot:
+        ids = ot.frames["Id"]
+        count = min(len(ids), max(1, round(sample_fraction * len(ids))))
+        # Evenly spread over the run, so that the whole gradient is represented.
+        sample = ids[np.unique(np.linspace(0, len(ids) - 1, count).round().astype(np.int64))] if len(ids) else ids
+        summary["sample_frames"] = len(sample)
+        for chunk in ot.iter_chunks(sample, columns=("scan", "tof", "intensity"), max_peaks=_SAMPLE_CHUNK_PEAKS):
+            if not len(chunk["intensity"]):
+                continue
+            peaks += len(chunk["intensity"])
+            summed += int(chunk["intensity"].sum(dtype=np.uint64))
+            for column in ("scan", "tof"):
+                lowest[column] = min(lowest.get(column, np.inf), int(chunk[column].min()))
+                highest[column] = max(highest.get(column, -1), int(chunk[column].max()))
+            values, value_counts = np.unique(chunk["intensity"], return_counts=True)
+            intensities, positions = np.unique(np.r_[intensities, values], return_inverse=True)
+            counts = np.bincount(positions, weights=np.r_[counts, value_counts], minlength=len(intensities)).astype(np.int64)
+
+    summary["sample_peaks"] = peaks
+    if peaks:
+        summary.update(
+            sample_min_scan=lowest["scan"],
+            sample_max_scan=highest["scan"],
+            sample_min_tof=lowest["tof"],
+            sample_max_tof=highest["tof"],
+            sample_mean_intensity=summed / peaks,
+            sample_median_intensity=_quantile(intensities, counts, 0.5),
+            sample_p99_intensity=_quantile(intensities, counts, 0.99),
+        )
+    return summary
+
+
+def summarize(analysis_directory: str | pathlib.Path, sample_fraction: float = 0.0) -> dict:
+    """Summarize a run quickly.
+
+    Without sampling, only analysis.tdf is read, so the summary takes about as long as reading
+    the Frames table. With sampling, a fraction of the frames, evenly spread over the run,
+    is decoded (in multiple threads, without m/z or ion mobility conversion).
+
+    Args:
+        analysis_directory (str, Path): folder containing 'analysis.tdf' and 'analysis.tdf_bin'.
+        sample_fraction (float): Fraction of frames to decode for peak-level statistics; 0 to decode none.
+            At least one frame is decoded if it is positive.
+
+    Returns:
+        dict: Statistic name to value (None when it is undefined, e.g. the cycle length of a run with one MS1 frame).
+            Times are in seconds; cycle_length is the median number of frames from one MS1 frame to the next.
+    """
+    summary = metadata_summary(analysis_directory)
+    if sample_fraction:
+        summary.update(sample_summary(analysis_directory, sample_fraction))
+    return summary
+
+
+def _init_worker(threads: int):
+    opentimspy_cpp.set_num_threads(threads)
+
+
+def _summarize_or_error(analysis_directory, sample_fraction: float) -> dict:
+    try:
+        return summarize(analysis_directory, sample_fraction)
+    except Exception as e:
+        return {"path": str(analysis_directory), "error": f"{type(e).__name__}: {e}"}
+
+
+def summarize_runs(
+    paths: typing.Iterable[str | pathlib.Path],
+    sample_fraction: float = 0.0,
+    jobs: int | None = None,
+) -> typing.Iterator[dict]:
+    """Summarize many runs concurrently, in separate processes.
+
+    A run that cannot be summarized does not stop the others: its summary is {'path': ..., 'error': ...}.
+
+    Args:
+        paths (iterable): Runs to summarize.
+        sample_fraction (float): As in summarize.
+        jobs (int): Number of worker processes. Default: one per core; 1 summarizes in this process.
+
+    Yields:
+        dict: Summaries, in the order of paths.
+    """
+    paths = list(paths)
+    jobs = min(jobs or os.cpu_count() or 1, max(len(paths), 1))
+    work = functools.partial(_summarize_or_error, sample_fraction=sample_fraction)
+    if jobs == 1:
+        yield from map(work, paths)
+        return
+    # Share the cores between the workers' decoding threads.
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(threads,)) as pool:
+        yield from pool.map(work, paths)
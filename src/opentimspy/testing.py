@@ -0,0 +1,234 @@
+#    OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+#    Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+#
+#    Licensed under the MIT License. See LICENCE file in the project root for details.
+"""Synthetic TDF datasets, for tests and benchmarks at realistic sizes.
+
+The data are random (no peptides, isotopic patterns or elution profiles), but
+the files are valid: OpenTIMS reads them like instrument data, including the
+open-source m/z and inverse ion mobility conversions. Requires the `zstandard`
+package (pip install opentimspy[writer]).
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import contextlib
+import os
+import pathlib
+import sqlite3
+import struct
+import typing
+
+import numpy as np
+
+from .writer import _compressor_pool, encode_frame_payload
+
+DIGITIZER_NUM_SAMPLES = 434064
+FRAME_PERIOD = 0.1  # seconds
+
+GLOBAL_METADATA = {
+    "SchemaType": "TDF",
+    "SchemaVersionMajor": "3",
+    "SchemaVersionMinor": "7",
+    "AcquisitionSoftwareVendor": "Bruker",
+    "InstrumentVendor": "Bruker",
+    "ClosedProperly": "1",
+    "TimsCompressionType": "2",
+    "DigitizerNumSamples": str(DIGITIZER_NUM_SAMPLES),
+    "MzAcqRangeLower": "100.000000",
+    "MzAcqRangeUpper": "1700.000000",
+    "OneOverK0AcqRangeLower": "0.600000",
+    "OneOverK0AcqRangeUpper": "1.600000",
+    "AcquisitionSoftware": "timsTOF",
+    "AcquisitionSoftwareVersion": "4.0.5",
+    "InstrumentName": "synthetic",
+    "SampleName": "opentimspy.testing.synthesize_tdf",
+    "PeakWidthEstimateValue": "0.000025",
+    "PeakListIndexScaleFactor": "1",
+}
+
+# Calibrations taken from a real run; only used by Bruker's conversion library.
+MZ_CALIBRATION = (
+    1, 2, 0.2, 18290.0, 25.353281850324734, 25.813574051301327, 20.0, 0.0, 319.7503329247901,
+    154829.60678941052, -0.001040750146883009, 319.7503329247901, -0.001040750146883009, 225.951491,
+    1519.712539, 7, -0.0043683204947120545, 0.00012177064496731006, -7.730837368063309e-07,
+    1.9667556408381262e-09, -2.3445026756938558e-12, 1.3101290806617338e-15, -2.770441001766999e-19,
+)
+TIMS_CALIBRATION = (
+    1, 2, 1, 917, 219.68855633492714, 73.23690980203908, 33.027522935779814, 1, 0.04573424425506575,
+    127.25805761386512, 12.589266611689046, 4779.789594949304,
+)
+
+SCHEMA = """
+CREATE TABLE GlobalMetadata (Key TEXT PRIMARY KEY, Value TEXT);
+CREATE TABLE Frames (
+    Id INTEGER PRIMARY KEY, Time REAL NOT NULL, Polarity CHAR(1) NOT NULL, ScanMode INTEGER NOT NULL,
+    MsMsType INTEGER NOT NULL, TimsId INTEGER, MaxIntensity INTEGER NOT NULL,
+    SummedIntensities INTEGER NOT NULL, NumScans INTEGER NOT NULL, NumPeaks INTEGER NOT NULL,
+    MzCalibration INTEGER NOT NULL, T1 REAL NOT NULL, T2 REAL NOT NULL, TimsCalibration INTEGER NOT NULL,
+    PropertyGroup INTEGER, AccumulationTime REAL NOT NULL, RampTime REAL NOT NULL, Pressure REAL);
+CREATE TABLE MzCalibration (
+    Id INTEGER PRIMARY KEY, ModelType INTEGER NOT NULL, DigitizerTimebase REAL NOT NULL,
+    DigitizerDelay REAL NOT NULL, T1 REAL NOT NULL, T2 REAL NOT NULL, dC1 REAL NOT NULL, dC2 REAL NOT NULL,
+    C0, C1, C2, C3, C4, C5, C6, C7, C8, C9, C10, C11, C12, C13, C14);
+CREATE TABLE TimsCalibration (Id INTEGER PRIMARY KEY, ModelType INTEGER NOT NULL, C0, C1, C2, C3, C4, C5, C6, C7, C8, C9);
+"""
+
+DIA_SCHEMA = """
+CREATE TABLE DiaFrameMsMsWindowGroups (Id INTEGER PRIMARY KEY);
+CREATE TABLE DiaFrameMsMsWindows (
+    WindowGroup INTEGER NOT NULL, ScanNumBegin INTEGER NOT NULL, ScanNumEnd INTEGER NOT NULL,
+    IsolationMz REAL NOT NULL, IsolationWidth REAL NOT NULL, CollisionEnergy REAL NOT NULL,
+    PRIMARY KEY(WindowGroup, ScanNumBegin)) WITHOUT ROWID;
+CREATE TABLE DiaFrameMsMsInfo (Frame INTEGER PRIMARY KEY, WindowGroup INTEGER NOT NULL);
+"""
+
+PASEF_SCHEMA = """
+CREATE TABLE Precursors (
+    Id INTEGER PRIMARY KEY, LargestPeakMz REAL NOT NULL, AverageMz REAL NOT NULL, MonoisotopicMz REAL,
+    Charge INTEGER, ScanNumber REAL NOT NULL, Intensity REAL NOT NULL, Parent INTEGER);
+CREATE TABLE PasefFrameMsMsInfo (
+    Frame INTEGER NOT NULL, ScanNumBegin INTEGER NOT NULL, ScanNumEnd INTEGER NOT NULL,
+    IsolationMz REAL NOT NULL, IsolationWidth REAL NOT NULL, CollisionEnergy REAL,
+    Precursor INTEGER, PRIMARY KEY(Frame, ScanNumBegin)) WITHOUT ROWID;
+"""
+
+ACQUISITIONS = ("ms1", "dia", "pasef")
+_MS2_TYPE = {"dia": 9, "pasef": 8}
+
+
+def _frame_peaks(seed: int, frame: int, num_peaks: int, num_scans: int):
+    """Random peaks of one frame, sorted by scan and TOF; depends only on (seed, frame)."""
+    rng = np.random.default_rng([seed, frame])
+    scans = rng.integers(0, num_scans, num_peaks)
+    tofs = rng.integers(0, DIGITIZER_NUM_SAMPLES, num_peaks)
+    order = np.argsort(scans * DIGITIZER_NUM_SAMPLES + tofs)
+    intensities = rng.geometric(0.02, num_peaks).astype(np.uint32) + 9
+    return scans[order], tofs[order], intensities
+
+
+def synthesize_tdf(
+    path: str | pathlib.Path,
+    n_frames: int = 100,
+    peaks_per_frame: int | typing.Callable[[np.random.Generator, int], np.ndarray] = 10_000,
+    num_scans: int = 918,
+    ms2_ratio: float = 0.0,
+    acquisition: str = "dia",
+    window_groups: int = 8,
+    seed: int = 0,
+    zstd_level: int = 1,
+    overwrite: bool = False,
+) -> pathlib.Path:
+    """Write a synthetic TDF dataset.
+
+    Frames come in cycles of one MS1 frame followed by MS2 frames. For DIA, each MS2 frame
+    cycles through window_groups window groups, each with 4 scan windows; for DDA-PASEF, each
+    MS2 frame fragments 4 precursors of the preceding MS1 frame in disjoint scan windows.
+    The output depends only on the arguments (not on the number of threads), and frames are
+    generated and compressed in multiple threads.
+
+    Args:
+        path (str, Path): The .d directory to create.
+        n_frames (int): Number of frames.
+        peaks_per_frame (int, callable): Mean number of peaks per frame (Poisson distributed), or a function
+            taking a numpy random Generator and n_frames and returning the numbers of peaks in each frame.
+        num_scans (int): Number of scans in each frame.
+        ms2_ratio (float): Fraction of MS2 frames, in [0, 1).
+        acquisition (str): MS2 layout: 'ms1' (no MS2 tables), 'dia' or 'pasef'.
+        window_groups (int): Number of DIA window groups.
+        seed (int): Seed of the random data.
+        zstd_level (int): zstd compression level.
+        overwrite (bool): Replace an existing dataset at path.
+
+    Returns:
+        pathlib.Path: path.
+    """
+    assert acquisition in ACQUISITIONS, f"acquisition must be one of {ACQUISITIONS}"
+    assert 0.0 <= ms2_ratio < 1.0, "ms2_ratio must be in [0, 1)"
+    assert acquisition != "ms1" or ms2_ratio == 0.0, "MS2 frames need a 'dia' or 'pasef' acquisition"
+    compress = _compressor_pool(zstd_level)
+    path = pathlib.Path(path)
+    for name in ("analysis.tdf", "analysis.tdf_bin"):
+        if (path / name).exists():
+            if not overwrite:
+                raise FileExistsError(f"{path / name} already exists; pass overwrite=True to replace it.")
+            (path / name).unlink()
+    path.mkdir(parents=True, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    if callable(peaks_per_frame):
+        num_peaks = np.asarray(peaks_per_frame(rng, n_frames), dtype=np.int64)
+    else:
+        num_peaks = rng.poisson(peaks_per_frame, n_frames)
+    cycle_length = int(round(1.0 / (1.0 - ms2_ratio)))
+    frame_ids = np.arange(1, n_frames + 1)
+    position_in_cycle = (frame_ids - 1) % cycle_length
+    ms_types = np.where(position_in_cycle == 0, 0, _MS2_TYPE.get(acquisition, 0))
+
+    def make_frame(ii):
+        scans, tofs, intensities = _frame_peaks(seed, int(frame_ids[ii]), int(num_peaks[ii]), num_scans)
+        packet = compress(encode_frame_payload(num_scans, scans, tofs, intensities))
+        stats = (int(intensities.max(initial=0)), int(intensities.sum(dtype=np.uint64)))
+        return packet, stats
+
+    frames_rows = []
+    tims_id = 0
+    with open(path / "analysis.tdf_bin", "wb") as tdf_bin, concurrent.futures.ThreadPoolExecutor(
+        os.cpu_count()
+    ) as executor:
+        # Bounded look-ahead keeps memory use independent of the number of frames.
+        batch = 4 * (os.cpu_count() or 1)
+        for start in range(0, n_frames, batch):
+            for ii, (packet, (max_intensity, summed)) in enumerate(
+                executor.map(make_frame, range(start, min(start + batch, n_frames))), start
+            ):
+                tdf_bin.write(struct.pack("<II", len(packet) + 8, num_scans))
+                tdf_bin.write(packet)
+                frames_rows.append((
+                    int(frame_ids[ii]), ii * FRAME_PERIOD + 1.0, "+", 9 if acquisition == "dia" else 8,
+                    int(ms_types[ii]), tims_id, max_intensity, summed, num_scans, int(num_peaks[ii]),
+                    1, 25.35, 25.81, 1, None, 100.0, 100.0, 2.5,
+                ))
+                tims_id += len(packet) + 8
+
+    with contextlib.closing(sqlite3.connect(path / "analysis.tdf")) as conn:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO GlobalMetadata VALUES (?, ?)", GLOBAL_METADATA.items())
+        conn.executemany("INSERT INTO Frames VALUES (" + ", ".join("?" * 18) + ")", frames_rows)
+        conn.execute("INSERT INTO MzCalibration VALUES (" + ", ".join("?" * len(MZ_CALIBRATION)) + ")", MZ_CALIBRATION)
+        conn.execute("INSERT INTO TimsCalibration VALUES (" + ", ".join("?" * len(TIMS_CALIBRATION)) + ")", TIMS_CALIBRATION)
+        ms2_frames = frame_ids[ms_types != 0]
+        windows = np.linspace(0, num_scans, 5).astype(int)
+        if acquisition == "dia":
+            conn.executescript(DIA_SCHEMA)
+            conn.executemany(
+                "INSERT INTO DiaFrameMsMsWindowGroups VALUES (?)", [(g,) for g in range(1, window_groups + 1)]
+            )
+            width = 1200.0 / (4 * window_groups)
+            conn.executemany(
+                "INSERT INTO DiaFrameMsMsWindows VALUES (?, ?, ?, ?, ?, 30.0)",
+                [
+                    (g, int(windows[w]), int(windows[w + 1]), 400.0 + ((w * window_groups) + g - 0.5) * width, width)
+                    for g in range(1, window_groups + 1)
+                    for w in range(4)
+                ],
+            )
+            conn.executemany(
+                "INSERT INTO DiaFrameMsMsInfo VALUES (?, ?)",
+                [(int(f), int(i % window_groups) + 1) for i, f in enumerate(ms2_frames)],
+            )
+        elif acquisition == "pasef":
+            conn.executescript(PASEF_SCHEMA)
+            precursors, pasef_rows = [], []
+            for frame in ms2_frames:
+                parent = int(frame - (frame - 1) % cycle_length)
+                for w in range(4):
+                    precursor = len(precursors) + 1
+                    mz = 400.0 + 800.0 * ((precursor * 0.618034) % 1.0)
+                    scan = (windows[w] + windows[w + 1]) / 2.0
+                    precursors.append((precursor, mz, mz, mz, 2, scan, 10000.0, parent))
+                    pasef_rows.append((int(frame), int(windows[w]), int(windows[w + 1]), mz, 2.0, 30.0, precursor))
+            conn.executemany("INSERT INTO Precursors VALUES (?, ?, ?, ?, ?, ?, ?, ?)", precursors)
+            conn.executemany("INSERT INTO PasefFrameMsMsInfo VALUES (?, ?, ?, ?, ?, ?, ?)", pasef_rows)
+        conn.commit()
+    return path
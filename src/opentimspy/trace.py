@@ -0,0 +1,88 @@
+#    OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+#    Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+#
+#    Licensed under the MIT License. See LICENCE file in the project root for details.
+"""Tracing of native data extraction, saved in the Chrome trace event format.
+
+    with opentimspy.trace(ot, path="extraction.json"):
+        ot.query(columns=("mz", "intensity"))
+
+The file opens in chrome://tracing or https://ui.perfetto.dev, with one track per
+worker thread (and one for the calling thread) and one span per stage (decompress,
+decode, ...) of every frame.
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import pathlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from .opentims import OpenTIMS
+
+
+class Trace:
+    """Spans recorded by trace(), available once its block exits."""
+
+    def __init__(self):
+        self.events: list[dict] = []
+        self.dropped = 0
+
+    def _collect(self, pid: int, ot: OpenTIMS):
+        spans = ot.handle.take_trace()
+        self.dropped += spans["dropped"]
+        names = spans["stage_names"]
+        self.events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": str(ot.analysis_directory)}})
+        for thread in sorted(set(spans["thread"].tolist())):
+            self.events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": f"worker {thread - 1}" if thread else "calling thread"}})
+        for start, duration, peaks, frame, thread, stage in zip(
+            *(spans[c].tolist() for c in ("start_ns", "duration_ns", "peaks", "frame", "thread", "stage"))
+        ):
+            self.events.append(
+                {
+                    "name": names[stage],
+                    "cat": "opentims",
+                    "ph": "X",
+                    "ts": start / 1e3,
+                    "dur": duration / 1e3,
+                    "pid": pid,
+                    "tid": thread,
+                    "args": {"frame": frame, "peaks": peaks},
+                }
+            )
+
+    def to_chrome(self) -> dict:
+        """The trace as a Chrome trace event JSON object."""
+        return {"traceEvents": self.events, "displayTimeUnit": "ns", "otherData": {"dropped_spans": self.dropped}}
+
+    def save(self, path: str | pathlib.Path):
+        with open(path, "w") as f:
+            json.dump(self.to_chrome(), f)
+
+
+@contextlib.contextmanager
+def trace(*datasets: OpenTIMS, path: str | pathlib.Path | None = None, capacity: int = 1_000_000):
+    """Record spans of native extraction in the datasets while the block runs.
+
+    Args:
+        *datasets (OpenTIMS): Datasets to trace.
+        path (str|pathlib.Path|None): Save the trace there on exit.
+        capacity (int): Number of most recent spans kept per dataset; older ones are dropped and counted.
+
+    Yields:
+        Trace: filled in when the block exits.
+    """
+    for ot in datasets:
+        ot._check_not_shared("trace")
+    result = Trace()
+    for ot in datasets:
+        ot.handle.start_trace(capacity)
+    try:
+        yield result
+    finally:
+        for pid, ot in enumerate(datasets):
+            ot.handle.stop_trace()
+            result._collect(pid, ot)
+        if path is not None:
+            result.save(path)
@@ -0,0 +1,169 @@
+#    OpenTIMS: a fully open-source library for opening Bruker's TimsTOF data files.
+#    Copyright (C) 2020-2024 Michał Startek and Mateusz Łącki
+#
+#    Licensed under the MIT License. See LICENCE file in the project root for details.
+"""Writing subsets of datasets as new .d directories in the TDF format.
+
+Frames are re-encoded natively (see TimsDataHandle.encode_frames) and compressed
+with zstd by the optional `zstandard` package (pip install opentimspy[writer]).
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import contextlib
+import os
+import pathlib
+import sqlite3
+import struct
+import threading
+import typing
+
+import numpy as np
+
+if typing.TYPE_CHECKING:
+    from .opentims import OpenTIMS
+
+
+def _compressor_pool(zstd_level: int):
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "Writing TDF files requires the 'zstandard' package: pip install opentimspy[writer]"
+        ) from e
+    local = threading.local()
+
+    def compress(payload) -> bytes:
+        # Compressors are not thread-safe: keep one per worker thread.
+        if not hasattr(local, "compressor"):
+            local.compressor = zstandard.ZstdCompressor(level=zstd_level)
+        return local.compressor.compress(payload)
+
+    return compress
+
+
+def encode_frame_payload(num_scans: int, scans, tofs, intensities) -> np.ndarray:
+    """Lay peaks out as the content of a TDF frame packet, before compression.
+
+    Args:
+        num_scans (int): Number of scans in the frame.
+        scans, tofs, intensities (np.ndarray): The peaks, sorted by scan and then by TOF. Intensities are
+            stored as they are, i.e. they are the decoded values for an AccumulationTime of 100.
+
+    Returns:
+        np.ndarray: The payload, as np.uint8.
+    """
+    scans = np.asarray(scans, dtype=np.int64)
+    tofs = np.asarray(tofs, dtype=np.int64)
+    values = np.empty(num_scans + 2 * len(tofs), dtype="<u4")
+    if num_scans > 0:
+        values[0] = num_scans
+        values[1:num_scans] = 2 * np.bincount(scans, minlength=num_scans)[: num_scans - 1]
+    # TOFs are stored as deltas within a scan, starting from -1.
+    previous = np.r_[-1, tofs[:-1]]
+    previous[np.r_[True, scans[1:] != scans[:-1]][: len(tofs)]] = -1
+    values[num_scans::2] = tofs - previous
+    values[num_scans + 1 :: 2] = intensities
+    return np.ascontiguousarray(values.view(np.uint8).reshape(-1, 4).T).ravel()
+
+
+def _tables_with_column(conn: sqlite3.Connection, column: str, exclude: str) -> list[str]:
+    """Tables other than exclude with the given column, e.g. a Frame column referring to frame Ids."""
+    tables = []
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name != ?", (exclude,)):
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{name}")')]
+        if column in columns:
+            tables.append(name)
+    return tables
+
+
+def _write_analysis_tdf(source: pathlib.Path, target: pathlib.Path, frames_rows: list[tuple]):
+    with contextlib.closing(sqlite3.connect(source)) as src, contextlib.closing(sqlite3.connect(target)) as dst:
+        src.backup(dst)
+        dst.execute(
+            "CREATE TEMP TABLE Kept (Id INTEGER PRIMARY KEY, TimsId INTEGER, NumPeaks INTEGER, "
+            "MaxIntensity INTEGER, SummedIntensities INTEGER)"
+        )
+        dst.executemany("INSERT INTO Kept VALUES (?, ?, ?, ?, ?)", frames_rows)
+        dst.execute("DELETE FROM Frames WHERE Id NOT IN (SELECT Id FROM Kept)")
+        for column in ("TimsId", "NumPeaks", "MaxIntensity", "SummedIntensities"):
+            dst.execute(f"UPDATE Frames SET {column} = (SELECT {column} FROM Kept WHERE Kept.Id = Frames.Id)")
+        for table in _tables_with_column(dst, "Frame", exclude="Frames"):
+            dst.execute(f'DELETE FROM "{table}" WHERE Frame NOT IN (SELECT Id FROM Kept)')
+        # DDA-PASEF precursors refer to the MS1 frames they were found in, and other tables to precursors.
+        if "Precursors" in _tables_with_column(dst, "Parent", exclude="Frames"):
+            dst.execute("DELETE FROM Precursors WHERE Parent NOT IN (SELECT Id FROM Kept)")
+            for table in _tables_with_column(dst, "Precursor", exclude="Precursors"):
+                dst.execute(f'DELETE FROM "{table}" WHERE Precursor NOT IN (SELECT Id FROM Precursors)')
+        dst.commit()
+        dst.execute("VACUUM")
+
+
+def write_tdf(
+    ot: OpenTIMS,
+    out_dir: str | pathlib.Path,
+    frames=None,
+    ms_level: int | None = None,
+    retention_time: tuple[float, float] | None = None,
+    scan: tuple[int, int] | None = None,
+    tof: tuple[int, int] | None = None,
+    mz: tuple[float, float] | None = None,
+    inv_ion_mobility: tuple[float, float] | None = None,
+    min_intensity: int = 0,
+    zstd_level: int = 3,
+    max_peaks: int = 10_000_000,
+    overwrite: bool = False,
+) -> pathlib.Path:
+    """Save chosen frames of a dataset, keeping only peaks within a box. See OpenTIMS.write_tdf."""
+    compress = _compressor_pool(zstd_level)
+    out_dir = pathlib.Path(out_dir)
+    if out_dir.exists() and out_dir.resolve() == ot.analysis_directory.resolve():
+        raise ValueError("Cannot write a dataset over itself.")
+    for name in ("analysis.tdf", "analysis.tdf_bin"):
+        if (out_dir / name).exists() and not overwrite:
+            raise FileExistsError(f"{out_dir / name} already exists; pass overwrite=True to replace it.")
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    frames = np.unique(np.r_[ot._select_frames(frames, ms_level, retention_time)]).astype(np.uint32)
+    bounds = ot._peak_boxes(frames, scan, tof, mz, inv_ion_mobility, min_intensity)
+    positions = np.searchsorted(ot.frames["Id"], frames)
+    num_scans = ot.frames["NumScans"][positions]
+    peaks = np.cumsum(ot.frames["NumPeaks"][positions], dtype=np.int64)
+
+    frames_rows = []
+    tims_id = 0
+    with open(out_dir / "analysis.tdf_bin", "wb") as tdf_bin, concurrent.futures.ThreadPoolExecutor(
+        os.cpu_count()
+    ) as executor:
+        start = 0
+        while start < len(frames):
+            # Batches bound the memory taken by uncompressed payloads, as in iter_chunks.
+            already = peaks[start - 1] if start > 0 else 0
+            end = max(np.searchsorted(peaks, already + max_peaks, side="right"), start + 1)
+            batch_bounds = [b if len(b) == 1 else b[start:end] for b in bounds]
+            encoded = ot.handle.encode_frames(frames[start:end], *batch_bounds)
+            offsets = encoded["payload_offsets"]
+            payloads = memoryview(encoded["payloads"])
+            compressed = executor.map(
+                compress, (payloads[offsets[i] : offsets[i + 1]] for i in range(end - start))
+            )
+            for i, packet in enumerate(compressed):
+                tdf_bin.write(struct.pack("<II", len(packet) + 8, num_scans[start + i]))
+                tdf_bin.write(packet)
+                frames_rows.append(
+                    (
+                        int(frames[start + i]),
+                        tims_id,
+                        int(encoded["num_peaks"][i]),
+                        int(encoded["max_intensity"][i]),
+                        int(encoded["summed_intensity"][i]),
+                    )
+                )
+                tims_id += len(packet) + 8
+            start = end
+
+    tdf_path = out_dir / "analysis.tdf"
+    if tdf_path.exists():
+        tdf_path.unlink()
+    _write_analysis_tdf(ot.analysis_directory / "analysis.tdf", tdf_path, frames_rows)
+    return out_dir
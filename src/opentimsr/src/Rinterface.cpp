@@ -64,106 +64,93 @@ size_t tdf_no_peaks_total(Rcpp::XPtr<TimsDataHandle> tdf)
 }
 
 
-// [[Rcpp::export]]
-Rcpp::DataFrame tdf_get_range(Rcpp::XPtr<TimsDataHandle> tdf, size_t start, size_t end, int32_t step = 1)
+// Output columns are allocated once as R vectors, sized from the peak counts of the frames, and
+// filled in place by the parallel extractor (see opentims_set_threads). R integers hold the
+// uint32 values bit for bit.
+static Rcpp::DataFrame extract_to_R(TimsDataHandle& tdh,
+                                    const std::vector<uint32_t>& indexes,
+                                    const bool get_frames,
+                                    const bool get_scans,
+                                    const bool get_tofs,
+                                    const bool get_intensities,
+                                    const bool get_mzs,
+                                    const bool get_inv_ion_mobilities,
+                                    const bool get_retention_times)
 {
     using namespace Rcpp;
-    
-    TimsDataHandle& tdh = *tdf;
-    if(end > tdh.max_frame_id())
-        end = tdh.max_frame_id()+1;
 
-    std::vector<uint32_t> frame_ids;
-    std::vector<uint32_t> scan_ids;
-    std::vector<uint32_t> tofs;
-    std::vector<uint32_t> intensities;
+    const size_t peaks_no = tdh.no_peaks_in_frames(indexes.data(), indexes.size());
 
-    for(size_t idx = start; idx < end; idx += step)
-    {
-        size_t frame_size = tdh.expose_frame(idx);
+    IntegerVector frames = no_init(get_frames ? peaks_no : 0);
+    IntegerVector scans = no_init(get_scans ? peaks_no : 0);
+    IntegerVector tofs = no_init(get_tofs ? peaks_no : 0);
+    IntegerVector intensities = no_init(get_intensities ? peaks_no : 0);
+    NumericVector mzs = no_init(get_mzs ? peaks_no : 0);
+    NumericVector inv_ion_mobilities = no_init(get_inv_ion_mobilities ? peaks_no : 0);
+    NumericVector retention_times = no_init(get_retention_times ? peaks_no : 0);
 
-        // std::cerr << "frame_size" << std::endl;
+    auto uint32_ptr = [](IntegerVector& v, bool wanted) { return wanted ? reinterpret_cast<uint32_t*>(v.begin()) : nullptr; };
+    auto double_ptr = [](NumericVector& v, bool wanted) { return wanted ? v.begin() : nullptr; };
 
-        for(size_t ii=0; ii<frame_size; ii++)
-        {
-            frame_ids.push_back(idx);
-            scan_ids.push_back(tdh.scan_ids_buffer()[ii]);
-            tofs.push_back(tdh.tofs_buffer()[ii]);
-            intensities.push_back(tdh.intensities_buffer()[ii]);
-        }
-    }
+    tdh.extract_frames(
+        indexes,
+        uint32_ptr(frames, get_frames),
+        uint32_ptr(scans, get_scans),
+        uint32_ptr(tofs, get_tofs),
+        uint32_ptr(intensities, get_intensities),
+        double_ptr(mzs, get_mzs),
+        double_ptr(inv_ion_mobilities, get_inv_ion_mobilities),
+        double_ptr(retention_times, get_retention_times)
+    );
 
-    DataFrame result = DataFrame::create( Named("frame")     = frame_ids,
-                                          Named("scan")      = scan_ids,
-                                          Named("tof")       = tofs,
-                                          Named("intensity") = intensities );
+    DataFrame result = DataFrame::create();
+
+    if(get_frames) result["frame"] = frames;
+    if(get_scans) result["scan"] = scans;
+    if(get_tofs) result["tof"] = tofs;
+    if(get_intensities) result["intensity"] = intensities;
+    if(get_mzs) result["mz"] = mzs;
+    if(get_inv_ion_mobilities) result["inv_ion_mobility"] = inv_ion_mobilities;
+    if(get_retention_times) result["retention_time"] = retention_times;
 
     return result;
 }
 
 
-// [[Rcpp::export]]
-Rcpp::DataFrame tdf_get_indexes(Rcpp::XPtr<TimsDataHandle> tdf, Rcpp::IntegerVector indexes)
+static std::vector<uint32_t> slice_indexes(size_t start, size_t end, int32_t step)
 {
-    using namespace Rcpp;
-
-    TimsDataHandle& tdh = *tdf;
-
-    std::vector<uint32_t> frame_ids;
-    std::vector<uint32_t> scan_ids;
-    std::vector<uint32_t> tofs;
-    std::vector<uint32_t> intensities;
-
-    for(auto idx = indexes.cbegin(); idx != indexes.cend(); idx++)
-    {
-        size_t frame_size = tdh.expose_frame(*idx);
-
-        // std::cerr << "frame_size" << std::endl;
-
-        for(size_t ii=0; ii<frame_size; ii++)
-        {
-            frame_ids.push_back(*idx);
-            scan_ids.push_back(tdh.scan_ids_buffer()[ii]);
-            tofs.push_back(tdh.tofs_buffer()[ii]);
-            intensities.push_back(tdh.intensities_buffer()[ii]);
-        }
-    }
-
-    DataFrame result = DataFrame::create( Named("frame") = frame_ids,
-                                          Named("scan")  = scan_ids,
-                                          Named("tof")   = tofs,
-                                          Named("intensity") = intensities );
-
-    return result;
+    if(step <= 0)
+        Rcpp::stop("step must be > 0");
+    std::vector<uint32_t> indexes;
+    for(size_t idx = start; idx < end; idx += step)
+        indexes.push_back(idx);
+    return indexes;
 }
 
 
 // [[Rcpp::export]]
-Rcpp::DataFrame tdf_get_range_noend(Rcpp::XPtr<TimsDataHandle> tdf, size_t start, int32_t step = 1)
+Rcpp::DataFrame tdf_get_range(Rcpp::XPtr<TimsDataHandle> tdf, size_t start, size_t end, int32_t step = 1)
 {
-    return tdf_get_range(tdf, start, std::numeric_limits<size_t>::max(), step);
+    TimsDataHandle& tdh = *tdf;
+    if(end > tdh.max_frame_id())
+        end = tdh.max_frame_id()+1;
+
+    return extract_to_R(tdh, slice_indexes(start, end, step), true, true, true, true, false, false, false);
 }
 
 
-template<typename T> std::unique_ptr<T[]> R_get_ptr(const size_t size,
-                                                    const bool really)
+// [[Rcpp::export]]
+Rcpp::DataFrame tdf_get_indexes(Rcpp::XPtr<TimsDataHandle> tdf, Rcpp::IntegerVector indexes)
 {
-    if(really)
-        return std::make_unique<T[]>(size);
-    else
-        return std::unique_ptr<T[]>();
+    std::vector<uint32_t> v(indexes.begin(), indexes.end());
+    return extract_to_R(*tdf, v, true, true, true, true, false, false, false);
 }
 
 
-template<typename T, typename U> void set_frame(Rcpp::DataFrame& df,
-                                                const std::string& name,
-                                                const std::unique_ptr<T[]>& tbl,
-                                                size_t size)
+// [[Rcpp::export]]
+Rcpp::DataFrame tdf_get_range_noend(Rcpp::XPtr<TimsDataHandle> tdf, size_t start, int32_t step = 1)
 {
-    if(tbl){
-        U vec = U::import(tbl.get(), tbl.get() + size);
-        df[name] = vec;
-    } 
+    return tdf_get_range(tdf, start, std::numeric_limits<size_t>::max(), step);
 }
 
 
@@ -179,48 +166,9 @@ Rcpp::DataFrame tdf_extract_frames(
     const bool get_inv_ion_mobilities = true,
     const bool get_retention_times = true)
 {
-    using namespace Rcpp;
-
-    TimsDataHandle& tdh = *tdf;
-
-    std::unique_ptr<uint32_t[]> v = std::make_unique<uint32_t[]>(indexes.size());
-
-    for(R_xlen_t ii=0; ii < indexes.size(); ++ii) v[ii] = indexes[ii];
-
-    const size_t peaks_no = tdh.no_peaks_in_frames(v.get(), indexes.size()); // conts for compiler optimization.
-
-    std::unique_ptr<uint32_t[]> frames = R_get_ptr<uint32_t>(peaks_no, get_frames);
-    std::unique_ptr<uint32_t[]> scans = R_get_ptr<uint32_t>(peaks_no, true);
-    std::unique_ptr<uint32_t[]> tofs = R_get_ptr<uint32_t>(peaks_no, true);
-    std::unique_ptr<uint32_t[]> intensities = R_get_ptr<uint32_t>(peaks_no, true);
-    std::unique_ptr<double[]> mzs = R_get_ptr<double>(peaks_no, get_mzs);
-    std::unique_ptr<double[]> inv_ion_mobilities = R_get_ptr<double>(peaks_no, get_inv_ion_mobilities);
-    std::unique_ptr<double[]> retention_times = R_get_ptr<double>(peaks_no, get_retention_times);
-
-    tdh.extract_frames(
-        v.get(),
-        indexes.size(),
-        frames.get(),
-        scans.get(),
-        tofs.get(),
-        intensities.get(),
-        mzs.get(),
-        inv_ion_mobilities.get(),
-        retention_times.get()
-    );
-
-    DataFrame result = DataFrame::create();
-
-    set_frame<uint32_t, Rcpp::IntegerVector>(result, "frame", frames, peaks_no);
-    set_frame<uint32_t, Rcpp::IntegerVector>(result, "scan", scans, peaks_no);
-    set_frame<uint32_t, Rcpp::IntegerVector>(result, "tof", tofs, peaks_no);
-    set_frame<uint32_t, Rcpp::IntegerVector>(result, "intensity", intensities, peaks_no);
-    
-    set_frame<double, Rcpp::NumericVector>(result, "mz", mzs, peaks_no);
-    set_frame<double, Rcpp::NumericVector>(result, "inv_ion_mobility", inv_ion_mobilities, peaks_no);
-    set_frame<double, Rcpp::NumericVector>(result, "retention_time", retention_times, peaks_no);
-
-    return result;
+    std::vector<uint32_t> v(indexes.begin(), indexes.end());
+    return extract_to_R(*tdf, v, get_frames, get_scans, get_tofs, get_intensities,
+                        get_mzs, get_inv_ion_mobilities, get_retention_times);
 }
 
 
@@ -239,46 +187,8 @@ Rcpp::DataFrame tdf_extract_frames_slice(
     const bool get_inv_ion_mobilities = true,
     const bool get_retention_times = true)
 {
-    using namespace Rcpp;
-
-    TimsDataHandle& tdh = *tdf;
-
-    const size_t peaks_no = tdh.no_peaks_in_slice(start, end, step);
-
-    //scan tof intensity always returned and only sometimes cut away
-    std::unique_ptr<uint32_t[]> frames = R_get_ptr<uint32_t>(peaks_no, get_frames);
-    std::unique_ptr<uint32_t[]> scans = R_get_ptr<uint32_t>(peaks_no, true);  
-    std::unique_ptr<uint32_t[]> tofs = R_get_ptr<uint32_t>(peaks_no, true);
-    std::unique_ptr<uint32_t[]> intensities = R_get_ptr<uint32_t>(peaks_no, true);
-    std::unique_ptr<double[]> mzs = R_get_ptr<double>(peaks_no, get_mzs);
-    std::unique_ptr<double[]> inv_ion_mobilities = R_get_ptr<double>(peaks_no, get_inv_ion_mobilities);
-    std::unique_ptr<double[]> retention_times = R_get_ptr<double>(peaks_no, get_retention_times);
-
-    tdh.extract_frames_slice(
-        start, 
-        end,
-        step,
-        frames.get(),
-        scans.get(),
-        tofs.get(),
-        intensities.get(),
-        mzs.get(),
-        inv_ion_mobilities.get(),
-        retention_times.get()
-    );
-
-    DataFrame result = DataFrame::create();
-
-    set_frame<uint32_t, Rcpp::IntegerVector>(result, "frame", frames, peaks_no);
-    set_frame<uint32_t, Rcpp::IntegerVector>(result, "scan", scans, peaks_no);
-    set_frame<uint32_t, Rcpp::IntegerVector>(result, "tof", tofs, peaks_no);
-    set_frame<uint32_t, Rcpp::IntegerVector>(result, "intensity", intensities, peaks_no);
-    
-    set_frame<double, Rcpp::NumericVector>(result, "mz", mzs, peaks_no);
-    set_frame<double, Rcpp::NumericVector>(result, "inv_ion_mobility", inv_ion_mobilities, peaks_no);
-    set_frame<double, Rcpp::NumericVector>(result, "retention_time", retention_times, peaks_no);
-
-    return result;
+    return extract_to_R(*tdf, slice_indexes(start, end, step), get_frames, get_scans, get_tofs, get_intensities,
+                        get_mzs, get_inv_ion_mobilities, get_retention_times);
 }
 
 // [[Rcpp::export]]
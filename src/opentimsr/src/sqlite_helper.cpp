@@ -0,0 +1 @@
+#include "opentims_core/sqlite_helper.cpp"